@@ -0,0 +1,157 @@
+"""
+Cassette-backed stand-ins for Gemini and storage, fed by traffic capture logs.
+
+A Cassette holds the LLM outputs and store results recorded by
+services/traffic_capture.py. The fakes serve them back per cassette key in
+recorded order, optionally with the recorded latencies (scaled by
+`latency_scale`, 0 for none). A call whose key wasn't recorded (e.g. the
+prompt or a generated user ID changed) gets the next recording of the same
+kind instead, and is counted as a miss.
+"""
+import copy
+import itertools
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from fakes import fake_usage
+from services.traffic_capture import llm_key, store_key
+
+
+class Cassette:
+    """Recorded `llm` and `db` events, handed out in recorded order per key"""
+
+    def __init__(self, events: Iterable[Dict[str, Any]]):
+        self._llm: Dict[str, deque] = defaultdict(deque)
+        self._llm_all: List[Dict[str, Any]] = []
+        self._db: Dict[Tuple[str, str], deque] = defaultdict(deque)
+        self._db_by_method: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._last: Dict[Any, Dict[str, Any]] = {}
+        self._fallbacks: Dict[str, Iterator[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        for event in sorted(events, key=lambda event: event.get('t', 0.0)):
+            if event['e'] == 'llm':
+                self._llm[event['k']].append(event)
+                self._llm_all.append(event)
+            elif event['e'] == 'db':
+                self._db[(event['m'], event['k'])].append(event)
+                self._db_by_method[event['m']].append(event)
+
+    def _next(self, queues: Dict[Any, deque], key: Any, kind: str, pool: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            queue = queues.get(key)
+            if queue:
+                event = self._last[key] = queue.popleft()
+                self.hits[kind] += 1
+                return event
+            if key in self._last:
+                # More calls than were recorded (e.g. a retry): repeat the latest
+                self.hits[kind] += 1
+                return self._last[key]
+            self.misses[kind] += 1
+            if not pool:
+                return None
+            if kind not in self._fallbacks:
+                self._fallbacks[kind] = itertools.cycle(pool)
+            return next(self._fallbacks[kind])
+
+    def next_llm(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._next(self._llm, key, 'llm', self._llm_all)
+
+    def next_store(self, method: str, key: str) -> Optional[Dict[str, Any]]:
+        return self._next(self._db, (method, key), f'db.{method}', self._db_by_method.get(method, []))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'hits': dict(self.hits), 'misses': dict(self.misses)}
+
+
+def _sleep_until(started: float, offset: float):
+    delay = started + offset - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+
+
+class CassetteChatModel(BaseChatModel):
+    """LangChain chat model replaying recorded outputs at their recorded chunk timings"""
+
+    cassette: Any = None
+    latency_scale: float = 1.0
+    model_name: str = "cassette-gemini"
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette-medical-chat"
+
+    def _recording(self, messages: List[BaseMessage]) -> Tuple[List[str], List[float]]:
+        event = self.cassette.next_llm(llm_key(messages))
+        if event is None:
+            return [''], [0.0]
+        return event['chunks'] or [''], [seconds * self.latency_scale for seconds in event['at']] or [0.0]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        chunks, times = self._recording(messages)
+        time.sleep(times[-1])
+        text = ''.join(chunks)
+        message = AIMessage(content=text, usage_metadata=fake_usage(messages, len(text.split())))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        chunks, times = self._recording(messages)
+        started = time.perf_counter()
+        output_tokens = sum(len(text.split()) for text in chunks)
+        for index, (text, offset) in enumerate(zip(chunks, times)):
+            _sleep_until(started, offset)
+            usage = fake_usage(messages, output_tokens) if index == len(chunks) - 1 else None
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=text, usage_metadata=usage))
+            if run_manager:
+                run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+
+class CassetteGenerativeModel:
+    """Stand-in for google.generativeai.GenerativeModel replaying recorded outputs"""
+
+    def __init__(self, cassette: Cassette, latency_scale: float = 1.0):
+        self.cassette = cassette
+        self.latency_scale = latency_scale
+
+    def generate_content(self, prompt: str, generation_config: dict = None, **kwargs: Any) -> SimpleNamespace:
+        event = self.cassette.next_llm(llm_key([prompt]))
+        if event is None:
+            return SimpleNamespace(text='')
+        time.sleep((event['at'] or [0.0])[-1] * self.latency_scale)
+        return SimpleNamespace(text=''.join(event['chunks']))
+
+
+class CassetteStore:
+    """Chat/profile store answering every method with its recorded results and latencies"""
+
+    def __init__(self, cassette: Cassette, latency_scale: float = 1.0):
+        self.cassette = cassette
+        self.latency_scale = latency_scale
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            event = self.cassette.next_store(name, store_key(args, kwargs))
+            if event is None:
+                return None
+            time.sleep(event['d'] * self.latency_scale)
+            # Callers may modify what they get, and a repeated event is served again
+            return copy.deepcopy(event['r'])
+
+        return call
@@ -0,0 +1,95 @@
+"""
+Local stand-ins for Gemini used by the benchmark suite.
+
+The fakes emit a canned, structured medical answer at a configurable token
+rate so the service layer can be driven without network access.
+"""
+import time
+from types import SimpleNamespace
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+CANNED_RESPONSE = """1. **Likely Condition(s):** Viral syndrome with tension-type headache (moderate confidence)
+2. **Recommended Medications:** Ibuprofen 400mg PO every 6-8 hours with food (max 1200mg/day); Acetaminophen 500mg PO every 4-6 hours as an alternative
+3. **Treatment Plan:** Rest, oral fluids 2-3L/day, symptomatic treatment for 3-5 days
+4. **Monitoring:** Temperature every 4 hours; watch for neck stiffness, confusion or rash
+5. **Follow-up:** Seek care if symptoms persist beyond 5 days or worsen"""
+
+
+def canned_tokens(count: int) -> List[str]:
+    """Return `count` whitespace tokens cycling through the canned response"""
+    words = CANNED_RESPONSE.split(' ')
+    return [words[i % len(words)] + ' ' for i in range(count)]
+
+
+def fake_usage(messages: List[BaseMessage], output_tokens: int) -> dict:
+    """Usage metadata with prompt tokens approximated by word count"""
+    input_tokens = sum(len(str(message.content).split()) for message in messages)
+    return {'input_tokens': input_tokens, 'output_tokens': output_tokens,
+            'total_tokens': input_tokens + output_tokens}
+
+
+class FakeChatModel(BaseChatModel):
+    """LangChain chat model that generates canned text at a fixed token rate"""
+
+    tokens_per_second: float = 200.0
+    response_tokens: int = 200
+    first_token_latency: float = 0.05
+    model_name: str = "fake-gemini"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-medical-chat"
+
+    def _token_count(self, kwargs: dict) -> int:
+        """Honour the max_output_tokens of a bound generation profile"""
+        limit = (kwargs.get('generation_config') or {}).get('max_output_tokens')
+        return min(self.response_tokens, limit) if limit else self.response_tokens
+
+    def _token_delay(self) -> float:
+        if self.tokens_per_second <= 0:
+            return 0.0
+        return 1.0 / self.tokens_per_second
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tokens = canned_tokens(self._token_count(kwargs))
+        time.sleep(self.first_token_latency + self._token_delay() * len(tokens))
+        message = AIMessage(content=''.join(tokens), usage_metadata=fake_usage(messages, len(tokens)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        delay = self._token_delay()
+        tokens = canned_tokens(self._token_count(kwargs))
+        for index, token in enumerate(tokens):
+            if delay:
+                time.sleep(delay)
+            # Like Gemini, usage arrives with the final chunk
+            usage = fake_usage(messages, len(tokens)) if index == len(tokens) - 1 else None
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token, usage_metadata=usage))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class FakeGenerativeModel:
+    """Stand-in for google.generativeai.GenerativeModel used by GeminiService"""
+
+    def __init__(self, tokens_per_second: float = 200.0, response_tokens: int = 200,
+                 first_token_latency: float = 0.05):
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.first_token_latency = first_token_latency
+
+    def generate_content(self, prompt: str, generation_config: dict = None, **kwargs: Any) -> SimpleNamespace:
+        limit = (generation_config or {}).get('max_output_tokens')
+        tokens = canned_tokens(min(self.response_tokens, limit) if limit else self.response_tokens)
+        delay = len(tokens) / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        time.sleep(self.first_token_latency + delay)
+        return SimpleNamespace(text=''.join(tokens))
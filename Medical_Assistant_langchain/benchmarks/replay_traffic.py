@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Replay captured production traffic against the current code, offline.
+
+Reads capture logs written with TRAFFIC_CAPTURE_DIR set (see
+src/services/traffic_capture.py) and re-drives MedicalChatService and
+MedicalAssistantService with the recorded requests, against cassette-backed
+fakes that return the recorded LLM outputs and store results with their
+recorded latencies. Each session's requests run in recorded order; with
+--pace recorded they also start at their recorded offsets (scaled by
+--speed), with --pace fast back to back.
+
+The JSON report has replayed and recorded latency per operation. Pass an
+earlier report as --baseline (e.g. one made on the main branch) to add
+p50/p95/p99 deltas between the two code versions.
+
+Usage:
+    python benchmarks/replay_traffic.py captures/ --pace fast --output replay.json
+    python benchmarks/replay_traffic.py captures/traffic-*.jsonl.gz --baseline main.json
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+# Add the benchmark and src directories to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.join(os.path.dirname(current_dir), 'src')
+for path in (current_dir, src_path):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from cassettes import Cassette, CassetteChatModel, CassetteGenerativeModel, CassetteStore
+from config import Config
+from services.gemini_service import GeminiService
+from services.intent_router import IntentRouter
+from services.langchain_service import MedicalChatService
+from services.llm_scheduler import LLMScheduler
+from services.medical_assistant_service import MedicalAssistantService
+from services.traffic_capture import read_traffic_log
+from utils.metrics import metrics, summarize
+
+PACES = ('recorded', 'fast')
+COMPARED = ('p50', 'p95', 'p99')
+
+
+def log_paths(targets: List[str]) -> List[str]:
+    """Capture logs named by files, directories and glob patterns"""
+    paths = []
+    for target in targets:
+        if os.path.isdir(target):
+            paths.extend(sorted(glob.glob(os.path.join(target, '*.jsonl.gz'))))
+        else:
+            paths.extend(sorted(glob.glob(target)) or [target])
+    return paths
+
+
+def load_events(paths: List[str]) -> List[Dict[str, Any]]:
+    """Events of every log, with offsets moved onto one timeline (the earliest log's start)"""
+    logs = []
+    for path in paths:
+        events = list(read_traffic_log(path))
+        meta = next((event for event in events if event['e'] == 'meta'), None)
+        started = datetime.fromisoformat(meta['started']) if meta else None
+        logs.append((started, [event for event in events if event['e'] != 'meta']))
+    known = [started for started, _ in logs if started is not None]
+    origin = min(known) if known else None
+    merged = []
+    for started, events in logs:
+        shift = (started - origin).total_seconds() if started is not None and origin is not None else 0.0
+        for event in events:
+            event['t'] = event.get('t', 0.0) + shift
+            merged.append(event)
+    return merged
+
+
+def session_of(request: Dict[str, Any], index: int) -> str:
+    args = request['args']
+    return str(args.get('session_id') or args.get('user_id') or f"request-{index}")
+
+
+def group_sessions(requests: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Requests per session in recorded order, sessions ordered by their first request"""
+    sessions: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for index, request in enumerate(sorted(requests, key=lambda request: request['t'])):
+        sessions[session_of(request, index)].append(request)
+    return list(sessions.values())
+
+
+def build_services(cassette: Cassette, args) -> Tuple[MedicalChatService, MedicalAssistantService]:
+    scale = 0.0 if args.backend_latency == 'none' else 1.0
+    store = CassetteStore(cassette, scale)
+    scheduler = LLMScheduler(slots=args.llm_slots)
+    chat_service = MedicalChatService(llm=CassetteChatModel(cassette=cassette, latency_scale=scale), db=store,
+                                      router=IntentRouter(log_path=''), scheduler=scheduler)
+    assistant = MedicalAssistantService(
+        gemini_service=GeminiService(model=CassetteGenerativeModel(cassette, scale), scheduler=scheduler),
+        db_manager=store
+    )
+    return chat_service, assistant
+
+
+def dispatch(chat_service: MedicalChatService, assistant: MedicalAssistantService, request: Dict[str, Any]) -> Any:
+    operation, arguments = request['op'], request['args']
+    if operation == 'chat':
+        return chat_service.chat(**arguments)
+    if operation == 'stream_chat':
+        return ''.join(chat_service.stream_chat(**arguments))
+    if operation.startswith('assistant.'):
+        return getattr(assistant, operation.split('.', 1)[1])(**arguments)
+    raise ValueError(f"Unknown captured operation: {operation}")
+
+
+def replay(events: List[Dict[str, Any]], args) -> Dict[str, Any]:
+    """Re-drive the captured requests and summarize replayed vs. recorded latency"""
+    requests = [event for event in events if event['e'] == 'req']
+    sessions = group_sessions(requests)
+    cassette = Cassette(events)
+    chat_service, assistant = build_services(cassette, args)
+    metrics.reset()
+    lock = threading.Lock()
+    replayed: Dict[str, List[float]] = defaultdict(list)
+    recorded: Dict[str, List[float]] = defaultdict(list)
+    stage_timings: Dict[str, List[float]] = defaultdict(list)
+    failures = {'count': 0}
+    first_offset = min((request['t'] for request in requests), default=0.0)
+    start = time.perf_counter()
+
+    def run_session(session: List[Dict[str, Any]]):
+        for request in session:
+            if args.pace == 'recorded':
+                delay = start + (request['t'] - first_offset) / args.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            with metrics.trace() as trace:
+                began = time.perf_counter()
+                try:
+                    result = dispatch(chat_service, assistant, request)
+                    failed = isinstance(result, dict) and 'error' in result
+                except Exception as e:
+                    print(f"Replayed {request['op']} failed: {e}", file=sys.stderr)
+                    failed = True
+                elapsed = time.perf_counter() - began
+            with lock:
+                replayed[request['op']].append(elapsed)
+                recorded[request['op']].append(request['d'])
+                for stage, seconds in trace.stages.items():
+                    stage_timings[stage].append(seconds)
+                if failed:
+                    failures['count'] += 1
+
+    # At recorded pacing every session needs its own worker, or requests start late
+    workers = len(sessions) if args.pace == 'recorded' else args.concurrency
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, args.max_workers))) as executor:
+        list(executor.map(run_session, sessions))
+    wall_seconds = time.perf_counter() - start
+    chat_service.shutdown()
+
+    all_replayed = [value for values in replayed.values() for value in values]
+    snapshot = metrics.snapshot()
+    return {
+        'requests': len(requests),
+        'sessions': len(sessions),
+        'recorded_seconds': (max(request['t'] for request in requests) - first_offset) if requests else 0.0,
+        'wall_seconds': wall_seconds,
+        'errors': failures['count'] + int(snapshot['counters'].get('chat.errors', 0)),
+        'throughput_ops_per_sec': len(all_replayed) / wall_seconds if wall_seconds else 0.0,
+        'latency': summarize(all_replayed),
+        'latency_by_operation': {name: summarize(values) for name, values in replayed.items()},
+        'recorded_latency_by_operation': {name: summarize(values) for name, values in recorded.items()},
+        'stages': {stage: summarize(values) for stage, values in stage_timings.items()},
+        'cassette': cassette.stats(),
+        'counters': snapshot['counters'],
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """Latency deltas (current - baseline, seconds, and ratio) per operation present in both"""
+    def deltas(now: Dict[str, float], then: Dict[str, float]) -> Dict[str, Any]:
+        return {stat: {'baseline': then[stat], 'current': now[stat], 'delta': now[stat] - then[stat],
+                       'ratio': now[stat] / then[stat] if then[stat] else None}
+                for stat in COMPARED}
+
+    before = baseline['replay']
+    after = current['replay']
+    return {
+        'latency': deltas(after['latency'], before['latency']),
+        'latency_by_operation': {name: deltas(stats, before['latency_by_operation'][name])
+                                 for name, stats in after['latency_by_operation'].items()
+                                 if name in before['latency_by_operation']},
+        'comparable': baseline['config'].get('pace') == current['config'].get('pace')
+                      and baseline['config'].get('backend_latency') == current['config'].get('backend_latency'),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay captured traffic against cassette-backed Gemini and storage")
+    parser.add_argument('logs', nargs='+', help="Capture logs, directories of them, or glob patterns")
+    parser.add_argument('--pace', choices=PACES, default='recorded',
+                        help="Start requests at their recorded offsets, or each session's back to back")
+    parser.add_argument('--speed', type=float, default=1.0, help="Time compression at recorded pacing (2 = twice as fast)")
+    parser.add_argument('--backend-latency', choices=('recorded', 'none'), default='recorded',
+                        help="Replay recorded LLM/store latencies, or answer instantly to time the service layer alone")
+    parser.add_argument('--concurrency', type=int, default=8, help="Sessions replayed in parallel with --pace fast")
+    parser.add_argument('--max-workers', type=int, default=256, help="Upper bound on replay threads")
+    parser.add_argument('--llm-slots', type=int, default=None,
+                        help="Concurrent LLM calls (default: LLM_MAX_CONCURRENCY)")
+    parser.add_argument('--baseline', help="Earlier replay report to compute latency deltas against")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # The replay itself must not be captured
+    Config.TRAFFIC_CAPTURE_DIR = None
+    paths = log_paths(args.logs)
+    events = load_events(paths)
+    print(f"Replaying {sum(event['e'] == 'req' for event in events)} requests from {len(paths)} log(s)...",
+          file=sys.stderr)
+    report: Dict[str, Any] = {
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'logs': paths,
+        'replay': replay(events, args),
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['comparison'] = compare(report, json.load(f))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        print(f"Replay report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Offline load and latency benchmarks for the medical assistant service layer.
+
+Drives MedicalChatService (chat and the specialised helpers) and
+MedicalAssistantService against local stand-ins: a fake Gemini model with a
+configurable token rate and SQLite storage (in-memory by default). Writes a
+machine-readable JSON report with p50/p95/p99 latency, throughput, per-stage
+timings and memory per session. With --background-workers, batch
+generations run at background priority throughout each scenario, to check
+that interactive latency holds up under the LLM scheduler.
+
+Usage:
+    python benchmarks/run_benchmarks.py --sessions 50 --turns 3 --concurrency 8 --output bench.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+# Add the benchmark and src directories to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.join(os.path.dirname(current_dir), 'src')
+for path in (current_dir, src_path):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from fakes import FakeChatModel, FakeGenerativeModel, canned_tokens
+from database.sqlite_manager import SQLiteManager
+from services.gemini_service import GeminiService
+from services.intent_router import IntentRouter
+from services.langchain_service import MedicalChatService
+from services.llm_scheduler import LLMScheduler
+from services.medical_assistant_service import MedicalAssistantService
+from services.turn_store import Turn, TurnStore
+from utils.metrics import metrics, summarize
+
+SCENARIOS = ('chat', 'helpers', 'assistant')
+
+CHAT_MESSAGES = [
+    "I have a severe headache and fever of 101°F",
+    "I'm experiencing chest pain and shortness of breath",
+    "I need information about ibuprofen dosage for back pain",
+    "I have type 2 diabetes and need medication recommendations",
+]
+
+HEALTH_INFO = {
+    'age': 45,
+    'gender': 'female',
+    'weight': 70,
+    'height': 165,
+    'allergies': ['penicillin'],
+    'medications': ['metformin'],
+    'medical_conditions': ['type 2 diabetes'],
+}
+
+Operation = Tuple[str, Callable[[], Any]]
+
+
+def build_chat_model(args) -> FakeChatModel:
+    return FakeChatModel(
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        first_token_latency=args.first_token_latency
+    )
+
+
+def build_generative_model(args) -> FakeGenerativeModel:
+    return FakeGenerativeModel(
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        first_token_latency=args.first_token_latency
+    )
+
+
+def chat_session(service: MedicalChatService, args, index: int) -> Iterator[Operation]:
+    """Free-form chat turns for one session"""
+    session_id = f"bench-chat-{index}"
+    for turn in range(args.turns):
+        message = CHAT_MESSAGES[(index + turn) % len(CHAT_MESSAGES)]
+        yield 'chat', lambda message=message: service.chat(message, session_id)
+
+
+def helpers_session(service: MedicalChatService, args, index: int) -> Iterator[Operation]:
+    """Specialised consultation helpers, cycled per turn"""
+    session_id = f"bench-helpers-{index}"
+    helpers = [
+        ('get_medical_suggestion', lambda: service.get_medical_suggestion(
+            ['headache', 'fever'], session_id=session_id)),
+        ('get_medication_info', lambda: service.get_medication_info(
+            'ibuprofen', session_id=session_id)),
+        ('get_first_aid_advice', lambda: service.get_first_aid_advice(
+            'allergic reaction', session_id=session_id)),
+        ('get_comprehensive_medical_consultation', lambda: service.get_comprehensive_medical_consultation(
+            'persistent cough and fatigue', age=35, medical_history='none', session_id=session_id)),
+        ('get_medication_prescription', lambda: service.get_medication_prescription(
+            'hypertension', patient_age=45, allergies='none', current_meds='none', session_id=session_id)),
+    ]
+    for turn in range(args.turns):
+        yield helpers[(index + turn) % len(helpers)]
+
+
+def assistant_session(service: MedicalAssistantService, args, index: int) -> Iterator[Operation]:
+    """Legacy MedicalAssistantService flow: create profile, update it, then query"""
+    state: Dict[str, Any] = {}
+
+    def create():
+        result = service.create_user_session(f"Bench User {index}", f"bench{index}@example.com", HEALTH_INFO)
+        state['user_id'] = result.get('user_id')
+        return result
+
+    yield 'create_user_session', create
+    if not state.get('user_id'):
+        return
+    user_id = state['user_id']
+    yield 'update_health_info', lambda: service.update_health_info(user_id, dict(HEALTH_INFO, age=46))
+    operations = [
+        ('process_medical_query', lambda: service.process_medical_query(user_id, CHAT_MESSAGES[index % len(CHAT_MESSAGES)])),
+        ('analyze_symptoms', lambda: service.analyze_symptoms(user_id, 'headache, fever, fatigue')),
+        ('get_health_recommendations', lambda: service.get_health_recommendations(user_id)),
+    ]
+    for turn in range(args.turns):
+        yield operations[turn % len(operations)]
+
+
+def background_worker(service: MedicalChatService, worker: int, stop: threading.Event, counts: Dict[str, int],
+                      lock: threading.Lock):
+    """Context-free generations at background priority until stopped (distinct prompts, so none coalesce)"""
+    index = 0
+    while not stop.is_set():
+        try:
+            service.answer_without_context(f"Summarise general wellness advice for newsletter item {worker}-{index}")
+            key = 'completed'
+        except Exception:
+            key = 'failed'
+        with lock:
+            counts[key] += 1
+        index += 1
+
+
+def run_scenario(args, session_fn: Callable[[int], Iterator[Operation]],
+                 background_service: MedicalChatService = None) -> Dict[str, Any]:
+    """Run args.sessions sessions at args.concurrency and summarize latencies"""
+    metrics.reset()
+    lock = threading.Lock()
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    stage_timings: Dict[str, List[float]] = defaultdict(list)
+    failures = {'count': 0}
+
+    def run_session(index: int):
+        for name, operation in session_fn(index):
+            with metrics.trace() as trace:
+                start = time.perf_counter()
+                try:
+                    result = operation()
+                    failed = isinstance(result, dict) and 'error' in result
+                except Exception as e:
+                    print(f"Benchmark operation {name} failed: {e}")
+                    failed = True
+                elapsed = time.perf_counter() - start
+            with lock:
+                latencies[name].append(elapsed)
+                for stage, seconds in trace.stages.items():
+                    stage_timings[stage].append(seconds)
+                if failed:
+                    failures['count'] += 1
+
+    stop = threading.Event()
+    background = {'completed': 0, 'failed': 0}
+    workers = [threading.Thread(target=background_worker, args=(background_service, worker, stop, background, lock),
+                                daemon=True)
+               for worker in range(args.background_workers if background_service is not None else 0)]
+    for worker in workers:
+        worker.start()
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(run_session, range(args.sessions)))
+    finally:
+        wall_seconds = time.perf_counter() - start
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    snapshot = metrics.snapshot()
+    return {
+        'wall_seconds': wall_seconds,
+        'operations': len(all_latencies),
+        'errors': failures['count'] + int(snapshot['counters'].get('chat.errors', 0)),
+        'throughput_ops_per_sec': len(all_latencies) / wall_seconds if wall_seconds else 0.0,
+        'latency': summarize(all_latencies),
+        'latency_by_operation': {name: summarize(values) for name, values in latencies.items()},
+        'stages': {stage: summarize(values) for stage, values in stage_timings.items()},
+        'background_ops': background,
+        'counters': snapshot['counters'],
+    }
+
+
+def measure_memory(args) -> Dict[str, Any]:
+    """Retained heap per chat session, measured with zero-latency fakes"""
+    store = SQLiteManager(':memory:')
+    model = FakeChatModel(tokens_per_second=0, response_tokens=args.response_tokens, first_token_latency=0)
+    service = MedicalChatService(llm=model, db=store, router=IntentRouter(log_path=''))
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        for index in range(args.memory_sessions):
+            session_id = f"bench-memory-{index}"
+            for turn in range(args.turns):
+                service.chat(CHAT_MESSAGES[(index + turn) % len(CHAT_MESSAGES)], session_id)
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    retained = max(current - baseline, 0)
+    return {
+        'sessions': args.memory_sessions,
+        'turns_per_session': args.turns,
+        'retained_bytes': retained,
+        'peak_bytes': peak - baseline,
+        'bytes_per_session': retained / args.memory_sessions if args.memory_sessions else 0,
+    }
+
+
+def measure_turn_memory(args) -> Dict[str, Any]:
+    """Heap per session for `memory_turns` resident turns: compact Turns vs. the previous
+    row dicts + LangChain messages + (message, response) UI tuples"""
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    response_text = ''.join(canned_tokens(args.response_tokens))
+
+    def turn_text(index: int, turn: int) -> Tuple[str, str]:
+        # Fresh strings per turn, as they would arrive from storage
+        return f"{CHAT_MESSAGES[(index + turn) % len(CHAT_MESSAGES)]} #{turn}", f"{response_text} #{index}.{turn}"
+
+    def legacy(index: int) -> Any:
+        session_id = f"bench-memory-{index}"
+        rows = []
+        for turn in range(args.memory_turns):
+            message, response = turn_text(index, turn)
+            rows.append({'session_id': session_id, 'message': message, 'response': response,
+                         'message_type': 'medical_query', 'timestamp': f"2024-01-01T00:00:{turn:02d}"})
+        messages = [cls(content=row[key]) for row in rows
+                    for cls, key in ((HumanMessage, 'message'), (AIMessage, 'response'))]
+        return rows, messages, [(row['message'], row['response']) for row in rows]
+
+    store = TurnStore(max_sessions=args.memory_sessions, history_size=args.memory_turns)
+
+    def compact(index: int) -> Any:
+        turns = [Turn(*turn_text(index, turn), 'medical_query', f"2024-01-01T00:00:{turn:02d}")
+                 for turn in range(args.memory_turns)]
+        store.extend(f"bench-memory-{index}", turns)
+
+    def retained(build: Callable[[int], Any]) -> int:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            baseline, _ = tracemalloc.get_traced_memory()
+            kept = [build(index) for index in range(args.memory_sessions)]
+            gc.collect()
+            current, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del kept
+        return max(current - baseline, 0)
+
+    legacy_bytes = retained(legacy)
+    compact_bytes = retained(compact)
+    return {
+        'sessions': args.memory_sessions,
+        'turns_per_session': args.memory_turns,
+        'legacy_bytes_per_session': legacy_bytes / args.memory_sessions,
+        'compact_bytes_per_session': compact_bytes / args.memory_sessions,
+        'reduction': 1 - compact_bytes / legacy_bytes if legacy_bytes else 0,
+    }
+
+
+def run_benchmarks(args) -> Dict[str, Any]:
+    """Run the selected scenarios and return the report"""
+    store = SQLiteManager(args.db_path)
+    scheduler = LLMScheduler(slots=args.llm_slots)
+    # Routing runs as in production, but decisions aren't logged
+    chat_service = MedicalChatService(llm=build_chat_model(args), db=store, router=IntentRouter(log_path=''),
+                                      scheduler=scheduler)
+    assistant = MedicalAssistantService(
+        gemini_service=GeminiService(model=build_generative_model(args), scheduler=scheduler),
+        db_manager=store
+    )
+    session_builders = {
+        'chat': lambda index: chat_session(chat_service, args, index),
+        'helpers': lambda index: helpers_session(chat_service, args, index),
+        'assistant': lambda index: assistant_session(assistant, args, index),
+    }
+
+    report: Dict[str, Any] = {
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'scenarios': {},
+    }
+    for scenario in args.scenarios:
+        print(f"Running scenario '{scenario}'...", file=sys.stderr)
+        report['scenarios'][scenario] = run_scenario(args, session_builders[scenario], chat_service)
+
+    if args.memory_sessions > 0:
+        print("Measuring memory per session...", file=sys.stderr)
+        report['memory'] = measure_memory(args)
+        report['memory']['history'] = measure_turn_memory(args)
+
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load and latency benchmarks for the medical assistant")
+    parser.add_argument('--sessions', type=int, default=20, help="Sessions per scenario")
+    parser.add_argument('--turns', type=int, default=3, help="Operations per session")
+    parser.add_argument('--concurrency', type=int, default=4, help="Sessions run in parallel")
+    parser.add_argument('--scenarios', type=lambda value: [s.strip() for s in value.split(',') if s.strip()],
+                        default=list(SCENARIOS), help="Comma-separated subset of: " + ', '.join(SCENARIOS))
+    parser.add_argument('--tokens-per-second', type=float, default=200.0, help="Fake LLM output rate (0 = instant)")
+    parser.add_argument('--response-tokens', type=int, default=200, help="Tokens per fake LLM answer")
+    parser.add_argument('--first-token-latency', type=float, default=0.05, help="Fake LLM time to first token (s)")
+    parser.add_argument('--llm-slots', type=int, default=None,
+                        help="Concurrent fake LLM calls (default: LLM_MAX_CONCURRENCY)")
+    parser.add_argument('--background-workers', type=int, default=0,
+                        help="Threads issuing background-priority generations during each scenario")
+    parser.add_argument('--db-path', default=':memory:', help="SQLite database path (default: in-memory)")
+    parser.add_argument('--memory-sessions', type=int, default=50, help="Sessions for the memory pass (0 = skip)")
+    parser.add_argument('--memory-turns', type=int, default=20, help="Resident turns per session in the history memory pass")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    unknown = [scenario for scenario in args.scenarios if scenario not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenario(s): {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmarks(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        print(f"Benchmark report written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ A comprehensive medical assistant chatbot with Gemini AI and Supabase backend
 
 import os
 import sys
+import argparse
 import subprocess
 from pathlib import Path
 
@@ -13,7 +14,7 @@ from pathlib import Path
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
-def check_requirements():
+def check_requirements(mode='streamlit'):
     """Check if required packages are installed"""
     required_packages = {
         'streamlit': 'streamlit',
@@ -21,6 +22,11 @@ def check_requirements():
         'supabase': 'supabase',
         'python-dotenv': 'dotenv'
     }
+    if mode == 'api':
+        required_packages.update({
+            'fastapi': 'fastapi',
+            'uvicorn': 'uvicorn'
+        })
     
     missing_packages = []
     for package_name, import_name in required_packages.items():
@@ -70,13 +76,34 @@ def check_environment():
         print(f"❌ Error checking environment: {e}")
         return False
 
-def run_medical_assistant():
+def run_streamlit(port=8501):
+    """Run the Streamlit frontend"""
+    streamlit_script = project_root / 'streamlit_app.py'
+    subprocess.run([
+        sys.executable, "-m", "streamlit", "run", str(streamlit_script),
+        f"--server.port={port}",
+        "--server.headless=true"
+    ])
+
+def run_api_server(port=None, workers=None):
+    """Run the HTTP/SSE chat API with uvicorn"""
+    sys.path.insert(0, str(project_root / 'src'))
+    from api.app import run
+    run(port=port, workers=workers)
+
+def run_supervisor(mode='streamlit', port=None, workers=None):
+    """Run N worker processes behind the session-affinity router"""
+    sys.path.insert(0, str(project_root / 'src'))
+    from api.supervisor import Supervisor
+    Supervisor(kind=mode, workers=workers, port=port).run()
+
+def run_medical_assistant(mode='streamlit', port=None, workers=None, supervise=False):
     """Run the medical assistant application"""
     print("🏥 Medical Assistant")
     print("=" * 50)
     
     # Check requirements
-    if not check_requirements():
+    if not check_requirements(mode):
         return
     
     # Check environment
@@ -85,18 +112,21 @@ def run_medical_assistant():
     
     print("✅ All requirements satisfied")
     print("🚀 Starting Medical Assistant...")
-    print("📱 Frontend will be available at: http://localhost:8501")
+    if mode == 'api':
+        from config import Config
+        print(f"🔌 API will be available at: http://{Config.API_HOST}:{port or Config.API_PORT}")
+    else:
+        print(f"📱 Frontend will be available at: http://localhost:{port or 8501}")
     print("⚠️  Press Ctrl+C to stop the application")
     print("=" * 50)
     
     try:
-        # Run Streamlit app
-        streamlit_script = project_root / 'streamlit_app.py'
-        subprocess.run([
-            sys.executable, "-m", "streamlit", "run", str(streamlit_script),
-            "--server.port=8501",
-            "--server.headless=true"
-        ])
+        if supervise:
+            run_supervisor(mode=mode, port=port, workers=workers)
+        elif mode == 'api':
+            run_api_server(port=port, workers=workers)
+        else:
+            run_streamlit(port=port or 8501)
     except KeyboardInterrupt:
         print("\n🛑 Shutting down Medical Assistant...")
     except FileNotFoundError:
@@ -105,5 +135,18 @@ def run_medical_assistant():
     except Exception as e:
         print(f"❌ Error running application: {e}")
 
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Medical Assistant launcher")
+    parser.add_argument('--mode', choices=['streamlit', 'api'], default='streamlit',
+                        help="Run the Streamlit UI or the HTTP/SSE chat API")
+    parser.add_argument('--port', type=int, help="Port to listen on")
+    parser.add_argument('--workers', type=int,
+                        help="Worker processes (uvicorn workers in api mode; supervised workers with --supervise)")
+    parser.add_argument('--supervise', action='store_true',
+                        help="Run workers as supervised processes behind a session-affinity router")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    run_medical_assistant()
\ No newline at end of file
+    args = parse_args()
+    run_medical_assistant(mode=args.mode, port=args.port, workers=args.workers, supervise=args.supervise)
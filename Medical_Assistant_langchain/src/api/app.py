@@ -0,0 +1,285 @@
+"""
+HTTP/SSE API for the medical chat service.
+
+Exposes chat, streaming chat (Server-Sent Events), history and
+clear-history endpoints on top of MedicalChatService so chat can scale
+independently of Streamlit. Each uvicorn worker process builds one service
+at startup and shares it across requests.
+
+Run with `python central.py --mode api` or directly:
+    uvicorn api.app:app --app-dir src --workers 4
+"""
+import asyncio
+import hmac
+import json
+from datetime import datetime
+import sys
+import os
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from services.langchain_service import MedicalChatService
+from utils.deadline import Deadline
+from utils.metrics import metrics
+from utils.profiling import PROFILE_HEADER, profile_call, profile_stream, profiling_requested, request_id_or_new
+
+# Usage rollups served over HTTP. Never per session: a session ID is all it
+# takes to read that session's transcript
+API_USAGE_GROUPS = ('message_type', 'model', 'day')
+
+
+class ChatRequest(BaseModel):
+    session_id: str = Field(..., min_length=1, max_length=128)
+    message: str = Field(..., min_length=1, max_length=8000)
+    # Selects the generation profile; unknown types use the default profile
+    message_type: Optional[str] = Field(None, max_length=64)
+    # Seconds the request may take (capped at CHAT_DEADLINE)
+    timeout: Optional[float] = Field(None, gt=0)
+    # Cancel the session's previous in-flight request
+    supersede: bool = False
+    # /chat/stream: also send `section` events as the answer's sections arrive
+    sections: bool = False
+    # /chat/stream: send a `triage` event (local preliminary triage) before the answer
+    triage: bool = False
+
+    def deadline(self) -> Deadline:
+        return Deadline(min(self.timeout or Config.CHAT_DEADLINE, Config.CHAT_DEADLINE))
+
+
+class ChatResponse(BaseModel):
+    session_id: str
+    response: str
+
+
+class HistoryResponse(BaseModel):
+    session_id: str
+    history: List[Dict[str, Any]]
+
+
+class SearchResponse(BaseModel):
+    session_id: str
+    results: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+
+class LLMSlots:
+    """Per-worker cap on concurrent LLM calls.
+
+    Requests wait up to `timeout` seconds for a slot and are then rejected
+    with 503 + Retry-After, so overload turns into fast, retryable failures
+    for the load balancer instead of an ever-growing queue.
+    """
+
+    def __init__(self, limit: int, timeout: float):
+        self._semaphore = asyncio.Semaphore(limit)
+        self.limit = limit
+        self.timeout = timeout
+        self.in_use = 0
+
+    async def acquire(self):
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            metrics.increment('api.rejected')
+            raise HTTPException(status_code=503, detail="Server busy, please retry",
+                                headers={"Retry-After": "1"})
+        self.in_use += 1
+        metrics.set_gauge('api.llm_slots_in_use', self.in_use)
+
+    def release(self):
+        self.in_use -= 1
+        metrics.set_gauge('api.llm_slots_in_use', self.in_use)
+        self._semaphore.release()
+
+
+def sse_event(data: Dict[str, Any], event: str = None) -> str:
+    """Format one Server-Sent Event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def require_admin(request: Request):
+    """Admin endpoints need `Authorization: Bearer <ADMIN_TOKEN>`; without a configured token they don't exist"""
+    if not Config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode(), Config.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Admin token required", headers={"WWW-Authenticate": "Bearer"})
+
+
+def create_app(service_factory: Callable[[], Any] = MedicalChatService) -> FastAPI:
+    """Build the API app; service_factory runs once per worker at startup"""
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        app.state.chat_service = await run_in_threadpool(service_factory)
+        app.state.llm_slots = LLMSlots(Config.API_MAX_INFLIGHT, Config.API_QUEUE_TIMEOUT)
+        if Config.WARMUP_ENABLED and hasattr(app.state.chat_service, 'warm_up'):
+            await run_in_threadpool(app.state.chat_service.warm_up)
+        yield
+        if hasattr(app.state.chat_service, 'shutdown'):
+            await run_in_threadpool(app.state.chat_service.shutdown)
+
+    app = FastAPI(title="Medical Assistant API", lifespan=lifespan)
+
+    @app.get("/healthz")
+    async def healthz(request: Request):
+        # Degraded storage keeps the worker healthy: it still serves chats
+        db = getattr(request.app.state.chat_service, 'db', None)
+        storage = 'degraded' if getattr(db, 'degraded', False) else 'ok'
+        return {"status": "ok", "storage": storage}
+
+    @app.post("/chat", response_model=ChatResponse)
+    async def chat(body: ChatRequest, request: Request, response: Response):
+        slots = request.app.state.llm_slots
+        await slots.acquire()
+        try:
+            args = (body.message, body.session_id, body.message_type, body.deadline(), body.supersede)
+            if profiling_requested(request.headers.get(PROFILE_HEADER)):
+                request_id = request_id_or_new(request.headers.get('X-Request-ID'))
+                response.headers['X-Request-ID'] = request_id
+                answer = await run_in_threadpool(
+                    profile_call, request.app.state.chat_service.chat, *args, request_id=request_id, tag='api.chat'
+                )
+            else:
+                answer = await run_in_threadpool(request.app.state.chat_service.chat, *args)
+        finally:
+            slots.release()
+        return ChatResponse(session_id=body.session_id, response=answer)
+
+    @app.post("/chat/stream")
+    async def chat_stream(body: ChatRequest, request: Request):
+        slots = request.app.state.llm_slots
+        await slots.acquire()
+        deadline = body.deadline()
+        # Filled by the parser while a chunk is produced, drained after it is sent
+        sections: List[Dict[str, Any]] = []
+        triage: List[Dict[str, Any]] = []
+        stream = request.app.state.chat_service.stream_chat(
+            body.message, body.session_id, body.message_type, deadline, body.supersede,
+            on_section=sections.append if body.sections else None,
+            on_triage=triage.append if body.triage else None
+        )
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        if profiling_requested(request.headers.get(PROFILE_HEADER)):
+            request_id = request_id_or_new(request.headers.get('X-Request-ID'))
+            headers['X-Request-ID'] = request_id
+            stream = profile_stream(stream, request_id=request_id, tag='api.chat_stream')
+
+        async def events():
+            try:
+                # The generator is advanced one chunk at a time, so a slow
+                # client pauses generation instead of buffering it in memory.
+                async for chunk in iterate_in_threadpool(stream):
+                    if await request.is_disconnected():
+                        # Abandoned: stop generating for nobody
+                        deadline.token.cancel('client disconnected')
+                        break
+                    # Triage is computed before the first chunk: send it ahead of it
+                    while triage:
+                        yield sse_event(triage.pop(0), event="triage")
+                    yield sse_event({"delta": chunk})
+                    while sections:
+                        yield sse_event(sections.pop(0), event="section")
+                else:
+                    while sections:
+                        yield sse_event(sections.pop(0), event="section")
+                    yield sse_event({"session_id": body.session_id}, event="done")
+            finally:
+                await run_in_threadpool(stream.close)
+                slots.release()
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+    @app.get("/sessions/{session_id}/history", response_model=HistoryResponse)
+    async def get_history(session_id: str, request: Request, limit: int = Query(10, ge=1, le=100)):
+        history = await run_in_threadpool(request.app.state.chat_service.get_chat_history, session_id, limit)
+        return HistoryResponse(session_id=session_id, history=history)
+
+    @app.delete("/sessions/{session_id}/history")
+    async def clear_history(session_id: str, request: Request):
+        success = await run_in_threadpool(request.app.state.chat_service.clear_chat_history, session_id)
+        if not success:
+            raise HTTPException(status_code=500, detail="Failed to clear chat history")
+        return {"success": True}
+
+    @app.get("/sessions/{session_id}/search", response_model=SearchResponse)
+    async def search_history(session_id: str, request: Request, q: str = Query(..., min_length=1, max_length=500),
+                             since: Optional[datetime] = None, until: Optional[datetime] = None,
+                             limit: int = Query(20, ge=1, le=100), cursor: Optional[str] = None,
+                             section: Optional[str] = Query(None, max_length=64)):
+        # Scoped to one session: sessions are the only ownership boundary there is
+        try:
+            page = await run_in_threadpool(
+                request.app.state.chat_service.search_history, q, session_id, since, until, limit, cursor, section
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return SearchResponse(session_id=session_id, **page)
+
+    @app.post("/sessions/{session_id}/cancel")
+    async def cancel_request(session_id: str, request: Request):
+        cancelled = request.app.state.chat_service.cancel_session(session_id)
+        return {"cancelled": cancelled}
+
+    @app.get("/usage", dependencies=[Depends(require_admin)])
+    async def get_usage(request: Request, group_by: str = Query('message_type'),
+                        since: Optional[datetime] = None, until: Optional[datetime] = None,
+                        limit: int = Query(100, ge=1, le=1000)):
+        if group_by not in API_USAGE_GROUPS:
+            raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(API_USAGE_GROUPS)}")
+        try:
+            rollup = await run_in_threadpool(
+                request.app.state.chat_service.get_usage_rollup, group_by, since, until, limit
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"group_by": group_by, "rollup": rollup}
+
+    @app.get("/analytics/cohort", dependencies=[Depends(require_admin)])
+    async def get_cohort_report(request: Request):
+        try:
+            return await run_in_threadpool(request.app.state.chat_service.get_cohort_report)
+        except Exception as e:
+            print(f"Error building cohort report: {e}")
+            raise HTTPException(status_code=503, detail="Cohort report unavailable")
+
+    @app.get("/metrics")
+    async def get_metrics():
+        return metrics.snapshot()
+
+    return app
+
+
+app = create_app()
+
+
+def run(host: str = None, port: int = None, workers: int = None):
+    """Serve the API with uvicorn (multiple worker processes when workers > 1)"""
+    import uvicorn
+
+    uvicorn.run(
+        "api.app:app",
+        app_dir=src_path,
+        host=host or Config.API_HOST,
+        port=port or Config.API_PORT,
+        workers=workers or Config.API_WORKERS,
+        timeout_keep_alive=Config.API_KEEP_ALIVE,
+        limit_concurrency=Config.API_MAX_CONNECTIONS,
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,324 @@
+"""
+Lightweight session-affinity router for local worker processes.
+
+Accepts HTTP connections, works out the request's session ID and forwards
+the connection to the worker chosen by rendezvous hashing over the healthy
+workers. The same session always lands on the same worker while it is
+healthy, so per-process caches stay hot. If a worker drops out, only its
+own sessions move.
+
+Requests without a session ID (Streamlit's page, static files and
+WebSocket) are routed by an affinity cookie the router sets on the first
+response, so each browser sticks to one worker even when every client
+arrives from the same load balancer address.
+
+The router reads only the request and response heads (and a small JSON
+body when it needs the session ID from it); bodies are piped as raw bytes,
+so Server-Sent Events and WebSocket upgrades pass through unchanged.
+Client connections are kept alive and each request on them is routed on
+its own; the hop to the worker is one connection per request, so a
+response ends when the worker closes it.
+"""
+import asyncio
+import hashlib
+import json
+import secrets
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from utils.metrics import metrics
+
+MAX_HEAD_BYTES = 64 * 1024
+MAX_PEEK_BODY_BYTES = 64 * 1024
+PIPE_CHUNK_BYTES = 64 * 1024
+
+SERVICE_UNAVAILABLE = (
+    b"HTTP/1.1 503 Service Unavailable\r\n"
+    b"Content-Length: 0\r\nRetry-After: 1\r\nConnection: close\r\n\r\n"
+)
+BAD_REQUEST = b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+# Routes requests that carry no session ID (one value per browser)
+AFFINITY_COOKIE = 'router_affinity'
+# Hop-by-hop headers the router sets itself on each side
+CONNECTION_HEADERS = ('connection', 'keep-alive')
+
+
+class Backend:
+    """A worker process the router can forward to"""
+
+    def __init__(self, name: str, host: str, port: int):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.healthy = False
+        self.active_connections = 0
+
+    def __repr__(self):
+        return f"Backend({self.name}, {self.host}:{self.port}, healthy={self.healthy})"
+
+
+def rank_backends(key: str, backends: List[Backend]) -> List[Backend]:
+    """Order backends by rendezvous (highest random weight) hash for key"""
+    def weight(backend: Backend) -> int:
+        digest = hashlib.blake2b(f"{key}|{backend.name}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+    return sorted(backends, key=weight, reverse=True)
+
+
+def parse_request_head(head: bytes) -> Tuple[str, str, str, List[Tuple[str, str]]]:
+    """Split a raw request head into method, target, version and headers"""
+    first_line, headers = parse_head(head)
+    method, target, version = first_line.split(' ', 2)
+    return method, target, version, headers
+
+
+def parse_head(head: bytes) -> Tuple[str, List[Tuple[str, str]]]:
+    """Split a raw request or response head into its first line and headers"""
+    lines = head.decode('latin-1').split('\r\n')
+    headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, _, value = line.partition(':')
+        headers.append((name.strip(), value.strip()))
+    return lines[0], headers
+
+
+def header_value(headers: List[Tuple[str, str]], name: str) -> Optional[str]:
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def cookie_value(headers: List[Tuple[str, str]], name: str) -> Optional[str]:
+    cookies = header_value(headers, 'Cookie') or ''
+    for cookie in cookies.split(';'):
+        key, _, value = cookie.strip().partition('=')
+        if key == name and value:
+            return value
+    return None
+
+
+def format_head(first_line: str, headers: List[Tuple[str, str]]) -> bytes:
+    return (f"{first_line}\r\n" + ''.join(f"{name}: {value}\r\n" for name, value in headers) + "\r\n").encode('latin-1')
+
+
+def session_key(target: str, headers: List[Tuple[str, str]], body: bytes = b'') -> Optional[str]:
+    """Extract the session ID from a header, path, query, cookie or JSON body"""
+    explicit = header_value(headers, 'X-Session-ID')
+    if explicit:
+        return explicit
+
+    url = urlsplit(target)
+    parts = [part for part in url.path.split('/') if part]
+    if len(parts) >= 2 and parts[0] == 'sessions':
+        return parts[1]
+
+    query = parse_qs(url.query)
+    if query.get('session_id'):
+        return query['session_id'][0]
+
+    cookie = cookie_value(headers, 'session_id')
+    if cookie:
+        return cookie
+
+    if body:
+        try:
+            payload = json.loads(body)
+            if isinstance(payload, dict) and payload.get('session_id'):
+                return str(payload['session_id'])
+        except ValueError:
+            pass
+    return None
+
+
+class AffinityRouter:
+    """asyncio TCP front end that routes each connection by session affinity"""
+
+    def __init__(self, backends: List[Backend], host: str = '127.0.0.1', port: int = 8000,
+                 keep_alive: float = 30.0):
+        self.backends = backends
+        self.host = host
+        self.port = port
+        self.keep_alive = keep_alive  # seconds an idle client connection stays open
+        self._connections: Dict[asyncio.Task, Backend] = {}
+
+    def candidates(self, key: str) -> List[Backend]:
+        """Healthy backends in affinity order (all backends if none are healthy)"""
+        healthy = [backend for backend in self.backends if backend.healthy]
+        return rank_backends(key, healthy or self.backends)
+
+    async def serve(self, stop: asyncio.Event, drain_timeout: float = 30.0):
+        """Accept connections until stop is set, then drain in-flight ones"""
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"Router listening on http://{self.host}:{self.port}")
+        async with server:
+            await stop.wait()
+            server.close()
+            await server.wait_closed()
+            await self.drain(drain_timeout)
+
+    async def drain(self, timeout: float):
+        """Wait for in-flight connections to finish, cancelling stragglers"""
+        pending = list(self._connections)
+        if not pending:
+            return
+        print(f"Draining {len(pending)} connection(s)...")
+        done, still_running = await asyncio.wait(pending, timeout=timeout)
+        for task in still_running:
+            task.cancel()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        try:
+            first = True
+            while True:
+                try:
+                    read_head = reader.readuntil(b'\r\n\r\n')
+                    head = await (read_head if first else asyncio.wait_for(read_head, self.keep_alive))
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                    return
+                first = False
+                if not await self._handle_request(head, reader, writer, task):
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+    async def _handle_request(self, head: bytes, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                              task: asyncio.Task) -> bool:
+        """Route one request; True if the client connection can carry another"""
+        if len(head) > MAX_HEAD_BYTES:
+            writer.write(BAD_REQUEST)
+            return False
+        try:
+            method, target, version, headers = parse_request_head(head[:-4])
+        except ValueError:
+            writer.write(BAD_REQUEST)
+            return False
+
+        length = header_value(headers, 'Content-Length')
+        length = int(length) if length and length.isdigit() else 0
+        upgrade = (header_value(headers, 'Upgrade') or '').lower() == 'websocket'
+        # Bodies the router can't frame, and clients that asked for it, end the connection
+        persistent = not (
+            upgrade or version == 'HTTP/1.0'
+            or (header_value(headers, 'Connection') or '').lower() == 'close'
+            or 'chunked' in (header_value(headers, 'Transfer-Encoding') or '').lower()
+            or (header_value(headers, 'Expect') or '').lower() == '100-continue'
+        )
+
+        # Peek at small JSON bodies (POST /chat) to find the session ID
+        body = b''
+        if 0 < length <= MAX_PEEK_BODY_BYTES:
+            body = await reader.readexactly(length)
+        key = session_key(target, headers, body)
+        set_cookie = None
+        if key is None:
+            key = cookie_value(headers, AFFINITY_COOKIE)
+        if key is None:
+            key = secrets.token_urlsafe(16)
+            set_cookie = f"{AFFINITY_COOKIE}={key}; Path=/; HttpOnly; SameSite=Lax"
+
+        if not upgrade:
+            # The worker closes after its response, which is how the router knows it ended
+            headers = [(name, value) for name, value in headers if name.lower() not in CONNECTION_HEADERS]
+            headers.append(('Connection', 'close'))
+        prefix = format_head(f"{method} {target} {version}", headers) + body
+        return await self._forward(key, prefix, length - len(body), reader, writer, task, set_cookie, persistent)
+
+    async def _forward(self, key: str, prefix: bytes, remaining: int, reader: asyncio.StreamReader,
+                       writer: asyncio.StreamWriter, task: asyncio.Task, set_cookie: Optional[str],
+                       persistent: bool) -> bool:
+        for backend in self.candidates(key):
+            try:
+                upstream_reader, upstream_writer = await asyncio.open_connection(backend.host, backend.port)
+            except OSError:
+                metrics.increment('router.connect_failures')
+                continue
+            self._connections[task] = backend
+            backend.active_connections += 1
+            metrics.increment('router.requests')
+            try:
+                upstream_writer.write(prefix)
+                await upstream_writer.drain()
+                if persistent:
+                    # Exactly this request's body goes up; the next request stays in the reader
+                    request_pipe = asyncio.ensure_future(self._copy(reader, upstream_writer, remaining))
+                else:
+                    request_pipe = asyncio.ensure_future(self._pipe(reader, upstream_writer))
+                try:
+                    reuse = await self._relay_response(upstream_reader, writer, set_cookie, persistent)
+                    # A response sent before the whole body was read leaves the stream out of step
+                    reuse = (reuse and request_pipe.done() and not request_pipe.cancelled()
+                             and request_pipe.exception() is None)
+                finally:
+                    request_pipe.cancel()
+            finally:
+                backend.active_connections -= 1
+                # An idle keep-alive connection is not in flight
+                self._connections.pop(task, None)
+                upstream_writer.close()
+            return reuse
+        metrics.increment('router.unavailable')
+        writer.write(SERVICE_UNAVAILABLE)
+        await writer.drain()
+        return False
+
+    async def _relay_response(self, upstream_reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                              set_cookie: Optional[str], persistent: bool) -> bool:
+        """Send the worker's response on (adding the affinity cookie); True if the client may send another"""
+        try:
+            head = await upstream_reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as e:
+            writer.write(e.partial)
+            return False
+        except asyncio.LimitOverrunError:
+            await self._pipe(upstream_reader, writer)
+            return False
+        status_line, headers = parse_head(head[:-4])
+        parts = status_line.split(' ')
+        status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+        # The client can only find the end of a response with a length or chunked framing
+        framed = (header_value(headers, 'Content-Length') is not None
+                  or 'chunked' in (header_value(headers, 'Transfer-Encoding') or '').lower()
+                  or status in (204, 304))
+        reuse = persistent and framed and status >= 200
+        if status != 101:
+            headers = [(name, value) for name, value in headers if name.lower() not in CONNECTION_HEADERS]
+            headers.append(('Connection', 'keep-alive' if reuse else 'close'))
+        if set_cookie:
+            headers.append(('Set-Cookie', set_cookie))
+        writer.write(format_head(status_line, headers))
+        await self._pipe(upstream_reader, writer, eof=not reuse)
+        return reuse
+
+    @staticmethod
+    async def _copy(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, length: int):
+        """Copy exactly length bytes"""
+        while length > 0:
+            data = await reader.read(min(length, PIPE_CHUNK_BYTES))
+            if not data:
+                raise asyncio.IncompleteReadError(b'', length)
+            length -= len(data)
+            writer.write(data)
+            await writer.drain()
+
+    @staticmethod
+    async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, eof: bool = True):
+        try:
+            while True:
+                data = await reader.read(PIPE_CHUNK_BYTES)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+            if eof and writer.can_write_eof():
+                writer.write_eof()
+        except (ConnectionError, OSError):
+            pass
@@ -0,0 +1,197 @@
+"""
+Multi-process supervisor for the medical assistant.
+
+Starts N single-process workers (the chat API or Streamlit) on consecutive
+local ports, health-checks them, restarts any that exit or stop answering,
+and fronts them with the session-affinity router. On SIGINT/SIGTERM the
+router stops accepting connections and drains in-flight ones. After that
+the workers get SIGTERM and a grace period before they are killed.
+"""
+import asyncio
+import signal
+import subprocess
+import sys
+import os
+import threading
+import time
+import urllib.request
+from typing import List, Optional
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+project_root = os.path.dirname(src_path)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from api.router import AffinityRouter, Backend
+from utils.metrics import metrics
+
+HEALTH_PATHS = {
+    'api': '/healthz',
+    'streamlit': '/_stcore/health',
+}
+
+
+class WorkerProcess:
+    """One supervised worker process"""
+
+    def __init__(self, index: int, kind: str, host: str, port: int):
+        self.index = index
+        self.kind = kind
+        self.backend = Backend(f"worker-{index}", host, port)
+        self.process: Optional[subprocess.Popen] = None
+        self.health_failures = 0
+        self.restarts = 0
+        self.started_at = 0.0
+
+    def command(self) -> List[str]:
+        host, port = self.backend.host, str(self.backend.port)
+        if self.kind == 'api':
+            return [
+                sys.executable, "-m", "uvicorn", "api.app:app",
+                "--app-dir", src_path,
+                "--host", host, "--port", port,
+                "--timeout-keep-alive", str(Config.API_KEEP_ALIVE),
+                "--limit-concurrency", str(Config.API_MAX_CONNECTIONS),
+            ]
+        return [
+            sys.executable, "-m", "streamlit", "run",
+            os.path.join(project_root, 'streamlit_app.py'),
+            f"--server.port={port}",
+            f"--server.address={host}",
+            "--server.headless=true",
+        ]
+
+    @property
+    def health_url(self) -> str:
+        return f"http://{self.backend.host}:{self.backend.port}{HEALTH_PATHS[self.kind]}"
+
+    def start(self):
+        self.process = subprocess.Popen(self.command(), cwd=project_root)
+        self.backend.healthy = False
+        self.health_failures = 0
+        self.started_at = time.monotonic()
+        print(f"Started {self.backend.name} ({self.kind}) on port {self.backend.port} [pid {self.process.pid}]")
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def terminate(self):
+        if self.alive():
+            self.process.terminate()
+
+    def wait(self, timeout: float):
+        """Wait for the process to exit, killing it after timeout"""
+        if self.process is None:
+            return
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            print(f"{self.backend.name} did not exit in time, killing it")
+            self.process.kill()
+            self.process.wait()
+
+    def restart(self, reason: str):
+        print(f"Restarting {self.backend.name}: {reason}")
+        self.backend.healthy = False
+        self.terminate()
+        self.wait(timeout=10)
+        self.restarts += 1
+        metrics.increment('supervisor.restarts')
+        self.start()
+
+
+class Supervisor:
+    """Run, health-check and route to N worker processes"""
+
+    # Grace period before failed health checks count against a fresh worker
+    STARTUP_GRACE = 30.0
+
+    def __init__(self, kind: str = 'api', workers: int = None, host: str = None, port: int = None):
+        if kind not in HEALTH_PATHS:
+            raise ValueError(f"Unknown worker kind: {kind}")
+        self.kind = kind
+        self.host = host or Config.API_HOST
+        self.port = port or (Config.API_PORT if kind == 'api' else 8501)
+        count = max(1, workers or Config.SUPERVISOR_WORKERS)
+        self.workers = [
+            WorkerProcess(index, kind, '127.0.0.1', self.port + 1 + index)
+            for index in range(count)
+        ]
+        self.router = AffinityRouter([worker.backend for worker in self.workers], self.host, self.port,
+                                     keep_alive=Config.API_KEEP_ALIVE)
+        self._stopping = threading.Event()
+
+    def check(self, worker: WorkerProcess):
+        """Health-check one worker, restarting it if it died or stopped answering"""
+        if self._stopping.is_set():
+            return
+        if not worker.alive():
+            worker.restart(f"exited with code {worker.process.returncode}")
+            return
+        try:
+            with urllib.request.urlopen(worker.health_url, timeout=2) as response:
+                ok = response.status == 200
+        except Exception:
+            ok = False
+        if ok:
+            worker.backend.healthy = True
+            worker.health_failures = 0
+            return
+        worker.backend.healthy = False
+        if time.monotonic() - worker.started_at < self.STARTUP_GRACE:
+            return
+        worker.health_failures += 1
+        if worker.health_failures >= Config.SUPERVISOR_MAX_HEALTH_FAILURES:
+            worker.restart(f"{worker.health_failures} failed health checks")
+
+    def _health_loop(self):
+        while not self._stopping.wait(Config.SUPERVISOR_HEALTH_INTERVAL):
+            for worker in self.workers:
+                self.check(worker)
+            metrics.set_gauge('supervisor.healthy_workers',
+                              sum(1 for worker in self.workers if worker.backend.healthy))
+
+    def _wait_for_first_health(self, timeout: float = 60.0):
+        """Block until every worker answers its health check (or timeout)"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for worker in self.workers:
+                if not worker.backend.healthy:
+                    self.check(worker)
+            if all(worker.backend.healthy for worker in self.workers):
+                return
+            time.sleep(0.5)
+        print("Warning: not all workers became healthy before the router started")
+
+    async def _serve(self):
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stop.set))
+        await self.router.serve(stop, drain_timeout=Config.SUPERVISOR_DRAIN_TIMEOUT)
+
+    def run(self):
+        """Start workers and the router; blocks until shutdown"""
+        for worker in self.workers:
+            worker.start()
+        try:
+            self._wait_for_first_health()
+            threading.Thread(target=self._health_loop, name='supervisor-health', daemon=True).start()
+            asyncio.run(self._serve())
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Stop health checks, then terminate workers gracefully"""
+        self._stopping.set()
+        print("Stopping workers...")
+        for worker in self.workers:
+            worker.terminate()
+        for worker in self.workers:
+            worker.wait(timeout=Config.SUPERVISOR_DRAIN_TIMEOUT)
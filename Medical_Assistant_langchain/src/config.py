@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -13,19 +14,215 @@ class Config:
     # Supabase Configuration
     SUPABASE_URL = os.getenv('SUPABASE_URL')
     SUPABASE_KEY = os.getenv('SUPABASE_KEY')
+    SUPABASE_TIMEOUT = float(os.getenv('SUPABASE_TIMEOUT', '5'))  # seconds per PostgREST request
     
     # Application Configuration
     MAX_CHAT_HISTORY = 10
     DEFAULT_TEMPERATURE = 0.7
-    
+
+    # Request Deadlines
+    CHAT_DEADLINE = float(os.getenv('CHAT_DEADLINE', '90'))  # seconds for a whole chat request
+    CHAT_HISTORY_SHARE = float(os.getenv('CHAT_HISTORY_SHARE', '0.1'))  # of the deadline for loading history
+    CHAT_PERSIST_SHARE = float(os.getenv('CHAT_PERSIST_SHARE', '0.1'))  # of the deadline kept back for saving
+    LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))  # per upstream Gemini request
+
+    # Generation Profiles
+    GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+    GEMINI_LIGHT_MODEL = os.getenv('GEMINI_LIGHT_MODEL', 'gemini-1.5-flash-8b')  # cheap tier for routed small talk/drug info
+    DEFAULT_MESSAGE_TYPE = 'medical_query'
+    # Per message_type output budget, sampling and model ('model': None uses
+    # GEMINI_MODEL). Output length drives most of the latency, so short
+    # answers get small budgets and long consultations get room to finish.
+    GENERATION_PROFILES = {
+        'medical_query': {'max_tokens': 1024, 'temperature': 0.7, 'stop': None, 'model': None},
+        'follow_up': {'max_tokens': 384, 'temperature': 0.7, 'stop': None, 'model': None},
+        'medication_inquiry': {'max_tokens': 1536, 'temperature': 0.3, 'stop': None, 'model': None},
+        'first_aid_inquiry': {'max_tokens': 768, 'temperature': 0.2, 'stop': None, 'model': None},
+        'comprehensive_consultation': {'max_tokens': 4096, 'temperature': 0.5, 'stop': None, 'model': None},
+        'medication_prescription': {'max_tokens': 2048, 'temperature': 0.2, 'stop': None, 'model': None},
+        'symptom_analysis': {'max_tokens': 1024, 'temperature': 0.5, 'stop': None, 'model': None},
+        'health_recommendations': {'max_tokens': 1024, 'temperature': 0.7, 'stop': None, 'model': None},
+        # Intent-routed types (see services/intent_router.py)
+        'small_talk': {'max_tokens': 128, 'temperature': 0.7, 'stop': None, 'model': GEMINI_LIGHT_MODEL},
+        'drug_info': {'max_tokens': 768, 'temperature': 0.3, 'stop': None, 'model': GEMINI_LIGHT_MODEL},
+        'emergency': {'max_tokens': 768, 'temperature': 0.2, 'stop': None, 'model': None},
+    }
+    # JSON overrides merged per type, e.g.
+    # GENERATION_PROFILES_JSON='{"comprehensive_consultation": {"model": "gemini-1.5-pro"}}'
+    GENERATION_PROFILE_OVERRIDES = json.loads(os.getenv('GENERATION_PROFILES_JSON') or '{}')
+
+    # API Server Configuration
+    API_HOST = os.getenv('API_HOST', '127.0.0.1')
+    API_PORT = int(os.getenv('API_PORT', '8000'))
+    API_WORKERS = int(os.getenv('API_WORKERS', '1'))
+    API_KEEP_ALIVE = int(os.getenv('API_KEEP_ALIVE', '30'))        # seconds an idle connection stays open
+    API_MAX_CONNECTIONS = int(os.getenv('API_MAX_CONNECTIONS', '200'))  # per worker; beyond this uvicorn answers 503
+    API_MAX_INFLIGHT = int(os.getenv('API_MAX_INFLIGHT', '16'))    # concurrent LLM calls per worker
+    API_QUEUE_TIMEOUT = float(os.getenv('API_QUEUE_TIMEOUT', '5'))  # seconds to wait for an LLM slot
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')  # bearer token for the admin endpoints (/usage); unset disables them
+
+    # Set to the API server URL to make Streamlit a thin client of it
+    API_BASE_URL = os.getenv('API_BASE_URL')
+
+    # Transcript Storage Configuration
+    DATA_DIR = os.getenv('DATA_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data'))
+    # Trained zstd dictionaries; must be shared by every replica that reads transcripts
+    TRANSCRIPT_DICT_DIR = os.getenv('TRANSCRIPT_DICT_DIR', os.path.join(DATA_DIR, 'zstd_dicts'))
+    TRANSCRIPT_COMPRESSION_LEVEL = int(os.getenv('TRANSCRIPT_COMPRESSION_LEVEL', '6'))
+    TRANSCRIPT_MIN_COMPRESS_BYTES = int(os.getenv('TRANSCRIPT_MIN_COMPRESS_BYTES', '64'))
+    ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '30'))
+    ARCHIVE_PARQUET_DIR = os.getenv('ARCHIVE_PARQUET_DIR')  # archive to local Parquet instead of the archive table
+    COMPACTION_INTERVAL = float(os.getenv('COMPACTION_INTERVAL', '3600'))
+    COMPACTION_BATCH_SESSIONS = int(os.getenv('COMPACTION_BATCH_SESSIONS', '100'))
+
+    # Retention Configuration
+    CHAT_RETENTION_DAYS = int(os.getenv('CHAT_RETENTION_DAYS', '365'))  # 0 keeps transcripts forever
+    PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', '1000'))
+    PURGE_INTERVAL = float(os.getenv('PURGE_INTERVAL', '60'))
+    PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', '3'))
+
+    # LLM Scheduler Configuration (services/llm_scheduler.py)
+    LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '16'))  # upstream LLM calls at once per process
+    LLM_BACKGROUND_SLOTS = int(os.getenv('LLM_BACKGROUND_SLOTS', '2'))  # of those, usable by background work
+    LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', '256'))  # waiting calls before background ones are dropped
+    LLM_EMERGENCY_MESSAGE_TYPES = tuple(
+        os.getenv('LLM_EMERGENCY_MESSAGE_TYPES', 'emergency,first_aid_inquiry').split(',')
+    )  # served before all other calls
+
+    # Generation Memo Configuration (services/generation_memo.py)
+    GENERATION_MEMO_ENABLED = os.getenv('GENERATION_MEMO_ENABLED', 'true').lower() == 'true'  # needs migration 006
+    GENERATION_MEMO_MAX_AGE_DAYS = float(os.getenv('GENERATION_MEMO_MAX_AGE_DAYS', '30'))  # regenerate older answers
+    GENERATION_MEMO_CACHE_SIZE = int(os.getenv('GENERATION_MEMO_CACHE_SIZE', '1000'))  # entries kept in memory
+
+    # Guardrails Configuration (services/guardrails.py)
+    GUARDRAILS_ENABLED = os.getenv('GUARDRAILS_ENABLED', 'true').lower() == 'true'
+    GUARDRAIL_INPUT_TIMEOUT = float(os.getenv('GUARDRAIL_INPUT_TIMEOUT', '0.05'))  # seconds to wait for the worker once history is loaded; then checked inline
+    GUARDRAIL_HOLDBACK_CHARS = int(os.getenv('GUARDRAIL_HOLDBACK_CHARS', '48'))  # streamed text held until checked
+    GUARDRAIL_DOSE_LIMITS_JSON = os.getenv('GUARDRAIL_DOSE_LIMITS_JSON')  # extra max daily doses in mg, by drug
+
+    # History Selection Configuration (services/history_index.py)
+    HISTORY_SELECTION_ENABLED = os.getenv('HISTORY_SELECTION_ENABLED', 'true').lower() == 'true'
+    HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', '1500'))  # estimated prompt tokens of history
+    HISTORY_RECENT_TURNS = int(os.getenv('HISTORY_RECENT_TURNS', '2'))  # latest turns always considered first
+    HISTORY_TOP_K = int(os.getenv('HISTORY_TOP_K', '4'))  # older turns picked by similarity to the message
+    HISTORY_MIN_SIMILARITY = float(os.getenv('HISTORY_MIN_SIMILARITY', '0.1'))  # cosine; less similar turns are left out
+    HISTORY_EMBEDDING_DIM = int(os.getenv('HISTORY_EMBEDDING_DIM', '256'))
+    HISTORY_EMBED_CHARS = int(os.getenv('HISTORY_EMBED_CHARS', '2000'))  # of each turn's text that is embedded
+    HISTORY_INDEX_MAX_TURNS = int(os.getenv('HISTORY_INDEX_MAX_TURNS', '200'))  # turns indexed per session
+    HISTORY_INDEX_MAX_SESSIONS = int(os.getenv('HISTORY_INDEX_MAX_SESSIONS', '1000'))  # sessions kept in memory
+
+    # Transcript Search Configuration (database/transcript_search.py)
+    TRANSCRIPT_SEARCH_ENABLED = os.getenv('TRANSCRIPT_SEARCH_ENABLED', 'true').lower() == 'true'  # needs migration 005
+    SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '20'))
+    SEARCH_SNIPPET_CHARS = int(os.getenv('SEARCH_SNIPPET_CHARS', '200'))
+
+    # Transcript Export Configuration (database/transcript_export.py)
+    EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', '1000'))  # rows per keyset page
+    EXPORT_PAGE_PAUSE = float(os.getenv('EXPORT_PAGE_PAUSE', '0'))  # seconds between pages, to go easy on the API
+    EXPORT_ROWS_PER_FILE = int(os.getenv('EXPORT_ROWS_PER_FILE', '500000'))  # Parquet part file size
+
+    # Storage Circuit Breaker Configuration (database/resilient_store.py)
+    STORAGE_BREAKER_FAILURES = int(os.getenv('STORAGE_BREAKER_FAILURES', '3'))  # consecutive failures before opening
+    STORAGE_BREAKER_RESET = float(os.getenv('STORAGE_BREAKER_RESET', '30'))  # seconds open before a trial call
+    STORAGE_SLOW_CALL_SECONDS = float(os.getenv('STORAGE_SLOW_CALL_SECONDS', '2'))  # slower calls count as failures
+    # Writes made while the breaker is open, replayed once it closes
+    STORAGE_JOURNAL_DIR = os.getenv('STORAGE_JOURNAL_DIR', os.path.join(DATA_DIR, 'storage_journal'))
+    DEGRADED_MAX_SESSIONS = int(os.getenv('DEGRADED_MAX_SESSIONS', '1000'))  # sessions kept in memory
+    DEGRADED_HISTORY_SIZE = int(os.getenv('DEGRADED_HISTORY_SIZE', '50'))  # turns kept per session
+
+    # Shared Cache Configuration (utils/tiered_cache.py, database/cached_store.py)
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')  # e.g. redis://cache:6379/0; unset disables the shared cache
+    CACHE_PREFIX = os.getenv('CACHE_PREFIX', 'medassist')
+    CACHE_KEY_VERSION = os.getenv('CACHE_KEY_VERSION', '1')  # change to retire every cached entry at once
+    CACHE_TTL = float(os.getenv('CACHE_TTL', '3600'))  # seconds an entry lives in Redis
+    CACHE_L1_ENTRIES = int(os.getenv('CACHE_L1_ENTRIES', '5000'))  # in-process entries per replica
+    CACHE_L1_TTL = float(os.getenv('CACHE_L1_TTL', '30'))  # bounds staleness if an invalidation is missed
+    CACHE_COMPRESS_MIN_BYTES = int(os.getenv('CACHE_COMPRESS_MIN_BYTES', '512'))
+    CACHE_TIMEOUT = float(os.getenv('CACHE_TIMEOUT', '0.1'))  # seconds per Redis call
+    CACHE_BREAKER_FAILURES = int(os.getenv('CACHE_BREAKER_FAILURES', '3'))
+    CACHE_BREAKER_RESET = float(os.getenv('CACHE_BREAKER_RESET', '30'))
+    CACHE_SLOW_CALL_SECONDS = float(os.getenv('CACHE_SLOW_CALL_SECONDS', '0.05'))
+
+    # Traffic Capture Configuration (services/traffic_capture.py)
+    TRAFFIC_CAPTURE_DIR = os.getenv('TRAFFIC_CAPTURE_DIR')  # per-process capture logs; unset disables capture
+    TRAFFIC_CAPTURE_SECONDS = float(os.getenv('TRAFFIC_CAPTURE_SECONDS', '0'))  # stop recording after this long (0 = never)
+    TRAFFIC_CAPTURE_FLUSH_EVENTS = int(os.getenv('TRAFFIC_CAPTURE_FLUSH_EVENTS', '100'))  # events between flushes
+
+    # Structured Output Configuration (services/structured_output.py)
+    STRUCTURED_OUTPUT_ENABLED = os.getenv('STRUCTURED_OUTPUT_ENABLED', 'false').lower() == 'true'  # JSON answers per message_type schema
+    STORE_SECTIONS = os.getenv('STORE_SECTIONS', 'true').lower() == 'true'  # needs migration 007 on Supabase
+
+    # Symptom Ontology Configuration (services/symptom_ontology.py)
+    SYMPTOM_ONTOLOGY_PATH = os.getenv('SYMPTOM_ONTOLOGY_PATH')  # JSON extending the built-in symptoms/conditions
+    SYMPTOM_TRIAGE_ENABLED = os.getenv('SYMPTOM_TRIAGE_ENABLED', 'true').lower() == 'true'  # preliminary differential while streaming
+    SYMPTOM_TRIAGE_MESSAGE_TYPES = tuple(
+        os.getenv('SYMPTOM_TRIAGE_MESSAGE_TYPES', 'medical_query,symptom_analysis,comprehensive_consultation,emergency').split(',')
+    )
+    SYMPTOM_TRIAGE_MAX_CONDITIONS = int(os.getenv('SYMPTOM_TRIAGE_MAX_CONDITIONS', '5'))
+    SYMPTOM_TRIAGE_MIN_PROBABILITY = float(os.getenv('SYMPTOM_TRIAGE_MIN_PROBABILITY', '0.02'))  # smaller ones aren't shown
+
+    # Cohort Analytics Configuration (services/cohort_analytics.py)
+    COHORT_CHUNK_SIZE = int(os.getenv('COHORT_CHUNK_SIZE', '5000'))  # profiles read and held per page
+    COHORT_TOP_TERMS = int(os.getenv('COHORT_TOP_TERMS', '20'))  # conditions/medications/allergies listed
+    COHORT_REPORT_TTL = float(os.getenv('COHORT_REPORT_TTL', '300'))  # seconds the API reuses a report
+    COHORT_MIN_COUNT = int(os.getenv('COHORT_MIN_COUNT', '10'))  # smaller counts are suppressed (k-anonymity)
+
+    # Usage Ledger Configuration (services/usage_ledger.py)
+    USAGE_LEDGER_ENABLED = os.getenv('USAGE_LEDGER_ENABLED', 'true').lower() == 'true'
+    USAGE_BATCH_SIZE = int(os.getenv('USAGE_BATCH_SIZE', '200'))
+    USAGE_FLUSH_INTERVAL = float(os.getenv('USAGE_FLUSH_INTERVAL', '5'))  # seconds between batch writes
+    USAGE_MAX_PENDING = int(os.getenv('USAGE_MAX_PENDING', '10000'))  # records kept while writes fail
+
+    # Intent Router Configuration
+    INTENT_ROUTER_ENABLED = os.getenv('INTENT_ROUTER_ENABLED', 'true').lower() == 'true'
+    INTENT_MIN_CONFIDENCE = float(os.getenv('INTENT_MIN_CONFIDENCE', '0.3'))  # below this the full medical prompt is used
+    INTENT_MODEL_PATH = os.getenv('INTENT_MODEL_PATH')  # retrained model (.npz); built-in examples otherwise
+    ROUTING_LOG_PATH = os.getenv('ROUTING_LOG_PATH')  # opt-in decision log for retraining (PII scrubbed, no session IDs)
+    ROUTING_LOG_MAX_BYTES = int(os.getenv('ROUTING_LOG_MAX_BYTES', str(5 * 1024 * 1024)))  # rolled over at this size
+    ROUTING_LOG_BACKUPS = int(os.getenv('ROUTING_LOG_BACKUPS', '2'))  # rolled-over files kept
+
+    # Warm-up and Quick Answers Configuration
+    WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+    WARMUP_LLM_PING = os.getenv('WARMUP_LLM_PING', 'true').lower() == 'true'  # tiny call to open the LLM connection
+    QUICK_ANSWERS_PATH = os.getenv('QUICK_ANSWERS_PATH', os.path.join(DATA_DIR, 'quick_answers.json'))
+    QUICK_ANSWERS_MAX_AGE = float(os.getenv('QUICK_ANSWERS_MAX_AGE', '86400'))  # regenerate answers older than this
+    QUICK_ANSWERS_REFRESH_INTERVAL = float(os.getenv('QUICK_ANSWERS_REFRESH_INTERVAL', '3600'))  # 0 disables
+
+    # Request Profiling Configuration (utils/profiling.py)
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # fraction of requests profiled; 0 disables
+    PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')  # X-Profile header / ?profile= value that forces a profile; unset disables
+    PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.002'))  # seconds between stack samples
+    PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(DATA_DIR, 'profiles'))
+
+    # Supervisor Configuration (central.py --supervise)
+    SUPERVISOR_WORKERS = int(os.getenv('SUPERVISOR_WORKERS', str(os.cpu_count() or 1)))
+    SUPERVISOR_HEALTH_INTERVAL = float(os.getenv('SUPERVISOR_HEALTH_INTERVAL', '5'))
+    SUPERVISOR_MAX_HEALTH_FAILURES = int(os.getenv('SUPERVISOR_MAX_HEALTH_FAILURES', '3'))
+    SUPERVISOR_DRAIN_TIMEOUT = float(os.getenv('SUPERVISOR_DRAIN_TIMEOUT', '30'))
+
+    @staticmethod
+    def generation_profile(message_type: str = None) -> dict:
+        """Generation settings for a message_type (unknown types use the default profile)"""
+        message_type = message_type or Config.DEFAULT_MESSAGE_TYPE
+        profile = Config.GENERATION_PROFILES.get(message_type,
+                                                 Config.GENERATION_PROFILES[Config.DEFAULT_MESSAGE_TYPE])
+        profile = {**profile, **Config.GENERATION_PROFILE_OVERRIDES.get(message_type, {})}
+        return {**profile, 'model': profile.get('model') or Config.GEMINI_MODEL}
+
     @staticmethod
     def validate_config():
-        """Validate that all required configuration is present"""
+        """Validate that all required configuration is present
+
+        Supabase settings are only required without STORAGE_JOURNAL_DIR:
+        with it, the chat store starts in degraded mode (history in memory,
+        writes journaled) and a missing Supabase setup is just reported.
+        """
         required_vars = {
             'GEMINI_API_KEY': 'Google Gemini API key',
             'SUPABASE_URL': 'Supabase project URL', 
             'SUPABASE_KEY': 'Supabase anon key'
         }
+        storage_vars = ('SUPABASE_URL', 'SUPABASE_KEY')
         missing_vars = []
         invalid_vars = []
         
@@ -42,6 +239,14 @@ class Config:
                   value == 'YOUR_SUPABASE_KEY'):
                 invalid_vars.append(f"{var} ({description})")
         
+        if Config.STORAGE_JOURNAL_DIR:
+            unset = [var for var in missing_vars + invalid_vars if var.split(' ')[0] in storage_vars]
+            if unset:
+                print(f"Supabase is not configured ({', '.join(unset)}): "
+                      f"running on in-memory history with writes journaled to {Config.STORAGE_JOURNAL_DIR}")
+                missing_vars = [var for var in missing_vars if var not in unset]
+                invalid_vars = [var for var in invalid_vars if var not in unset]
+
         if missing_vars or invalid_vars:
             error_msg = "Configuration Error:\n"
             if missing_vars:
@@ -0,0 +1,120 @@
+"""
+Chat and profile store behind the shared cache tier.
+
+Wraps a store (usually a ResilientStore or SupabaseManager) and caches
+session history, user profiles and generation memos in a TieredCache, so
+a session that moves to another replica finds them warm. Writes go to the
+store first and then invalidate the cached copy (memos, which never change
+once written, are cached as saved); every other
+replica drops its L1 copy on the invalidation message.
+Methods other than the cached ones are delegated to the store directly.
+"""
+from typing import Any, Dict, List, Optional
+import sys
+import os
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from utils.tiered_cache import TieredCache, get_shared_cache
+
+# Cache namespaces; bump a suffix when the shape of its values changes
+HISTORY = 'history.v3'
+PROFILE = 'profile.v1'
+MEMO = 'memo.v1'
+
+
+class CachedStore:
+    """Store wrapper reading history, profiles and memos through a TieredCache
+
+    History entries hold the latest `limit` rows of a session (oldest
+    first, as the stores return them) with the largest limit fetched, so
+    any smaller window is served from their tail.
+    """
+
+    def __init__(self, store, cache: TieredCache):
+        self.store = store
+        self.cache = cache
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.store, name)
+
+    # History
+
+    def get_chat_history(self, session_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        entry = self.cache.get(HISTORY, session_id)
+        # A shorter list than was asked for is the whole session
+        if entry is not None and (limit <= entry['limit'] or len(entry['rows']) < entry['limit']):
+            return entry['rows'][-limit:]
+        rows = self.store.get_chat_history(session_id, limit)
+        if rows:
+            # Empty results aren't cached: the store returns [] on errors too
+            self.cache.set(HISTORY, session_id, {'limit': limit, 'rows': rows})
+        return rows
+
+    def save_chat_message(self, session_id: str, message: str, response: str,
+                          message_type: str = 'medical_query', timestamp: str = None,
+                          sections: Dict[str, str] = None) -> Dict[str, Any]:
+        saved = self.store.save_chat_message(session_id, message, response, message_type, timestamp, sections)
+        # Dropped rather than appended to: two replicas appending to the window they
+        # each read would both write back a copy missing the other's turn
+        self.cache.invalidate(HISTORY, session_id)
+        return saved
+
+    def delete_chat_history(self, session_id: str, deleted_at: str = None) -> bool:
+        deleted = self.store.delete_chat_history(session_id, deleted_at)
+        self.cache.invalidate(HISTORY, session_id)
+        return deleted
+
+    def delete_sessions(self, session_ids: List[str]) -> bool:
+        deleted = self.store.delete_sessions(session_ids)
+        self.cache.invalidate(HISTORY, *session_ids)
+        return deleted
+
+    # Profiles
+
+    def get_user_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        profile = self.cache.get(PROFILE, user_id)
+        if profile is None:
+            profile = self.store.get_user_profile(user_id)
+            if profile is None:
+                return None
+            self.cache.set(PROFILE, user_id, profile)
+        # Callers may edit the profile they get; the cached one stays as stored
+        return dict(profile, health_info=dict(profile.get('health_info') or {}))
+
+    def update_user_health_info(self, user_id: str, health_info: Dict[str, Any]) -> bool:
+        updated = self.store.update_user_health_info(user_id, health_info)
+        self.cache.invalidate(PROFILE, user_id)
+        return updated
+
+    # Generation memos
+
+    def get_generation_memo(self, key: str) -> Optional[Dict[str, Any]]:
+        memo = self.cache.get(MEMO, key)
+        if memo is None:
+            memo = self.store.get_generation_memo(key)
+            if memo is not None:
+                self.cache.set(MEMO, key, memo)
+        return memo
+
+    def save_generation_memo(self, memo: Dict[str, Any]) -> bool:
+        saved = self.store.save_generation_memo(memo)
+        if saved:
+            self.cache.set(MEMO, memo['key'], memo)
+        return saved
+
+
+def with_shared_cache(store):
+    """store behind the shared cache when CACHE_REDIS_URL is set, else store itself"""
+    try:
+        cache = get_shared_cache()
+    except Exception as e:
+        print(f"Shared cache unavailable, using the store directly: {e}")
+        return store
+    return CachedStore(store, cache) if cache is not None else store
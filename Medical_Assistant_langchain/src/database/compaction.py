@@ -0,0 +1,114 @@
+import argparse
+from datetime import datetime, timedelta
+import sys
+import os
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from utils.metrics import metrics
+from utils.periodic import PeriodicJob
+
+
+class TranscriptCompactor(PeriodicJob):
+    """Background job that moves idle sessions to the cold transcript tier.
+
+    `store` is a SupabaseManager or SQLiteManager. When an archive
+    (ParquetArchive) is configured, cold sessions are copied to Parquet
+    and then deleted from the hot table; otherwise the store moves them
+    into its archive table itself.
+    """
+
+    name = 'transcript-compactor'
+
+    def __init__(self, store, archive=None, older_than_days: int = None,
+                 interval: float = None, batch_sessions: int = None):
+        super().__init__(interval if interval is not None else Config.COMPACTION_INTERVAL)
+        self.store = store
+        self.archive = archive if archive is not None else getattr(store, 'archive', None)
+        self.older_than_days = older_than_days if older_than_days is not None else Config.ARCHIVE_AFTER_DAYS
+        self.batch_sessions = batch_sessions or Config.COMPACTION_BATCH_SESSIONS
+
+    def _archive_batch(self, cutoff: datetime) -> int:
+        """Archive one batch of cold sessions, returning the number of sessions handled"""
+        if self.archive is None:
+            moved = self.store.archive_sessions(cutoff, self.batch_sessions)
+            metrics.increment('compaction.rows', moved)
+            # The RPC reports rows, not sessions; a short batch means we're done
+            return self.batch_sessions if moved else 0
+
+        session_ids = self.store.get_cold_sessions(cutoff, self.batch_sessions)
+        if not session_ids:
+            return 0
+        rows = self.store.get_archive_rows(session_ids)
+        # Only delete from the hot table once the Parquet file is on disk
+        self.archive.write(rows)
+        if not self.store.delete_sessions(session_ids):
+            raise RuntimeError("archived sessions could not be removed from the hot table")
+        metrics.increment('compaction.rows', len(rows))
+        return len(session_ids)
+
+    def run_once(self) -> int:
+        """Archive every session idle for longer than older_than_days"""
+        cutoff = datetime.now() - timedelta(days=self.older_than_days)
+        total = 0
+        try:
+            with metrics.stage('compaction'):
+                while not self.stopping:
+                    handled = self._archive_batch(cutoff)
+                    total += handled
+                    if handled < self.batch_sessions:
+                        break
+            metrics.increment('compaction.runs')
+        except Exception as e:
+            metrics.increment('compaction.errors')
+            print(f"Error compacting transcripts: {e}")
+        return total
+
+
+def create_store(sqlite_path: str = None):
+    """Storage manager with the configured archive tier"""
+    if sqlite_path:
+        from database.sqlite_manager import SQLiteManager
+        archive = None
+        if Config.ARCHIVE_PARQUET_DIR:
+            from database.transcript_archive import ParquetArchive
+            archive = ParquetArchive(Config.ARCHIVE_PARQUET_DIR)
+        return SQLiteManager(sqlite_path, archive=archive)
+    from database.supabase_manager import SupabaseManager
+    return SupabaseManager()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive idle chat sessions to the cold transcript tier")
+    parser.add_argument('--once', action='store_true', help='Run a single compaction pass and exit')
+    parser.add_argument('--train-dictionary', type=int, metavar='N',
+                        help='Train a zstd dictionary from the N most recent responses and exit')
+    parser.add_argument('--sqlite', help='Compact a local SQLite database instead of Supabase')
+    parser.add_argument('--older-than-days', type=int, default=Config.ARCHIVE_AFTER_DAYS)
+    args = parser.parse_args()
+
+    store = create_store(args.sqlite)
+
+    if args.train_dictionary:
+        dict_id = store.codec.train_dictionary(store.sample_responses(args.train_dictionary))
+        if dict_id is None:
+            sys.exit(1)
+        print(f"Trained compression dictionary {dict_id}")
+        return
+
+    compactor = TranscriptCompactor(store, older_than_days=args.older_than_days)
+    if args.once:
+        print(f"Archived {compactor.run_once()} sessions")
+        return
+
+    print(f"Compacting every {compactor.interval:.0f}s (Ctrl+C to stop)")
+    compactor.run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+-- Compressed, tiered transcript storage for chat_conversations.
+--
+-- New rows store the LLM response compressed in `response_body` (base64 of
+-- the compressed bytes) with the codec name in `codec` ('raw', 'zlib',
+-- 'zstd' or 'zstd:<dict_id>'). Legacy rows keep plaintext `response` with
+-- codec NULL and are read as before.
+--
+-- Sessions idle for longer than the archive threshold are moved to
+-- chat_conversations_archive by archive_chat_sessions(), which the
+-- compaction job (src/database/compaction.py) calls in batches.
+
+CREATE TABLE IF NOT EXISTS chat_conversations (
+    id uuid PRIMARY KEY,
+    session_id text NOT NULL,
+    message text,
+    response text,
+    message_type text,
+    timestamp timestamptz NOT NULL DEFAULT now()
+);
+
+ALTER TABLE chat_conversations
+    ADD COLUMN IF NOT EXISTS response_body text,
+    ADD COLUMN IF NOT EXISTS codec text;
+
+-- History reads filter by session and order by time
+CREATE INDEX IF NOT EXISTS idx_chat_conversations_session_timestamp
+    ON chat_conversations (session_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS chat_conversations_archive (
+    LIKE chat_conversations INCLUDING DEFAULTS,
+    archived_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_chat_conversations_archive_session_timestamp
+    ON chat_conversations_archive (session_id, timestamp);
+
+-- Sessions whose most recent turn is older than `cutoff`
+CREATE OR REPLACE FUNCTION cold_chat_sessions(cutoff timestamptz, max_sessions integer)
+RETURNS SETOF text
+LANGUAGE sql STABLE AS $$
+    SELECT session_id
+    FROM chat_conversations
+    GROUP BY session_id
+    HAVING max(timestamp) < cutoff
+    LIMIT max_sessions;
+$$;
+
+-- Move up to `max_sessions` cold sessions into the archive table atomically.
+-- Returns the number of rows moved.
+CREATE OR REPLACE FUNCTION archive_chat_sessions(cutoff timestamptz, max_sessions integer)
+RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    moved_rows integer;
+BEGIN
+    WITH cold AS (
+        SELECT * FROM cold_chat_sessions(cutoff, max_sessions) AS session_id
+    ), moved AS (
+        DELETE FROM chat_conversations c
+        USING cold
+        WHERE c.session_id = cold.session_id
+        RETURNING c.id, c.session_id, c.message, c.response, c.message_type,
+                  c.timestamp, c.response_body, c.codec
+    )
+    INSERT INTO chat_conversations_archive
+        (id, session_id, message, response, message_type, timestamp, response_body, codec)
+    SELECT id, session_id, message, response, message_type, timestamp, response_body, codec
+    FROM moved;
+
+    GET DIAGNOSTICS moved_rows = ROW_COUNT;
+    RETURN moved_rows;
+END;
+$$;
@@ -0,0 +1,202 @@
+-- Time-partitioned chat_conversations with retention and soft deletes.
+--
+-- chat_conversations becomes a table partitioned by month on `timestamp`.
+-- Retention drops whole partitions (drop_expired_chat_partitions) instead
+-- of deleting rows, so it never contends with live inserts.
+--
+-- Clearing a session only records a tombstone in chat_session_tombstones.
+-- Reads go through the chat_conversations_live view, which hides rows
+-- written before the tombstone; purge_deleted_chat_sessions() removes them
+-- physically in batches from the background purger
+-- (src/database/retention.py). A session can be reused after clearing:
+-- only rows older than deleted_at are hidden and purged.
+--
+-- Run after 001_compressed_transcripts.sql, ideally in a quiet window: the
+-- existing rows are copied into the new partitioned table.
+
+BEGIN;
+
+ALTER TABLE chat_conversations RENAME TO chat_conversations_unpartitioned;
+ALTER INDEX IF EXISTS idx_chat_conversations_session_timestamp
+    RENAME TO idx_chat_conversations_unpartitioned_session_timestamp;
+
+CREATE TABLE chat_conversations (
+    id uuid NOT NULL,
+    session_id text NOT NULL,
+    message text,
+    response text,
+    message_type text,
+    timestamp timestamptz NOT NULL DEFAULT now(),
+    response_body text,
+    codec text,
+    -- The partition key must be part of the primary key
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- Created on the parent, so every partition gets its own
+-- (session_id, timestamp) index, including ones added later
+CREATE INDEX idx_chat_conversations_session_timestamp
+    ON chat_conversations (session_id, timestamp);
+
+-- Catches rows outside every monthly partition (e.g. clock skew)
+CREATE TABLE chat_conversations_default PARTITION OF chat_conversations DEFAULT;
+
+-- Monthly partitions chat_conversations_pYYYYMM from `from_month` through
+-- `months_ahead` months from now
+CREATE OR REPLACE FUNCTION ensure_chat_partitions(from_month date DEFAULT NULL, months_ahead integer DEFAULT 3)
+RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    month_start date := date_trunc('month', coalesce(from_month, now()::date));
+    last_month date := date_trunc('month', now() + make_interval(months => months_ahead));
+    partition_name text;
+    created integer := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        partition_name := format('chat_conversations_p%s', to_char(month_start, 'YYYYMM'));
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF chat_conversations FOR VALUES FROM (%L) TO (%L)',
+                partition_name, month_start, (month_start + interval '1 month')::date
+            );
+            created := created + 1;
+        END IF;
+        month_start := (month_start + interval '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$;
+
+SELECT ensure_chat_partitions(
+    (SELECT min(timestamp)::date FROM chat_conversations_unpartitioned), 3
+);
+
+INSERT INTO chat_conversations
+    (id, session_id, message, response, message_type, timestamp, response_body, codec)
+SELECT id, session_id, message, response, message_type, timestamp, response_body, codec
+FROM chat_conversations_unpartitioned;
+
+DROP TABLE chat_conversations_unpartitioned CASCADE;
+
+-- Drop monthly partitions whose whole range is older than the retention
+-- window. Returns the number of partitions dropped.
+CREATE OR REPLACE FUNCTION drop_expired_chat_partitions(retention_days integer)
+RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    part record;
+    dropped integer := 0;
+    cutoff date := (now() - make_interval(days => retention_days))::date;
+BEGIN
+    FOR part IN
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'chat_conversations'
+          AND child.relname ~ '^chat_conversations_p[0-9]{6}$'
+    LOOP
+        -- pYYYYMM covers [month start, next month start)
+        IF (to_date(right(part.relname, 6), 'YYYYMM') + interval '1 month')::date <= cutoff THEN
+            EXECUTE format('DROP TABLE %I', part.relname);
+            dropped := dropped + 1;
+        END IF;
+    END LOOP;
+    RETURN dropped;
+END;
+$$;
+
+-- Soft deletes: rows of a session written at or before deleted_at are gone
+CREATE TABLE IF NOT EXISTS chat_session_tombstones (
+    session_id text PRIMARY KEY,
+    deleted_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE VIEW chat_conversations_live AS
+SELECT c.*
+FROM chat_conversations c
+LEFT JOIN chat_session_tombstones t ON t.session_id = c.session_id
+WHERE t.session_id IS NULL OR c.timestamp > t.deleted_at;
+
+-- Sessions that are already cleared are purged rather than archived
+CREATE OR REPLACE FUNCTION cold_chat_sessions(cutoff timestamptz, max_sessions integer)
+RETURNS SETOF text
+LANGUAGE sql STABLE AS $$
+    SELECT session_id
+    FROM chat_conversations_live
+    GROUP BY session_id
+    HAVING max(timestamp) < cutoff
+    LIMIT max_sessions;
+$$;
+
+-- Physically delete up to `batch_size` tombstoned rows from the hot and
+-- archive tables, then forget tombstones with nothing left to delete.
+-- Returns the number of rows deleted.
+CREATE OR REPLACE FUNCTION purge_deleted_chat_sessions(batch_size integer)
+RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    hot_rows integer;
+    archived_rows integer;
+BEGIN
+    WITH doomed AS (
+        SELECT c.id, c.timestamp
+        FROM chat_conversations c
+        JOIN chat_session_tombstones t ON t.session_id = c.session_id
+        WHERE c.timestamp <= t.deleted_at
+        LIMIT batch_size
+    )
+    DELETE FROM chat_conversations c
+    USING doomed
+    WHERE c.id = doomed.id AND c.timestamp = doomed.timestamp;
+    GET DIAGNOSTICS hot_rows = ROW_COUNT;
+
+    WITH doomed AS (
+        SELECT a.id
+        FROM chat_conversations_archive a
+        JOIN chat_session_tombstones t ON t.session_id = a.session_id
+        WHERE a.timestamp <= t.deleted_at
+        LIMIT greatest(batch_size - hot_rows, 0)
+    )
+    DELETE FROM chat_conversations_archive a
+    USING doomed
+    WHERE a.id = doomed.id;
+    GET DIAGNOSTICS archived_rows = ROW_COUNT;
+
+    IF hot_rows + archived_rows < batch_size THEN
+        DELETE FROM chat_session_tombstones t
+        WHERE NOT EXISTS (
+            SELECT 1 FROM chat_conversations c
+            WHERE c.session_id = t.session_id AND c.timestamp <= t.deleted_at
+        ) AND NOT EXISTS (
+            SELECT 1 FROM chat_conversations_archive a
+            WHERE a.session_id = t.session_id AND a.timestamp <= t.deleted_at
+        );
+    END IF;
+
+    RETURN hot_rows + archived_rows;
+END;
+$$;
+
+-- The archive table is not partitioned; expire it in batches by age
+CREATE INDEX IF NOT EXISTS idx_chat_conversations_archive_timestamp
+    ON chat_conversations_archive (timestamp);
+
+CREATE OR REPLACE FUNCTION expire_archived_chat_rows(retention_days integer, batch_size integer)
+RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    expired integer;
+BEGIN
+    DELETE FROM chat_conversations_archive
+    WHERE id IN (
+        SELECT id FROM chat_conversations_archive
+        WHERE timestamp < now() - make_interval(days => retention_days)
+        LIMIT batch_size
+    );
+    GET DIAGNOSTICS expired = ROW_COUNT;
+    RETURN expired;
+END;
+$$;
+
+COMMIT;
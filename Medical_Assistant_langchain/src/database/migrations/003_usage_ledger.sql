@@ -0,0 +1,66 @@
+-- Per-turn token and latency usage, written in batches by the usage ledger
+-- (src/services/usage_ledger.py) and summarised by chat_usage_rollup().
+--
+-- cache_status is 'miss' for turns that made their own LLM call,
+-- 'coalesced' for turns that shared another request's call and
+-- 'quick_answer' for precomputed answers; only misses carry token counts.
+
+CREATE TABLE IF NOT EXISTS chat_usage (
+    id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    session_id text NOT NULL,
+    message_type text,
+    model text,
+    prompt_tokens integer,
+    output_tokens integer,
+    cached_tokens integer,
+    ttft_ms integer,
+    latency_ms integer,
+    cache_status text,
+    timestamp timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_chat_usage_timestamp ON chat_usage (timestamp);
+CREATE INDEX IF NOT EXISTS idx_chat_usage_session ON chat_usage (session_id);
+
+-- Totals per session, message_type, model or day over [since, until),
+-- costliest (prompt + output tokens) first
+CREATE OR REPLACE FUNCTION chat_usage_rollup(
+    group_by text,
+    since timestamptz DEFAULT NULL,
+    until timestamptz DEFAULT NULL,
+    max_rows integer DEFAULT 100
+)
+RETURNS TABLE (
+    key text,
+    turns bigint,
+    prompt_tokens bigint,
+    output_tokens bigint,
+    cached_tokens bigint,
+    cache_hits bigint,
+    avg_ttft_ms double precision,
+    avg_latency_ms double precision,
+    max_latency_ms integer
+)
+LANGUAGE sql STABLE AS $$
+    SELECT
+        CASE group_by
+            WHEN 'session' THEN u.session_id
+            WHEN 'message_type' THEN u.message_type
+            WHEN 'model' THEN u.model
+            ELSE to_char(u.timestamp, 'YYYY-MM-DD')
+        END AS key,
+        count(*),
+        sum(u.prompt_tokens),
+        sum(u.output_tokens),
+        sum(u.cached_tokens),
+        count(*) FILTER (WHERE u.cache_status <> 'miss'),
+        avg(u.ttft_ms)::double precision,
+        avg(u.latency_ms)::double precision,
+        max(u.latency_ms)
+    FROM chat_usage u
+    WHERE (since IS NULL OR u.timestamp >= since)
+      AND (until IS NULL OR u.timestamp < until)
+    GROUP BY 1
+    ORDER BY coalesce(sum(u.prompt_tokens), 0) + coalesce(sum(u.output_tokens), 0) DESC
+    LIMIT max_rows;
+$$;
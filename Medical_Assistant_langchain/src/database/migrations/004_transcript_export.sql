@@ -0,0 +1,8 @@
+-- Keyset pagination for transcript exports (src/database/transcript_export.py).
+--
+-- Exports read chat_conversations_live ordered by (timestamp, id) and ask
+-- for the rows after the last (timestamp, id) they saw, so each page is a
+-- range scan on this index instead of an ever-growing OFFSET.
+
+CREATE INDEX IF NOT EXISTS idx_chat_conversations_timestamp_id
+    ON chat_conversations (timestamp, id);
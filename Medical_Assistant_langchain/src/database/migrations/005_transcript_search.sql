@@ -0,0 +1,103 @@
+-- Full-text search over past consultations (src/database/transcript_search.py).
+--
+-- Responses are stored compressed, so Postgres cannot index them itself.
+-- The client sends the plaintext response in `search_text` on insert; a
+-- trigger folds it (with the message) into `search_vector` and clears it,
+-- so only the tsvector is kept. A GIN index on search_vector serves
+-- search_chat_conversations(), which ranks with ts_rank_cd and pages with
+-- a (rank, id) cursor. Snippets are cut client-side from the decoded text.
+--
+-- Rows written before this migration are indexed by the UPDATE below
+-- (plaintext legacy rows) and by `transcript_search.py --backfill`
+-- (compressed rows, via chat_search_backfill()).
+
+ALTER TABLE chat_conversations
+    ADD COLUMN IF NOT EXISTS search_text text,
+    ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+-- Created on the parent, so every partition gets its own GIN index
+CREATE INDEX IF NOT EXISTS idx_chat_conversations_search
+    ON chat_conversations USING gin (search_vector);
+
+CREATE OR REPLACE FUNCTION chat_search_document(message text, response text)
+RETURNS tsvector
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT setweight(to_tsvector('english', coalesce(message, '')), 'A') ||
+           setweight(to_tsvector('english', coalesce(response, '')), 'B');
+$$;
+
+CREATE OR REPLACE FUNCTION chat_conversations_search_vector()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.search_vector := chat_search_document(NEW.message, coalesce(NEW.search_text, NEW.response));
+    NEW.search_text := NULL;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS chat_conversations_search_vector ON chat_conversations;
+CREATE TRIGGER chat_conversations_search_vector
+    BEFORE INSERT ON chat_conversations
+    FOR EACH ROW EXECUTE FUNCTION chat_conversations_search_vector();
+
+UPDATE chat_conversations
+SET search_vector = chat_search_document(message, response)
+WHERE search_vector IS NULL AND response IS NOT NULL;
+
+-- Index rows whose plaintext was decoded client-side: rows is a JSON array
+-- of {"id": ..., "text": ...}
+CREATE OR REPLACE FUNCTION chat_search_backfill(rows jsonb)
+RETURNS integer
+LANGUAGE sql AS $$
+    WITH updated AS (
+        UPDATE chat_conversations c
+        SET search_vector = chat_search_document(c.message, r.text)
+        FROM jsonb_to_recordset(rows) AS r(id uuid, text text)
+        WHERE c.id = r.id
+        RETURNING 1
+    )
+    SELECT count(*)::integer FROM updated;
+$$;
+
+-- Live (not cleared) turns matching a web-style query, best first.
+-- Pass the rank and id of the last row of a page to get the next one.
+CREATE OR REPLACE FUNCTION search_chat_conversations(
+    query text,
+    session text DEFAULT NULL,
+    since timestamptz DEFAULT NULL,
+    until timestamptz DEFAULT NULL,
+    after_rank real DEFAULT NULL,
+    after_id uuid DEFAULT NULL,
+    max_rows integer DEFAULT 20
+)
+RETURNS TABLE (
+    id uuid,
+    session_id text,
+    message text,
+    response text,
+    response_body text,
+    codec text,
+    message_type text,
+    "timestamp" timestamptz,
+    rank real
+)
+LANGUAGE sql STABLE AS $$
+    WITH matches AS (
+        SELECT c.id, c.session_id, c.message, c.response, c.response_body, c.codec, c.message_type,
+               c.timestamp, ts_rank_cd(c.search_vector, q) AS rank
+        FROM chat_conversations c, websearch_to_tsquery('english', query) q
+        WHERE c.search_vector @@ q
+          AND (session IS NULL OR c.session_id = session)
+          AND (since IS NULL OR c.timestamp >= since)
+          AND (until IS NULL OR c.timestamp < until)
+          AND NOT EXISTS (
+              SELECT 1 FROM chat_session_tombstones t
+              WHERE t.session_id = c.session_id AND c.timestamp <= t.deleted_at
+          )
+    )
+    SELECT * FROM matches m
+    WHERE after_rank IS NULL OR m.rank < after_rank OR (m.rank = after_rank AND m.id > after_id)
+    ORDER BY m.rank DESC, m.id
+    LIMIT max_rows;
+$$;
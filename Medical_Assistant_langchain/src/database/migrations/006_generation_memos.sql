@@ -0,0 +1,21 @@
+-- Memoised profile-based generations (src/services/generation_memo.py).
+--
+-- Health recommendations and symptom analyses are pure functions of the
+-- validated health profile (plus the normalised symptoms), so they are
+-- stored under a hash of those inputs and the profile's content hash
+-- (profile_version). Editing the profile changes its version, so stale
+-- entries are never read again; rows older than
+-- GENERATION_MEMO_MAX_AGE_DAYS are ignored and can be deleted with the
+-- statement at the end.
+
+CREATE TABLE IF NOT EXISTS generation_memos (
+    key text PRIMARY KEY,
+    kind text NOT NULL,
+    profile_version text NOT NULL,
+    response text NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_generation_memos_created_at ON generation_memos (created_at);
+
+-- DELETE FROM generation_memos WHERE created_at < now() - interval '30 days';
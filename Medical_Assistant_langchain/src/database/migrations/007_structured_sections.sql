@@ -0,0 +1,95 @@
+-- Parsed response sections (src/services/structured_output.py).
+--
+-- Answers of message types with a section schema (likely conditions,
+-- recommended medications, treatment plan, ...) are split into their
+-- sections when they are generated, and the sections are stored next to
+-- the compressed body as a jsonb object of section key -> text. History
+-- reads, search results and caches can then address one section without
+-- decompressing and re-parsing the response. Rows written before this
+-- migration, and answers without sections, have NULL.
+--
+-- Until this migration is applied, run with STORE_SECTIONS=false.
+
+ALTER TABLE chat_conversations
+    ADD COLUMN IF NOT EXISTS sections jsonb;
+
+ALTER TABLE chat_conversations_archive
+    ADD COLUMN IF NOT EXISTS sections jsonb;
+
+-- c.* was expanded when the view was created: recreate it to pick up the column
+CREATE OR REPLACE VIEW chat_conversations_live AS
+SELECT c.*
+FROM chat_conversations c
+LEFT JOIN chat_session_tombstones t ON t.session_id = c.session_id
+WHERE t.session_id IS NULL OR c.timestamp > t.deleted_at;
+
+-- As in 001, now moving sections too
+CREATE OR REPLACE FUNCTION archive_chat_sessions(cutoff timestamptz, max_sessions integer)
+RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    moved_rows integer;
+BEGIN
+    WITH cold AS (
+        SELECT * FROM cold_chat_sessions(cutoff, max_sessions) AS session_id
+    ), moved AS (
+        DELETE FROM chat_conversations c
+        USING cold
+        WHERE c.session_id = cold.session_id
+        RETURNING c.id, c.session_id, c.message, c.response, c.message_type,
+                  c.timestamp, c.response_body, c.codec, c.sections
+    )
+    INSERT INTO chat_conversations_archive
+        (id, session_id, message, response, message_type, timestamp, response_body, codec, sections)
+    SELECT id, session_id, message, response, message_type, timestamp, response_body, codec, sections
+    FROM moved;
+
+    GET DIAGNOSTICS moved_rows = ROW_COUNT;
+    RETURN moved_rows;
+END;
+$$;
+
+-- As in 005, now returning sections; the result type changes, so it is
+-- dropped first
+DROP FUNCTION IF EXISTS search_chat_conversations(text, text, timestamptz, timestamptz, real, uuid, integer);
+
+CREATE FUNCTION search_chat_conversations(
+    query text,
+    session text DEFAULT NULL,
+    since timestamptz DEFAULT NULL,
+    until timestamptz DEFAULT NULL,
+    after_rank real DEFAULT NULL,
+    after_id uuid DEFAULT NULL,
+    max_rows integer DEFAULT 20
+)
+RETURNS TABLE (
+    id uuid,
+    session_id text,
+    message text,
+    response text,
+    response_body text,
+    codec text,
+    message_type text,
+    "timestamp" timestamptz,
+    sections jsonb,
+    rank real
+)
+LANGUAGE sql STABLE AS $$
+    WITH matches AS (
+        SELECT c.id, c.session_id, c.message, c.response, c.response_body, c.codec, c.message_type,
+               c.timestamp, c.sections, ts_rank_cd(c.search_vector, q) AS rank
+        FROM chat_conversations c, websearch_to_tsquery('english', query) q
+        WHERE c.search_vector @@ q
+          AND (session IS NULL OR c.session_id = session)
+          AND (since IS NULL OR c.timestamp >= since)
+          AND (until IS NULL OR c.timestamp < until)
+          AND NOT EXISTS (
+              SELECT 1 FROM chat_session_tombstones t
+              WHERE t.session_id = c.session_id AND c.timestamp <= t.deleted_at
+          )
+    )
+    SELECT * FROM matches m
+    WHERE after_rank IS NULL OR m.rank < after_rank OR (m.rank = after_rank AND m.id > after_id)
+    ORDER BY m.rank DESC, m.id
+    LIMIT max_rows;
+$$;
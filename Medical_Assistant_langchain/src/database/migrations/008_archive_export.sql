@@ -0,0 +1,15 @@
+-- Transcript exports include archived sessions (src/database/transcript_export.py).
+--
+-- After the live rows, an export pages through the archive table with
+-- the same (timestamp, id) keyset cursor. This view hides archived rows of
+-- cleared sessions the way chat_conversations_live does for hot rows, and
+-- the index keeps each page a range scan.
+
+CREATE INDEX IF NOT EXISTS idx_chat_conversations_archive_timestamp_id
+    ON chat_conversations_archive (timestamp, id);
+
+CREATE OR REPLACE VIEW chat_conversations_archive_live AS
+SELECT a.*
+FROM chat_conversations_archive a
+LEFT JOIN chat_session_tombstones t ON t.session_id = a.session_id
+WHERE t.session_id IS NULL OR a.timestamp > t.deleted_at;
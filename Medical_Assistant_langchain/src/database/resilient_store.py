@@ -0,0 +1,326 @@
+"""
+Circuit-breaking wrapper around the chat store.
+
+When Supabase is slow or down, the breaker opens after a few failures and
+chat traffic stops waiting on it: history is served from the recent turns
+kept in memory per session, and writes are journaled to a local JSONL file.
+Once a trial call succeeds the breaker closes and the journal is replayed
+in the background, with the original timestamps, so the stored transcript
+ends up as if there had been no outage.
+"""
+import copy
+import json
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+import sys
+import os
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from utils.circuit_breaker import CLOSED, CircuitBreaker, CircuitOpenError
+from utils.metrics import metrics
+from services.turn_store import Turn, TurnStore
+
+
+# What delegated store methods return while the store is unavailable
+# (what the stores return on their own errors)
+DEGRADED_RESULTS: Dict[str, Any] = {
+    'create_user_profile': None, 'get_user_profile': None, 'update_user_health_info': False,
+    'get_generation_memo': None, 'save_generation_memo': False,
+    'get_usage_rollup': [], 'get_archived_history': [], 'get_tombstone': None, 'get_tombstones': [],
+    'get_cold_sessions': [], 'sample_responses': [], 'delete_sessions': False,
+    'purge_deleted_sessions': 0, 'ensure_partitions': 0, 'drop_expired_partitions': 0,
+    'expire_archived_rows': 0, 'archive_sessions': 0,
+}
+
+
+def default_store():
+    from database.supabase_manager import SupabaseManager
+    return SupabaseManager(raise_errors=True)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class ResilientStore:
+    """Chat store that degrades to local memory and a journal during outages.
+
+    store_factory builds the real store and must return one that raises on
+    failure (e.g. SupabaseManager(raise_errors=True)); it is called through
+    the breaker, so a store that can't even connect at startup is retried
+    when the breaker half-opens instead of failing the service.
+    Other methods are delegated to the underlying store through the
+    breaker too: while it is open they return their DEGRADED_RESULTS
+    value without touching the store, or raise if they have none (exports
+    and scans must not mistake an outage for the end of the data).
+    """
+
+    def __init__(self, store_factory: Callable[[], Any] = None, breaker: CircuitBreaker = None,
+                 journal_dir: str = None, max_sessions: int = None, history_size: int = None):
+        self.store_factory = store_factory or default_store
+        self.breaker = breaker or CircuitBreaker(
+            'storage', Config.STORAGE_BREAKER_FAILURES, Config.STORAGE_BREAKER_RESET,
+            Config.STORAGE_SLOW_CALL_SECONDS
+        )
+        self.journal_dir = journal_dir if journal_dir is not None else Config.STORAGE_JOURNAL_DIR
+        self.journal_path = os.path.join(self.journal_dir, f'journal-{os.getpid()}.jsonl') if self.journal_dir else None
+        self.max_sessions = max_sessions or Config.DEGRADED_MAX_SESSIONS
+        self.history_size = history_size or Config.DEGRADED_HISTORY_SIZE
+        self._store = None
+        # Recent turns per session (LRU), enough to keep conversations going
+        self._turns = TurnStore(self.max_sessions, self.history_size)
+        # Writes not yet applied to the store, oldest first
+        self._backlog: List[Dict[str, Any]] = []
+        self._lock = threading.RLock()
+        self._replay_lock = threading.Lock()
+        self.breaker.on_state_change(self._on_breaker_change)
+
+        self._adopt_orphaned_journals()
+        try:
+            self.breaker.call(self._ensure_store)
+        except Exception as e:
+            print(f"Storage unavailable, starting in degraded mode: {e}")
+        if self._backlog and not self.breaker.is_open:
+            self.start_replay()
+
+    def _ensure_store(self):
+        if self._store is None:
+            try:
+                self._store = self.store_factory()
+            except Exception:
+                # Not built again until the breaker lets a trial call through
+                self.breaker.trip()
+                raise
+        return self._store
+
+    def _call(self, method: str, *args, **kwargs):
+        """Call a store method through the breaker"""
+        return self.breaker.call(lambda: getattr(self._ensure_store(), method)(*args, **kwargs))
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._store is not None:
+            attribute = getattr(self._store, name)
+            if not callable(attribute):
+                return attribute
+
+        def call(*args, **kwargs):
+            try:
+                return self._call(name, *args, **kwargs)
+            except Exception as e:
+                if name not in DEGRADED_RESULTS:
+                    raise
+                self._log_degraded(name, e)
+                return copy.copy(DEGRADED_RESULTS[name])
+        call.__name__ = name
+        return call
+
+    @property
+    def degraded(self) -> bool:
+        return self.breaker.is_open
+
+    # Chat store interface
+
+    def save_chat_message(self, session_id: str, message: str, response: str,
+                          message_type: str = 'medical_query', timestamp: str = None,
+                          sections: Dict[str, str] = None) -> Dict[str, Any]:
+        """Save a chat turn, journaling it locally if the store is unavailable"""
+        row = {
+            'id': str(uuid.uuid4()),
+            'session_id': session_id,
+            'message': message,
+            'response': response,
+            'message_type': message_type,
+            'timestamp': timestamp or datetime.now().isoformat(),
+            'sections': sections,
+        }
+        try:
+            saved = self._call('save_chat_message', session_id, message, response,
+                               message_type, row['timestamp'], sections)
+            self._turns.extend(session_id, [Turn.from_row(saved or row)])
+            return saved
+        except Exception as e:
+            self._log_degraded('save', e)
+            self._turns.extend(session_id, [Turn(message, response, message_type, row['timestamp'], pending=True,
+                                                 sections=sections)])
+            self._journal({'op': 'save', **{k: v for k, v in row.items() if k != 'id'}})
+            return row
+
+    def get_chat_history(self, session_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """History from the store, or from memory while it is unavailable"""
+        try:
+            rows = self._call('get_chat_history', session_id, limit)
+        except Exception as e:
+            self._log_degraded('read', e)
+            metrics.increment('storage.degraded_reads')
+            return [turn.to_row() for turn in self._turns.get(session_id, limit)]
+
+        turns = [Turn.from_row(row) for row in rows]
+        # Journaled turns aren't in the store yet
+        pending = [turn for turn in self._turns.get(session_id) if turn.pending]
+        if pending:
+            turns = sorted(turns + pending, key=lambda turn: turn.timestamp)[-limit:]
+            rows = [turn.to_row() for turn in turns]
+        self._turns.extend(session_id, turns, replace=True)
+        return rows
+
+    def delete_chat_history(self, session_id: str, deleted_at: str = None) -> bool:
+        """Clear a session, journaling the clear if the store is unavailable"""
+        deleted_at = deleted_at or datetime.now().isoformat()
+        self._turns.pop(session_id)
+        try:
+            return self._call('delete_chat_history', session_id, deleted_at)
+        except Exception as e:
+            self._log_degraded('clear', e)
+            self._journal({'op': 'delete', 'session_id': session_id, 'deleted_at': deleted_at})
+            return True
+
+    def search_chat_messages(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        """Search through the breaker; unavailable while degraded (raises)"""
+        return self._call('search_chat_messages', *args, **kwargs)
+
+    def save_usage_records(self, records: List[Dict[str, Any]]) -> bool:
+        """Write a usage batch; while the store is unavailable the batch is left for a retry"""
+        try:
+            return self._call('save_usage_records', records)
+        except Exception as e:
+            self._log_degraded('usage write', e)
+            return False
+
+    def _log_degraded(self, operation: str, error: Exception):
+        if not isinstance(error, CircuitOpenError):
+            print(f"Storage {operation} failed, using local fallback: {error}")
+
+    # Journal
+
+    def _journal(self, entry: Dict[str, Any]):
+        with self._lock:
+            self._backlog.append(entry)
+            pending = len(self._backlog)
+            if self.journal_path:
+                try:
+                    os.makedirs(self.journal_dir, exist_ok=True)
+                    with open(self.journal_path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(entry) + '\n')
+                except Exception as e:
+                    print(f"Error writing storage journal: {e}")
+        metrics.increment('storage.journaled')
+        metrics.set_gauge('storage.journal_pending', pending)
+
+    def _rewrite_journal(self):
+        """Persist the remaining backlog (caller holds the lock)"""
+        if not self.journal_path:
+            return
+        try:
+            if not self._backlog:
+                if os.path.exists(self.journal_path):
+                    os.remove(self.journal_path)
+                return
+            temp_path = f"{self.journal_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(entry) + '\n' for entry in self._backlog)
+            os.replace(temp_path, self.journal_path)
+        except Exception as e:
+            print(f"Error rewriting storage journal: {e}")
+
+    def _adopt_orphaned_journals(self):
+        """Take over journals left by this process's earlier life or by dead workers"""
+        if not self.journal_dir or not os.path.isdir(self.journal_dir):
+            return
+        adopted = []
+        for name in sorted(os.listdir(self.journal_dir)):
+            if not (name.startswith('journal-') and name.endswith('.jsonl')):
+                continue
+            try:
+                pid = int(name[len('journal-'):-len('.jsonl')])
+            except ValueError:
+                continue
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            path = os.path.join(self.journal_dir, name)
+            claimed = f"{path}.{os.getpid()}.claimed"
+            try:
+                # Atomic: only one worker gets each orphaned journal
+                os.rename(path, claimed)
+                with open(claimed, encoding='utf-8') as f:
+                    self._backlog.extend(json.loads(line) for line in f if line.strip())
+                adopted.append(claimed)
+            except (OSError, ValueError) as e:
+                print(f"Error adopting storage journal {name}: {e}")
+        if adopted:
+            with self._lock:
+                self._rewrite_journal()
+            for path in adopted:
+                os.remove(path)
+            metrics.set_gauge('storage.journal_pending', len(self._backlog))
+
+    # Replay
+
+    def _on_breaker_change(self, state: str):
+        metrics.set_gauge('storage.degraded', 0 if state == CLOSED else 1)
+        if state == CLOSED and self._backlog:
+            self.start_replay()
+
+    def start_replay(self):
+        """Replay the journal on a background thread (no-op if one is running)"""
+        threading.Thread(target=self.replay, name='storage-journal-replay', daemon=True).start()
+
+    def replay(self) -> int:
+        """Apply journaled writes in order until done or the store fails again"""
+        if not self._replay_lock.acquire(blocking=False):
+            return 0
+        replayed = 0
+        try:
+            while True:
+                with self._lock:
+                    if not self._backlog:
+                        break
+                    entry = self._backlog[0]
+                try:
+                    if entry['op'] == 'save':
+                        self._call('save_chat_message', entry['session_id'], entry['message'],
+                                   entry['response'], entry['message_type'], entry['timestamp'],
+                                   entry.get('sections'))
+                    elif entry['op'] == 'delete':
+                        self._call('delete_chat_history', entry['session_id'], entry['deleted_at'])
+                except Exception as e:
+                    self._log_degraded('replay', e)
+                    break
+                with self._lock:
+                    self._backlog.pop(0)
+                    self._mark_replayed(entry)
+                replayed += 1
+            with self._lock:
+                self._rewrite_journal()
+                pending = len(self._backlog)
+        finally:
+            self._replay_lock.release()
+        if replayed:
+            metrics.increment('storage.replayed', replayed)
+            print(f"Replayed {replayed} journaled storage writes")
+        metrics.set_gauge('storage.journal_pending', pending)
+        return replayed
+
+    def _mark_replayed(self, entry: Dict[str, Any]):
+        """The replayed turn is in the store now (caller holds the lock)"""
+        if entry['op'] != 'save':
+            return
+        for turn in self._turns.get(entry['session_id']):
+            if turn.pending and turn.timestamp == entry['timestamp'] and turn.message == entry['message']:
+                turn.pending = False
+                break
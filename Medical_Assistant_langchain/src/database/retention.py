@@ -0,0 +1,100 @@
+import argparse
+from datetime import datetime, timedelta
+import sys
+import os
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from database.compaction import create_store
+from utils.metrics import metrics
+from utils.periodic import PeriodicJob
+
+
+class ChatPurger(PeriodicJob):
+    """Background job that physically deletes cleared and expired transcripts.
+
+    Clearing a session only writes a tombstone; each pass deletes the
+    tombstoned rows in batches of `batch_size`, so large sessions never
+    hold long locks against live inserts. It then keeps the monthly
+    partitions ahead of time and drops the ones past `retention_days`.
+    """
+
+    name = 'chat-purger'
+
+    def __init__(self, store, archive=None, retention_days: int = None,
+                 batch_size: int = None, interval: float = None):
+        super().__init__(interval if interval is not None else Config.PURGE_INTERVAL)
+        self.store = store
+        self.archive = archive if archive is not None else getattr(store, 'archive', None)
+        self.retention_days = retention_days if retention_days is not None else Config.CHAT_RETENTION_DAYS
+        self.batch_size = batch_size or Config.PURGE_BATCH_SIZE
+
+    def purge_deleted(self) -> int:
+        """Delete tombstoned rows batch by batch until none are left"""
+        if self.archive is not None:
+            # Parquet files first: the store forgets tombstones once its own rows are gone
+            for tombstone in self.store.get_tombstones():
+                self.archive.delete_session(tombstone['session_id'], before=tombstone['deleted_at'])
+        total = 0
+        while not self.stopping:
+            deleted = self.store.purge_deleted_sessions(self.batch_size)
+            total += deleted
+            if deleted < self.batch_size:
+                break
+        metrics.increment('purge.rows', total)
+        return total
+
+    def apply_retention(self) -> int:
+        """Drop partitions (and archived data) older than retention_days"""
+        if not self.retention_days:
+            return 0
+        removed = self.store.drop_expired_partitions(self.retention_days)
+        while not self.stopping:
+            expired = self.store.expire_archived_rows(self.retention_days, self.batch_size)
+            removed += expired
+            if expired < self.batch_size:
+                break
+        if self.archive is not None:
+            removed += self.archive.expire_before(datetime.now() - timedelta(days=self.retention_days))
+        metrics.increment('retention.removed', removed)
+        return removed
+
+    def run_once(self) -> int:
+        """One purge and retention pass, returning the number of rows purged"""
+        purged = 0
+        try:
+            with metrics.stage('purge'):
+                purged = self.purge_deleted()
+                self.store.ensure_partitions(Config.PARTITION_MONTHS_AHEAD)
+                self.apply_retention()
+            metrics.increment('purge.runs')
+        except Exception as e:
+            metrics.increment('purge.errors')
+            print(f"Error purging transcripts: {e}")
+        return purged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Purge cleared chat sessions and apply transcript retention")
+    parser.add_argument('--once', action='store_true', help='Run a single purge pass and exit')
+    parser.add_argument('--sqlite', help='Purge a local SQLite database instead of Supabase')
+    parser.add_argument('--retention-days', type=int, default=Config.CHAT_RETENTION_DAYS,
+                        help='Drop transcripts older than this many days (0 keeps them forever)')
+    args = parser.parse_args()
+
+    purger = ChatPurger(create_store(args.sqlite), retention_days=args.retention_days)
+    if args.once:
+        print(f"Purged {purger.run_once()} rows")
+        return
+
+    print(f"Purging every {purger.interval:.0f}s (Ctrl+C to stop)")
+    purger.run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,662 @@
+import sqlite3
+import threading
+from typing import Optional, Dict, List, Any
+import json
+import re
+from datetime import datetime, timedelta
+import uuid
+import sys
+import os
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from database.transcript_archive import not_cleared
+from database.transcript_codec import TranscriptCodec, get_codec
+
+HISTORY_COLUMNS = 'message, response, response_body, codec, message_type, timestamp, sections'
+ARCHIVE_ROW_COLUMNS = 'id, session_id, message, response, response_body, codec, message_type, timestamp, sections'
+USAGE_COLUMNS = ('session_id', 'message_type', 'model', 'prompt_tokens', 'output_tokens', 'cached_tokens',
+                 'ttft_ms', 'latency_ms', 'cache_status', 'timestamp')
+# Usage rollup groupings (see get_usage_rollup)
+USAGE_GROUP_KEYS = {
+    'session': 'session_id',
+    'message_type': 'message_type',
+    'model': 'model',
+    'day': 'substr(timestamp, 1, 10)',
+}
+# Hides rows written before a session was cleared (see delete_chat_history)
+LIVE_FILTER = (
+    "NOT EXISTS (SELECT 1 FROM chat_session_tombstones t "
+    "WHERE t.session_id = c.session_id AND c.timestamp <= t.deleted_at)"
+)
+
+
+class SQLiteManager:
+    """Local SQLite storage with the same interface as SupabaseManager.
+
+    Used for offline development and benchmarks. The default ':memory:'
+    database lives only as long as the manager.
+    """
+
+    def __init__(self, db_path: str = ':memory:', codec: TranscriptCodec = None, archive=None,
+                 raise_errors: bool = False):
+        """archive: optional ParquetArchive used as the cold tier instead of the archive table
+
+        raise_errors: re-raise failures of the chat and usage read/write methods
+        instead of returning an empty result (used by ResilientStore to detect outages)
+        """
+        self.db_path = db_path
+        self.raise_errors = raise_errors
+        self.codec = codec if codec is not None else get_codec()
+        self.archive = archive
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.create_chat_table()
+
+    def create_chat_table(self) -> bool:
+        """Create the chat and profile tables if they don't exist"""
+        try:
+            with self._lock:
+                self.conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS chat_conversations (
+                        id TEXT PRIMARY KEY,
+                        session_id TEXT NOT NULL,
+                        message TEXT,
+                        response TEXT,
+                        message_type TEXT,
+                        timestamp TEXT NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_chat_conversations_session
+                        ON chat_conversations (session_id, timestamp);
+                    CREATE TABLE IF NOT EXISTS chat_conversations_archive (
+                        id TEXT PRIMARY KEY,
+                        session_id TEXT NOT NULL,
+                        message TEXT,
+                        response TEXT,
+                        message_type TEXT,
+                        timestamp TEXT NOT NULL,
+                        response_body BLOB,
+                        codec TEXT,
+                        archived_at TEXT
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_chat_conversations_archive_session
+                        ON chat_conversations_archive (session_id, timestamp);
+                    CREATE INDEX IF NOT EXISTS idx_chat_conversations_timestamp
+                        ON chat_conversations (timestamp);
+                    CREATE INDEX IF NOT EXISTS idx_chat_conversations_timestamp_id
+                        ON chat_conversations (timestamp, id);
+                    CREATE INDEX IF NOT EXISTS idx_chat_conversations_archive_timestamp
+                        ON chat_conversations_archive (timestamp);
+                    CREATE VIRTUAL TABLE IF NOT EXISTS chat_search USING fts5(
+                        id UNINDEXED, message, response, tokenize = 'porter unicode61'
+                    );
+                    CREATE TABLE IF NOT EXISTS chat_session_tombstones (
+                        session_id TEXT PRIMARY KEY,
+                        deleted_at TEXT NOT NULL
+                    );
+                    CREATE TABLE IF NOT EXISTS chat_usage (
+                        id INTEGER PRIMARY KEY,
+                        session_id TEXT NOT NULL,
+                        message_type TEXT,
+                        model TEXT,
+                        prompt_tokens INTEGER,
+                        output_tokens INTEGER,
+                        cached_tokens INTEGER,
+                        ttft_ms INTEGER,
+                        latency_ms INTEGER,
+                        cache_status TEXT,
+                        timestamp TEXT NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_chat_usage_timestamp ON chat_usage (timestamp);
+                    CREATE INDEX IF NOT EXISTS idx_chat_usage_session ON chat_usage (session_id);
+                    CREATE TABLE IF NOT EXISTS user_profiles (
+                        id TEXT PRIMARY KEY,
+                        name TEXT,
+                        email TEXT,
+                        health_info TEXT,
+                        created_at TEXT,
+                        updated_at TEXT
+                    );
+                    CREATE TABLE IF NOT EXISTS generation_memos (
+                        key TEXT PRIMARY KEY,
+                        kind TEXT NOT NULL,
+                        profile_version TEXT NOT NULL,
+                        response TEXT NOT NULL,
+                        created_at TEXT NOT NULL
+                    );
+                """)
+                self._add_missing_columns('chat_conversations', {'response_body': 'BLOB', 'codec': 'TEXT',
+                                                                 'sections': 'TEXT'})
+                self._add_missing_columns('chat_conversations_archive', {'sections': 'TEXT'})
+                self.conn.commit()
+            return True
+        except Exception as e:
+            print(f"Error creating chat table: {e}")
+            return False
+
+    def save_chat_message(self, session_id: str, message: str, response: str,
+                         message_type: str = 'medical_query', timestamp: str = None,
+                         sections: Dict[str, str] = None) -> Dict[str, Any]:
+        """Save a chat message and response (the response body is stored compressed)
+
+        sections: the response's parsed sections (see services/structured_output.py), stored as JSON
+        """
+        try:
+            payload, codec = self.codec.encode(response)
+            chat_data = {
+                'id': str(uuid.uuid4()),
+                'session_id': session_id,
+                'message': message,
+                'response_body': payload,
+                'codec': codec,
+                'message_type': message_type,
+                'timestamp': timestamp or datetime.now().isoformat(),
+                'sections': json.dumps(sections, ensure_ascii=False) if sections else None
+            }
+            with self._lock:
+                self.conn.execute(
+                    "INSERT INTO chat_conversations "
+                    "(id, session_id, message, response_body, codec, message_type, timestamp, sections) "
+                    "VALUES (:id, :session_id, :message, :response_body, :codec, :message_type, :timestamp, :sections)",
+                    chat_data
+                )
+                self.conn.execute("INSERT INTO chat_search (id, message, response) VALUES (?, ?, ?)",
+                                  (chat_data['id'], message, response))
+                self.conn.commit()
+            chat_data.pop('response_body')
+            chat_data.pop('codec')
+            chat_data['response'] = response
+            chat_data['sections'] = sections or None
+            return chat_data
+        except Exception as e:
+            print(f"Error saving chat message: {e}")
+            if self.raise_errors:
+                raise
+            return None
+
+    def _add_missing_columns(self, table: str, columns: Dict[str, str]):
+        """Upgrade databases created before a column existed"""
+        existing = {row['name'] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+        for name, column_type in columns.items():
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+    def _decode_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Replace a stored compressed body with the plaintext response (and decode its sections)"""
+        codec = row.pop('codec', None)
+        body = row.pop('response_body', None)
+        if codec and body is not None:
+            row['response'] = self.codec.decode(bytes(body), codec)
+        if isinstance(row.get('sections'), str):
+            row['sections'] = json.loads(row['sections'])
+        return row
+
+    def get_chat_history(self, session_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get the latest `limit` turns of a session, oldest first (falls back to the cold archive)"""
+        try:
+            with self._lock:
+                rows = self.conn.execute(
+                    f"SELECT {HISTORY_COLUMNS} FROM chat_conversations c WHERE session_id = ? AND {LIVE_FILTER} "
+                    "ORDER BY timestamp DESC LIMIT ?",
+                    (session_id, limit)
+                ).fetchall()
+            rows = [dict(row) for row in reversed(rows)]
+            if not rows:
+                rows = self.get_archived_history(session_id, limit)
+            return [self._decode_row(row) for row in rows]
+        except Exception as e:
+            print(f"Error fetching chat history: {e}")
+            if self.raise_errors:
+                raise
+            return []
+
+    def get_archived_history(self, session_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get the latest stored (still compressed) rows of an archived session, oldest first"""
+        if self.archive is not None:
+            return self.archive.get_session(session_id, limit, after=self.get_tombstone(session_id))
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT {HISTORY_COLUMNS} FROM chat_conversations_archive c WHERE session_id = ? AND {LIVE_FILTER} "
+                "ORDER BY timestamp DESC LIMIT ?",
+                (session_id, limit)
+            ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def delete_chat_history(self, session_id: str, deleted_at: str = None) -> bool:
+        """Clear chat history for a session (as of deleted_at, default now).
+
+        Only records a tombstone, so this returns immediately; the rows are
+        hidden from reads and deleted later by the background purger.
+        """
+        try:
+            with self._lock:
+                self.conn.execute(
+                    "INSERT INTO chat_session_tombstones (session_id, deleted_at) VALUES (?, ?) "
+                    "ON CONFLICT (session_id) DO UPDATE SET deleted_at = excluded.deleted_at",
+                    (session_id, deleted_at or datetime.now().isoformat())
+                )
+                self.conn.commit()
+            return True
+        except Exception as e:
+            print(f"Error deleting chat history: {e}")
+            if self.raise_errors:
+                raise
+            return False
+
+    def get_tombstone(self, session_id: str) -> Optional[str]:
+        """When a session was last cleared, or None"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT deleted_at FROM chat_session_tombstones WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return row['deleted_at'] if row else None
+
+    def get_tombstones(self, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Cleared sessions still waiting to be purged"""
+        try:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT session_id, deleted_at FROM chat_session_tombstones LIMIT ?", (limit,)
+                ).fetchall()
+            return [dict(row) for row in rows]
+        except Exception as e:
+            print(f"Error fetching tombstones: {e}")
+            return []
+
+    def _delete_batch(self, table: str, where: str, params: tuple, batch_size: int) -> int:
+        """Delete up to batch_size matching rows from table"""
+        cursor = self.conn.execute(
+            f"DELETE FROM {table} WHERE rowid IN (SELECT c.rowid FROM {table} c WHERE {where} LIMIT ?)",
+            (*params, batch_size)
+        )
+        return cursor.rowcount
+
+    def purge_deleted_sessions(self, batch_size: int = 1000) -> int:
+        """Physically delete up to batch_size rows of cleared sessions"""
+        tombstoned = f"NOT ({LIVE_FILTER})"
+        try:
+            with self._lock:
+                deleted = self._delete_batch('chat_conversations', tombstoned, (), batch_size)
+                if deleted < batch_size:
+                    deleted += self._delete_batch('chat_conversations_archive', tombstoned, (), batch_size - deleted)
+                if deleted < batch_size:
+                    # Nothing left to purge for these sessions; archived turns stay searchable
+                    self.conn.execute(
+                        "DELETE FROM chat_search WHERE id NOT IN (SELECT id FROM chat_conversations) "
+                        "AND id NOT IN (SELECT id FROM chat_conversations_archive)"
+                    )
+                    self.conn.execute(
+                        "DELETE FROM chat_session_tombstones WHERE NOT EXISTS ("
+                        "SELECT 1 FROM chat_conversations c WHERE c.session_id = chat_session_tombstones.session_id "
+                        "AND c.timestamp <= chat_session_tombstones.deleted_at) AND NOT EXISTS ("
+                        "SELECT 1 FROM chat_conversations_archive a WHERE a.session_id = chat_session_tombstones.session_id "
+                        "AND a.timestamp <= chat_session_tombstones.deleted_at)"
+                    )
+                self.conn.commit()
+            return deleted
+        except Exception as e:
+            print(f"Error purging deleted chat sessions: {e}")
+            return 0
+
+    def ensure_partitions(self, months_ahead: int = 3) -> int:
+        """SQLite has no table partitions; nothing to create"""
+        return 0
+
+    def drop_expired_partitions(self, retention_days: int) -> int:
+        """SQLite has no table partitions, so expired hot rows are deleted in batches instead"""
+        cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+        deleted = 0
+        try:
+            while True:
+                with self._lock:
+                    batch = self._delete_batch('chat_conversations', 'c.timestamp < ?', (cutoff,), 1000)
+                    self.conn.commit()
+                deleted += batch
+                if batch < 1000:
+                    return deleted
+        except Exception as e:
+            print(f"Error expiring chat rows: {e}")
+            return deleted
+
+    def expire_archived_rows(self, retention_days: int, batch_size: int = 1000) -> int:
+        """Delete up to batch_size archived rows older than the retention window"""
+        cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+        try:
+            with self._lock:
+                expired = self._delete_batch('chat_conversations_archive', 'c.timestamp < ?', (cutoff,), batch_size)
+                self.conn.commit()
+            return expired
+        except Exception as e:
+            print(f"Error expiring archived chat rows: {e}")
+            return 0
+
+    def get_cold_sessions(self, cutoff: datetime, max_sessions: int = 100) -> List[str]:
+        """Session IDs whose latest turn is older than cutoff"""
+        try:
+            with self._lock:
+                rows = self.conn.execute(
+                    f"SELECT session_id FROM chat_conversations c WHERE {LIVE_FILTER} GROUP BY session_id "
+                    "HAVING MAX(timestamp) < ? LIMIT ?",
+                    (cutoff.isoformat(), max_sessions)
+                ).fetchall()
+            return [row['session_id'] for row in rows]
+        except Exception as e:
+            print(f"Error finding cold chat sessions: {e}")
+            return []
+
+    def archive_sessions(self, cutoff: datetime, max_sessions: int = 100) -> int:
+        """Move up to max_sessions sessions idle since cutoff into the archive table"""
+        try:
+            session_ids = self.get_cold_sessions(cutoff, max_sessions)
+            if not session_ids:
+                return 0
+            placeholders = ','.join('?' * len(session_ids))
+            with self._lock:
+                # Rows of cleared sessions move too; the purger removes them from the archive
+                cursor = self.conn.execute(
+                    f"INSERT INTO chat_conversations_archive ({ARCHIVE_ROW_COLUMNS}, archived_at) "
+                    f"SELECT {ARCHIVE_ROW_COLUMNS}, ? FROM chat_conversations WHERE session_id IN ({placeholders})",
+                    [datetime.now().isoformat(), *session_ids]
+                )
+                moved = cursor.rowcount
+                self.conn.execute(f"DELETE FROM chat_conversations WHERE session_id IN ({placeholders})", session_ids)
+                self.conn.commit()
+            return moved
+        except Exception as e:
+            print(f"Error archiving chat sessions: {e}")
+            return 0
+
+    def get_archive_rows(self, session_ids: List[str]) -> List[Dict[str, Any]]:
+        """Stored rows for sessions, with bodies as compressed bytes (legacy rows are compressed here)"""
+        placeholders = ','.join('?' * len(session_ids))
+        with self._lock:
+            # Rows of cleared sessions are left for the purger, not archived
+            rows = self.conn.execute(
+                f"SELECT {ARCHIVE_ROW_COLUMNS} FROM chat_conversations c WHERE session_id IN ({placeholders}) "
+                f"AND {LIVE_FILTER}",
+                session_ids
+            ).fetchall()
+        archive_rows = []
+        for row in rows:
+            row = dict(row)
+            if row.get('codec'):
+                body, codec = bytes(row['response_body']), row['codec']
+            else:
+                body, codec = self.codec.encode(row.get('response') or '')
+            row.pop('response', None)
+            row['response_body'] = body
+            row['codec'] = codec
+            archive_rows.append(row)
+        return archive_rows
+
+    def delete_sessions(self, session_ids: List[str]) -> bool:
+        """Delete all hot rows for the given sessions"""
+        try:
+            placeholders = ','.join('?' * len(session_ids))
+            with self._lock:
+                self.conn.execute(f"DELETE FROM chat_conversations WHERE session_id IN ({placeholders})", session_ids)
+                self.conn.commit()
+            return True
+        except Exception as e:
+            print(f"Error deleting chat sessions: {e}")
+            return False
+
+    def get_export_page(self, after: Optional[tuple] = None, limit: int = 1000, since: datetime = None,
+                        until: datetime = None, message_type: str = None, session_id: str = None,
+                        archived: bool = False) -> List[Dict[str, Any]]:
+        """One page of live (or, with archived, cold archive) rows ordered by (timestamp, id), after the `after` cursor
+
+        Failures are raised, so an export never mistakes an error for the end of the data.
+        """
+        if archived and self.archive is not None:
+            rows = self.archive.get_export_page(after, limit, since, until, message_type, session_id,
+                                                visible=not_cleared(self.get_tombstone))
+            return [self._decode_row(row) for row in rows]
+        table = 'chat_conversations_archive' if archived else 'chat_conversations'
+        clauses, params = [LIVE_FILTER], []
+        if after:
+            clauses.append("(c.timestamp, c.id) > (?, ?)")
+            params.extend(after)
+        if since:
+            clauses.append("c.timestamp >= ?")
+            params.append(since.isoformat())
+        if until:
+            clauses.append("c.timestamp < ?")
+            params.append(until.isoformat())
+        if message_type:
+            clauses.append("c.message_type = ?")
+            params.append(message_type)
+        if session_id:
+            clauses.append("c.session_id = ?")
+            params.append(session_id)
+        try:
+            with self._lock:
+                rows = self.conn.execute(
+                    f"SELECT {ARCHIVE_ROW_COLUMNS} FROM {table} c WHERE {' AND '.join(clauses)} "
+                    "ORDER BY c.timestamp, c.id LIMIT ?",
+                    params + [limit]
+                ).fetchall()
+            return [self._decode_row(dict(row)) for row in rows]
+        except Exception as e:
+            print(f"Error fetching export page: {e}")
+            raise
+
+    def search_chat_messages(self, query: str, session_id: str = None, since: datetime = None,
+                             until: datetime = None, after: Optional[tuple] = None,
+                             limit: int = 20) -> List[Dict[str, Any]]:
+        """Turns matching query (FTS5, BM25-ranked), best first, after the (rank, id) cursor
+
+        Covers hot and archive-table turns alike (the index keeps a row
+        when its session is archived); turns in a Parquet archive are
+        not searchable.
+        """
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return []
+        clauses, params = ["chat_search MATCH ?", LIVE_FILTER], [' '.join(f'"{term}"' for term in terms)]
+        if session_id:
+            clauses.append("c.session_id = ?")
+            params.append(session_id)
+        if since:
+            clauses.append("c.timestamp >= ?")
+            params.append(since.isoformat())
+        if until:
+            clauses.append("c.timestamp < ?")
+            params.append(until.isoformat())
+        matches = ' UNION ALL '.join(
+            f"SELECT {', '.join('c.' + column for column in ARCHIVE_ROW_COLUMNS.split(', '))}, "
+            # bm25() is lower-is-better; messages weigh twice as much as responses
+            "-bm25(chat_search, 0.0, 2.0, 1.0) AS rank "
+            f"FROM chat_search JOIN {table} c ON c.id = chat_search.id WHERE {' AND '.join(clauses)}"
+            for table in ('chat_conversations', 'chat_conversations_archive')
+        )
+        params = params * 2
+        page = ""
+        if after:
+            page = "WHERE rank < ? OR (rank = ? AND id > ?)"
+            params.extend([after[0], after[0], after[1]])
+        try:
+            with self._lock:
+                rows = self.conn.execute(
+                    f"SELECT * FROM ({matches}) {page} ORDER BY rank DESC, id LIMIT ?",
+                    params + [limit]
+                ).fetchall()
+            return [self._decode_row(dict(row)) for row in rows]
+        except Exception as e:
+            print(f"Error searching chat messages: {e}")
+            if self.raise_errors:
+                raise
+            return []
+
+    def get_unindexed_rows(self, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Hot or archived turns missing from the search index (saved before it existed), with plaintext responses"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, message, response, response_body, codec FROM chat_conversations "
+                "WHERE id NOT IN (SELECT id FROM chat_search) UNION ALL "
+                "SELECT id, message, response, response_body, codec FROM chat_conversations_archive "
+                "WHERE id NOT IN (SELECT id FROM chat_search) LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [self._decode_row(dict(row)) for row in rows]
+
+    def index_search_rows(self, rows: List[Dict[str, Any]]) -> int:
+        """Add turns (id, message, response) to the search index"""
+        with self._lock:
+            self.conn.executemany(
+                "INSERT INTO chat_search (id, message, response) VALUES (:id, :message, :response)",
+                [{'id': row['id'], 'message': row.get('message'), 'response': row.get('response')} for row in rows]
+            )
+            self.conn.commit()
+        return len(rows)
+
+    def sample_responses(self, limit: int = 1000) -> List[str]:
+        """Recent plaintext responses, e.g. for training a compression dictionary"""
+        try:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT response, response_body, codec FROM chat_conversations ORDER BY timestamp DESC LIMIT ?",
+                    (limit,)
+                ).fetchall()
+            return [self._decode_row(dict(row)).get('response') or '' for row in rows]
+        except Exception as e:
+            print(f"Error sampling responses: {e}")
+            return []
+
+    def save_usage_records(self, records: List[Dict[str, Any]]) -> bool:
+        """Insert a batch of per-turn usage records"""
+        try:
+            with self._lock:
+                self.conn.executemany(
+                    f"INSERT INTO chat_usage ({', '.join(USAGE_COLUMNS)}) "
+                    f"VALUES ({', '.join(':' + column for column in USAGE_COLUMNS)})",
+                    [{column: record.get(column) for column in USAGE_COLUMNS} for record in records]
+                )
+                self.conn.commit()
+            return True
+        except Exception as e:
+            print(f"Error saving usage records: {e}")
+            if self.raise_errors:
+                raise
+            return False
+
+    def get_usage_rollup(self, group_by: str = 'session', since: datetime = None, until: datetime = None,
+                         limit: int = 100) -> List[Dict[str, Any]]:
+        """Token and latency totals per session, message_type, model or day, costliest first"""
+        try:
+            key = USAGE_GROUP_KEYS[group_by]
+            since = (since or datetime.min).isoformat()
+            until = (until or datetime.max).isoformat()
+            with self._lock:
+                rows = self.conn.execute(
+                    f"SELECT {key} AS key, COUNT(*) AS turns, "
+                    "SUM(prompt_tokens) AS prompt_tokens, SUM(output_tokens) AS output_tokens, "
+                    "SUM(cached_tokens) AS cached_tokens, SUM(cache_status != 'miss') AS cache_hits, "
+                    "AVG(ttft_ms) AS avg_ttft_ms, AVG(latency_ms) AS avg_latency_ms, MAX(latency_ms) AS max_latency_ms "
+                    "FROM chat_usage WHERE timestamp >= ? AND timestamp < ? "
+                    "GROUP BY key ORDER BY SUM(prompt_tokens) + SUM(output_tokens) DESC LIMIT ?",
+                    (since, until, limit)
+                ).fetchall()
+            return [dict(row) for row in rows]
+        except Exception as e:
+            print(f"Error fetching usage rollup: {e}")
+            return []
+
+    def create_user_profile(self, user_id: str, name: str, email: str,
+                            health_info: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Create a user profile"""
+        try:
+            now = datetime.now().isoformat()
+            profile = {
+                'id': user_id,
+                'name': name,
+                'email': email,
+                'health_info': health_info or {},
+                'created_at': now,
+                'updated_at': now
+            }
+            with self._lock:
+                self.conn.execute(
+                    "INSERT INTO user_profiles (id, name, email, health_info, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (user_id, name, email, json.dumps(profile['health_info']), now, now)
+                )
+                self.conn.commit()
+            return profile
+        except Exception as e:
+            print(f"Error creating user profile: {e}")
+            return None
+
+    def get_user_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get a user profile by ID"""
+        try:
+            with self._lock:
+                row = self.conn.execute("SELECT * FROM user_profiles WHERE id = ?", (user_id,)).fetchone()
+            if not row:
+                return None
+            profile = dict(row)
+            profile['health_info'] = json.loads(profile['health_info'] or '{}')
+            return profile
+        except Exception as e:
+            print(f"Error fetching user profile: {e}")
+            return None
+
+    def update_user_health_info(self, user_id: str, health_info: Dict[str, Any]) -> bool:
+        """Replace a user's health information"""
+        try:
+            with self._lock:
+                cursor = self.conn.execute(
+                    "UPDATE user_profiles SET health_info = ?, updated_at = ? WHERE id = ?",
+                    (json.dumps(health_info), datetime.now().isoformat(), user_id)
+                )
+                self.conn.commit()
+            return cursor.rowcount > 0
+        except Exception as e:
+            print(f"Error updating health info: {e}")
+            return False
+
+    def get_profile_page(self, after: Optional[str] = None, limit: int = 5000) -> List[Dict[str, Any]]:
+        """One page of (id, health_info) profiles ordered by id, starting after the `after` id
+
+        Failures are raised, so a cohort report never mistakes an error for the end of the data.
+        """
+        try:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT id, health_info FROM user_profiles WHERE id > ? ORDER BY id LIMIT ?",
+                    (after or '', limit)
+                ).fetchall()
+            return [{'id': row['id'], 'health_info': json.loads(row['health_info'] or '{}')} for row in rows]
+        except Exception as e:
+            print(f"Error fetching profile page: {e}")
+            raise
+
+    def get_generation_memo(self, key: str) -> Optional[Dict[str, Any]]:
+        """A memoised generation by key"""
+        try:
+            with self._lock:
+                row = self.conn.execute("SELECT * FROM generation_memos WHERE key = ?", (key,)).fetchone()
+            return dict(row) if row else None
+        except Exception as e:
+            print(f"Error fetching generation memo: {e}")
+            return None
+
+    def save_generation_memo(self, memo: Dict[str, Any]) -> bool:
+        """Insert or replace a memoised generation"""
+        try:
+            with self._lock:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO generation_memos (key, kind, profile_version, response, created_at) "
+                    "VALUES (:key, :kind, :profile_version, :response, :created_at)",
+                    memo
+                )
+                self.conn.commit()
+            return True
+        except Exception as e:
+            print(f"Error saving generation memo: {e}")
+            return False
@@ -1,5 +1,7 @@
-from supabase import create_client, Client
+from supabase import create_client, Client, ClientOptions
+from postgrest import ReturnMethod
 from typing import Optional, Dict, List, Any
+import base64
 import json
 from datetime import datetime
 import uuid
@@ -13,12 +15,36 @@ if src_path not in sys.path:
     sys.path.insert(0, src_path)
 
 from config import Config
+from database.transcript_archive import not_cleared
+from database.transcript_codec import TranscriptCodec, get_codec
+
+# Columns a history read needs; compressed bodies are decoded client-side
+HISTORY_COLUMNS = 'message, response, response_body, codec, message_type, timestamp'
+ARCHIVE_ROW_COLUMNS = 'id, session_id, message, response, response_body, codec, message_type, timestamp'
+
+
+def history_columns() -> str:
+    """HISTORY_COLUMNS, plus parsed response sections once migration 007 is applied"""
+    return f"{HISTORY_COLUMNS}, sections" if Config.STORE_SECTIONS else HISTORY_COLUMNS
+
+USAGE_GROUPS = ('session', 'message_type', 'model', 'day')
 
 class SupabaseManager:
     """Manage Supabase database connections and operations for medical chatbot"""
     
-    def __init__(self):
+    def __init__(self, codec: TranscriptCodec = None, archive=None, raise_errors: bool = False):
+        """archive: optional ParquetArchive used as the cold tier instead of the archive table
+
+        raise_errors: re-raise failures of the chat and usage read/write methods
+        instead of returning an empty result (used by ResilientStore to detect outages)
+        """
         self.client: Optional[Client] = None
+        self.raise_errors = raise_errors
+        self.codec = codec if codec is not None else get_codec()
+        if archive is None and Config.ARCHIVE_PARQUET_DIR:
+            from database.transcript_archive import ParquetArchive
+            archive = ParquetArchive(Config.ARCHIVE_PARQUET_DIR)
+        self.archive = archive
         self.connect()
     
     def connect(self):
@@ -37,7 +63,9 @@ class SupabaseManager:
                 Config.SUPABASE_KEY == 'your_supabase_anon_key_here'):
                 raise ValueError("Please replace placeholder values in .env file with actual Supabase credentials")
             
-            self.client = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
+            # Fail fast rather than holding a chat request for the default 120s
+            options = ClientOptions(postgrest_client_timeout=Config.SUPABASE_TIMEOUT)
+            self.client = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY, options)
             print("Successfully connected to Supabase")
         except ValueError as e:
             print(f"Configuration error: {e}")
@@ -46,42 +74,382 @@ class SupabaseManager:
             print(f"Failed to connect to Supabase: {e}")
             raise
     
-    def save_chat_message(self, session_id: str, message: str, 
-                         response: str, message_type: str = 'medical_query') -> Dict[str, Any]:
-        """Save a chat message and response"""
+    def save_chat_message(self, session_id: str, message: str, response: str,
+                         message_type: str = 'medical_query', timestamp: str = None,
+                         sections: Dict[str, str] = None) -> Dict[str, Any]:
+        """Save a chat message and response (the response body is stored compressed)
+
+        sections: the response's parsed sections (see services/structured_output.py), stored as jsonb
+        """
         try:
+            payload, codec = self.codec.encode(response)
             chat_data = {
                 'id': str(uuid.uuid4()),
                 'session_id': session_id,
                 'message': message,
-                'response': response,
+                'response_body': base64.b64encode(payload).decode('ascii'),
+                'codec': codec,
                 'message_type': message_type,
-                'timestamp': datetime.now().isoformat()
+                'timestamp': timestamp or datetime.now().isoformat()
             }
+            if Config.TRANSCRIPT_SEARCH_ENABLED:
+                # Indexed by a trigger and then discarded; only the tsvector is stored
+                chat_data['search_text'] = response
+            if sections and Config.STORE_SECTIONS:
+                chat_data['sections'] = sections
             
-            result = self.client.table('chat_conversations').insert(chat_data).execute()
-            return result.data[0] if result.data else None
+            # The row is built client-side, so skip echoing it back
+            self.client.table('chat_conversations').insert(chat_data, returning=ReturnMethod.minimal).execute()
+            chat_data.pop('search_text', None)
+            chat_data.pop('response_body')
+            chat_data.pop('codec')
+            chat_data['response'] = response
+            return chat_data
             
         except Exception as e:
             print(f"Error saving chat message: {e}")
+            if self.raise_errors:
+                raise
             return None
     
+    def _decode_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Replace a stored compressed body with the plaintext response"""
+        codec = row.pop('codec', None)
+        body = row.pop('response_body', None)
+        if codec and body is not None:
+            if isinstance(body, str):
+                body = base64.b64decode(body)
+            row['response'] = self.codec.decode(body, codec)
+        return row
+    
     def get_chat_history(self, session_id: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get chat history for a session"""
+        """Get the latest `limit` turns of a session, oldest first (falls back to the cold archive)"""
         try:
-            result = self.client.table('chat_conversations').select('*').eq('session_id', session_id).order('timestamp', desc=False).limit(limit).execute()
-            return result.data or []
+            # The live view hides rows of cleared sessions until they are purged
+            result = self.client.table('chat_conversations_live').select(history_columns()).eq('session_id', session_id).order('timestamp', desc=True).limit(limit).execute()
+            rows = list(reversed(result.data or []))
+            if not rows:
+                rows = self.get_archived_history(session_id, limit)
+            return [self._decode_row(row) for row in rows]
         except Exception as e:
             print(f"Error fetching chat history: {e}")
+            if self.raise_errors:
+                raise
             return []
     
-    def delete_chat_history(self, session_id: str) -> bool:
-        """Delete chat history for a session"""
+    def get_archived_history(self, session_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get the latest stored (still compressed) rows of an archived session, oldest first"""
+        deleted_at = self.get_tombstone(session_id)
+        if self.archive is not None:
+            return self.archive.get_session(session_id, limit, after=deleted_at)
+        query = self.client.table('chat_conversations_archive').select(history_columns()).eq('session_id', session_id)
+        if deleted_at:
+            query = query.gt('timestamp', deleted_at)
+        result = query.order('timestamp', desc=True).limit(limit).execute()
+        return list(reversed(result.data or []))
+    
+    def delete_chat_history(self, session_id: str, deleted_at: str = None) -> bool:
+        """Clear chat history for a session (as of deleted_at, default now).
+
+        Only records a tombstone, so this returns immediately; the rows are
+        hidden from reads and deleted later by the background purger.
+        """
         try:
-            result = self.client.table('chat_conversations').delete().eq('session_id', session_id).execute()
+            self.client.table('chat_session_tombstones').upsert({
+                'session_id': session_id,
+                'deleted_at': deleted_at or datetime.now().isoformat()
+            }, returning=ReturnMethod.minimal).execute()
             return True
         except Exception as e:
             print(f"Error deleting chat history: {e}")
+            if self.raise_errors:
+                raise
+            return False
+    
+    def get_tombstone(self, session_id: str) -> Optional[str]:
+        """When a session was last cleared, or None"""
+        result = self.client.table('chat_session_tombstones').select('deleted_at').eq('session_id', session_id).limit(1).execute()
+        return result.data[0]['deleted_at'] if result.data else None
+    
+    def get_tombstones(self, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Cleared sessions still waiting to be purged"""
+        try:
+            result = self.client.table('chat_session_tombstones').select('session_id, deleted_at').limit(limit).execute()
+            return result.data or []
+        except Exception as e:
+            print(f"Error fetching tombstones: {e}")
+            return []
+    
+    def purge_deleted_sessions(self, batch_size: int = 1000) -> int:
+        """Physically delete up to batch_size rows of cleared sessions"""
+        try:
+            result = self.client.rpc('purge_deleted_chat_sessions', {'batch_size': batch_size}).execute()
+            return int(result.data or 0)
+        except Exception as e:
+            print(f"Error purging deleted chat sessions: {e}")
+            return 0
+    
+    def ensure_partitions(self, months_ahead: int = 3) -> int:
+        """Create upcoming monthly partitions of chat_conversations"""
+        try:
+            result = self.client.rpc('ensure_chat_partitions', {'months_ahead': months_ahead}).execute()
+            return int(result.data or 0)
+        except Exception as e:
+            print(f"Error creating chat partitions: {e}")
+            return 0
+    
+    def drop_expired_partitions(self, retention_days: int) -> int:
+        """Drop monthly partitions entirely older than the retention window"""
+        try:
+            result = self.client.rpc('drop_expired_chat_partitions', {'retention_days': retention_days}).execute()
+            return int(result.data or 0)
+        except Exception as e:
+            print(f"Error dropping expired chat partitions: {e}")
+            return 0
+    
+    def expire_archived_rows(self, retention_days: int, batch_size: int = 1000) -> int:
+        """Delete up to batch_size archived rows older than the retention window"""
+        try:
+            result = self.client.rpc('expire_archived_chat_rows', {
+                'retention_days': retention_days,
+                'batch_size': batch_size
+            }).execute()
+            return int(result.data or 0)
+        except Exception as e:
+            print(f"Error expiring archived chat rows: {e}")
+            return 0
+    
+    def archive_sessions(self, cutoff: datetime, max_sessions: int = 100) -> int:
+        """Move up to max_sessions sessions idle since cutoff into the archive table"""
+        try:
+            result = self.client.rpc('archive_chat_sessions', {
+                'cutoff': cutoff.isoformat(),
+                'max_sessions': max_sessions
+            }).execute()
+            return int(result.data or 0)
+        except Exception as e:
+            print(f"Error archiving chat sessions: {e}")
+            return 0
+    
+    def get_cold_sessions(self, cutoff: datetime, max_sessions: int = 100) -> List[str]:
+        """Session IDs whose latest turn is older than cutoff"""
+        try:
+            result = self.client.rpc('cold_chat_sessions', {
+                'cutoff': cutoff.isoformat(),
+                'max_sessions': max_sessions
+            }).execute()
+            return [row if isinstance(row, str) else row.get('cold_chat_sessions') for row in (result.data or [])]
+        except Exception as e:
+            print(f"Error finding cold chat sessions: {e}")
+            return []
+    
+    def get_archive_rows(self, session_ids: List[str]) -> List[Dict[str, Any]]:
+        """Stored rows for sessions, with bodies as compressed bytes (legacy rows are compressed here)"""
+        # Rows of cleared sessions are left for the purger, not archived
+        result = self.client.table('chat_conversations_live').select(ARCHIVE_ROW_COLUMNS).in_('session_id', session_ids).execute()
+        rows = []
+        for row in result.data or []:
+            if row.get('codec'):
+                body = base64.b64decode(row['response_body'])
+                codec = row['codec']
+            else:
+                body, codec = self.codec.encode(row.get('response') or '')
+            row.pop('response', None)
+            row['response_body'] = body
+            row['codec'] = codec
+            rows.append(row)
+        return rows
+    
+    def delete_sessions(self, session_ids: List[str]) -> bool:
+        """Delete all hot rows for the given sessions"""
+        try:
+            self.client.table('chat_conversations').delete().in_('session_id', session_ids).execute()
+            return True
+        except Exception as e:
+            print(f"Error deleting chat sessions: {e}")
+            return False
+    
+    def get_export_page(self, after: Optional[tuple] = None, limit: int = 1000, since: datetime = None,
+                        until: datetime = None, message_type: str = None, session_id: str = None,
+                        archived: bool = False) -> List[Dict[str, Any]]:
+        """One page of live (or, with archived, cold archive) rows ordered by (timestamp, id), after the `after` cursor
+
+        Keyset pagination: every page is an index range scan on
+        (timestamp, id), however deep into the table it is. Failures are
+        raised, so an export never mistakes an error for the end of the data.
+        Archived pages read the Parquet archive when one is configured,
+        otherwise the chat_conversations_archive_live view (migration 008).
+        """
+        try:
+            if archived and self.archive is not None:
+                rows = self.archive.get_export_page(after, limit, since, until, message_type, session_id,
+                                                    visible=not_cleared(self.get_tombstone))
+                return [self._decode_row(row) for row in rows]
+            view = 'chat_conversations_archive_live' if archived else 'chat_conversations_live'
+            query = self.client.table(view).select(ARCHIVE_ROW_COLUMNS)
+            if after:
+                timestamp, row_id = after
+                query = query.or_(f'timestamp.gt."{timestamp}",and(timestamp.eq."{timestamp}",id.gt.{row_id})')
+            if since:
+                query = query.gte('timestamp', since.isoformat())
+            if until:
+                query = query.lt('timestamp', until.isoformat())
+            if message_type:
+                query = query.eq('message_type', message_type)
+            if session_id:
+                query = query.eq('session_id', session_id)
+            result = query.order('timestamp').order('id').limit(limit).execute()
+            return [self._decode_row(row) for row in result.data or []]
+        except Exception as e:
+            print(f"Error fetching export page: {e}")
+            raise
+    
+    def search_chat_messages(self, query: str, session_id: str = None, since: datetime = None,
+                             until: datetime = None, after: Optional[tuple] = None,
+                             limit: int = 20) -> List[Dict[str, Any]]:
+        """Live turns matching a web-style query (GIN-indexed tsvector), best first, after the (rank, id) cursor"""
+        try:
+            result = self.client.rpc('search_chat_conversations', {
+                'query': query,
+                'session': session_id,
+                'since': since.isoformat() if since else None,
+                'until': until.isoformat() if until else None,
+                'after_rank': after[0] if after else None,
+                'after_id': after[1] if after else None,
+                'max_rows': limit,
+            }).execute()
+            return [self._decode_row(row) for row in result.data or []]
+        except Exception as e:
+            print(f"Error searching chat messages: {e}")
+            if self.raise_errors:
+                raise
+            return []
+    
+    def get_unindexed_rows(self, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Turns missing from the search index (saved before it existed), with plaintext responses"""
+        result = self.client.table('chat_conversations').select(
+            'id, message, response, response_body, codec'
+        ).is_('search_vector', 'null').limit(limit).execute()
+        return [self._decode_row(row) for row in result.data or []]
+    
+    def index_search_rows(self, rows: List[Dict[str, Any]]) -> int:
+        """Add turns (id, message, response) to the search index"""
+        result = self.client.rpc('chat_search_backfill', {
+            'rows': [{'id': row['id'], 'text': row.get('response') or ''} for row in rows]
+        }).execute()
+        return result.data or 0
+    
+    def sample_responses(self, limit: int = 1000) -> List[str]:
+        """Recent plaintext responses, e.g. for training a compression dictionary"""
+        try:
+            result = self.client.table('chat_conversations').select('response, response_body, codec').order('timestamp', desc=True).limit(limit).execute()
+            return [self._decode_row(row).get('response') or '' for row in (result.data or [])]
+        except Exception as e:
+            print(f"Error sampling responses: {e}")
+            return []
+
+    def save_usage_records(self, records: List[Dict[str, Any]]) -> bool:
+        """Insert a batch of per-turn usage records"""
+        try:
+            self.client.table('chat_usage').insert(records, returning=ReturnMethod.minimal).execute()
+            return True
+        except Exception as e:
+            print(f"Error saving usage records: {e}")
+            if self.raise_errors:
+                raise
+            return False
+
+    def get_usage_rollup(self, group_by: str = 'session', since: datetime = None, until: datetime = None,
+                         limit: int = 100) -> List[Dict[str, Any]]:
+        """Token and latency totals per session, message_type, model or day, costliest first"""
+        try:
+            if group_by not in USAGE_GROUPS:
+                raise ValueError(f"Unknown usage grouping: {group_by}")
+            result = self.client.rpc('chat_usage_rollup', {
+                'group_by': group_by,
+                'since': since.isoformat() if since else None,
+                'until': until.isoformat() if until else None,
+                'max_rows': limit,
+            }).execute()
+            return result.data or []
+        except Exception as e:
+            print(f"Error fetching usage rollup: {e}")
+            return []
+
+    def create_user_profile(self, user_id: str, name: str, email: str,
+                            health_info: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Create a user profile"""
+        try:
+            now = datetime.now().isoformat()
+            profile_data = {
+                'id': user_id,
+                'name': name,
+                'email': email,
+                'health_info': health_info or {},
+                'created_at': now,
+                'updated_at': now
+            }
+
+            result = self.client.table('user_profiles').insert(profile_data).execute()
+            return result.data[0] if result.data else None
+
+        except Exception as e:
+            print(f"Error creating user profile: {e}")
+            return None
+
+    def get_user_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get a user profile by ID"""
+        try:
+            result = self.client.table('user_profiles').select('*').eq('id', user_id).limit(1).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            print(f"Error fetching user profile: {e}")
+            return None
+
+    def update_user_health_info(self, user_id: str, health_info: Dict[str, Any]) -> bool:
+        """Replace a user's health information"""
+        try:
+            result = self.client.table('user_profiles').update({
+                'health_info': health_info,
+                'updated_at': datetime.now().isoformat()
+            }).eq('id', user_id).execute()
+            return bool(result.data)
+        except Exception as e:
+            print(f"Error updating health info: {e}")
+            return False
+
+    def get_profile_page(self, after: Optional[str] = None, limit: int = 5000) -> List[Dict[str, Any]]:
+        """One page of (id, health_info) profiles ordered by id, starting after the `after` id
+
+        Keyset pagination on the primary key. Failures are raised, so a
+        cohort report never mistakes an error for the end of the data.
+        """
+        try:
+            query = self.client.table('user_profiles').select('id, health_info')
+            if after:
+                query = query.gt('id', after)
+            result = query.order('id').limit(limit).execute()
+            return result.data or []
+        except Exception as e:
+            print(f"Error fetching profile page: {e}")
+            raise
+
+    def get_generation_memo(self, key: str) -> Optional[Dict[str, Any]]:
+        """A memoised generation by key"""
+        try:
+            result = self.client.table('generation_memos').select('*').eq('key', key).limit(1).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            print(f"Error fetching generation memo: {e}")
+            return None
+
+    def save_generation_memo(self, memo: Dict[str, Any]) -> bool:
+        """Insert or replace a memoised generation"""
+        try:
+            self.client.table('generation_memos').upsert(memo, returning=ReturnMethod.minimal).execute()
+            return True
+        except Exception as e:
+            print(f"Error saving generation memo: {e}")
             return False
 
     def create_chat_table(self) -> bool:
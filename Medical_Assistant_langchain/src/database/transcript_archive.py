@@ -0,0 +1,229 @@
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed for the Parquet archive tier
+    pa = None
+
+ARCHIVE_COLUMNS = ['id', 'session_id', 'message', 'response_body', 'codec', 'message_type', 'timestamp']
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parse an ISO timestamp as naive UTC so stored and client-side times compare"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def not_cleared(get_tombstone: Callable[[str], Optional[str]]) -> Callable[[Dict[str, Any]], bool]:
+    """visible(row) for get_export_page: False for rows written before their session was cleared"""
+    tombstones: Dict[str, Optional[datetime]] = {}
+
+    def visible(row: Dict[str, Any]) -> bool:
+        session_id = row['session_id']
+        if session_id not in tombstones:
+            deleted_at = get_tombstone(session_id)
+            tombstones[session_id] = parse_timestamp(deleted_at) if deleted_at else None
+        cutoff = tombstones[session_id]
+        return cutoff is None or parse_timestamp(row['timestamp']) > cutoff
+    return visible
+
+
+def archive_schema():
+    return pa.schema([
+        ('id', pa.string()),
+        ('session_id', pa.string()),
+        ('message', pa.string()),
+        ('response_body', pa.binary()),
+        ('codec', pa.string()),
+        ('message_type', pa.string()),
+        ('timestamp', pa.string()),
+        # timestamp as naive UTC, for filtering and ordering (null in files written before it existed)
+        ('timestamp_utc', pa.timestamp('us')),
+    ])
+
+
+def with_utc_timestamps(table):
+    """table conformed to archive_schema(), with timestamp_utc filled in from timestamp where missing"""
+    schema = archive_schema()
+    if 'timestamp_utc' in table.column_names:
+        utc = table['timestamp_utc'].cast(pa.timestamp('us'))
+        missing = utc.null_count > 0
+    else:
+        utc = None
+        missing = True
+    if missing:
+        parsed = [parse_timestamp(ts) for ts in table['timestamp'].to_pylist()]
+        utc = pa.array(parsed, type=pa.timestamp('us')) if utc is None else \
+            pc.coalesce(utc, pa.array(parsed, type=pa.timestamp('us')))
+    columns = [table[column] for column in ARCHIVE_COLUMNS] + [utc]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+class ParquetArchive:
+    """Cold transcript tier stored as local Parquet files.
+
+    Each compaction batch writes one file under
+    `<directory>/archived_date=YYYY-MM-DD/`. Bodies stay in their compressed
+    form (response_body + codec), so archiving never re-encodes them.
+    Rows keep their original timestamp string; timestamp_utc holds the same
+    instant as naive UTC, so filters and sort order hold across offsets and
+    ISO formats. Files written before that column existed are parsed on read
+    and upgraded whenever they are rewritten.
+    """
+
+    def __init__(self, directory: str):
+        if pa is None:
+            raise ImportError("pyarrow is required for the Parquet transcript archive")
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, rows: List[Dict[str, Any]]) -> str:
+        """Write archive rows (response_body as bytes) to a new Parquet file"""
+        if not rows:
+            return None
+        partition = os.path.join(self.directory, f"archived_date={datetime.now().strftime('%Y-%m-%d')}")
+        os.makedirs(partition, exist_ok=True)
+        path = os.path.join(partition, f"part-{uuid.uuid4().hex}.parquet")
+        table = pa.Table.from_pylist(
+            [{**{column: row.get(column) for column in ARCHIVE_COLUMNS},
+              'timestamp_utc': parse_timestamp(row['timestamp'])} for row in rows],
+            schema=archive_schema()
+        )
+        with self._lock:
+            pq.write_table(table, path, compression='zstd')
+        return path
+
+    def _dataset(self):
+        return ds.dataset(self.directory, format='parquet', partitioning='hive', schema=archive_schema())
+
+    def _read(self, expression=None):
+        """Rows matching expression, with timestamp_utc filled in"""
+        with self._lock:
+            table = self._dataset().to_table(columns=ARCHIVE_COLUMNS + ['timestamp_utc'], filter=expression)
+        return with_utc_timestamps(table)
+
+    def get_session(self, session_id: str, limit: int = None, after: str = None) -> List[Dict[str, Any]]:
+        """Archived rows for a session in chronological order (the latest `limit`), optionally only those after a timestamp"""
+        table = self._read(ds.field('session_id') == session_id)
+        if after:
+            table = table.filter(pc.greater(table['timestamp_utc'], pa.scalar(parse_timestamp(after), pa.timestamp('us'))))
+        table = table.sort_by([('timestamp_utc', 'ascending'), ('id', 'ascending')]).select(ARCHIVE_COLUMNS)
+        rows = table.to_pylist()
+        return rows[-limit:] if limit else rows
+
+    def get_export_page(self, after: Optional[tuple] = None, limit: int = 1000, since: datetime = None,
+                        until: datetime = None, message_type: str = None, session_id: str = None,
+                        visible: Callable[[Dict[str, Any]], bool] = None) -> List[Dict[str, Any]]:
+        """Up to `limit` archived rows ordered by (timestamp, id), starting after the `after` cursor
+
+        Timestamps are compared as UTC instants, not as strings. The time
+        filters are pushed down to files with timestamp_utc and re-applied
+        once older files have been parsed. visible(row) drops rows (of
+        cleared sessions) without cutting the page short; further batches
+        are read until it is full or the archive runs out.
+        """
+        utc = ds.field('timestamp_utc')
+        expression = None
+
+        def both(left, right):
+            return right if left is None else left & right
+
+        def matches(left, right):
+            return right if left is None else pc.and_(left, right)
+
+        def at(value):
+            return pa.scalar(parse_timestamp(value if isinstance(value, str) else value.isoformat()),
+                             pa.timestamp('us'))
+
+        if since:
+            expression = both(expression, (utc >= at(since)) | ~utc.is_valid())
+        if until:
+            expression = both(expression, (utc < at(until)) | ~utc.is_valid())
+        if message_type:
+            expression = both(expression, ds.field('message_type') == message_type)
+        if session_id:
+            expression = both(expression, ds.field('session_id') == session_id)
+        rows: List[Dict[str, Any]] = []
+        while len(rows) < limit:
+            where = expression
+            if after:
+                timestamp, row_id = after
+                where = both(where, (utc > at(timestamp))
+                             | ((utc == at(timestamp)) & (ds.field('id') > str(row_id)))
+                             | ~utc.is_valid())
+            table = self._read(where)
+            # Files without timestamp_utc could not be filtered on it
+            keep = None
+            if since:
+                keep = pc.greater_equal(table['timestamp_utc'], at(since))
+            if until:
+                keep = matches(keep, pc.less(table['timestamp_utc'], at(until)))
+            if after:
+                keep = matches(keep, pc.or_(pc.greater(table['timestamp_utc'], at(timestamp)),
+                                         pc.and_(pc.equal(table['timestamp_utc'], at(timestamp)),
+                                                 pc.greater(table['id'], str(row_id)))))
+            if keep is not None:
+                table = table.filter(keep)
+            batch = table.sort_by([('timestamp_utc', 'ascending'), ('id', 'ascending')]) \
+                .slice(0, limit).select(ARCHIVE_COLUMNS).to_pylist()
+            rows.extend(row for row in batch if visible is None or visible(row))
+            if len(batch) < limit:
+                break
+            after = (batch[-1]['timestamp'], batch[-1]['id'])
+        return rows[:limit]
+
+    def delete_session(self, session_id: str, before: str = None) -> int:
+        """Rewrite the files that contain a session without its rows (only rows at or before `before` if given)"""
+        cutoff = pa.scalar(parse_timestamp(before), pa.timestamp('us')) if before else None
+        removed = 0
+        with self._lock:
+            for fragment in self._dataset().get_fragments():
+                table = with_utc_timestamps(pq.read_table(fragment.path))
+                keep = pc.not_equal(table['session_id'], session_id)
+                if cutoff is not None:
+                    keep = pc.or_(keep, pc.greater(table['timestamp_utc'], cutoff))
+                kept = table.filter(keep)
+                if kept.num_rows == table.num_rows:
+                    continue
+                removed += table.num_rows - kept.num_rows
+                if kept.num_rows:
+                    pq.write_table(kept, fragment.path, compression='zstd')
+                else:
+                    os.remove(fragment.path)
+        return removed
+
+    def expire_before(self, cutoff: datetime) -> int:
+        """Remove archived turns whose own timestamp is before cutoff, returning the rows removed
+
+        Retention follows the turn, not the day it was archived: a file is
+        deleted outright once its newest turn has expired and rewritten
+        when only some of its turns have. Emptied partitions are removed.
+        """
+        cutoff = pa.scalar(parse_timestamp(cutoff.isoformat()), pa.timestamp('us'))
+        removed = 0
+        with self._lock:
+            for fragment in self._dataset().get_fragments():
+                table = with_utc_timestamps(pq.read_table(fragment.path))
+                kept = table.filter(pc.greater_equal(table['timestamp_utc'], cutoff))
+                if kept.num_rows == table.num_rows:
+                    continue
+                removed += table.num_rows - kept.num_rows
+                if kept.num_rows:
+                    pq.write_table(kept, fragment.path, compression='zstd')
+                else:
+                    os.remove(fragment.path)
+            for name in os.listdir(self.directory):
+                partition = os.path.join(self.directory, name)
+                if name.startswith('archived_date=') and os.path.isdir(partition) and not os.listdir(partition):
+                    os.rmdir(partition)
+        return removed
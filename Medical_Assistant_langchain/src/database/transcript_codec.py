@@ -0,0 +1,140 @@
+import glob
+import os
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # optional: fall back to zlib
+    zstandard = None
+
+import sys
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+
+# Codec names stored alongside each compressed body
+CODEC_RAW = 'raw'
+CODEC_ZLIB = 'zlib'
+CODEC_ZSTD = 'zstd'
+DICT_PREFIX = 'zstd:'  # 'zstd:<dict_id>' = zstd with a trained dictionary
+
+
+class TranscriptCodec:
+    """Compress and decompress transcript bodies.
+
+    Uses zstd when the `zstandard` package is installed, with the newest
+    trained dictionary found in Config.TRANSCRIPT_DICT_DIR. Our answers are
+    repetitive and structured, so a dictionary gives much better ratios on
+    short bodies. Every dictionary in that directory stays loadable, so rows
+    written with an older dictionary still decode after retraining. Without
+    zstandard the codec falls back to zlib.
+    """
+
+    def __init__(self, dict_dir: str = None, level: int = None):
+        self.dict_dir = dict_dir if dict_dir is not None else Config.TRANSCRIPT_DICT_DIR
+        self.level = level if level is not None else Config.TRANSCRIPT_COMPRESSION_LEVEL
+        self._dicts: Dict[int, 'zstandard.ZstdCompressionDict'] = {}
+        self.active_dict_id: Optional[int] = None
+        self._local = threading.local()
+        self.load_dictionaries()
+
+    def load_dictionaries(self):
+        """Load every *.zdict file; the most recently modified becomes active"""
+        if zstandard is None or not self.dict_dir or not os.path.isdir(self.dict_dir):
+            return
+        paths = sorted(glob.glob(os.path.join(self.dict_dir, '*.zdict')), key=os.path.getmtime)
+        for path in paths:
+            try:
+                with open(path, 'rb') as f:
+                    dictionary = zstandard.ZstdCompressionDict(f.read())
+                self._dicts[dictionary.dict_id()] = dictionary
+                self.active_dict_id = dictionary.dict_id()
+            except Exception as e:
+                print(f"Error loading compression dictionary {path}: {e}")
+        # Compressors cache the active dictionary per thread
+        self._local = threading.local()
+
+    def train_dictionary(self, samples: List[str], dict_size: int = 112640) -> Optional[int]:
+        """Train a zstd dictionary from sample bodies, save it and make it active"""
+        if zstandard is None:
+            print("zstandard is not installed; cannot train a dictionary")
+            return None
+        encoded = [sample.encode('utf-8') for sample in samples if sample]
+        if len(encoded) < 8:
+            print("Not enough samples to train a dictionary")
+            return None
+        dictionary = zstandard.train_dictionary(dict_size, encoded)
+        os.makedirs(self.dict_dir, exist_ok=True)
+        path = os.path.join(self.dict_dir, f"transcripts-{dictionary.dict_id()}.zdict")
+        with open(path, 'wb') as f:
+            f.write(dictionary.as_bytes())
+        self._dicts[dictionary.dict_id()] = dictionary
+        self.active_dict_id = dictionary.dict_id()
+        self._local = threading.local()
+        return dictionary.dict_id()
+
+    def _compressor(self):
+        compressor = getattr(self._local, 'compressor', None)
+        if compressor is None:
+            dictionary = self._dicts.get(self.active_dict_id) if self.active_dict_id else None
+            compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary)
+            self._local.compressor = compressor
+        return compressor
+
+    def _decompressor(self, dict_id: Optional[int]):
+        cache = getattr(self._local, 'decompressors', None)
+        if cache is None:
+            cache = self._local.decompressors = {}
+        decompressor = cache.get(dict_id)
+        if decompressor is None:
+            dictionary = None
+            if dict_id is not None:
+                dictionary = self._dicts.get(dict_id)
+                if dictionary is None:
+                    raise ValueError(f"Compression dictionary {dict_id} is not available")
+            decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+            cache[dict_id] = decompressor
+        return decompressor
+
+    def encode(self, text: str) -> Tuple[bytes, str]:
+        """Compress text, returning (payload, codec name)"""
+        data = (text or '').encode('utf-8')
+        if len(data) < Config.TRANSCRIPT_MIN_COMPRESS_BYTES:
+            return data, CODEC_RAW
+        if zstandard is not None:
+            codec = f"{DICT_PREFIX}{self.active_dict_id}" if self.active_dict_id else CODEC_ZSTD
+            return self._compressor().compress(data), codec
+        return zlib.compress(data, min(self.level, 9)), CODEC_ZLIB
+
+    def decode(self, payload: bytes, codec: str) -> str:
+        """Decompress a payload written by encode()"""
+        if codec == CODEC_RAW:
+            return payload.decode('utf-8')
+        if codec == CODEC_ZLIB:
+            return zlib.decompress(payload).decode('utf-8')
+        if codec == CODEC_ZSTD or codec.startswith(DICT_PREFIX):
+            if zstandard is None:
+                raise ValueError("zstandard is required to read zstd-compressed transcripts")
+            dict_id = int(codec[len(DICT_PREFIX):]) if codec.startswith(DICT_PREFIX) else None
+            return self._decompressor(dict_id).decompress(payload).decode('utf-8')
+        raise ValueError(f"Unknown transcript codec: {codec}")
+
+
+_default_codec: Optional[TranscriptCodec] = None
+_default_codec_lock = threading.Lock()
+
+
+def get_codec() -> TranscriptCodec:
+    """Process-wide codec shared by the storage managers"""
+    global _default_codec
+    with _default_codec_lock:
+        if _default_codec is None:
+            _default_codec = TranscriptCodec()
+        return _default_codec
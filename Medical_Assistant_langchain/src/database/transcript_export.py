@@ -0,0 +1,282 @@
+"""
+Streaming export of chat transcripts for analytics.
+
+Rows are read one keyset page at a time, ordered by (timestamp, id): each
+page asks for the rows after the last one seen, so it costs the same
+however deep into the table it is, and only one page is held in memory.
+Live transcripts are exported first, then archived sessions (the archive
+table or Parquet archive); a session archived while the export runs can
+appear in both, with the same row ids. Rows are written as JSON Lines or
+as Parquet part files, and a checkpoint records the tier and cursor after
+each durable write so an interrupted export resumes where it stopped.
+
+Usage:
+    python src/database/transcript_export.py --output chats.jsonl --since 2024-01-01
+    python src/database/transcript_export.py --format parquet --output chats/ --message-type medical_query
+    python src/database/transcript_export.py --output recent.jsonl --since 2024-06-01 --live-only
+"""
+import argparse
+import glob
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+import sys
+import os
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from database.compaction import create_store
+from utils.metrics import metrics
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed for Parquet exports
+    pa = None
+
+EXPORT_COLUMNS = ['id', 'session_id', 'message', 'response', 'message_type', 'timestamp']
+EXPORT_FORMATS = ('jsonl', 'parquet')
+# Exported in this order; a checkpoint records which one it stopped in
+EXPORT_TIERS = ('live', 'archive')
+
+
+def iter_transcripts(store, after: Optional[tuple] = None, page_size: int = None, pause: float = None,
+                     archived: bool = False, **filters) -> Iterator[Dict[str, Any]]:
+    """Yield live (or, with archived, archived) transcript rows in (timestamp, id) order, after the `after` cursor
+
+    filters: since, until, message_type, session_id (see get_export_page).
+    """
+    page_size = page_size or Config.EXPORT_PAGE_SIZE
+    pause = Config.EXPORT_PAGE_PAUSE if pause is None else pause
+    while True:
+        page = store.get_export_page(after, page_size, archived=archived, **filters)
+        metrics.increment('export.pages')
+        yield from page
+        if len(page) < page_size:
+            return
+        after = (page[-1]['timestamp'], page[-1]['id'])
+        if pause:
+            time.sleep(pause)
+
+
+class JsonlExportWriter:
+    """One JSON object per line; resumes by truncating to the checkpointed offset"""
+
+    def __init__(self, path: str, offset: int = 0):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'r+b' if offset and os.path.exists(path) else 'wb')
+        # Drop anything written after the last checkpoint
+        self.file.seek(offset)
+        self.file.truncate()
+
+    def write(self, rows: List[Dict[str, Any]]):
+        self.file.write(''.join(json.dumps({column: row.get(column) for column in EXPORT_COLUMNS},
+                                           ensure_ascii=False, default=str) + '\n'
+                                for row in rows).encode('utf-8'))
+
+    def checkpoint(self) -> Optional[Dict[str, Any]]:
+        """State to resume from, once everything written so far is on disk"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {'offset': self.file.tell()}
+
+    def close(self) -> Dict[str, Any]:
+        state = self.checkpoint()
+        self.file.close()
+        return state
+
+
+class ParquetExportWriter:
+    """Numbered Parquet part files of up to rows_per_file rows, one row group per page.
+
+    Only closed part files count as written: resuming deletes the parts
+    started after the last checkpoint.
+    """
+
+    def __init__(self, directory: str, parts: int = 0, rows_per_file: int = None):
+        if pa is None:
+            raise ImportError("pyarrow is required for Parquet exports")
+        self.directory = directory
+        self.parts = parts
+        self.rows_per_file = rows_per_file or Config.EXPORT_ROWS_PER_FILE
+        self.schema = pa.schema([(column, pa.string()) for column in EXPORT_COLUMNS])
+        self._writer = None
+        self._file_rows = 0
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, 'part-*.parquet')):
+            try:
+                index = int(os.path.basename(path)[len('part-'):-len('.parquet')])
+            except ValueError:
+                continue
+            if index >= parts:
+                os.remove(path)
+
+    def write(self, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        if self._writer is None:
+            path = os.path.join(self.directory, f"part-{self.parts:05d}.parquet")
+            self._writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+        table = pa.Table.from_pylist(
+            [{column: None if row.get(column) is None else str(row[column]) for column in EXPORT_COLUMNS}
+             for row in rows],
+            schema=self.schema
+        )
+        self._writer.write_table(table)
+        self._file_rows += len(rows)
+
+    def _close_part(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._file_rows = 0
+            self.parts += 1
+
+    def checkpoint(self) -> Optional[Dict[str, Any]]:
+        """State to resume from when a part file was just completed, else None"""
+        if self._file_rows < self.rows_per_file:
+            return None
+        self._close_part()
+        return {'parts': self.parts}
+
+    def close(self) -> Dict[str, Any]:
+        self._close_part()
+        return {'parts': self.parts}
+
+
+class TranscriptExporter:
+    """Export transcripts matching the filters (live, then archived) to a JSONL file or a Parquet directory"""
+
+    def __init__(self, store, output: str, fmt: str = 'jsonl', checkpoint_path: str = None,
+                 page_size: int = None, pause: float = None, rows_per_file: int = None,
+                 since: datetime = None, until: datetime = None, message_type: str = None,
+                 session_id: str = None, include_archive: bool = True):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+        self.store = store
+        self.output = output
+        self.format = fmt
+        self.checkpoint_path = checkpoint_path or f"{output.rstrip(os.sep)}.checkpoint.json"
+        self.page_size = page_size or Config.EXPORT_PAGE_SIZE
+        self.pause = pause
+        self.rows_per_file = rows_per_file
+        self.filters = {'since': since, 'until': until, 'message_type': message_type, 'session_id': session_id}
+        self.tiers = EXPORT_TIERS if include_archive else EXPORT_TIERS[:1]
+
+    def _describe(self) -> Dict[str, Any]:
+        """What is being exported; a checkpoint only resumes the same export"""
+        return {
+            'format': self.format,
+            'output': os.path.abspath(self.output),
+            'filters': {key: value.isoformat() if isinstance(value, datetime) else value
+                        for key, value in self.filters.items()},
+            'tiers': list(self.tiers),
+        }
+
+    def load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if {key: checkpoint.get(key) for key in ('format', 'output', 'filters', 'tiers')} != self._describe():
+            raise ValueError(f"{self.checkpoint_path} belongs to a different export; remove it to start over")
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint: Dict[str, Any]):
+        temp_path = f"{self.checkpoint_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def _open_writer(self, state: Dict[str, Any]):
+        if self.format == 'parquet':
+            return ParquetExportWriter(self.output, state.get('parts', 0), self.rows_per_file)
+        return JsonlExportWriter(self.output, state.get('offset', 0))
+
+    def run(self) -> int:
+        """Export (or resume exporting) every matching row, returning the rows written by this run"""
+        checkpoint = self.load_checkpoint() or {**self._describe(), 'tier': self.tiers[0], 'cursor': None, 'rows': 0}
+        if checkpoint.get('complete'):
+            print(f"Export to {self.output} already complete ({checkpoint['rows']} rows)")
+            return 0
+        if checkpoint['rows']:
+            print(f"Resuming export after {checkpoint['rows']} rows")
+        writer = self._open_writer(checkpoint)
+        written = 0
+        try:
+            with metrics.stage('export'):
+                for tier in self.tiers[self.tiers.index(checkpoint['tier']):]:
+                    if tier != checkpoint['tier']:
+                        checkpoint.update(tier=tier, cursor=None)
+                    after = tuple(checkpoint['cursor']) if checkpoint['cursor'] else None
+                    page: List[Dict[str, Any]] = []
+                    for row in iter_transcripts(self.store, after, self.page_size, self.pause,
+                                                archived=tier == 'archive', **self.filters):
+                        page.append(row)
+                        if len(page) < self.page_size:
+                            continue
+                        written += self._write_page(writer, page, checkpoint)
+                        page = []
+                    written += self._write_page(writer, page, checkpoint)
+                checkpoint.update(writer.close(), complete=True)
+                writer = None
+                self.save_checkpoint(checkpoint)
+        finally:
+            if writer is not None:
+                writer.close()
+        return written
+
+    def _write_page(self, writer, page: List[Dict[str, Any]], checkpoint: Dict[str, Any]) -> int:
+        if not page:
+            return 0
+        writer.write(page)
+        checkpoint['rows'] += len(page)
+        checkpoint['cursor'] = [page[-1]['timestamp'], page[-1]['id']]
+        metrics.increment('export.rows', len(page))
+        state = writer.checkpoint()
+        if state is not None:
+            self.save_checkpoint({**checkpoint, **state})
+        return len(page)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export chat transcripts to JSON Lines or Parquet")
+    parser.add_argument('--output', required=True, help='JSONL file, or directory of Parquet part files')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='jsonl')
+    parser.add_argument('--since', type=datetime.fromisoformat, help='Only turns at or after this date/time')
+    parser.add_argument('--until', type=datetime.fromisoformat, help='Only turns before this date/time')
+    parser.add_argument('--message-type', help='Only turns of this message_type')
+    parser.add_argument('--session-id', help='Only turns of this session')
+    parser.add_argument('--live-only', action='store_true', help='Skip archived sessions')
+    parser.add_argument('--checkpoint', help='Checkpoint file (default: <output>.checkpoint.json)')
+    parser.add_argument('--page-size', type=int, default=Config.EXPORT_PAGE_SIZE)
+    parser.add_argument('--pause', type=float, default=Config.EXPORT_PAGE_PAUSE, help='Seconds between pages')
+    parser.add_argument('--rows-per-file', type=int, default=Config.EXPORT_ROWS_PER_FILE,
+                        help='Rows per Parquet part file')
+    parser.add_argument('--sqlite', help='Export a local SQLite database instead of Supabase')
+    args = parser.parse_args()
+
+    exporter = TranscriptExporter(
+        create_store(args.sqlite), args.output, args.format, args.checkpoint, args.page_size, args.pause,
+        args.rows_per_file, args.since, args.until, args.message_type, args.session_id, not args.live_only
+    )
+    if args.live_only and (args.since is None or args.since < datetime.now() - timedelta(days=Config.ARCHIVE_AFTER_DAYS)):
+        print(f"Warning: --live-only skips sessions idle for over {Config.ARCHIVE_AFTER_DAYS} days, "
+              "which this date range can include")
+    try:
+        written = exporter.run()
+    except Exception as e:
+        print(f"Export failed, rerun to resume from {exporter.checkpoint_path}: {e}")
+        sys.exit(1)
+    print(f"Exported {written} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Full-text search over past consultations.
+
+Stores keep a maintained full-text index over message and response: a
+GIN-indexed tsvector in Supabase (migrations/005_transcript_search.sql) and
+an FTS5 table in SQLite. Both rank matches (ts_rank_cd / BM25) and page
+with an opaque (rank, id) cursor. Responses are stored compressed, so
+snippets are cut here from the decoded text. Turns with stored sections
+(migrations/007_structured_sections.sql) report the section the match is
+in, and can be narrowed to matches in one section.
+
+Usage:
+    python src/database/transcript_search.py --backfill          # index turns saved before the index existed
+    python src/database/transcript_search.py "metformin dose" --session-id <id>
+    python src/database/transcript_search.py "ibuprofen" --section recommended_medications
+"""
+import argparse
+import base64
+import json
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import sys
+import os
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from database.compaction import create_store
+from utils.metrics import metrics
+
+
+def encode_cursor(rank: float, row_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([rank, row_id]).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        rank, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return float(rank), str(row_id)
+    except Exception:
+        raise ValueError("invalid search cursor")
+
+
+def term_pattern(terms: List[str]) -> Optional[re.Pattern]:
+    """Regex matching the query terms by stem, so "doses" finds "dose" (the indexes stem too)"""
+    stems = [re.escape(term[:max(4, len(term) - 2)]) for term in terms if term]
+    return re.compile(r'\b(?:' + '|'.join(stems) + r')\w*', re.IGNORECASE) if stems else None
+
+
+def make_snippet(text: str, terms: List[str], width: int = None) -> str:
+    """About `width` characters of text around the first query term, terms in **bold**"""
+    width = width or Config.SEARCH_SNIPPET_CHARS
+    text = ' '.join((text or '').split())
+    pattern = term_pattern(terms)
+    match = pattern.search(text) if pattern else None
+    start = 0
+    if match and match.start() > width // 3:
+        # Start at a word boundary a little before the match
+        start = text.find(' ', match.start() - width // 3) + 1
+    snippet = text[start:start + width]
+    if pattern:
+        snippet = pattern.sub(lambda found: f"**{found.group(0)}**", snippet)
+    return f"{'…' if start else ''}{snippet}{'…' if start + width < len(text) else ''}"
+
+
+def matching_section(sections: Optional[Dict[str, str]], pattern: Optional[re.Pattern]) -> Optional[str]:
+    """Key of the first stored section containing a query term"""
+    if not sections or pattern is None:
+        return None
+    return next((key for key, text in sections.items() if text and pattern.search(text)), None)
+
+
+def search_transcripts(store, query: str, session_id: str = None, since: datetime = None,
+                       until: datetime = None, limit: int = None, cursor: str = None,
+                       section: str = None) -> Dict[str, Any]:
+    """One page of matching turns, best first, with snippets and the cursor of the next page
+
+    With `section`, only turns matching in that section are returned, so a
+    page can hold fewer than `limit` results and still have a next page.
+    """
+    limit = limit or Config.SEARCH_PAGE_SIZE
+    after = decode_cursor(cursor) if cursor else None
+    terms = re.findall(r'\w+', query.lower())
+    pattern = term_pattern(terms)
+    with metrics.stage('search'):
+        rows = store.search_chat_messages(query, session_id, since, until, after, limit)
+    metrics.increment('search.queries')
+    results = []
+    for row in rows:
+        sections = row.get('sections')
+        if section:
+            if matching_section({section: (sections or {}).get(section)}, pattern) is None:
+                continue
+            found = section
+        else:
+            found = matching_section(sections, pattern)
+        response = row.get('response') or ''
+        # Show where the match is: in its section, the answer if it's there, else in the question
+        if found:
+            source = sections[found]
+        else:
+            source = response if pattern and pattern.search(response) else row.get('message')
+        results.append({
+            'id': str(row['id']),
+            'session_id': row['session_id'],
+            'message_type': row.get('message_type'),
+            'timestamp': str(row['timestamp']),
+            'rank': row['rank'],
+            'message': row.get('message'),
+            'section': found,
+            'snippet': make_snippet(source, terms),
+        })
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = encode_cursor(rows[-1]['rank'], str(rows[-1]['id']))
+    return {'results': results, 'next_cursor': next_cursor}
+
+
+def backfill(store, batch_size: int = 500) -> int:
+    """Index every turn saved before the search index existed"""
+    total = 0
+    while True:
+        rows = store.get_unindexed_rows(batch_size)
+        if not rows:
+            return total
+        store.index_search_rows(rows)
+        total += len(rows)
+        print(f"Indexed {total} turns")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search past consultations or backfill the search index")
+    parser.add_argument('query', nargs='?', help='Web-style search query')
+    parser.add_argument('--session-id', help='Only search this session')
+    parser.add_argument('--since', type=datetime.fromisoformat)
+    parser.add_argument('--until', type=datetime.fromisoformat)
+    parser.add_argument('--limit', type=int, default=Config.SEARCH_PAGE_SIZE)
+    parser.add_argument('--cursor', help='next_cursor of the previous page')
+    parser.add_argument('--section', help='Only matches in this response section (e.g. treatment_plan)')
+    parser.add_argument('--backfill', action='store_true', help='Index turns saved before the index existed')
+    parser.add_argument('--sqlite', help='Use a local SQLite database instead of Supabase')
+    args = parser.parse_args()
+
+    store = create_store(args.sqlite)
+    if args.backfill:
+        print(f"Indexed {backfill(store)} turns")
+        return
+    if not args.query:
+        parser.error("a query (or --backfill) is required")
+    print(json.dumps(search_transcripts(store, args.query, args.session_id, args.since, args.until,
+                                        args.limit, args.cursor, args.section), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List
+
+import httpx
+
+
+class MedicalChatClient:
+    """HTTP client for the medical chat API with the MedicalChatService interface.
+
+    Lets Streamlit run as a thin client in front of horizontally scaled API
+    workers. A single pooled connection is reused across calls (keep-alive).
+    """
+
+    ERROR_RESPONSE = "I apologize, but I'm experiencing technical difficulties. Please try again later or consult a healthcare professional for medical advice."
+
+    def __init__(self, base_url: str, timeout: float = 120.0):
+        self.base_url = base_url.rstrip('/')
+        self.client = httpx.Client(base_url=self.base_url, timeout=timeout)
+
+    def chat(self, message: str, session_id: str, message_type: str = None, supersede: bool = False) -> str:
+        """Send a chat message and return the full response"""
+        try:
+            result = self.client.post('/chat', json={
+                'session_id': session_id, 'message': message, 'message_type': message_type,
+                'supersede': supersede
+            })
+            result.raise_for_status()
+            return result.json()['response']
+        except Exception as e:
+            print(f"Error calling chat API: {e}")
+            return self.ERROR_RESPONSE
+
+    def stream_chat(self, message: str, session_id: str, message_type: str = None,
+                    supersede: bool = False,
+                    on_section: Callable[[Dict[str, Any]], None] = None,
+                    on_triage: Callable[[Dict[str, Any]], None] = None) -> Iterator[str]:
+        """Send a chat message and yield response chunks from the SSE stream
+
+        Closing the generator closes the connection, which cancels the
+        generation on the server. on_section and on_triage, if given, receive
+        the server's section and triage events (see
+        MedicalChatService.stream_chat).
+        """
+        try:
+            with self.client.stream('POST', '/chat/stream', json={
+                'session_id': session_id, 'message': message, 'message_type': message_type,
+                'supersede': supersede, 'sections': on_section is not None, 'triage': on_triage is not None
+            }) as result:
+                result.raise_for_status()
+                event = None
+                for line in result.iter_lines():
+                    if line.startswith('event:'):
+                        event = line[len('event:'):].strip()
+                    elif line.startswith('data:'):
+                        if event == 'done':
+                            return
+                        data = json.loads(line[len('data:'):])
+                        if event == 'section':
+                            on_section(data)
+                        elif event == 'triage':
+                            on_triage(data)
+                        else:
+                            yield data['delta']
+                    elif not line:
+                        event = None
+        except Exception as e:
+            print(f"Error calling streaming chat API: {e}")
+            yield self.ERROR_RESPONSE
+
+    def get_chat_history(self, session_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get stored chat turns for a session"""
+        try:
+            result = self.client.get(f'/sessions/{session_id}/history', params={'limit': limit})
+            result.raise_for_status()
+            return result.json()['history']
+        except Exception as e:
+            print(f"Error fetching chat history from API: {e}")
+            return []
+
+    def search_history(self, query: str, session_id: str, since: datetime = None, until: datetime = None,
+                       limit: int = None, cursor: str = None, section: str = None) -> Dict[str, Any]:
+        """Full-text search over a session's stored turns"""
+        params = {'q': query, 'since': since.isoformat() if since else None,
+                  'until': until.isoformat() if until else None, 'limit': limit, 'cursor': cursor,
+                  'section': section}
+        try:
+            result = self.client.get(f'/sessions/{session_id}/search',
+                                     params={key: value for key, value in params.items() if value is not None})
+            result.raise_for_status()
+            page = result.json()
+            return {'results': page['results'], 'next_cursor': page['next_cursor']}
+        except Exception as e:
+            print(f"Error searching chat history via API: {e}")
+            return {'results': [], 'next_cursor': None}
+
+    def clear_chat_history(self, session_id: str) -> bool:
+        """Clear chat history for a session"""
+        try:
+            result = self.client.delete(f'/sessions/{session_id}/history')
+            result.raise_for_status()
+            return True
+        except Exception as e:
+            print(f"Error clearing chat history via API: {e}")
+            return False
+
+    def cancel_session(self, session_id: str) -> bool:
+        """Cancel the session's in-flight request"""
+        try:
+            result = self.client.post(f'/sessions/{session_id}/cancel')
+            result.raise_for_status()
+            return result.json()['cancelled']
+        except Exception as e:
+            print(f"Error cancelling request via API: {e}")
+            return False
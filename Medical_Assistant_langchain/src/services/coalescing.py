@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+
+from utils.metrics import metrics
+
+
+def request_key(messages: List[Any], params: Dict[str, Any] = None) -> str:
+    """Stable key for a fully rendered prompt plus model parameters"""
+    payload = {
+        'messages': [
+            [getattr(message, 'type', type(message).__name__), getattr(message, 'content', message)]
+            for message in messages
+        ],
+        'params': params or {},
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class _SharedStream:
+    """Chunks of one upstream stream, replayed to every attached consumer.
+
+    There is no dedicated leader: whichever consumer first needs a chunk
+    that hasn't arrived yet pulls it from the upstream iterator. A consumer
+    that stops early therefore never cuts the stream short for the others.
+    The upstream is closed only when every consumer has gone.
+    """
+
+    def __init__(self, factory: Callable[[], Iterable[Any]], on_finish: Callable[[], None]):
+        self._factory = factory
+        self._on_finish = on_finish
+        self._source: Optional[Iterator[Any]] = None
+        self._cond = threading.Condition()
+        self._chunks: List[Any] = []
+        self._pulling = False
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._consumers = 0
+
+    def attach(self):
+        with self._cond:
+            self._consumers += 1
+
+    def _finish(self, error: BaseException = None):
+        with self._cond:
+            self._done = True
+            self._error = error
+            self._pulling = False
+            self._cond.notify_all()
+        self._on_finish()
+
+    def consume(self) -> Iterator[Any]:
+        """Yield every chunk from the start; call attach() first"""
+        index = 0
+        try:
+            while True:
+                pull = False
+                with self._cond:
+                    while index >= len(self._chunks) and not self._done and self._pulling:
+                        self._cond.wait()
+                    if index < len(self._chunks):
+                        chunk = self._chunks[index]
+                    elif self._done:
+                        if self._error is not None:
+                            raise self._error
+                        return
+                    else:
+                        self._pulling = True
+                        pull = True
+                if pull:
+                    try:
+                        if self._source is None:
+                            self._source = iter(self._factory())
+                        chunk = next(self._source)
+                    except StopIteration:
+                        self._finish()
+                        continue
+                    except Exception as e:
+                        self._finish(e)
+                        raise
+                    with self._cond:
+                        self._chunks.append(chunk)
+                        self._pulling = False
+                        self._cond.notify_all()
+                index += 1
+                yield chunk
+        finally:
+            with self._cond:
+                self._consumers -= 1
+                abandoned = self._consumers == 0 and not self._done
+            if abandoned:
+                close = getattr(self._source, 'close', None)
+                if close is not None:
+                    close()
+                self._finish()
+
+
+class SingleFlight:
+    """Coalesce concurrent identical requests onto one upstream call.
+
+    Requests are keyed (see request_key) on the rendered prompt and model
+    parameters. While a call for a key is in flight, later callers with the
+    same key wait for and share its result instead of issuing their own.
+    Sync callers (do, stream) and async callers (do_async) share the same
+    in-flight table, so a coalesced call may mix both.
+    """
+
+    def __init__(self, name: str = 'llm'):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self._streams: Dict[str, _SharedStream] = {}
+
+    def _record(self, leader: bool):
+        metrics.increment(f'coalesce.{self.name}.leaders' if leader else f'coalesce.{self.name}.followers')
+        metrics.set_gauge(f'coalesce.{self.name}.rate', self.coalesce_rate())
+
+    def coalesce_rate(self) -> float:
+        """Share of requests that were served by another request's upstream call"""
+        leaders = metrics.counter(f'coalesce.{self.name}.leaders')
+        followers = metrics.counter(f'coalesce.{self.name}.followers')
+        total = leaders + followers
+        return followers / total if total else 0.0
+
+    def _join(self, key: str):
+        """Return (future, is_leader) for key"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def _complete(self, key: str, future: Future, result: Any = None, error: BaseException = None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Run fn once for all concurrent sync callers with the same key"""
+        future, leader = self._join(key)
+        self._record(leader)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._complete(key, future, error=e)
+            raise
+        self._complete(key, future, result=result)
+        return result
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await fn() once for all concurrent callers (sync or async) with the same key"""
+        future, leader = self._join(key)
+        self._record(leader)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._complete(key, future, error=e)
+            raise
+        self._complete(key, future, result=result)
+        return result
+
+    def stream(self, key: str, factory: Callable[[], Iterable[Any]]) -> Iterator[Any]:
+        """Iterate one upstream stream, fanned out to all concurrent callers with the same key"""
+        with self._lock:
+            shared = self._streams.get(key)
+            leader = shared is None
+            if leader:
+                shared = _SharedStream(factory, lambda: self._drop_stream(key, shared))
+                self._streams[key] = shared
+            shared.attach()
+        self._record(leader)
+        return shared.consume()
+
+    def _drop_stream(self, key: str, shared: _SharedStream):
+        with self._lock:
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+
+
+# Process-wide coalescer for LLM calls, shared by every service instance
+llm_flights = SingleFlight('llm')
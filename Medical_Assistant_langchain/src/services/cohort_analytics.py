@@ -0,0 +1,315 @@
+"""
+Population analytics over stored health profiles.
+
+Profiles are read one keyset page (COHORT_CHUNK_SIZE profiles) at a time
+and turned into columnar NumPy arrays; BMI, BMI categories, age bands and
+the cross-tab between them are computed on whole columns, and condition,
+medication and allergy prevalence by normalising each distinct term once
+per chunk and counting (profile, term) pairs with np.unique/np.bincount.
+Only running totals are kept between chunks, so memory stays bounded
+however many profiles there are.
+
+Reports are k-anonymous: a count of fewer than COHORT_MIN_COUNT profiles
+(but more than none) is suppressed, as is one more cell on any line of a
+table where a single suppressed cell could be worked out from the total.
+Terms held by fewer profiles are left out of the prevalence lists, and
+the BMI range (each end is one person's value) is withheld.
+
+Usage:
+    python src/services/cohort_analytics.py
+    python src/services/cohort_analytics.py --sqlite data/local.db --json
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import sys
+import os
+
+import numpy as np
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from database.compaction import create_store
+from utils.metrics import metrics
+
+# Same thresholds as utils.helpers.get_bmi_category
+BMI_EDGES = np.array([18.5, 25.0, 30.0])
+BMI_CATEGORIES = ['Underweight', 'Normal weight', 'Overweight', 'Obese', 'Unknown']
+AGE_EDGES = np.array([18, 30, 45, 60, 75])
+AGE_BANDS = ['<18', '18-29', '30-44', '45-59', '60-74', '75+', 'Unknown']
+TERM_FIELDS = ('medical_conditions', 'medications', 'allergies')
+# "Metformin 500mg twice daily" and "metformin" are the same medication
+DOSE_SUFFIX = re.compile(r'\s+\d.*$')
+
+
+def to_float(value: Any) -> float:
+    """A number from a profile field ("72", "72 kg", 72), NaN if there isn't one"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    match = re.match(r'\s*(\d+(?:\.\d+)?)', str(value)) if value is not None else None
+    return float(match.group(1)) if match else np.nan
+
+
+def normalize_terms(value: Any) -> List[str]:
+    """Distinct lowercased terms of a list or comma-separated field"""
+    items = value if isinstance(value, list) else re.split(r'[,;\n]+', str(value or ''))
+    terms = {DOSE_SUFFIX.sub('', ' '.join(str(item).lower().split())) for item in items}
+    terms.discard('')
+    terms.discard('none')
+    return sorted(terms)
+
+
+def bmi(weight_kg: np.ndarray, height_cm: np.ndarray) -> np.ndarray:
+    """BMI of whole columns; NaN where weight or height is missing or implausible"""
+    height_m = height_cm / 100.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = weight_kg / (height_m * height_m)
+    values[(height_cm < 50) | (height_cm > 250) | (weight_kg < 2) | (weight_kg > 500)] = np.nan
+    return np.round(values, 1)
+
+
+def bmi_category_codes(values: np.ndarray) -> np.ndarray:
+    """Index into BMI_CATEGORIES for each BMI (NaN is 'Unknown')"""
+    codes = np.digitize(values, BMI_EDGES)
+    codes[np.isnan(values)] = len(BMI_CATEGORIES) - 1
+    return codes
+
+
+def age_band_codes(ages: np.ndarray) -> np.ndarray:
+    """Index into AGE_BANDS for each age (NaN or implausible is 'Unknown')"""
+    codes = np.digitize(ages, AGE_EDGES)
+    codes[np.isnan(ages) | (ages < 0) | (ages > 120)] = len(AGE_BANDS) - 1
+    return codes
+
+
+def suppression_mask(table: np.ndarray, min_count: int) -> np.ndarray:
+    """True for the cells of a 1-D or 2-D count table that must not be published
+
+    Small non-zero cells are suppressed first; then, while a row or
+    column has exactly one suppressed cell (which its published total
+    would give away), its smallest other non-zero cell is suppressed too.
+    """
+    table = np.atleast_2d(table)
+    mask = (table > 0) & (table < min_count)
+    changed = True
+    while changed:
+        changed = False
+        for lines, line_mask in ((table, mask), (table.T, mask.T)):
+            for line, hidden in zip(lines, line_mask):
+                if hidden.sum() != 1:
+                    continue
+                candidates = np.flatnonzero(~hidden & (line > 0))
+                if candidates.size:
+                    hidden[candidates[np.argmin(line[candidates])]] = True
+                    changed = True
+    return mask
+
+
+def term_counts(owners: List[int], raw_items: List[str]) -> Tuple[List[str], np.ndarray]:
+    """(terms, number of profiles mentioning each) for a chunk's raw list items
+
+    owners[i] is the profile (row in the chunk) that raw_items[i] came
+    from. Each distinct raw item is normalised once; a profile mentioning
+    a term twice counts once.
+    """
+    raw_codes: Dict[str, int] = {}
+    codes = np.fromiter((raw_codes.setdefault(item, len(raw_codes)) for item in raw_items),
+                        dtype=np.int64, count=len(raw_items))
+    term_ids: Dict[str, int] = {}
+    raw_terms = [[term_ids.setdefault(term, len(term_ids)) for term in normalize_terms(raw)] for raw in raw_codes]
+    if not term_ids:
+        return [], np.zeros(0, dtype=np.int64)
+    # Expand each (profile, raw item) into its (profile, term) pairs
+    lengths = np.fromiter((len(terms) for terms in raw_terms), dtype=np.int64, count=len(raw_terms))
+    offsets = np.cumsum(lengths) - lengths
+    flat = np.fromiter((term for terms in raw_terms for term in terms), dtype=np.int64, count=int(lengths.sum()))
+    repeats = lengths[codes]
+    pair_owners = np.repeat(np.asarray(owners, dtype=np.int64), repeats)
+    within = np.arange(int(repeats.sum())) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    pair_terms = flat[np.repeat(offsets[codes], repeats) + within]
+    distinct = np.unique(pair_owners * len(term_ids) + pair_terms)
+    return list(term_ids), np.bincount(distinct % len(term_ids), minlength=len(term_ids))
+
+
+class ProfileColumns:
+    """One chunk of profiles as columns"""
+
+    def __init__(self, profiles: List[Dict[str, Any]]):
+        infos = [profile.get('health_info') or {} for profile in profiles]
+        self.size = len(infos)
+        self.age = np.fromiter((to_float(info.get('age')) for info in infos), dtype=np.float64, count=self.size)
+        self.weight = np.fromiter((to_float(info.get('weight')) for info in infos), dtype=np.float64, count=self.size)
+        self.height = np.fromiter((to_float(info.get('height')) for info in infos), dtype=np.float64, count=self.size)
+        self.gender = np.array([str(info.get('gender') or 'unknown').strip().lower() for info in infos], dtype=object)
+        # Per field: (terms, profiles mentioning each)
+        self.terms: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        for field in TERM_FIELDS:
+            owners, raw_items = [], []
+            for row, info in enumerate(infos):
+                value = info.get(field)
+                for item in value if isinstance(value, list) else (value,):
+                    if item:
+                        owners.append(row)
+                        raw_items.append(str(item))
+            self.terms[field] = term_counts(owners, raw_items)
+
+
+class CohortAccumulator:
+    """Running totals over chunks of profiles"""
+
+    def __init__(self):
+        self.profiles = 0
+        self.bmi_count = 0
+        self.bmi_sum = 0.0
+        self.bmi_min = np.inf
+        self.bmi_max = -np.inf
+        # BMI category x age band
+        self.crosstab = np.zeros((len(BMI_CATEGORIES), len(AGE_BANDS)), dtype=np.int64)
+        self.genders: Counter = Counter()
+        self.terms: Dict[str, Counter] = {field: Counter() for field in TERM_FIELDS}
+
+    def add(self, columns: ProfileColumns):
+        self.profiles += columns.size
+        values = bmi(columns.weight, columns.height)
+        known = values[~np.isnan(values)]
+        if known.size:
+            self.bmi_count += int(known.size)
+            self.bmi_sum += float(known.sum())
+            self.bmi_min = min(self.bmi_min, float(known.min()))
+            self.bmi_max = max(self.bmi_max, float(known.max()))
+        cells = bmi_category_codes(values) * len(AGE_BANDS) + age_band_codes(columns.age)
+        self.crosstab += np.bincount(cells, minlength=self.crosstab.size).reshape(self.crosstab.shape)
+        if columns.size:
+            genders, counts = np.unique(columns.gender, return_counts=True)
+            self.genders.update(dict(zip(genders.tolist(), counts.tolist())))
+        for field, (terms, counts) in columns.terms.items():
+            self.terms[field].update(dict(zip(terms, counts.tolist())))
+
+    def report(self, top: int = None, min_count: int = None) -> Dict[str, Any]:
+        """The totals as a report; counts below min_count come back as None"""
+        top = top or Config.COHORT_TOP_TERMS
+        min_count = Config.COHORT_MIN_COUNT if min_count is None else min_count
+        total = self.profiles or 1
+
+        def shares(names: List[str], counts: np.ndarray, hidden: np.ndarray) -> List[Dict[str, Any]]:
+            return [{'name': name, 'count': None, 'share': None} if suppressed else
+                    {'name': name, 'count': int(count), 'share': round(int(count) / total, 4)}
+                    for name, count, suppressed in zip(names, counts.tolist(), hidden.tolist())]
+
+        def table(names: List[str], counts: List[int]) -> List[Dict[str, Any]]:
+            counts = np.asarray(counts, dtype=np.int64)
+            return shares(names, counts, suppression_mask(counts, min_count)[0])
+
+        def prevalence(counter: Counter) -> List[Dict[str, Any]]:
+            common = [(name, count) for name, count in counter.most_common() if count >= min_count][:top]
+            return shares([name for name, _ in common], np.array([count for _, count in common], dtype=np.int64),
+                          np.zeros(len(common), dtype=bool))
+
+        crosstab = self.crosstab.astype(object)
+        crosstab[suppression_mask(self.crosstab, min_count)] = None
+        small = self.bmi_count < min_count
+        genders = self.genders.most_common()
+        return {
+            'profiles': self.profiles,
+            'min_count': min_count,
+            'bmi': {
+                'count': self.bmi_count,
+                'mean': round(self.bmi_sum / self.bmi_count, 1) if self.bmi_count and not small else None,
+                'min': self.bmi_min if self.bmi_count and min_count <= 1 else None,
+                'max': self.bmi_max if self.bmi_count and min_count <= 1 else None,
+                'categories': table(BMI_CATEGORIES, self.crosstab.sum(axis=1)),
+            },
+            'age_bands': table(AGE_BANDS, self.crosstab.sum(axis=0)),
+            'bmi_by_age_band': {band: dict(zip(BMI_CATEGORIES, crosstab[:, index].tolist()))
+                                for index, band in enumerate(AGE_BANDS)},
+            'gender': table([name for name, _ in genders], [count for _, count in genders]),
+            **{field: prevalence(counter) for field, counter in self.terms.items()},
+        }
+
+
+def iter_profile_chunks(store, chunk_size: int = None) -> Iterator[List[Dict[str, Any]]]:
+    """Yield every stored profile, chunk_size at a time, in id order"""
+    chunk_size = chunk_size or Config.COHORT_CHUNK_SIZE
+    after = None
+    while True:
+        page = store.get_profile_page(after, chunk_size)
+        if page:
+            yield page
+        if len(page) < chunk_size:
+            return
+        after = page[-1]['id']
+
+
+def cohort_report(store, chunk_size: int = None, top: int = None, min_count: int = None) -> Dict[str, Any]:
+    """Aggregate statistics over every stored health profile"""
+    started = time.perf_counter()
+    totals = CohortAccumulator()
+    with metrics.stage('cohort_report'):
+        for chunk in iter_profile_chunks(store, chunk_size):
+            totals.add(ProfileColumns(chunk))
+    report = totals.report(top, min_count)
+    report['elapsed'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+class CohortReportCache:
+    """The latest report, rebuilt at most every COHORT_REPORT_TTL seconds"""
+
+    def __init__(self, store, ttl: float = None):
+        self.store = store
+        self.ttl = Config.COHORT_REPORT_TTL if ttl is None else ttl
+        self._report: Optional[Dict[str, Any]] = None
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> Dict[str, Any]:
+        # One rebuild at a time; concurrent callers wait for it rather than scanning too
+        with self._lock:
+            if self._report is None or time.monotonic() - self._built_at > self.ttl:
+                self._report = cohort_report(self.store)
+                self._built_at = time.monotonic()
+            return self._report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"Profiles: {report['profiles']}  (built in {report['elapsed']}s, "
+             f"counts under {report['min_count']} suppressed)"]
+    bmi_stats = report['bmi']
+    if bmi_stats['mean'] is not None:
+        spread = f", range {bmi_stats['min']}-{bmi_stats['max']}" if bmi_stats['min'] is not None else ''
+        lines.append(f"BMI: mean {bmi_stats['mean']}{spread} ({bmi_stats['count']} with weight and height)")
+    for title, key in (('BMI category', None), ('Age band', 'age_bands'), ('Gender', 'gender'),
+                       ('Conditions', 'medical_conditions'), ('Medications', 'medications'),
+                       ('Allergies', 'allergies')):
+        rows = bmi_stats['categories'] if key is None else report[key]
+        lines.append(f"\n{title}:")
+        lines.extend(f"  {row['name']:<30} {'<' + str(report['min_count']):>8}" if row['count'] is None else
+                     f"  {row['name']:<30} {row['count']:>8}  {row['share']:>7.1%}" for row in rows)
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Population statistics over stored health profiles")
+    parser.add_argument('--chunk-size', type=int, default=Config.COHORT_CHUNK_SIZE, help='Profiles read per page')
+    parser.add_argument('--top', type=int, default=Config.COHORT_TOP_TERMS, help='Most common terms listed per field')
+    parser.add_argument('--min-count', type=int, default=Config.COHORT_MIN_COUNT,
+                        help='Suppress counts of fewer profiles than this')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    parser.add_argument('--sqlite', help='Use a local SQLite database instead of Supabase')
+    args = parser.parse_args()
+
+    report = cohort_report(create_store(args.sqlite), args.chunk_size, args.top, args.min_count)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
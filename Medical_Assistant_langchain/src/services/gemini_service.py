@@ -12,13 +12,26 @@ if src_path not in sys.path:
     sys.path.insert(0, src_path)
 
 from config import Config
+from services.coalescing import SingleFlight, llm_flights, request_key
+from services.llm_scheduler import LLMScheduler, llm_scheduler, priority_for
+from services.traffic_capture import get_recorder, llm_key
 
 class GeminiService:
     """Service for interacting with Google's Gemini AI model"""
     
-    def __init__(self):
-        self.model = None
-        self.initialize_model()
+    ERROR_RESPONSE = "I apologize, but I'm having trouble processing your request right now. Please try again later or consult with a healthcare professional."
+    
+    def __init__(self, model=None, coalescer: SingleFlight = None, scheduler: LLMScheduler = None):
+        """Create the service; a model exposing generate_content() may be injected"""
+        self.model = model
+        self._model_injected = model is not None
+        self._models: Dict[str, Any] = {}
+        self.coalescer = coalescer if coalescer is not None else llm_flights
+        self.scheduler = scheduler if scheduler is not None else llm_scheduler
+        # Outputs are logged for replay while TRAFFIC_CAPTURE_DIR is set
+        self.recorder = get_recorder()
+        if self.model is None:
+            self.initialize_model()
     
     def initialize_model(self):
         """Initialize the Gemini model"""
@@ -35,12 +48,20 @@ class GeminiService:
                 raise ValueError("Please replace placeholder value in .env file with actual Gemini API key")
             
             genai.configure(api_key=Config.GEMINI_API_KEY)
-            self.model = genai.GenerativeModel('gemini-pro')
+            self.model = self.model_for(Config.GEMINI_MODEL)
             print("Gemini model initialized successfully")
         except Exception as e:
             print(f"Failed to initialize Gemini model: {e}")
             raise
     
+    def model_for(self, name: str):
+        """Model client for a generation profile, created on first use (an injected model serves all)"""
+        if self._model_injected:
+            return self.model
+        if name not in self._models:
+            self._models[name] = genai.GenerativeModel(name)
+        return self._models[name]
+    
     def create_medical_prompt(self, user_query: str, health_info: Dict[str, Any] = None, 
                             chat_history: List[Dict[str, Any]] = None) -> str:
         """Create a comprehensive medical prompt with context"""
@@ -110,22 +131,50 @@ While I provide comprehensive medical guidance including specific medication rec
         
         return base_prompt
     
-    def generate_response(self, prompt: str) -> str:
-        """Generate a response using Gemini"""
+    def generate_response(self, prompt: str, message_type: str = None, timeout: float = None,
+                          session_id: str = None, priority: int = None) -> str:
+        """Generate a response using Gemini with the message_type's generation profile
+
+        The upstream request is abandoned after `timeout` seconds (LLM_TIMEOUT by default).
+        It waits for a scheduler slot as session_id, in `priority` (by message_type if not given).
+        """
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
+            profile = Config.generation_profile(message_type)
+            generation_config = {
+                'max_output_tokens': profile['max_tokens'],
+                'temperature': profile['temperature'],
+            }
+            if profile.get('stop'):
+                generation_config['stop_sequences'] = profile['stop']
+            model = self.model_for(profile['model'])
+            priority = priority_for(message_type) if priority is None else priority
+            cost = len(prompt) // 4 + profile['max_tokens']
+            
+            def call():
+                with self.scheduler.slot(priority, session_id, cost):
+                    request = lambda: model.generate_content(
+                        prompt, generation_config=generation_config,
+                        request_options={'timeout': timeout or Config.LLM_TIMEOUT}
+                    )
+                    if self.recorder is not None and self.recorder.active:
+                        return self.recorder.llm_call(llm_key([prompt]), request).text
+                    return request().text
+            
+            # Identical prompts already in flight share one upstream call
+            key = request_key([prompt], profile)
+            return self.coalescer.do(key, call)
         except Exception as e:
             print(f"Error generating response: {e}")
-            return "I apologize, but I'm having trouble processing your request right now. Please try again later or consult with a healthcare professional."
+            return self.ERROR_RESPONSE
     
     def process_medical_query(self, user_query: str, health_info: Dict[str, Any] = None, 
-                             chat_history: List[Dict[str, Any]] = None) -> str:
+                             chat_history: List[Dict[str, Any]] = None,
+                             message_type: str = 'medical_query', session_id: str = None) -> str:
         """Process a medical query with full context"""
         prompt = self.create_medical_prompt(user_query, health_info, chat_history)
-        return self.generate_response(prompt)
+        return self.generate_response(prompt, message_type, session_id=session_id)
     
-    def analyze_symptoms(self, symptoms: str, health_info: Dict[str, Any] = None) -> str:
+    def analyze_symptoms(self, symptoms: str, health_info: Dict[str, Any] = None, session_id: str = None) -> str:
         """Analyze symptoms and provide guidance"""
         prompt = f"""You are a medical assistant. A user has described the following symptoms: {symptoms}
         
@@ -139,9 +188,9 @@ While I provide comprehensive medical guidance including specific medication rec
         
         Remember to emphasize the importance of professional medical consultation."""
         
-        return self.generate_response(prompt)
+        return self.generate_response(prompt, 'symptom_analysis', session_id=session_id)
     
-    def generate_health_recommendations(self, health_info: Dict[str, Any]) -> str:
+    def generate_health_recommendations(self, health_info: Dict[str, Any], session_id: str = None) -> str:
         """Generate personalized health recommendations"""
         prompt = f"""Based on the following health information, provide general wellness recommendations:
         
@@ -155,4 +204,4 @@ While I provide comprehensive medical guidance including specific medication rec
         
         Keep recommendations general and emphasize consulting healthcare professionals."""
         
-        return self.generate_response(prompt)
+        return self.generate_response(prompt, 'health_recommendations', session_id=session_id)
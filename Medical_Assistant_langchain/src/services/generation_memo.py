@@ -0,0 +1,115 @@
+"""
+Memoised profile-based generations.
+
+Health recommendations depend only on the validated health profile, and a
+symptom analysis only on the symptoms plus that profile, so both are
+stored against a content hash of the profile (its version) and reused
+until the profile actually changes. Entries live in the
+`generation_memos` table (migrations/006_generation_memos.sql), with a
+small in-process LRU in front of it.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+import sys
+import os
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from utils.helpers import parse_symptoms, validate_health_info
+from utils.metrics import metrics
+
+# Bump when the recommendation or symptom prompts change, so old answers aren't reused
+MEMO_VERSION = 1
+
+
+def profile_version(health_info: Dict[str, Any]) -> str:
+    """Stable hash of the validated profile: equal profiles share a version"""
+    validated = validate_health_info(health_info or {})
+    canonical = json.dumps(validated, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+
+def normalize_symptoms(symptoms: str) -> str:
+    """Sorted, lowercased, de-duplicated symptoms, synonyms as codes: "Fever, headache" and "head ache; high temperature" are equal"""
+    return ', '.join(sorted(parse_symptoms(symptoms, canonical=True)))
+
+
+class GenerationMemo:
+    """Generated text keyed by kind, profile version and normalised inputs"""
+
+    def __init__(self, store, max_entries: int = None, max_age_days: float = None):
+        self.store = store
+        self.max_entries = max_entries or Config.GENERATION_MEMO_CACHE_SIZE
+        self.max_age = timedelta(days=Config.GENERATION_MEMO_MAX_AGE_DAYS if max_age_days is None else max_age_days)
+        self._entries: 'OrderedDict[str, Tuple[str, datetime]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(kind: str, version: str, *parts: str) -> str:
+        model = Config.generation_profile(kind)['model']
+        raw = json.dumps([MEMO_VERSION, kind, model, version, *parts], ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """A fresh memoised response, from memory or the store"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            row = self.store.get_generation_memo(key)
+            if row is None:
+                return None
+            created_at = row['created_at']
+            if isinstance(created_at, str):
+                created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+            entry = (row['response'], created_at.replace(tzinfo=None))
+            self._remember(key, entry)
+        response, created_at = entry
+        if datetime.now() - created_at > self.max_age:
+            return None
+        return response
+
+    def put(self, key: str, kind: str, version: str, response: str):
+        created_at = datetime.now()
+        self._remember(key, (response, created_at))
+        self.store.save_generation_memo({
+            'key': key,
+            'kind': kind,
+            'profile_version': version,
+            'response': response,
+            'created_at': created_at.isoformat(),
+        })
+
+    def _remember(self, key: str, entry: Tuple[str, datetime]):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_generate(self, kind: str, version: str, generate: Callable[[], str], *parts: str,
+                        failed: str = None) -> Tuple[str, bool]:
+        """(response, cached): the memoised response, or generate()'s, which is stored
+
+        A response equal to `failed` (the generator's error text) is returned but not stored.
+        """
+        key = self.key(kind, version, *parts)
+        response = self.get(key)
+        if response is not None:
+            metrics.increment(f'memo.{kind}.hits')
+            return response, True
+        metrics.increment(f'memo.{kind}.misses')
+        response = generate()
+        if response and response != failed:
+            self.put(key, kind, version, response)
+        return response, False
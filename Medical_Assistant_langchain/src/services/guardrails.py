@@ -0,0 +1,296 @@
+"""
+Input and output guardrails that run alongside generation.
+
+Input checks (PII scrubbing, self-harm detection) run on a worker thread
+while the session's history loads, so they only add latency if they take
+longer than the load (a late check is run again on the request thread,
+never skipped). Output checks (implausible doses, the user's own PII
+echoed back) run on the token stream as it arrives: a short tail of text is held back
+until it has been checked, and a failed check cuts the stream and closes
+the upstream LLM call. Every check is a regular expression compiled at
+import, so a message or chunk is checked in microseconds.
+"""
+import json
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+import sys
+import os
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from utils.metrics import current_trace, metrics
+
+# Input checks run here while the request thread loads history
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='guardrails')
+
+# (pattern, replacement), applied in order to messages and responses
+PII_PATTERNS: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r'\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b'), '[email removed]'),
+    (re.compile(r'\b\d{3}-\d{2}-\d{4}\b'), '[SSN removed]'),
+    (re.compile(r'\b(?:\d[ -]?){13,16}\b'), '[card number removed]'),
+    (re.compile(r'(?<![\w+])(?:\+?\d{1,2}[ .-]?)?(?:\(\d{3}\)|\d{3})[ .-]?\d{3}[ .-]?\d{4}\b'), '[phone removed]'),
+]
+# In answers these are only removed when they repeat the user's own input:
+# the model has to be able to give helpline and emergency numbers
+ECHO_ONLY_REPLACEMENTS = ('[email removed]', '[phone removed]')
+
+# Broader than the router's emergency pattern, which only sees explicit phrases
+SELF_HARM_PATTERN = re.compile(
+    r"\b(suicid\w*|kill(ing)? myself|end(ing)? my life|take my (own )?life|want(ed)? to die|"
+    r"better off dead|(hurt(ing)?|harm(ing)?|cut(ting)?) myself|self[- ]harm\w*|no reason to live|overdos\w* on purpose|"
+    r"end(ing)? it all|(don['’]?t|do not) want to (be here|live|wake up)|(can['’]?t|cannot) go on|"
+    r"no point (in )?living|(rather|wish I was|wish I were) (be )?dead)\b",
+    re.IGNORECASE
+)
+
+# Maximum adult daily dose in mg: any single mention above it is a
+# generation error, whatever the context. GUARDRAIL_DOSE_LIMITS_JSON
+# adds or overrides entries, e.g. '{"warfarin": 15}'.
+DOSE_LIMITS_MG: Dict[str, float] = {
+    'acetaminophen': 4000, 'paracetamol': 4000, 'tylenol': 4000,
+    'ibuprofen': 3200, 'advil': 3200, 'motrin': 3200,
+    'naproxen': 1500, 'aleve': 1500,
+    'aspirin': 4000,
+    'diphenhydramine': 300, 'benadryl': 300,
+    'cetirizine': 20, 'loratadine': 20, 'fexofenadine': 360,
+    'amoxicillin': 4000, 'azithromycin': 2000, 'doxycycline': 300,
+    'metformin': 2550, 'lisinopril': 80, 'amlodipine': 10, 'atorvastatin': 80,
+    'sertraline': 200, 'fluoxetine': 80, 'omeprazole': 120,
+    'warfarin': 20, 'codeine': 360, 'tramadol': 400,
+}
+UNIT_MG = {'mg': 1.0, 'milligram': 1.0, 'milligrams': 1.0, 'g': 1000.0, 'gram': 1000.0, 'grams': 1000.0,
+           'mcg': 0.001, 'µg': 0.001, 'microgram': 0.001, 'micrograms': 0.001}
+AMOUNT_PATTERN = re.compile(
+    r'\b(\d{1,3}(?:,\d{3})+|\d+(?:\.\d+)?)\s*(' + '|'.join(sorted(UNIT_MG, key=len, reverse=True)) + r')\b',
+    re.IGNORECASE
+)
+WORD_PATTERN = re.compile(r'[a-z]+')
+# An amount is only matched to a drug named earlier in the same clause
+CLAUSE_BREAK = re.compile(r'[.;,\n]|\b(?:and|plus|but|or|then|with)\b', re.IGNORECASE)
+DOSE_CONTEXT_CHARS = 60  # how far before an amount its drug is looked for
+DOSE_LOOKAHEAD_CHARS = 24  # text needed after an amount before it is judged ("5 g" / "5 glasses", "of <drug>")
+
+# Text kept before the part being checked, so a dose split across chunks
+# is still matched to the drug named before it
+OUTPUT_OVERLAP_CHARS = 100
+
+BLOCKED_DOSE_NOTICE = (
+    "\n\n[Response stopped: it stated a dose of {drug} above the usual maximum. "
+    "Please confirm any dosing with a pharmacist or doctor.]"
+)
+
+
+def dose_limits() -> Dict[str, float]:
+    limits = dict(DOSE_LIMITS_MG)
+    limits.update(json.loads(Config.GUARDRAIL_DOSE_LIMITS_JSON or '{}'))
+    return limits
+
+
+def safe_cut(text: str, limit: int) -> int:
+    """A split point at or before limit that is at a word boundary and inside no PII match"""
+    cut = text.rfind(' ', 0, limit) + 1
+    moved = True
+    while moved and cut:
+        moved = False
+        for pattern, _ in PII_PATTERNS:
+            for match in pattern.finditer(text, 0, len(text)):
+                if match.start() < cut < match.end():
+                    cut = match.start()
+                    moved = True
+    return cut
+
+
+def scrub_pii(text: str) -> Tuple[str, int]:
+    """text with PII replaced, and the number of replacements"""
+    total = 0
+    for pattern, replacement in PII_PATTERNS:
+        text, count = pattern.subn(replacement, text)
+        total += count
+    return text, total
+
+
+def pii_key(value: str) -> str:
+    """Compare PII by its digits (the last 10, so "+1 555..." is "555..."), or lowercased"""
+    digits = re.sub(r'\D', '', value)
+    return digits[-10:] if digits else value.lower()
+
+
+def pii_values(text: str) -> frozenset:
+    """pii_key of every PII match in text"""
+    return frozenset(pii_key(match.group(0)) for pattern, _ in PII_PATTERNS for match in pattern.finditer(text))
+
+
+def scrub_output_pii(text: str, echoed: frozenset) -> Tuple[str, int]:
+    """Like scrub_pii, but emails and phone numbers are kept unless their pii_key is in echoed"""
+    total = 0
+
+    def replace(match: re.Match, replacement: str) -> str:
+        nonlocal total
+        if replacement in ECHO_ONLY_REPLACEMENTS and pii_key(match.group(0)) not in echoed:
+            return match.group(0)
+        total += 1
+        return replacement
+
+    for pattern, replacement in PII_PATTERNS:
+        text = pattern.sub(lambda match: replace(match, replacement), text)
+    return text, total
+
+
+class InputVerdict(NamedTuple):
+    message: str          # with PII removed
+    escalate: bool        # self-harm language: answer on the emergency path
+    reasons: Tuple[str, ...]
+
+
+class Guardrails:
+    """Compiled checks shared by every request; start() begins one request's checks"""
+
+    def __init__(self, limits: Dict[str, float] = None):
+        self.limits = {drug.lower(): limit for drug, limit in (limits or dose_limits()).items()}
+
+    def check_input(self, message: str) -> InputVerdict:
+        reasons = []
+        scrubbed, redactions = scrub_pii(message)
+        if redactions:
+            reasons.append('pii')
+        escalate = SELF_HARM_PATTERN.search(message) is not None
+        if escalate:
+            reasons.append('self_harm')
+        return InputVerdict(scrubbed, escalate, tuple(reasons))
+
+    def check_dose(self, text: str, complete: bool = True) -> Optional[str]:
+        """The first drug in text given a dose above its daily maximum
+
+        An amount belongs to the drug right after it ("2 g of paracetamol"),
+        else to the nearest one before it in the same clause, unless it is
+        an amount of something else ("5000 mg of vitamin C"). Unless the
+        text is complete, amounts too close to its end are left for later.
+        """
+        for match in AMOUNT_PATTERN.finditer(text):
+            if not complete and match.end() + DOSE_LOOKAHEAD_CHARS > len(text):
+                break
+            after = WORD_PATTERN.findall(text[match.end():match.end() + DOSE_LOOKAHEAD_CHARS].lower())[:2]
+            of_other = False
+            if after and after[0] == 'of':
+                after = after[1:]
+                of_other = bool(after) and after[0] not in self.limits
+            drug = after[0] if after and after[0] in self.limits else None
+            if drug is None and not of_other:
+                before = CLAUSE_BREAK.split(text[max(0, match.start() - DOSE_CONTEXT_CHARS):match.start()])[-1]
+                drug = next((word for word in reversed(WORD_PATTERN.findall(before.lower()))
+                             if word in self.limits), None)
+            if drug is not None:
+                milligrams = float(match.group(1).replace(',', '')) * UNIT_MG[match.group(2).lower()]
+                if milligrams > self.limits[drug]:
+                    return drug
+        return None
+
+    def check_output(self, text: str, message: str = '') -> Tuple[str, Optional[str]]:
+        """(text with message's PII scrubbed, drug with an implausible dose or None) for a complete answer"""
+        return scrub_output_pii(text, pii_values(message))[0], self.check_dose(text)
+
+    def start(self, message: str) -> 'GuardrailRun':
+        """Start the input checks of a request on a worker thread"""
+        return GuardrailRun(self, message)
+
+
+class GuardrailRun:
+    """One request's guardrails, and the time they added to it"""
+
+    def __init__(self, guardrails: Guardrails, message: str):
+        self.guardrails = guardrails
+        self.message = message
+        self.echoed = pii_values(message)  # the user's PII, removed if the answer repeats it
+        self.added = 0.0
+        self._pending: Future = _pool.submit(guardrails.check_input, message)
+
+    def input_verdict(self) -> InputVerdict:
+        """The input verdict; the checks always run
+
+        Waits at most GUARDRAIL_INPUT_TIMEOUT for the worker thread, then
+        runs the checks on this thread instead, so a busy pool costs time but
+        never skips PII scrubbing or self-harm escalation. Only the time
+        spent here is added to the request.
+        """
+        started = time.perf_counter()
+        try:
+            verdict = self._pending.result(timeout=Config.GUARDRAIL_INPUT_TIMEOUT)
+        except FutureTimeout:
+            metrics.increment('guardrails.input_timeouts')
+            self._pending.cancel()
+            verdict = self.guardrails.check_input(self.message)
+        except Exception as e:
+            print(f"Error running input guardrails on the pool, checking inline: {e}")
+            verdict = self.guardrails.check_input(self.message)
+        self._record('guardrail_input', time.perf_counter() - started)
+        for reason in verdict.reasons:
+            metrics.increment(f'guardrails.input.{reason}')
+        return verdict
+
+    def guard_stream(self, chunks: Iterator[str]) -> Iterator[str]:
+        """Yield the checked text of chunks, holding back GUARDRAIL_HOLDBACK_CHARS until checked
+
+        PII from the user's message is scrubbed as it passes (other
+        numbers, such as helplines, are left alone). An implausible dose stops the stream
+        with a notice, and the held-back text is dropped; the source is closed.
+        """
+        holdback = Config.GUARDRAIL_HOLDBACK_CHARS
+        checked_tail = ''   # already yielded, kept as context for the dose check
+        pending = ''
+        spent = 0.0
+        try:
+            for chunk in chunks:
+                started = time.perf_counter()
+                pending += chunk
+                drug = self.guardrails.check_dose(checked_tail + pending, complete=False)
+                if drug is not None:
+                    spent += time.perf_counter() - started
+                    metrics.increment('guardrails.output.dose_blocked')
+                    yield BLOCKED_DOSE_NOTICE.format(drug=drug)
+                    return
+                ready = ''
+                if len(pending) > holdback:
+                    # The held-back tail may be the start of PII still arriving
+                    cut = safe_cut(pending, len(pending) - holdback)
+                    ready, pending = self._scrub(pending[:cut]), pending[cut:]
+                    checked_tail = (checked_tail + ready)[-OUTPUT_OVERLAP_CHARS:]
+                spent += time.perf_counter() - started
+                if ready:
+                    yield ready
+            if pending:
+                # The stream is complete: the doses at its very end can be judged now
+                drug = self.guardrails.check_dose(checked_tail + pending)
+                if drug is not None:
+                    metrics.increment('guardrails.output.dose_blocked')
+                    yield BLOCKED_DOSE_NOTICE.format(drug=drug)
+                    return
+                yield self._scrub(pending)
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+            self._record('guardrail_output', spent)
+
+    def _scrub(self, text: str) -> str:
+        text, redactions = scrub_output_pii(text, self.echoed)
+        if redactions:
+            metrics.increment('guardrails.output.pii', redactions)
+        return text
+
+    def _record(self, stage: str, seconds: float):
+        self.added += seconds
+        metrics.observe(f'stage.{stage}', seconds)
+        trace = current_trace()
+        if trace is not None:
+            trace.record(stage, seconds)
+
+    def report(self):
+        """Record the total latency the guardrails added to this request"""
+        metrics.observe('guardrails.added_latency', self.added)
@@ -0,0 +1,188 @@
+"""
+Relevance-ranked chat history selection.
+
+Each stored turn gets a small embedding when it is written (or when its
+session is first loaded): signed feature hashing of its content words and
+word pairs, so it needs no model and no network call.
+Vectors live in one float16 NumPy array per session. For a new message the
+prompt gets the last HISTORY_RECENT_TURNS turns plus the HISTORY_TOP_K most
+similar older turns, within HISTORY_TOKEN_BUDGET estimated tokens, so an
+allergy mentioned 30 messages ago still reaches the model while unrelated
+turns stay out.
+"""
+import threading
+import zlib
+from collections import OrderedDict
+from typing import List, Optional
+import sys
+import os
+
+import numpy as np
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from services.intent_router import TOKEN_PATTERN
+from services.turn_store import Turn
+from utils.metrics import metrics
+
+
+STOPWORDS = frozenset(
+    "a about after all also am an and any are as at be been before but by can could did do does doing for from "
+    "had has have having he her him his how i i'm if in into is it it's its just me more most my no not now of "
+    "on or our out over same she should so some such than that the their them then there these they this those "
+    "to too under up very was we were what when where which while who why will with would you your".split()
+)
+STEM_CHARS = 6  # "allergy", "allergic" and "allergies" share "allerg"
+
+
+def terms(text: str) -> List[str]:
+    """Distinct content-word stems and adjacent stem pairs"""
+    stems = [word[:STEM_CHARS] for word in TOKEN_PATTERN.findall(text.lower())
+             if word not in STOPWORDS and len(word) > 1]
+    return list(set(stems + [f"{a} {b}" for a, b in zip(stems, stems[1:])]))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return len(text or '') // 4 + 1
+
+
+class HashingEmbedder:
+    """L2-normalised signed feature-hashing vectors of a text's terms
+
+    Terms count once however often they repeat, so long boilerplate answers
+    don't drown out the words that say what a turn was about.
+    """
+
+    def __init__(self, dim: int = None, max_chars: int = None):
+        self.dim = dim or Config.HISTORY_EMBEDDING_DIM
+        self.max_chars = max_chars or Config.HISTORY_EMBED_CHARS
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        tokens = terms((text or '')[:self.max_chars])
+        if not tokens:
+            return vector
+        # crc32 is stable across processes, unlike hash()
+        hashes = np.fromiter((zlib.crc32(token.encode('utf-8')) for token in tokens),
+                             dtype=np.uint32, count=len(tokens))
+        signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(vector, hashes % self.dim, signs)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_turn(self, turn: Turn) -> np.ndarray:
+        # The question says what the turn was about; weight it like the whole answer
+        question = self.embed(turn.message)
+        answer = self.embed(turn.response)
+        vector = question + answer
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class _SessionIndex:
+    __slots__ = ('turns', 'vectors', 'costs')
+
+    def __init__(self, turns: List[Turn], vectors: np.ndarray, costs: np.ndarray):
+        self.turns = turns
+        self.vectors = vectors  # (len(turns), dim) float16
+        self.costs = costs      # estimated prompt tokens per turn
+
+
+class HistoryIndex:
+    """Per-session turn embeddings for the `max_sessions` most recently used sessions"""
+
+    def __init__(self, embedder: HashingEmbedder = None, max_sessions: int = None, max_turns: int = None):
+        self.embedder = embedder or HashingEmbedder()
+        self.max_sessions = max_sessions or Config.HISTORY_INDEX_MAX_SESSIONS
+        self.max_turns = max_turns or Config.HISTORY_INDEX_MAX_TURNS
+        self._sessions: 'OrderedDict[str, _SessionIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    def _build(self, turns: List[Turn]) -> _SessionIndex:
+        turns = turns[-self.max_turns:]
+        vectors = np.zeros((len(turns), self.embedder.dim), dtype=np.float16)
+        for row, turn in enumerate(turns):
+            vectors[row] = self.embedder.embed_turn(turn)
+        costs = np.array([estimate_tokens(turn.message) + estimate_tokens(turn.response) for turn in turns],
+                         dtype=np.int32)
+        return _SessionIndex(turns, vectors, costs)
+
+    def load(self, session_id: str, turns: List[Turn]):
+        """Index a session's stored turns (oldest first), replacing what was held for it"""
+        index = self._build(turns)
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._sessions[session_id] = index
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            sessions = len(self._sessions)
+        metrics.set_gauge('history_index.sessions', sessions)
+
+    def add(self, session_id: str, turn: Turn):
+        """Index a new turn as it is written; sessions not held are indexed on their next load"""
+        added = self._build([turn])
+        with self._lock:
+            index = self._sessions.get(session_id)
+            if index is None:
+                return
+            keep = self.max_turns - 1
+            index.turns = index.turns[-keep:] + added.turns if keep else added.turns
+            index.vectors = np.concatenate([index.vectors[-keep:] if keep else index.vectors[:0], added.vectors])
+            index.costs = np.concatenate([index.costs[-keep:] if keep else index.costs[:0], added.costs])
+
+    def drop(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def select(self, session_id: str, query: str, budget: int = None, top_k: int = None,
+               recent: int = None) -> Optional[List[Turn]]:
+        """Turns to put in the prompt for query, oldest first (None if the session isn't indexed)
+
+        The last `recent` turns come first, then the `top_k` older turns most
+        similar to the query, skipping any that would exceed `budget` tokens.
+        """
+        budget = budget if budget is not None else Config.HISTORY_TOKEN_BUDGET
+        top_k = top_k if top_k is not None else Config.HISTORY_TOP_K
+        recent = recent if recent is not None else Config.HISTORY_RECENT_TURNS
+        with self._lock:
+            index = self._sessions.get(session_id)
+            if index is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            turns, vectors, costs = index.turns, index.vectors, index.costs
+
+        chosen: List[int] = []
+        used = 0
+        # The latest turns carry the thread of the conversation; the very last one always goes in
+        for row in range(len(turns) - 1, max(len(turns) - recent, 0) - 1, -1):
+            if chosen and used + costs[row] > budget:
+                break
+            chosen.append(row)
+            used += int(costs[row])
+
+        older = len(turns) - len(chosen)
+        if older > 0 and top_k > 0:
+            scores = vectors[:older].astype(np.float32) @ self.embedder.embed(query)
+            picked = 0
+            for row in np.argsort(-scores, kind='stable'):
+                if picked >= top_k or scores[row] < Config.HISTORY_MIN_SIMILARITY:
+                    break
+                if used + costs[row] > budget:
+                    continue
+                chosen.append(int(row))
+                used += int(costs[row])
+                picked += 1
+
+        metrics.increment('history_select.turns', len(chosen))
+        metrics.increment('history_select.skipped_turns', len(turns) - len(chosen))
+        return [turns[row] for row in sorted(chosen)]
@@ -0,0 +1,374 @@
+"""
+Local intent router for chat messages.
+
+A TF-IDF nearest-neighbour classifier (numpy only) decides which prompt
+template and generation profile a message needs, so "thanks" or "what is
+ibuprofen?" don't pay for the full consultation prompt on the heavy model.
+The model is built once per process; with ROUTING_LOG_PATH set, decisions
+(PII-scrubbed messages, no session IDs) are appended to a size-rotated
+JSONL log that can be labelled and fed back in with:
+
+    python src/services/intent_router.py --train labelled.jsonl --output intent_model.npz
+"""
+import argparse
+import json
+import re
+import threading
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence
+import sys
+import os
+
+import numpy as np
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from services.guardrails import DOSE_LIMITS_MG, SELF_HARM_PATTERN, scrub_pii
+from services.symptom_ontology import CONDITIONS, SymptomMatch, get_symptom_ontology
+
+SMALL_TALK = 'small_talk'
+DRUG_INFO = 'drug_info'
+SYMPTOM_TRIAGE = 'symptom_triage'
+EMERGENCY = 'emergency'
+PRESCRIPTION = 'prescription'
+
+# Intent -> message_type, which selects the generation profile (and so the
+# model tier) in Config.GENERATION_PROFILES
+INTENT_MESSAGE_TYPES = {
+    SMALL_TALK: 'small_talk',
+    DRUG_INFO: 'drug_info',
+    SYMPTOM_TRIAGE: 'medical_query',
+    EMERGENCY: 'emergency',
+    PRESCRIPTION: 'medication_prescription',
+}
+
+# Built-in training examples used until a retrained model is configured
+SEED_EXAMPLES: Dict[str, List[str]] = {
+    SMALL_TALK: [
+        "hi", "hello", "hey there", "good morning", "thanks", "thank you so much",
+        "ok thanks", "great, thank you", "bye", "goodbye", "who are you",
+        "what can you do", "how are you", "nice, that helps", "cool", "appreciate it",
+    ],
+    DRUG_INFO: [
+        "what is ibuprofen", "what is paracetamol used for", "side effects of amoxicillin",
+        "can i take ibuprofen with alcohol", "what does metformin do", "is aspirin a blood thinner",
+        "how does omeprazole work", "interactions between warfarin and aspirin",
+        "what class of drug is lisinopril", "is acetaminophen the same as tylenol",
+        "how long does cetirizine last", "what is the maximum dose of ibuprofen",
+        "can i take antihistamines while pregnant", "what are the side effects of statins",
+    ],
+    SYMPTOM_TRIAGE: [
+        "i have a headache and fever", "my throat hurts and i have a cough",
+        "i have been feeling dizzy for two days", "stomach pain after eating",
+        "rash on my arm that itches", "i feel tired all the time", "my back hurts when i bend",
+        "i have a runny nose and sneezing", "my knee is swollen", "i keep getting headaches",
+        "pain when urinating", "i have diarrhea and nausea", "what could cause my joint pain",
+        "my child has a fever of 38", "i have a sore ear and a temperature",
+    ],
+    EMERGENCY: [
+        "chest pain spreading to my arm", "i can't breathe", "someone is unconscious",
+        "he is having a seizure", "severe bleeding that won't stop", "she took too many pills",
+        "my face is swelling and i can't swallow", "signs of a stroke", "slurred speech and face drooping",
+        "allergic reaction throat closing", "i want to kill myself", "my baby is not breathing",
+        "heavy bleeding after a fall", "poisoning what do i do",
+    ],
+    PRESCRIPTION: [
+        "prescribe something for my sinus infection", "what medication should i take for my migraine",
+        "can you give me a prescription for antibiotics", "what dose of amoxicillin should i take for strep",
+        "write me a prescription for high blood pressure", "which medicine should i take for my uti",
+        "recommend a drug and dosage for my anxiety", "what should i take for acid reflux and how much",
+        "medication plan for type 2 diabetes", "what antibiotic is best for my ear infection",
+        "prescribe pain relief for my back", "what treatment and dose for my eczema",
+    ],
+}
+
+# The cheapest path must be more certain: a real question wrongly sent to
+# small talk gets a 128-token answer from the light model
+INTENT_MIN_CONFIDENCE = {
+    SMALL_TALK: 0.6,
+}
+# ...and is refused outright for longer messages and ones naming a symptom,
+# drug or condition ("what can you do about my back pain")
+SMALL_TALK_MAX_WORDS = 8
+CLINICAL_TERMS = set(DOSE_LIMITS_MG) | {name.lower() for name in CONDITIONS} | {
+    'diabetes', 'asthma', 'hypertension', 'blood pressure', 'cholesterol', 'cancer', 'infection', 'allergy',
+    'allergies', 'arthritis', 'depression', 'pregnant', 'pregnancy', 'covid', 'flu', 'medication',
+    'medications', 'medicine', 'medicines', 'drug', 'drugs', 'pill', 'pills', 'dose', 'dosage', 'prescription',
+    'symptom', 'symptoms', 'pain', 'ache', 'sick', 'disease', 'injury', 'doctor',
+}
+CLINICAL_TERM_PATTERN = re.compile(
+    r"\b(" + '|'.join(re.escape(term) for term in sorted(CLINICAL_TERMS, key=len, reverse=True)) + r")\b"
+)
+
+# Red-flag phrases (and their inflections) always route to the emergency
+# template, whatever the model says
+EMERGENCY_PATTERN = re.compile(
+    r"\b(chest pains?|(can['’]?t|cannot|couldn['’]?t|unable to) breathe?|(not|stopped) breathing|"
+    r"unconscious\w*|seizures?|seizing|strokes?|overdos\w*|suicid\w*|kill(ing)? myself|"
+    r"(severe(ly)?|heavy|heavily) bleeding|bleeding (heavily|severely)|throat (is )?clos(e|es|ed|ing)|"
+    r"anaphyla\w*|(?<!food )poison(ed|ing)|too many (pills|tablets)|"
+    r"(swallow\w*|drank|drunk|drink(ing|s)?|ate|eat(en|ing)?|ingest\w*|chew(ed|ing)?)\b[^.?!]{0,40}?\b("
+    r"bleach|detergent|laundry (pod|capsule)s?|(button |coin )?batter(y|ies)|antifreeze|rat poison|pesticides?|"
+    r"insecticides?|weed ?killer|drain cleaner|oven cleaner|cleaning (product|fluid|spray)s?|lye|ammonia|"
+    r"gasoline|petrol|kerosene|lighter fluid|lamp oil|magnets?|(someone else'?s|all (the|my|her|his)) (pills|tablets|medicine)))\b"
+)
+
+# Dosing for these isn't the "typical adult dosing" of the drug_info
+# prompt: such drug questions take the full medical path instead
+SPECIAL_POPULATION_PATTERN = re.compile(
+    r"\b(child|children|childs|kids?|son|daughter|baby|babies|infants?|toddlers?|newborns?|teen\w*|"
+    r"pregnan\w*|breast ?feed\w*|nursing|elderly|\d+[- ]?(years?|yrs?|months?|mos?|weeks?|wks?)[- ]?olds?|"
+    r"aged? \d+|\d+ ?(kg|kilos?|lbs?|pounds)\b)"
+)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+class RouteDecision(NamedTuple):
+    intent: Optional[str]   # None when confidence is below the threshold
+    confidence: float
+    message_type: str
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word unigrams and bigrams"""
+    words = TOKEN_PATTERN.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class IntentClassifier:
+    """TF-IDF vectoriser plus the L2-normalised training examples.
+
+    An intent scores the best cosine similarity among its examples, so
+    short messages ("thanks") still match strongly. Prediction is one
+    matrix product against the examples, so a message is classified in
+    microseconds.
+    """
+
+    def __init__(self, vocabulary: Sequence[str], idf: np.ndarray, examples: np.ndarray,
+                 example_labels: np.ndarray, labels: Sequence[str]):
+        self.vocabulary = {term: index for index, term in enumerate(vocabulary)}
+        self.idf = idf
+        self.examples = examples              # (n_examples, n_terms)
+        self.example_labels = example_labels  # index into labels per example
+        self.labels = list(labels)
+
+    @classmethod
+    def fit(cls, texts: Sequence[str], labels: Sequence[str]) -> 'IntentClassifier':
+        """Build the vocabulary, IDF weights and example vectors from labelled texts"""
+        documents = [set(tokenize(text)) for text in texts]
+        vocabulary = sorted(set().union(*documents))
+        index = {term: i for i, term in enumerate(vocabulary)}
+        df = np.zeros(len(vocabulary))
+        for document in documents:
+            df[[index[term] for term in document]] += 1
+        idf = np.log((1 + len(documents)) / (1 + df)) + 1
+
+        classes = sorted(set(labels))
+        example_labels = np.array([classes.index(label) for label in labels])
+        classifier = cls(vocabulary, idf, np.zeros((0, len(vocabulary))), example_labels, classes)
+        classifier.examples = classifier.transform(texts)
+        return classifier
+
+    def transform(self, texts: Sequence[str]) -> np.ndarray:
+        """L2-normalised TF-IDF rows for texts"""
+        matrix = np.zeros((len(texts), len(self.vocabulary)))
+        for row, text in enumerate(texts):
+            for term in tokenize(text):
+                column = self.vocabulary.get(term)
+                if column is not None:
+                    matrix[row, column] += 1
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def predict(self, texts: Sequence[str]) -> List[tuple]:
+        """(label, cosine similarity of the closest example) for each text"""
+        similarities = self.transform(texts) @ self.examples.T
+        scores = np.column_stack([
+            similarities[:, self.example_labels == i].max(axis=1) for i in range(len(self.labels))
+        ])
+        best = scores.argmax(axis=1)
+        return [(self.labels[i], float(scores[row, i])) for row, i in enumerate(best)]
+
+    def save(self, path: str):
+        vocabulary = sorted(self.vocabulary, key=self.vocabulary.get)
+        np.savez(path, vocabulary=np.array(vocabulary), idf=self.idf, examples=self.examples,
+                 example_labels=self.example_labels, labels=np.array(self.labels))
+
+    @classmethod
+    def load(cls, path: str) -> 'IntentClassifier':
+        data = np.load(path, allow_pickle=False)
+        return cls(data['vocabulary'].tolist(), data['idf'], data['examples'],
+                   data['example_labels'], data['labels'].tolist())
+
+
+def seed_classifier() -> IntentClassifier:
+    """Classifier trained on the built-in examples"""
+    texts = [text for examples in SEED_EXAMPLES.values() for text in examples]
+    labels = [intent for intent, examples in SEED_EXAMPLES.items() for _ in examples]
+    return IntentClassifier.fit(texts, labels)
+
+
+class IntentRouter:
+    """Classify messages, pick their message_type and log each decision"""
+
+    def __init__(self, classifier: IntentClassifier = None, min_confidence: float = None,
+                 log_path: str = None):
+        self.classifier = classifier if classifier is not None else self.load_classifier()
+        self.min_confidence = min_confidence if min_confidence is not None else Config.INTENT_MIN_CONFIDENCE
+        # Opt-in: unset or empty disables the log
+        self.log_path = log_path if log_path is not None else Config.ROUTING_LOG_PATH
+        self.log_max_bytes = Config.ROUTING_LOG_MAX_BYTES
+        self.log_backups = Config.ROUTING_LOG_BACKUPS
+        self._log_lock = threading.Lock()
+
+    @staticmethod
+    def load_classifier() -> IntentClassifier:
+        if Config.INTENT_MODEL_PATH:
+            try:
+                return IntentClassifier.load(Config.INTENT_MODEL_PATH)
+            except Exception as e:
+                print(f"Error loading intent model {Config.INTENT_MODEL_PATH}: {e}")
+        return seed_classifier()
+
+    def route(self, message: str, session_id: str = None) -> RouteDecision:
+        """Route one message; low-confidence messages keep the full medical path, as do
+        drug questions about children, pregnancy or a given age or weight
+
+        session_id is accepted for callers' convenience; it is not logged.
+        """
+        if EMERGENCY_PATTERN.search(message.lower()):
+            intent, confidence = EMERGENCY, 1.0
+        else:
+            symptoms = self.symptom_matches(message)
+            intent, confidence = self.classifier.predict([self.classifier_text(message, symptoms)])[0]
+            if confidence < max(self.min_confidence, INTENT_MIN_CONFIDENCE.get(intent, 0.0)):
+                intent = None
+            elif intent == SMALL_TALK and not self.small_talk_allowed(message, symptoms):
+                intent = None
+            elif intent == DRUG_INFO and SPECIAL_POPULATION_PATTERN.search(message.lower()):
+                intent = None
+        message_type = INTENT_MESSAGE_TYPES.get(intent, Config.DEFAULT_MESSAGE_TYPE)
+        decision = RouteDecision(intent, confidence, message_type)
+        self.log(message, decision)
+        return decision
+
+    @staticmethod
+    def symptom_matches(message: str) -> List[SymptomMatch]:
+        try:
+            return get_symptom_ontology().match(message)
+        except Exception as e:
+            print(f"Error matching symptoms for routing: {e}")
+            return []
+
+    @staticmethod
+    def classifier_text(message: str, symptoms: List[SymptomMatch]) -> str:
+        """The message plus the canonical names of the symptoms it mentions, so
+        "cephalalgia" or "pyrexia" are classified like "headache" and "fever"
+        """
+        return ' '.join([message] + [match.name.lower() for match in symptoms if not match.negated])
+
+    @staticmethod
+    def small_talk_allowed(message: str, symptoms: List[SymptomMatch]) -> bool:
+        """Whether a message the model calls small talk may take the small-talk path"""
+        if symptoms or len(TOKEN_PATTERN.findall(message.lower())) > SMALL_TALK_MAX_WORDS:
+            return False
+        return CLINICAL_TERM_PATTERN.search(message.lower()) is None
+
+    def log(self, message: str, decision: RouteDecision):
+        """Append the decision to the routing log (if enabled) for offline retraining
+
+        Messages are logged with PII scrubbed and without their session, and
+        self-harm messages aren't logged at all. The log rolls over to
+        .1 ... .<ROUTING_LOG_BACKUPS> at ROUTING_LOG_MAX_BYTES, oldest dropped.
+        """
+        if not self.log_path or SELF_HARM_PATTERN.search(message):
+            return
+        entry = {
+            'timestamp': datetime.now().isoformat(),
+            'message': scrub_pii(message)[0],
+            'intent': decision.intent,
+            'confidence': round(decision.confidence, 4),
+            'message_type': decision.message_type,
+        }
+        try:
+            with self._log_lock:
+                os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+                self._rotate_log()
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry) + '\n')
+        except Exception as e:
+            print(f"Error writing routing log: {e}")
+
+    def _rotate_log(self):
+        if not self.log_max_bytes or not os.path.exists(self.log_path) \
+                or os.path.getsize(self.log_path) < self.log_max_bytes:
+            return
+        if self.log_backups <= 0:
+            os.remove(self.log_path)
+            return
+        for index in range(self.log_backups - 1, 0, -1):
+            older = f"{self.log_path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.log_path}.{index + 1}")
+        os.replace(self.log_path, f"{self.log_path}.1")
+
+
+_default_router: Optional[IntentRouter] = None
+_default_router_lock = threading.Lock()
+
+
+def get_router() -> IntentRouter:
+    """Process-wide router, built on first use"""
+    global _default_router
+    with _default_router_lock:
+        if _default_router is None:
+            _default_router = IntentRouter()
+        return _default_router
+
+
+def load_labelled(path: str) -> tuple:
+    """Read {"message", "label"} lines (falling back to the logged "intent")"""
+    texts, labels = [], []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            label = entry.get('label') or entry.get('intent')
+            if label:
+                texts.append(entry['message'])
+                labels.append(label)
+    return texts, labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrain the chat intent router")
+    parser.add_argument('--train', required=True, help='JSONL of {"message", "label"} (e.g. a labelled routing log)')
+    parser.add_argument('--output', required=True, help='Where to write the model (.npz)')
+    parser.add_argument('--no-seed', action='store_true', help='Train without the built-in examples')
+    args = parser.parse_args()
+
+    texts, labels = load_labelled(args.train)
+    if not args.no_seed:
+        for intent, examples in SEED_EXAMPLES.items():
+            texts += examples
+            labels += [intent] * len(examples)
+    classifier = IntentClassifier.fit(texts, labels)
+
+    # Training-set accuracy as a quick sanity check
+    predicted = [label for label, _ in classifier.predict(texts)]
+    accuracy = sum(p == l for p, l in zip(predicted, labels)) / max(len(labels), 1)
+    classifier.save(args.output)
+    print(f"Trained on {len(texts)} examples ({len(set(labels))} intents), "
+          f"training accuracy {accuracy:.1%}, saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
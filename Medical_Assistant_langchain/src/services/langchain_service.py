@@ -1,10 +1,12 @@
-from langchain.schema import HumanMessage, SystemMessage, AIMessage
+from langchain.schema import HumanMessage, SystemMessage
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.memory import ConversationBufferMemory
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.schema.runnable import RunnablePassthrough
 from langchain.schema.output_parser import StrOutputParser
-from typing import List, Dict, Any, Optional
+from langchain_core.messages.ai import add_usage
+from typing import Callable, List, Dict, Any, Optional, Iterator
+import asyncio
+import threading
+import time
 import sys
 import os
 
@@ -15,19 +17,91 @@ if src_path not in sys.path:
     sys.path.insert(0, src_path)
 
 from config import Config
-from database.supabase_manager import SupabaseManager
+from database.resilient_store import ResilientStore
+from database.cached_store import CachedStore, HISTORY, with_shared_cache
+from database.transcript_search import search_transcripts
+from utils.metrics import metrics
+from utils.deadline import Cancelled, Deadline, DeadlineExceeded, RequestRegistry, iterate_until, run_with_timeout
+from services.coalescing import SingleFlight, llm_flights, request_key
+from services.intent_router import (IntentRouter, RouteDecision, get_router, SMALL_TALK, DRUG_INFO, EMERGENCY,
+                                    INTENT_MESSAGE_TYPES)
+from services.quick_actions import QuickAnswerStore, QuickAnswerRefresher
+from services.usage_ledger import UsageLedger, CACHE_MISS, CACHE_COALESCED, CACHE_QUICK_ANSWER
+from services.turn_store import Turn, to_messages
+from services.history_index import HistoryIndex, estimate_tokens
+from services.guardrails import Guardrails, GuardrailRun
+from services.cohort_analytics import CohortReportCache
+from services.llm_scheduler import LLMScheduler, llm_scheduler, priority_for, BACKGROUND
+from services.traffic_capture import RecordingStore, captured, get_recorder, llm_key
+from services.structured_output import (JsonSectionRenderer, SectionParser, json_instruction, parse_sections,
+                                        render_sections, schema_for, structured_output)
+from services.symptom_ontology import get_symptom_ontology
+
+# Short system prompts for routed intents that don't need the full
+# consultation prompt; other intents use the medical prompt
+INTENT_SYSTEM_PROMPTS = {
+    SMALL_TALK: """You are a friendly medical assistant. Reply briefly and warmly to greetings, thanks and questions about what you can do. Invite the user to describe any health concern; do not give medical advice unprompted.""",
+    DRUG_INFO: """You are a clinical pharmacology assistant. Answer the question about the medication concisely: what it is, what it is used for, typical adult dosing, key side effects, important interactions and contraindications. Recommend checking with a pharmacist or doctor for personal dosing.""",
+    EMERGENCY: """You are an emergency medical assistant. The user may be describing a medical emergency. Start by telling them to call their local emergency number (911 in the US) immediately if there is any danger to life. Then give clear, numbered first-aid steps to take while waiting for help. If the message mentions self-harm or suicide, respond with empathy and give crisis line information (988 in the US). Be calm, short and direct.""",
+}
 
 class MedicalChatService:
     """LangChain-powered medical chatbot service"""
     
-    def __init__(self):
-        self.llm = None
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
-        )
-        self.db = SupabaseManager()
-        self.setup_llm()
+    ERROR_RESPONSE = "I apologize, but I'm experiencing technical difficulties. Please try again later or consult a healthcare professional for medical advice."
+    TIMEOUT_RESPONSE = "I'm sorry, this is taking longer than expected. Please try again in a moment, and call your local emergency number if this is urgent."
+    CANCELLED_RESPONSE = "This request was cancelled."
+    
+    def __init__(self, llm=None, db=None, coalescer: SingleFlight = None, router: IntentRouter = None,
+                 quick_answers: QuickAnswerStore = None, usage_ledger: UsageLedger = None,
+                 scheduler: LLMScheduler = None):
+        """Create the service; llm and db may be injected (e.g. local stand-ins for benchmarks)
+
+        An injected llm serves every generation profile regardless of the
+        profile's model.
+        """
+        self.llm = llm
+        self._llm_injected = llm is not None
+        # Storage calls go through a circuit breaker, so a Supabase outage
+        # degrades to in-memory history instead of stalling every message;
+        # with CACHE_REDIS_URL set, history is shared between replicas
+        self.db = db if db is not None else with_shared_cache(ResilientStore())
+        self.coalescer = coalescer if coalescer is not None else llm_flights
+        # Upstream calls wait for a slot by priority class and per-session fair share
+        self.scheduler = scheduler if scheduler is not None else llm_scheduler
+        # Messages without an explicit message_type are routed by intent
+        self.router = router if router is not None else (get_router() if Config.INTENT_ROUTER_ENABLED else None)
+        # Precomputed answers for context-free prompts (filled by warm_up())
+        self.quick_answers = quick_answers
+        self.quick_answer_refresher: Optional[QuickAnswerRefresher] = None
+        # In-flight requests per session, so a new message can cancel the old one
+        self.requests = RequestRegistry()
+        # Per-turn token/latency records, written in batches
+        if usage_ledger is None and Config.USAGE_LEDGER_ENABLED:
+            usage_ledger = UsageLedger(self.db)
+        self.usage_ledger = usage_ledger
+        # Population statistics over health profiles, rebuilt every COHORT_REPORT_TTL seconds
+        self.cohort_reports = CohortReportCache(self.db)
+        # Turn embeddings per session, so prompts carry the relevant history
+        # rather than just the latest turns
+        self.history_index = HistoryIndex() if Config.HISTORY_SELECTION_ENABLED else None
+        if self.history_index is not None and isinstance(self.db, CachedStore):
+            # A session written or cleared on another replica is re-indexed here on next use
+            self.db.cache.on_invalidate(HISTORY, self.history_index.drop)
+        # With TRAFFIC_CAPTURE_DIR set, requests, LLM outputs and the chat
+        # path's store results are logged for benchmarks/replay_traffic.py
+        # (the usage ledger and cohort reports keep the unrecorded store)
+        self.recorder = get_recorder()
+        if self.recorder is not None:
+            self.db = RecordingStore(self.db, self.recorder)
+        # Input checks run alongside history loading, output checks on the stream
+        self.guardrails = Guardrails() if Config.GUARDRAILS_ENABLED else None
+        # One client per model, one bound chain per message_type; both are
+        # built once and reused, so applying a profile costs nothing per call
+        self._llms: Dict[str, Any] = {}
+        self._generation_chains: Dict[str, Any] = {}
+        if self.llm is None:
+            self.setup_llm()
         self.setup_chain()
     
     def setup_llm(self):
@@ -37,17 +111,27 @@ class MedicalChatService:
             if not Config.GEMINI_API_KEY:
                 raise ValueError("Gemini API key is required")
             
-            self.llm = ChatGoogleGenerativeAI(
-                model="gemini-1.5-flash",
-                google_api_key=Config.GEMINI_API_KEY,
-                temperature=0.7,
-                max_tokens=1000
-            )
+            self.llm = self.llm_for_model(Config.GEMINI_MODEL)
             print("LangChain Gemini LLM initialized successfully")
         except Exception as e:
             print(f"Error initializing LLM: {e}")
             raise
     
+    def llm_for_model(self, model: str):
+        """Client for a Gemini model, created on first use"""
+        if self._llm_injected:
+            return self.llm
+        if model not in self._llms:
+            # Per-call settings (output budget, temperature, stop) come from
+            # the generation profile, so the client keeps library defaults
+            self._llms[model] = ChatGoogleGenerativeAI(
+                model=model,
+                google_api_key=Config.GEMINI_API_KEY,
+                temperature=Config.DEFAULT_TEMPERATURE,
+                timeout=Config.LLM_TIMEOUT
+            )
+        return self._llms[model]
+    
     def setup_chain(self):
         """Setup the conversation chain with medical prompt"""
         self.medical_prompt = ChatPromptTemplate.from_messages([
@@ -103,76 +187,612 @@ Be thorough, specific, and professional in your recommendations."""),
             MessagesPlaceholder(variable_name="chat_history"),
             ("human", "{input}")
         ])
+        self.intent_prompts = {
+            intent: ChatPromptTemplate.from_messages([
+                SystemMessage(content=system_prompt),
+                MessagesPlaceholder(variable_name="chat_history"),
+                ("human", "{input}")
+            ])
+            for intent, system_prompt in INTENT_SYSTEM_PROMPTS.items()
+        }
         
-        self.chain = (
-            RunnablePassthrough.assign(
-                chat_history=lambda x: self.memory.chat_memory.messages
-            )
-            | self.medical_prompt
-            | self.llm
-            | StrOutputParser()
-        )
+        # Chat history is passed per call rather than held on the instance, so
+        # one service can serve many sessions concurrently (API workers).
+        self.chain = self.medical_prompt | self.llm | StrOutputParser()
+        # Prompts are rendered separately so identical in-flight requests can
+        # be coalesced on the rendered messages (see generate()).
+        self.generation_chain = self.generation_chain_for(Config.DEFAULT_MESSAGE_TYPE)
+    
+    def generation_chain_for(self, message_type: str = None):
+        """LLM | parser chain bound to the generation profile of message_type"""
+        message_type = message_type or Config.DEFAULT_MESSAGE_TYPE
+        chain = self._generation_chains.get(message_type)
+        if chain is None:
+            profile = Config.generation_profile(message_type)
+            bound = {'generation_config': {
+                'max_output_tokens': profile['max_tokens'],
+                'temperature': profile['temperature'],
+            }}
+            if profile.get('stop'):
+                bound['stop'] = profile['stop']
+            if structured_output(message_type):
+                bound['generation_config']['response_mime_type'] = 'application/json'
+            chain = self.llm_for_model(profile['model']).bind(**bound) | StrOutputParser()
+            self._generation_chains[message_type] = chain
+        return chain
+    
+    def route(self, message: str, session_id: str, message_type: str = None) -> RouteDecision:
+        """Pick the template and message_type; an explicit message_type skips routing"""
+        if message_type or self.router is None:
+            return RouteDecision(None, 1.0, message_type or Config.DEFAULT_MESSAGE_TYPE)
+        decision = self.router.route(message, session_id)
+        metrics.increment(f"router.intent.{decision.intent or 'fallback'}")
+        return decision
+    
+    def render_prompt(self, message: str, chat_history: List[Turn], intent: str = None,
+                      message_type: str = None) -> List[Any]:
+        """Render the intent's prompt (the medical prompt by default) into the messages sent to the LLM
+
+        History turns become LangChain messages only here, for the duration of the call.
+        With structured output, the system prompt asks for message_type's sections as JSON.
+        """
+        prompt = self.intent_prompts.get(intent, self.medical_prompt)
+        messages = prompt.format_messages(input=message, chat_history=to_messages(chat_history))
+        if structured_output(message_type):
+            messages[0] = SystemMessage(content=f"{messages[0].content}\n\n{json_instruction(schema_for(message_type))}")
+        return messages
+    
+    def generation_key(self, messages: List[Any], message_type: str = None) -> str:
+        """Coalescing key: rendered messages plus the model and generation profile"""
+        params = dict(getattr(self.llm, '_identifying_params', None) or {})
+        params.update(Config.generation_profile(message_type))
+        return request_key(messages, params)
+    
+    def scheduling_cost(self, messages: List[Any], message_type: str = None) -> int:
+        """Estimated tokens of a call (prompt plus output budget), its size for fair queuing"""
+        prompt = sum(estimate_tokens(str(getattr(message, 'content', message))) for message in messages)
+        return prompt + Config.generation_profile(message_type)['max_tokens']
+    
+    def generate(self, messages: List[Any], message_type: str = None, deadline: Deadline = None,
+                 usage: Dict[str, Any] = None, session_id: str = None, priority: int = None) -> str:
+        """Generate a response, sharing the upstream call with identical in-flight requests
+
+        With a deadline the response is streamed internally, so the upstream
+        call can be abandoned when the deadline passes or the request is cancelled.
+        If a usage dict is given it is filled with the call's token counts,
+        model, time to first token and cache status. The call waits for a
+        scheduler slot as session_id, in `priority` (by message_type if not given).
+        """
+        if deadline is not None:
+            return "".join(self.stream_generate(messages, message_type, deadline, usage, session_id, priority))
+        model = self.generation_chain_for(message_type).first
+        priority = priority_for(message_type) if priority is None else priority
+        upstream = []
+        
+        def call():
+            upstream.append(True)
+            with self.scheduler.slot(priority, session_id, self.scheduling_cost(messages, message_type)):
+                if self.recording:
+                    return self.recorder.llm_call(llm_key(messages), lambda: model.invoke(messages))
+                return model.invoke(messages)
+        
+        started = time.perf_counter()
+        response = self.coalescer.do(self.generation_key(messages, message_type), call)
+        if usage is not None:
+            self.fill_usage(usage, message_type, response.usage_metadata, time.perf_counter() - started,
+                            coalesced=not upstream)
+        return response.text()
+    
+    async def agenerate(self, messages: List[Any], message_type: str = None, session_id: str = None,
+                        priority: int = None) -> str:
+        """Async variant of generate()"""
+        chain = self.generation_chain_for(message_type)
+        priority = priority_for(message_type) if priority is None else priority
+        
+        async def call():
+            # Waiting for a slot blocks, so it happens off the event loop
+            ticket = await asyncio.to_thread(self.scheduler.acquire, priority, session_id,
+                                             self.scheduling_cost(messages, message_type))
+            try:
+                return await chain.ainvoke(messages)
+            finally:
+                self.scheduler.release(ticket)
+        
+        return await self.coalescer.do_async(self.generation_key(messages, message_type), call)
+    
+    def stream_generate(self, messages: List[Any], message_type: str = None, deadline: Deadline = None,
+                        usage: Dict[str, Any] = None, session_id: str = None,
+                        priority: int = None) -> Iterator[str]:
+        """Stream a response; identical in-flight requests share one upstream stream
+
+        The upstream stream starts once the scheduler grants it a slot (see generate()).
+        """
+        # Stream the bound model rather than the LLM | parser sequence: closing
+        # a sequence's stream runs the upstream generation to completion,
+        # while closing the model's stream aborts the request
+        model = self.generation_chain_for(message_type).first
+        priority = priority_for(message_type) if priority is None else priority
+        upstream = []
+        
+        def open_stream():
+            upstream.append(True)
+            return self.scheduler.stream(lambda: self.upstream_stream(model, messages), priority, session_id,
+                                         self.scheduling_cost(messages, message_type), deadline=deadline)
+        
+        stream = self.coalescer.stream(self.generation_key(messages, message_type), open_stream)
+        # Stopping early detaches this caller; the upstream stream is closed
+        # once no coalesced caller is left
+        if deadline is not None:
+            stream = iterate_until(stream, deadline)
+        return self._stream_text(stream, message_type, usage, upstream)
+    
+    @property
+    def recording(self) -> bool:
+        return self.recorder is not None and self.recorder.active
+    
+    def upstream_stream(self, model, messages: List[Any]) -> Iterator[Any]:
+        """The model's chunk stream for messages, recorded while traffic capture is on"""
+        stream = model.stream(messages)
+        return self.recorder.llm_stream(llm_key(messages), stream) if self.recording else stream
+    
+    def _stream_text(self, chunks: Iterator[Any], message_type: str, usage: Optional[Dict[str, Any]],
+                     upstream: List[bool]) -> Iterator[str]:
+        started = time.perf_counter()
+        ttft = None
+        usage_metadata = None
+        try:
+            for chunk in chunks:
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                if chunk.usage_metadata:
+                    usage_metadata = add_usage(usage_metadata, chunk.usage_metadata)
+                yield chunk.text()
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+            if usage is not None:
+                self.fill_usage(usage, message_type, usage_metadata, ttft, coalesced=not upstream)
+    
+    def fill_usage(self, usage: Dict[str, Any], message_type: str, usage_metadata: Optional[Dict[str, Any]],
+                   ttft: Optional[float], coalesced: bool):
+        """Record a generation in usage; coalesced calls cost no tokens of their own"""
+        if self._llm_injected:
+            model = getattr(self.llm, 'model_name', None) or type(self.llm).__name__
+        else:
+            model = Config.generation_profile(message_type)['model']
+        usage_metadata = usage_metadata if usage_metadata and not coalesced else {}
+        usage.update({
+            'model': model,
+            'prompt_tokens': usage_metadata.get('input_tokens', 0),
+            'output_tokens': usage_metadata.get('output_tokens', 0),
+            'cached_tokens': (usage_metadata.get('input_token_details') or {}).get('cache_read', 0),
+            'ttft': ttft,
+            'cache_status': CACHE_COALESCED if coalesced else CACHE_MISS,
+        })
+    
+    def record_usage(self, session_id: str, message_type: str, usage: Dict[str, Any], started: float):
+        """Queue the turn's usage record (written in batches)"""
+        if self.usage_ledger is None:
+            return
+        try:
+            self.usage_ledger.record(session_id, message_type, usage, time.perf_counter() - started)
+        except Exception as e:
+            print(f"Error recording usage: {e}")
+    
+    def get_usage_rollup(self, group_by: str = 'session', since: Any = None, until: Any = None,
+                         limit: int = 100) -> List[Dict[str, Any]]:
+        """Token and latency totals per session, message_type, model or day"""
+        if self.usage_ledger is None:
+            return []
+        return self.usage_ledger.rollup(group_by, since, until, limit)
+    
+    def get_cohort_report(self) -> Dict[str, Any]:
+        """BMI, age band, gender and condition/medication/allergy statistics over all health profiles"""
+        return self.cohort_reports.get()
+    
+    def answer_without_context(self, message: str, priority: int = BACKGROUND) -> tuple:
+        """Generate (response, message_type) for a message with no session history
+
+        Used to precompute answers, so by default it runs as background work.
+        The answer goes through the output guardrails; one stating an
+        implausible dose raises ValueError, so it is never stored or served.
+        """
+        route = self.route(message, None)
+        messages = self.render_prompt(message, [], route.intent, route.message_type)
+        response = render_sections(self.generate(messages, route.message_type, priority=priority), route.message_type)
+        if self.guardrails is not None:
+            response, drug = self.guardrails.check_output(response, message)
+            if drug is not None:
+                metrics.increment('guardrails.output.dose_blocked')
+                raise ValueError(f"answer states a dose of {drug} above the usual maximum")
+        return response, route.message_type
+    
+    def quick_answer(self, message: str, chat_history: List[Turn]) -> Optional[str]:
+        """Precomputed answer for a context-free prompt, only when the session has no history"""
+        if chat_history or self.quick_answers is None:
+            return None
+        entry = self.quick_answers.get(message)
+        if entry is None:
+            return None
+        metrics.increment('quick_answers.hits')
+        return entry['response']
+
+    def preliminary_triage(self, message: str, message_type: str) -> Optional[Dict[str, Any]]:
+        """Local symptom triage for a symptom message, or None (disabled, other type, no symptoms)"""
+        if not Config.SYMPTOM_TRIAGE_ENABLED or message_type not in Config.SYMPTOM_TRIAGE_MESSAGE_TYPES:
+            return None
+        try:
+            triage = get_symptom_ontology().triage(message)
+        except Exception as e:
+            print(f"Error in preliminary triage: {e}")
+            return None
+        if triage is not None:
+            metrics.increment('triage.shown')
+        return triage
+
+    def warm_up(self, precompute: bool = True, wait: bool = False):
+        """Open the DB and LLM connections and prime caches before the first request
+
+        With precompute, quick-action answers are generated (or loaded from
+        another worker's file) and kept fresh by a background refresher.
+        Generating them can take a while, so unless `wait` is set it happens
+        in the background and startup (and health checks) aren't held up.
+        """
+        with metrics.stage('warm_up'):
+            try:
+                self.db.get_chat_history('warm-up', 1)
+            except Exception as e:
+                print(f"Error warming up database: {e}")
+            
+            # Build every profile's client and bound chain, render each
+            # template once and load the intent model
+            for message_type in Config.GENERATION_PROFILES:
+                self.generation_chain_for(message_type)
+            for intent in [None, *self.intent_prompts]:
+                self.render_prompt('warm-up', [], intent)
+            if self.router is not None:
+                self.router.classifier.predict(['warm-up'])
+            
+            if Config.WARMUP_LLM_PING:
+                # A tiny request opens the LLM connection
+                try:
+                    with self.scheduler.slot(BACKGROUND, 'warm-up'):
+                        self.generation_chain_for('small_talk').invoke([HumanMessage(content="ping")])
+                except Exception as e:
+                    print(f"Error warming up LLM: {e}")
+            
+            if precompute:
+                if self.quick_answers is None:
+                    self.quick_answers = QuickAnswerStore(self)
+                self.quick_answers.load()
+                if wait:
+                    self.quick_answers.refresh()
+                if Config.QUICK_ANSWERS_REFRESH_INTERVAL > 0 and self.quick_answer_refresher is None:
+                    self.quick_answer_refresher = QuickAnswerRefresher(self.quick_answers, run_immediately=not wait)
+                    self.quick_answer_refresher.start()
+                elif not wait:
+                    threading.Thread(target=self.quick_answers.refresh, name='quick-answer-warm-up', daemon=True).start()
+        metrics.increment('warm_up.runs')
     
-    def chat(self, message: str, session_id: str) -> str:
-        """Process a chat message and return response"""
+    def shutdown(self):
+        """Stop background jobs and flush queued usage records"""
+        if self.quick_answer_refresher is not None:
+            self.quick_answer_refresher.stop()
+            self.quick_answer_refresher = None
+        if self.usage_ledger is not None:
+            self.usage_ledger.close()
+    
+    @captured('chat')
+    def chat(self, message: str, session_id: str, message_type: str = None,
+             deadline: Deadline = None, supersede: bool = False) -> str:
+        """Process a chat message and return response
+
+        message_type selects the generation profile (see Config.GENERATION_PROFILES);
+        without one, the intent router picks the prompt and message_type.
+        The request runs within `deadline` (CHAT_DEADLINE seconds by default);
+        with supersede, it cancels the session's previous in-flight request.
+        """
+        started = time.perf_counter()
+        deadline = deadline or Deadline(Config.CHAT_DEADLINE)
+        if supersede:
+            self.requests.begin(session_id, deadline.token)
+        # Filled in by the LLM call; stays a quick answer if none is made
+        usage = {'cache_status': CACHE_QUICK_ANSWER}
+        guard: Optional[GuardrailRun] = None
         try:
+            # Input guardrails run while the message is routed and history loads
+            guard = self.guardrails.start(message) if self.guardrails is not None else None
+            
+            with metrics.stage('route'):
+                route = self.route(message, session_id, message_type)
+            
             # Load chat history from database
-            self.load_chat_history(session_id)
+            with metrics.stage('history_load'):
+                chat_history = self.load_chat_history(session_id, deadline=deadline, query=message)
+            
+            message, route = self.apply_input_guardrails(guard, message, route)
+            message_type = route.message_type
             
-            # Generate response
-            response = self.chain.invoke({"input": message})
+            parser = None
+            response = self.quick_answer(message, chat_history)
+            if response is not None:
+                # Answers stored before they were checked are checked on the way out
+                stream, parser = self.section_stream(iter([response]), message_type, guard, rendered=True)
+                response = "".join(stream)
+            else:
+                with metrics.stage('prompt_render'):
+                    messages = self.render_prompt(message, chat_history, route.intent, message_type)
+                
+                # Generate response, leaving time to save it
+                with metrics.stage('llm'):
+                    stream = self.stream_generate(messages, message_type, self.llm_deadline(deadline), usage,
+                                                  session_id)
+                    stream, parser = self.section_stream(stream, message_type, guard)
+                    response = "".join(stream)
             
-            # Save to memory
-            self.memory.chat_memory.add_user_message(message)
-            self.memory.chat_memory.add_ai_message(response)
+            # A superseded answer is not saved (an expired deadline still is:
+            # the answer is complete)
+            if deadline.token.cancelled:
+                raise Cancelled(deadline.token.reason)
             
             # Save to database
-            self.db.save_chat_message(
-                session_id=session_id,
-                message=message,
-                response=response,
-                message_type="medical_query"
-            )
+            with metrics.stage('persist'):
+                sections = parser.sections if parser is not None else parse_sections(response, message_type)
+                self.persist(session_id, message, response, message_type, deadline, sections)
             
+            self.record_usage(session_id, message_type, usage, started)
+            metrics.increment('chat.requests')
             return response
             
+        except Cancelled as e:
+            metrics.increment('chat.cancelled')
+            print(f"Chat request cancelled: {e}")
+            return self.CANCELLED_RESPONSE
+        except DeadlineExceeded as e:
+            metrics.increment('chat.deadline_exceeded')
+            print(f"Chat request timed out: {e}")
+            return self.TIMEOUT_RESPONSE
         except Exception as e:
+            metrics.increment('chat.errors')
             print(f"Error in chat processing: {e}")
-            return "I apologize, but I'm experiencing technical difficulties. Please try again later or consult a healthcare professional for medical advice."
+            return self.ERROR_RESPONSE
+        finally:
+            if guard is not None:
+                guard.report()
+            if supersede:
+                self.requests.finish(session_id, deadline.token)
     
-    def load_chat_history(self, session_id: str, limit: int = 10):
-        """Load chat history from database into memory"""
+    @captured('stream_chat')
+    def stream_chat(self, message: str, session_id: str, message_type: str = None,
+                    deadline: Deadline = None, supersede: bool = False,
+                    on_section: Callable[[Dict[str, Any]], None] = None,
+                    on_triage: Callable[[Dict[str, Any]], None] = None) -> Iterator[str]:
+        """Process a chat message and yield the response as it is generated
+
+        Takes the same deadline and supersede arguments as chat(). Closing
+        the generator, cancelling the token or a newer superseding request
+        stops the upstream LLM stream. For message types with sections,
+        on_section is called as each section's text arrives and completes
+        (see SectionParser). For symptom messages, on_triage is called once,
+        before the LLM is asked, with the local preliminary triage (see
+        SymptomOntology.triage).
+        """
+        started = time.perf_counter()
+        deadline = deadline or Deadline(Config.CHAT_DEADLINE)
+        if supersede:
+            self.requests.begin(session_id, deadline.token)
+        # Filled in by the LLM call; stays a quick answer if none is made
+        usage = {'cache_status': CACHE_QUICK_ANSWER}
+        guard: Optional[GuardrailRun] = None
+        chunks = []
         try:
-            history = self.db.get_chat_history(session_id, limit)
+            guard = self.guardrails.start(message) if self.guardrails is not None else None
             
-            # Clear existing memory
-            self.memory.clear()
+            with metrics.stage('route'):
+                route = self.route(message, session_id, message_type)
             
-            # Add messages to memory in chronological order
-            for chat in history:
-                self.memory.chat_memory.add_user_message(chat['message'])
-                self.memory.chat_memory.add_ai_message(chat['response'])
+            with metrics.stage('history_load'):
+                chat_history = self.load_chat_history(session_id, deadline=deadline, query=message)
+            
+            message, route = self.apply_input_guardrails(guard, message, route)
+            message_type = route.message_type
+            
+            if on_triage is not None:
+                with metrics.stage('triage'):
+                    triage = self.preliminary_triage(message, message_type)
+                if triage is not None:
+                    on_triage(triage)
+            
+            quick = self.quick_answer(message, chat_history)
+            if quick is not None:
+                stream, parser = self.section_stream(iter([quick]), message_type, guard, on_section,
+                                                     rendered=True)
+                for chunk in stream:
+                    chunks.append(chunk)
+                    yield chunk
+            else:
+                with metrics.stage('prompt_render'):
+                    messages = self.render_prompt(message, chat_history, route.intent, message_type)
                 
+                with metrics.stage('llm'):
+                    stream = self.stream_generate(messages, message_type, self.llm_deadline(deadline), usage,
+                                                  session_id)
+                    stream, parser = self.section_stream(stream, message_type, guard, on_section)
+                    for chunk in stream:
+                        chunks.append(chunk)
+                        yield chunk
+            
+            if deadline.token.cancelled:
+                raise Cancelled(deadline.token.reason)
+            
+            with metrics.stage('persist'):
+                self.persist(session_id, message, "".join(chunks), message_type, deadline,
+                             parser.sections if parser is not None else None)
+            
+            self.record_usage(session_id, message_type, usage, started)
+            metrics.increment('chat.requests')
+            
+        except Cancelled as e:
+            # Nobody is reading any more; stop without an error message
+            metrics.increment('chat.cancelled')
+            print(f"Streaming chat cancelled: {e}")
+        except DeadlineExceeded as e:
+            metrics.increment('chat.deadline_exceeded')
+            print(f"Streaming chat timed out: {e}")
+            yield ("\n\n" if chunks else "") + self.TIMEOUT_RESPONSE
+        except Exception as e:
+            metrics.increment('chat.errors')
+            print(f"Error in streaming chat: {e}")
+            yield self.ERROR_RESPONSE
+        finally:
+            if guard is not None:
+                guard.report()
+            if supersede:
+                self.requests.finish(session_id, deadline.token)
+    
+    def section_stream(self, stream: Iterator[str], message_type: str, guard: Optional[GuardrailRun] = None,
+                       on_section: Callable[[Dict[str, Any]], None] = None, rendered: bool = False) -> tuple:
+        """(displayed text stream, SectionParser or None) for an answer stream
+
+        JSON answers are rendered as markdown first (unless already
+        rendered), so guardrails and the section parser see what the user sees.
+        """
+        schema = schema_for(message_type)
+        if schema is None:
+            return (guard.guard_stream(stream) if guard is not None else stream), None
+        if not rendered and structured_output(message_type):
+            stream = JsonSectionRenderer(schema).render(stream)
+        if guard is not None:
+            stream = guard.guard_stream(stream)
+        parser = SectionParser(schema, on_section)
+        return parser.track(stream), parser
+    
+    def apply_input_guardrails(self, guard: Optional[GuardrailRun], message: str,
+                               route: RouteDecision) -> tuple:
+        """(message, route) after the input checks: PII scrubbed, self-harm answered on the emergency path
+
+        The message sent to the LLM and saved is the scrubbed one.
+        """
+        verdict = guard.input_verdict() if guard is not None else None
+        if verdict is None:
+            return message, route
+        if verdict.escalate and route.intent != EMERGENCY:
+            route = RouteDecision(EMERGENCY, 1.0, INTENT_MESSAGE_TYPES[EMERGENCY])
+        return verdict.message, route
+    
+    @staticmethod
+    def llm_deadline(deadline: Deadline) -> Deadline:
+        """The LLM stage ends early enough to leave the persist share of the budget"""
+        return deadline.reserve(deadline.timeout * Config.CHAT_PERSIST_SHARE)
+    
+    def persist(self, session_id: str, message: str, response: str, message_type: str, deadline: Deadline,
+                sections: Dict[str, str] = None):
+        """Save a turn (with its parsed sections), waiting at most until the deadline.
+
+        A save that overruns is not abandoned: it completes in the background
+        and the response is returned without waiting for it.
+        """
+        if self.history_index is not None:
+            self.history_index.add(session_id, Turn(message, response, message_type, sections=sections))
+        try:
+            run_with_timeout(self.db.save_chat_message, deadline.remaining(),
+                             session_id=session_id, message=message,
+                             response=response, message_type=message_type, sections=sections)
+        except DeadlineExceeded as e:
+            metrics.increment('persist.timeouts')
+            print(f"Saving chat message is taking too long, finishing in background: {e}")
+    
+    def cancel_session(self, session_id: str, reason: str = 'cancelled') -> bool:
+        """Cancel the session's in-flight request (e.g. the user left or started over)"""
+        cancelled = self.requests.cancel(session_id, reason)
+        if cancelled:
+            metrics.increment('chat.cancel_requests')
+        return cancelled
+    
+    def load_chat_history(self, session_id: str, limit: int = 10, deadline: Deadline = None,
+                          query: str = None) -> List[Turn]:
+        """Load chat history from database as compact turns, oldest first
+
+        With a query (and history selection enabled) the turns are the latest
+        ones plus the older ones most relevant to it, within
+        HISTORY_TOKEN_BUDGET; the session's turns are indexed on first use.
+        With a deadline the load gets CHAT_HISTORY_SHARE of the budget; if it
+        takes longer the request goes ahead without history.
+        """
+        if query is None or self.history_index is None:
+            return self._fetch_turns(session_id, limit, deadline) or []
+        
+        selected = self.history_index.select(session_id, query)
+        if selected is None:
+            turns = self._fetch_turns(session_id, Config.HISTORY_INDEX_MAX_TURNS, deadline)
+            if turns is None:
+                return []
+            with metrics.stage('history_index'):
+                self.history_index.load(session_id, turns)
+            selected = self.history_index.select(session_id, query)
+        return selected or []
+    
+    def _fetch_turns(self, session_id: str, limit: int, deadline: Deadline = None) -> Optional[List[Turn]]:
+        """Stored turns of a session, or None if they couldn't be loaded"""
+        try:
+            if deadline is not None:
+                history = run_with_timeout(self.db.get_chat_history,
+                                           deadline.budget(Config.CHAT_HISTORY_SHARE), session_id, limit)
+            else:
+                history = self.db.get_chat_history(session_id, limit)
+            
+            return [Turn.from_row(chat) for chat in history]
+        except DeadlineExceeded as e:
+            metrics.increment('history_load.timeouts')
+            print(f"Loading chat history timed out, continuing without it: {e}")
         except Exception as e:
             print(f"Error loading chat history: {e}")
+        return None
+    
+    def get_chat_history(self, session_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get stored chat turns for a session"""
+        return self.db.get_chat_history(session_id, limit)
+    
+    def search_history(self, query: str, session_id: str = None, since: Any = None,
+                       until: Any = None, limit: int = None, cursor: str = None,
+                       section: str = None) -> Dict[str, Any]:
+        """Full-text search over stored turns (of one session, or all), best first
+
+        Returns {'results': [...], 'next_cursor': ...}; an invalid cursor raises ValueError.
+        """
+        try:
+            return search_transcripts(self.db, query, session_id, since, until, limit, cursor, section)
+        except ValueError:
+            raise
+        except Exception as e:
+            print(f"Error searching chat history: {e}")
+            return {'results': [], 'next_cursor': None}
     
     def clear_chat_history(self, session_id: str):
         """Clear chat history for a session"""
         try:
-            self.memory.clear()
+            self.cancel_session(session_id, 'history cleared')
+            if self.history_index is not None:
+                self.history_index.drop(session_id)
             self.db.delete_chat_history(session_id)
             return True
         except Exception as e:
             print(f"Error clearing chat history: {e}")
             return False
     
-    def get_medical_suggestion(self, symptoms: List[str]) -> str:
+    def get_medical_suggestion(self, symptoms: List[str], session_id: str = "medical_consultation") -> str:
         """Get medical suggestions based on symptoms"""
         symptoms_text = ", ".join(symptoms)
+        # The patient's own words carry severity, onset and duration; the
+        # recognised symptoms are only added next to them
+        ontology = get_symptom_ontology()
+        recognised = ", ".join(ontology.name(code) for code in ontology.codes_for(symptoms_text))
+        recognised_line = f"\nRecognised symptoms: {recognised}\n" if recognised else ""
         prompt = f"""**MEDICAL CONSULTATION REQUEST**
 
 Patient presents with symptoms: {symptoms_text}
-
+{recognised_line}
 Please provide a comprehensive medical assessment:
 
 1. **DIFFERENTIAL DIAGNOSIS:** List 3-5 most likely conditions with probability percentages
@@ -185,9 +805,9 @@ Please provide a comprehensive medical assessment:
 
 Format your response as a medical consultation note with specific medication recommendations."""
         
-        return self.chat(prompt, "medical_consultation")
+        return self.chat(prompt, session_id, message_type="symptom_analysis")
     
-    def get_medication_info(self, medication_name: str) -> str:
+    def get_medication_info(self, medication_name: str, session_id: str = "medication_inquiry") -> str:
         """Get comprehensive information about a medication"""
         prompt = f"""**MEDICATION CONSULTATION for: {medication_name}**
 
@@ -213,9 +833,9 @@ Please provide a comprehensive medication profile including:
 
 Provide this information as a detailed medication monograph."""
         
-        return self.chat(prompt, "medication_inquiry")
+        return self.chat(prompt, session_id, message_type="medication_inquiry")
     
-    def get_first_aid_advice(self, emergency_type: str) -> str:
+    def get_first_aid_advice(self, emergency_type: str, session_id: str = "first_aid_inquiry") -> str:
         """Get comprehensive first aid and emergency medical advice"""
         prompt = f"""**EMERGENCY MEDICAL PROTOCOL for: {emergency_type}**
 
@@ -235,10 +855,11 @@ Provide comprehensive emergency management including:
 
 Structure as an emergency medical protocol with specific medication recommendations."""
         
-        return self.chat(prompt, "first_aid_inquiry")
+        return self.chat(prompt, session_id, message_type="first_aid_inquiry")
     
     def get_comprehensive_medical_consultation(self, symptoms: str, age: int = None, 
-                                             medical_history: str = None) -> str:
+                                             medical_history: str = None,
+                                             session_id: str = "comprehensive_consultation") -> str:
         """Get comprehensive medical consultation with detailed medication recommendations"""
         prompt = f"""**COMPREHENSIVE MEDICAL CONSULTATION**
 
@@ -290,10 +911,11 @@ Please provide a COMPLETE medical consultation including:
 
 Provide this as a detailed medical consultation with emphasis on specific medication recommendations."""
         
-        return self.chat(prompt, "comprehensive_consultation")
+        return self.chat(prompt, session_id, message_type="comprehensive_consultation")
     
     def get_medication_prescription(self, condition: str, patient_age: int = None, 
-                                  allergies: str = None, current_meds: str = None) -> str:
+                                  allergies: str = None, current_meds: str = None,
+                                  session_id: str = "medication_prescription") -> str:
         """Get specific medication prescription for a condition"""
         prompt = f"""**MEDICATION PRESCRIPTION REQUEST**
 
@@ -340,4 +962,4 @@ Please provide a DETAILED MEDICATION PRESCRIPTION including:
 
 Format as a complete prescription with all necessary details a physician would provide."""
         
-        return self.chat(prompt, "medication_prescription")
+        return self.chat(prompt, session_id, message_type="medication_prescription")
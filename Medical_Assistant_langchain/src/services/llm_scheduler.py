@@ -0,0 +1,222 @@
+"""
+Priority classes and per-session fair queuing for LLM calls.
+
+Every upstream Gemini call (chat, the consultation helpers, the legacy
+service, warm-up and quick-answer refreshes) takes one of
+LLM_MAX_CONCURRENCY slots before it starts and frees it when it ends.
+Waiting calls are served strictly by class (emergency, then interactive,
+then background) and, within a class, by weighted fair queuing across
+sessions: a call's tag is its session's previous tag (or the class's
+virtual time, if later) plus its estimated tokens divided by its weight,
+and the lowest tag goes next. A session sending many or long requests
+therefore waits behind sessions that have sent less, rather than holding
+every slot.
+
+Background calls use at most LLM_BACKGROUND_SLOTS slots, so chat always
+has capacity, and queued background calls are preempted (they raise
+Preempted) when the queue is full and more urgent work arrives.
+"""
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+import sys
+import os
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from utils.deadline import Cancelled, Deadline, DeadlineExceeded
+from utils.metrics import metrics
+
+# Priority classes, most urgent first
+EMERGENCY = 0
+INTERACTIVE = 1
+BACKGROUND = 2
+PRIORITY_NAMES = ('emergency', 'interactive', 'background')
+
+# How often a waiting call checks its cancellation token
+WAIT_POLL_SECONDS = 0.1
+
+
+class Preempted(Exception):
+    """A queued background call was dropped to make room for more urgent work"""
+
+
+def priority_for(message_type: str = None) -> int:
+    """Class of a user-facing call: emergency message types go first"""
+    return EMERGENCY if message_type in Config.LLM_EMERGENCY_MESSAGE_TYPES else INTERACTIVE
+
+
+class _Ticket:
+    __slots__ = ('priority', 'session', 'start', 'finish', 'seq', 'queued_at', 'granted', 'preempted', 'abandoned')
+
+    def __init__(self, priority: int, session: str, start: float, finish: float, seq: int):
+        self.priority = priority
+        self.session = session
+        self.start = start    # virtual time the call may start at
+        self.finish = finish  # its tag: lower tags are served first
+        self.seq = seq
+        self.queued_at = time.perf_counter()
+        self.granted = False
+        self.preempted = False
+        self.abandoned = False
+
+    def __lt__(self, other: '_Ticket') -> bool:
+        return (self.finish, self.seq) < (other.finish, other.seq)
+
+
+class LLMScheduler:
+    """Admits LLM calls into a fixed number of slots by class, then by fair share per session"""
+
+    def __init__(self, slots: int = None, background_slots: int = None, max_queue: int = None):
+        self.slots = slots or Config.LLM_MAX_CONCURRENCY
+        self.background_slots = min(self.slots, Config.LLM_BACKGROUND_SLOTS if background_slots is None
+                                    else background_slots)
+        self.max_queue = max_queue or Config.LLM_MAX_QUEUE
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        # Per class: heap of waiting tickets, virtual time and each session's last tag
+        self._queues: List[List[_Ticket]] = [[] for _ in PRIORITY_NAMES]
+        self._queued = [0] * len(PRIORITY_NAMES)
+        self._virtual = [0.0] * len(PRIORITY_NAMES)
+        self._tags: List[Dict[str, float]] = [{} for _ in PRIORITY_NAMES]
+        self._running = [0] * len(PRIORITY_NAMES)
+
+    def queue_depth(self, priority: int = None) -> int:
+        with self._cond:
+            return sum(self._queued) if priority is None else self._queued[priority]
+
+    def acquire(self, priority: int = INTERACTIVE, session_id: str = None, cost: float = 1.0,
+                weight: float = 1.0, deadline: Deadline = None) -> _Ticket:
+        """Wait for a slot; release() the returned ticket when the call ends
+
+        Raises DeadlineExceeded or Cancelled if the deadline passes (LLM_TIMEOUT
+        without one) or is cancelled first, and Preempted if a background call
+        is dropped from the queue.
+        """
+        name = PRIORITY_NAMES[priority]
+        expires_at = deadline.expires_at if deadline is not None else time.monotonic() + Config.LLM_TIMEOUT
+        with self._cond:
+            ticket = self._enqueue(priority, session_id or '', max(cost, 1.0) / max(weight, 1e-3))
+            self._dispatch()
+            with metrics.stage('llm_queue'):
+                while not ticket.granted:
+                    if ticket.preempted:
+                        metrics.increment('llm_scheduler.preempted')
+                        raise Preempted(f"{name} call preempted by more urgent work")
+                    remaining = expires_at - time.monotonic()
+                    if remaining <= 0 or (deadline is not None and deadline.token.cancelled):
+                        self._abandon(ticket)
+                        metrics.increment(f'llm_scheduler.{name}.timeouts')
+                        if deadline is not None and deadline.token.cancelled:
+                            raise Cancelled(deadline.token.reason)
+                        raise DeadlineExceeded(f"no free LLM slot before the deadline ({name} queue)")
+                    self._cond.wait(min(remaining, WAIT_POLL_SECONDS))
+        metrics.observe(f'llm_scheduler.{name}.wait', time.perf_counter() - ticket.queued_at)
+        return ticket
+
+    def release(self, ticket: _Ticket):
+        with self._cond:
+            self._running[ticket.priority] -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority: int = INTERACTIVE, session_id: str = None, cost: float = 1.0,
+             weight: float = 1.0, deadline: Deadline = None) -> Iterator[None]:
+        """Hold a slot for the duration of a blocking call"""
+        ticket = self.acquire(priority, session_id, cost, weight, deadline)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def stream(self, factory: Callable[[], Iterable[Any]], priority: int = INTERACTIVE, session_id: str = None,
+               cost: float = 1.0, weight: float = 1.0, deadline: Deadline = None) -> Iterator[Any]:
+        """Iterate factory()'s stream holding a slot; the slot is taken on the first next()"""
+        ticket = self.acquire(priority, session_id, cost, weight, deadline)
+        try:
+            # Closing this generator closes the upstream stream too
+            yield from factory()
+        finally:
+            self.release(ticket)
+
+    def _enqueue(self, priority: int, session: str, size: float) -> _Ticket:
+        tags = self._tags[priority]
+        start = max(self._virtual[priority], tags.get(session, 0.0))
+        ticket = _Ticket(priority, session, start, start + size, next(self._seq))
+        tags[session] = ticket.finish
+        if len(tags) > 4 * self._queued[priority] + 1024:
+            # Sessions whose tag the virtual time has passed would start at it anyway
+            virtual = self._virtual[priority]
+            self._tags[priority] = {key: tag for key, tag in tags.items() if tag > virtual}
+        if sum(self._queued) >= self.max_queue:
+            if priority == BACKGROUND:
+                # A full queue sheds new background work rather than growing
+                ticket.preempted = True
+                return ticket
+            # Interactive and emergency calls are always queued (the API's
+            # slot limit bounds how many arrive); background work makes room
+            self._preempt_background()
+        heapq.heappush(self._queues[priority], ticket)
+        self._queued[priority] += 1
+        self._publish()
+        return ticket
+
+    def _preempt_background(self):
+        """Drop the queued background call that would run last"""
+        waiting = [ticket for ticket in self._queues[BACKGROUND] if not ticket.abandoned]
+        if waiting:
+            victim = max(waiting)
+            victim.preempted = True
+            self._abandon(victim)
+            self._cond.notify_all()
+
+    def _abandon(self, ticket: _Ticket):
+        # Left in the heap and skipped when it reaches the top
+        if not ticket.abandoned:
+            ticket.abandoned = True
+            self._queued[ticket.priority] -= 1
+            self._publish()
+
+    def _dispatch(self):
+        """Grant free slots to the most urgent, lowest-tagged waiting calls"""
+        granted = False
+        while sum(self._running) < self.slots:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            ticket.granted = True
+            self._queued[ticket.priority] -= 1
+            self._running[ticket.priority] += 1
+            self._virtual[ticket.priority] = max(self._virtual[ticket.priority], ticket.start)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+        self._publish()
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        for priority, queue in enumerate(self._queues):
+            while queue and queue[0].abandoned:
+                heapq.heappop(queue)
+            if not queue:
+                continue
+            if priority == BACKGROUND and self._running[BACKGROUND] >= self.background_slots:
+                return None
+            return heapq.heappop(queue)
+        return None
+
+    def _publish(self):
+        for priority, name in enumerate(PRIORITY_NAMES):
+            metrics.set_gauge(f'llm_scheduler.{name}.queued', self._queued[priority])
+            metrics.set_gauge(f'llm_scheduler.{name}.running', self._running[priority])
+
+
+# Process-wide scheduler for LLM calls, shared by every service instance
+llm_scheduler = LLMScheduler()
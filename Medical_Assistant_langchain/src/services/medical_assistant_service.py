@@ -10,17 +10,30 @@ src_path = os.path.dirname(current_dir)
 if src_path not in sys.path:
     sys.path.insert(0, src_path)
 
+from config import Config
 from services.gemini_service import GeminiService
-from database.supabase_manager import SupabaseManager
+from services.generation_memo import GenerationMemo, normalize_symptoms, profile_version
+from database.resilient_store import ResilientStore
+from database.cached_store import with_shared_cache
+from services.traffic_capture import RecordingStore, captured, get_recorder
 from utils.helpers import validate_email, sanitize_input, validate_health_info
+from utils.metrics import metrics
 
 class MedicalAssistantService:
     """Main service class for the medical assistant"""
     
-    def __init__(self):
-        self.gemini_service = GeminiService()
-        self.db_manager = SupabaseManager()
+    def __init__(self, gemini_service: GeminiService = None, db_manager=None):
+        self.gemini_service = gemini_service if gemini_service is not None else GeminiService()
+        # Like MedicalChatService: starts (and keeps chatting) while Supabase is down
+        self.db_manager = db_manager if db_manager is not None else with_shared_cache(ResilientStore())
+        # With TRAFFIC_CAPTURE_DIR set, calls and store results are logged for replay
+        self.recorder = get_recorder()
+        if self.recorder is not None:
+            self.db_manager = RecordingStore(self.db_manager, self.recorder)
+        # Recommendations and symptom analyses reused until the profile changes
+        self.memo = GenerationMemo(self.db_manager) if Config.GENERATION_MEMO_ENABLED else None
     
+    @captured('assistant.create_user_session')
     def create_user_session(self, name: str, email: str, 
                            health_info: Dict[str, Any] = None) -> Dict[str, Any]:
         """Create a new user session"""
@@ -52,10 +65,12 @@ class MedicalAssistantService:
         except Exception as e:
             return {"error": f"Error creating user session: {str(e)}"}
     
+    @captured('assistant.get_user_session')
     def get_user_session(self, user_id: str) -> Dict[str, Any]:
         """Get user session information"""
         try:
-            user_profile = self.db_manager.get_user_profile(user_id)
+            with metrics.stage('profile_load'):
+                user_profile = self.db_manager.get_user_profile(user_id)
             if user_profile:
                 return {
                     "success": True,
@@ -66,6 +81,7 @@ class MedicalAssistantService:
         except Exception as e:
             return {"error": f"Error fetching user session: {str(e)}"}
     
+    @captured('assistant.update_health_info')
     def update_health_info(self, user_id: str, health_info: Dict[str, Any]) -> Dict[str, Any]:
         """Update user's health information"""
         try:
@@ -83,6 +99,7 @@ class MedicalAssistantService:
         except Exception as e:
             return {"error": f"Error updating health info: {str(e)}"}
     
+    @captured('assistant.process_medical_query')
     def process_medical_query(self, user_id: str, query: str) -> Dict[str, Any]:
         """Process a medical query from the user"""
         try:
@@ -90,27 +107,32 @@ class MedicalAssistantService:
             query = sanitize_input(query)
             
             # Get user profile and health info
-            user_profile = self.db_manager.get_user_profile(user_id)
+            with metrics.stage('profile_load'):
+                user_profile = self.db_manager.get_user_profile(user_id)
             if not user_profile:
                 return {"error": "User session not found"}
             
             # Get chat history for context
-            chat_history = self.db_manager.get_chat_history(user_id, limit=5)
+            with metrics.stage('history_load'):
+                chat_history = self.db_manager.get_chat_history(user_id, limit=5)
             
             # Generate response using Gemini
-            response = self.gemini_service.process_medical_query(
-                user_query=query,
-                health_info=user_profile.get('health_info', {}),
-                chat_history=chat_history
-            )
+            with metrics.stage('llm'):
+                response = self.gemini_service.process_medical_query(
+                    user_query=query,
+                    health_info=user_profile.get('health_info', {}),
+                    chat_history=chat_history,
+                    session_id=user_id
+                )
             
             # Save the conversation
-            chat_record = self.db_manager.save_chat_message(
-                user_id=user_id,
-                message=query,
-                response=response,
-                message_type='medical_query'
-            )
+            with metrics.stage('persist'):
+                chat_record = self.db_manager.save_chat_message(
+                    session_id=user_id,
+                    message=query,
+                    response=response,
+                    message_type='medical_query'
+                )
             
             return {
                 "success": True,
@@ -122,31 +144,39 @@ class MedicalAssistantService:
         except Exception as e:
             return {"error": f"Error processing medical query: {str(e)}"}
     
+    @captured('assistant.analyze_symptoms')
     def analyze_symptoms(self, user_id: str, symptoms: str) -> Dict[str, Any]:
         """Analyze symptoms for the user"""
         try:
             # Get user profile
-            user_profile = self.db_manager.get_user_profile(user_id)
+            with metrics.stage('profile_load'):
+                user_profile = self.db_manager.get_user_profile(user_id)
             if not user_profile:
                 return {"error": "User session not found"}
             
-            # Generate symptom analysis
-            analysis = self.gemini_service.analyze_symptoms(
-                symptoms=symptoms,
-                health_info=user_profile.get('health_info', {})
-            )
+            # Generate symptom analysis (or reuse the one for these symptoms and this profile)
+            health_info = user_profile.get('health_info') or {}
+            with metrics.stage('llm'):
+                analysis, cached = self.memoised(
+                    'symptom_analysis', health_info,
+                    lambda: self.gemini_service.analyze_symptoms(symptoms=symptoms, health_info=health_info,
+                                                                 session_id=user_id),
+                    normalize_symptoms(symptoms)
+                )
             
             # Save the conversation
-            chat_record = self.db_manager.save_chat_message(
-                user_id=user_id,
-                message=f"Symptom analysis: {symptoms}",
-                response=analysis,
-                message_type='symptom_analysis'
-            )
+            with metrics.stage('persist'):
+                chat_record = self.db_manager.save_chat_message(
+                    session_id=user_id,
+                    message=f"Symptom analysis: {symptoms}",
+                    response=analysis,
+                    message_type='symptom_analysis'
+                )
             
             return {
                 "success": True,
                 "analysis": analysis,
+                "cached": cached,
                 "chat_id": chat_record.get('id') if chat_record else None,
                 "timestamp": datetime.now().isoformat()
             }
@@ -154,30 +184,38 @@ class MedicalAssistantService:
         except Exception as e:
             return {"error": f"Error analyzing symptoms: {str(e)}"}
     
+    @captured('assistant.get_health_recommendations')
     def get_health_recommendations(self, user_id: str) -> Dict[str, Any]:
         """Get personalized health recommendations"""
         try:
             # Get user profile
-            user_profile = self.db_manager.get_user_profile(user_id)
+            with metrics.stage('profile_load'):
+                user_profile = self.db_manager.get_user_profile(user_id)
             if not user_profile:
                 return {"error": "User session not found"}
             
-            # Generate recommendations
-            recommendations = self.gemini_service.generate_health_recommendations(
-                health_info=user_profile.get('health_info', {})
-            )
+            # Generate recommendations (or reuse the ones for this profile)
+            health_info = user_profile.get('health_info') or {}
+            with metrics.stage('llm'):
+                recommendations, cached = self.memoised(
+                    'health_recommendations', health_info,
+                    lambda: self.gemini_service.generate_health_recommendations(health_info=health_info,
+                                                                                session_id=user_id)
+                )
             
             # Save the conversation
-            chat_record = self.db_manager.save_chat_message(
-                user_id=user_id,
-                message="Health recommendations request",
-                response=recommendations,
-                message_type='health_recommendations'
-            )
+            with metrics.stage('persist'):
+                chat_record = self.db_manager.save_chat_message(
+                    session_id=user_id,
+                    message="Health recommendations request",
+                    response=recommendations,
+                    message_type='health_recommendations'
+                )
             
             return {
                 "success": True,
                 "recommendations": recommendations,
+                "cached": cached,
                 "chat_id": chat_record.get('id') if chat_record else None,
                 "timestamp": datetime.now().isoformat()
             }
@@ -185,6 +223,14 @@ class MedicalAssistantService:
         except Exception as e:
             return {"error": f"Error generating recommendations: {str(e)}"}
     
+    def memoised(self, kind: str, health_info: Dict[str, Any], generate, *parts: str) -> tuple:
+        """(response, cached) for a generation that depends only on the profile (and parts)"""
+        if self.memo is None:
+            return generate(), False
+        return self.memo.get_or_generate(kind, profile_version(health_info), generate, *parts,
+                                         failed=GeminiService.ERROR_RESPONSE)
+    
+    @captured('assistant.get_chat_history')
     def get_chat_history(self, user_id: str, limit: int = 10) -> Dict[str, Any]:
         """Get user's chat history"""
         try:
@@ -196,6 +242,7 @@ class MedicalAssistantService:
         except Exception as e:
             return {"error": f"Error fetching chat history: {str(e)}"}
     
+    @captured('assistant.clear_chat_history')
     def clear_chat_history(self, user_id: str) -> Dict[str, Any]:
         """Clear user's chat history"""
         try:
@@ -0,0 +1,189 @@
+"""
+Quick-action prompts and their precomputed answers.
+
+The sidebar quick actions send fixed, context-free messages, so their
+answers are generated ahead of time (at warm-up and then on a schedule)
+and served from QuickAnswerStore when a session has no history yet.
+"""
+import json
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+import sys
+import os
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from utils.metrics import metrics
+from utils.periodic import PeriodicJob
+
+# Sidebar quick actions in display order: (section, label, message)
+QUICK_ACTIONS = [
+    ("Quick Actions", "🆘 First Aid", "I need first aid advice for an emergency situation."),
+    ("Quick Actions", "💊 Get Medication", "I need specific medication recommendations for my condition. Please provide exact drug names and dosages."),
+    ("Quick Actions", "🤒 Symptoms", "I'm experiencing symptoms and need a complete medical consultation with medication recommendations."),
+    ("Quick Actions", "🏥 Prescription", "I need a detailed prescription for my medical condition with specific medications and dosages."),
+    ("Medication Services", "📋 Drug Info", "I need detailed information about a specific medication including dosage, side effects, and interactions."),
+    ("Medication Services", "⚠️ Drug Interactions", "I need to check for drug interactions between my medications."),
+    ("Medication Services", "🔄 Alternative Meds", "I need alternative medication options for my condition due to side effects or allergies."),
+    ("Medication Services", "📊 Dosage Adjustment", "I need help adjusting my medication dosage based on my response to treatment."),
+]
+
+QUICK_ACTION_MESSAGES = [message for _, _, message in QUICK_ACTIONS]
+
+
+class QuickAnswerStore:
+    """Precomputed answers for context-free prompts, persisted as JSON.
+
+    Workers sharing `path` reuse each other's answers: one worker at a time
+    regenerates entries older than max_age (guarded by a lock file) and
+    the others pick the file up when it changes.
+    """
+
+    LOCK_TIMEOUT = 600  # seconds before a leftover lock file is considered abandoned
+
+    def __init__(self, service, prompts: List[str] = None, path: str = None, max_age: float = None):
+        self.service = service
+        self.prompts = prompts if prompts is not None else QUICK_ACTION_MESSAGES
+        self.path = path if path is not None else Config.QUICK_ANSWERS_PATH
+        self.max_age = timedelta(seconds=max_age if max_age is not None else Config.QUICK_ANSWERS_MAX_AGE)
+        self._answers: Dict[str, Dict[str, Any]] = {}
+        self._loaded_mtime: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read answers saved by this or another worker"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, encoding='utf-8') as f:
+                answers = json.load(f)
+            with self._lock:
+                self._answers.update(answers)
+                self._loaded_mtime = mtime
+        except Exception as e:
+            print(f"Error loading quick answers: {e}")
+
+    def _reload_if_changed(self):
+        try:
+            if self.path and os.path.getmtime(self.path) != self._loaded_mtime:
+                self.load()
+        except OSError:
+            pass
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with self._lock:
+                data = json.dumps(self._answers)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            print(f"Error saving quick answers: {e}")
+
+    def get(self, message: str) -> Optional[Dict[str, Any]]:
+        """Stored answer ({'response', 'message_type', 'computed_at'}) for a prompt, if any"""
+        if message not in self.prompts:
+            return None
+        with self._lock:
+            entry = self._answers.get(message)
+        if entry is None:
+            # Another worker may have computed it since we last looked
+            self._reload_if_changed()
+            with self._lock:
+                entry = self._answers.get(message)
+        return entry
+
+    def is_fresh(self, message: str) -> bool:
+        entry = self.get(message)
+        if not entry:
+            return False
+        return datetime.now() - datetime.fromisoformat(entry['computed_at']) < self.max_age
+
+    def _acquire_refresh_lock(self) -> bool:
+        if not self.path:
+            return True
+        lock_path = f"{self.path}.lock"
+        os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+        try:
+            if datetime.now().timestamp() - os.path.getmtime(lock_path) > self.LOCK_TIMEOUT:
+                os.remove(lock_path)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            return False
+
+    def _release_refresh_lock(self):
+        if self.path:
+            try:
+                os.remove(f"{self.path}.lock")
+            except OSError:
+                pass
+
+    def refresh(self, force: bool = False) -> int:
+        """Generate answers that are missing or stale, returning how many were updated"""
+        self.load()
+        if not self._acquire_refresh_lock():
+            # Another worker is refreshing; its results arrive via the file
+            return 0
+        try:
+            return self._refresh(force)
+        finally:
+            self._release_refresh_lock()
+
+    def _refresh(self, force: bool) -> int:
+        updated = 0
+        for message in self.prompts:
+            if not force and self.is_fresh(message):
+                continue
+            try:
+                response, message_type = self.service.answer_without_context(message)
+            except Exception as e:
+                metrics.increment('quick_answers.errors')
+                print(f"Error precomputing quick answer: {e}")
+                continue
+            with self._lock:
+                self._answers[message] = {
+                    'response': response,
+                    'message_type': message_type,
+                    'computed_at': datetime.now().isoformat(),
+                }
+            updated += 1
+        if updated:
+            self.save()
+        metrics.set_gauge('quick_answers.count', len(self._answers))
+        return updated
+
+
+class QuickAnswerRefresher(PeriodicJob):
+    """Regenerates stale quick answers in the background"""
+
+    name = 'quick-answer-refresher'
+
+    def __init__(self, store: QuickAnswerStore, interval: float = None, run_immediately: bool = True):
+        super().__init__(interval if interval is not None else Config.QUICK_ANSWERS_REFRESH_INTERVAL)
+        self.store = store
+        self.run_immediately = run_immediately
+
+    def _loop(self):
+        if self.run_immediately:
+            self.run_once()
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def run_once(self) -> int:
+        with metrics.stage('quick_answers_refresh'):
+            return self.store.refresh()
@@ -0,0 +1,502 @@
+"""
+Sectioned answers: a schema per message_type and incremental parsers.
+
+Each consultation prompt asks for fixed sections (Likely Condition(s),
+Recommended Medications, ...). SECTION_SCHEMAS lists them per
+message_type. Answers are split into those sections while they stream:
+
+- With STRUCTURED_OUTPUT_ENABLED, Gemini is asked for one JSON object with
+  a string per section key (response_mime_type=application/json), and
+  JsonSectionRenderer turns the partial JSON into markdown as it arrives
+  ("**Title:** text" per section), so users and guardrails see the same
+  text as before.
+- SectionParser follows the displayed markdown (from either mode) and
+  reports each section as its tokens pass, then its full text once the
+  next section starts, so a UI can render sections progressively. Its
+  sections are saved with the turn.
+
+Message types without a schema (small talk, drug info, emergencies) are
+streamed as plain text.
+"""
+import json
+import re
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import sys
+import os
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+
+Schema = Tuple[Tuple[str, str], ...]
+
+# (key, title) per section, in answer order
+CONSULTATION_SECTIONS: Schema = (
+    ('likely_conditions', 'Likely Condition(s)'),
+    ('recommended_medications', 'Recommended Medications'),
+    ('treatment_plan', 'Treatment Plan'),
+    ('monitoring', 'Monitoring'),
+    ('follow_up', 'Follow-up'),
+)
+
+SECTION_SCHEMAS: Dict[str, Schema] = {
+    'medical_query': CONSULTATION_SECTIONS,
+    'follow_up': CONSULTATION_SECTIONS,
+    'symptom_analysis': (
+        ('differential_diagnosis', 'Differential Diagnosis'),
+        ('recommended_medications', 'Recommended Medications'),
+        ('treatment_protocol', 'Treatment Protocol'),
+        ('diagnostic_tests', 'Diagnostic Tests'),
+        ('monitoring', 'Monitoring Instructions'),
+        ('follow_up', 'Follow-up Timeline'),
+        ('red_flags', 'Red Flags'),
+    ),
+    'medication_inquiry': (
+        ('drug_classification', 'Drug Classification'),
+        ('clinical_indications', 'Clinical Indications'),
+        ('dosage_protocols', 'Dosage Protocols'),
+        ('administration', 'Administration Details'),
+        ('contraindications', 'Contraindications'),
+        ('drug_interactions', 'Drug Interactions'),
+        ('side_effects', 'Side Effects'),
+        ('monitoring', 'Monitoring Requirements'),
+        ('alternatives', 'Alternative Medications'),
+        ('cost', 'Cost Considerations'),
+    ),
+    'first_aid_inquiry': (
+        ('immediate_actions', 'Immediate Actions'),
+        ('emergency_medications', 'Emergency Medications'),
+        ('assessment', 'Assessment Protocol'),
+        ('when_to_call_911', 'When to Call 911'),
+        ('hospital_preparation', 'Hospital Preparation'),
+        ('follow_up_medications', 'Follow-up Medications'),
+        ('prevention', 'Prevention Strategies'),
+    ),
+    'comprehensive_consultation': (
+        ('chief_complaint', 'Chief Complaint Analysis'),
+        ('differential_diagnosis', 'Differential Diagnosis'),
+        ('recommended_medications', 'Recommended Medications'),
+        ('drug_recommendations', 'Specific Drug Recommendations'),
+        ('monitoring', 'Monitoring Protocol'),
+        ('medication_adjustments', 'Follow-up Medication Adjustments'),
+        ('emergency_medications', 'Emergency Medications'),
+    ),
+    'medication_prescription': (
+        ('primary_regimen', 'Primary Medication Regimen'),
+        ('dosing_schedule', 'Dosing Schedule'),
+        ('alternatives', 'Alternative Medications'),
+        ('interaction_warnings', 'Drug Interaction Warnings'),
+        ('monitoring', 'Monitoring Requirements'),
+        ('refills', 'Prescription Refill Instructions'),
+    ),
+}
+
+# Text before the first section heading
+PREAMBLE = 'preamble'
+
+JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+STRING_SPECIALS = re.compile(r'["\\]')
+# A partial line longer than this is never a heading
+MAX_HEADING_CHARS = 120
+
+
+def schema_for(message_type: str = None) -> Optional[Schema]:
+    return SECTION_SCHEMAS.get(message_type or Config.DEFAULT_MESSAGE_TYPE)
+
+
+def structured_output(message_type: str = None) -> bool:
+    """Whether message_type's answers are requested as JSON"""
+    return Config.STRUCTURED_OUTPUT_ENABLED and schema_for(message_type) is not None
+
+
+def json_instruction(schema: Schema) -> str:
+    """System prompt addition asking for the schema's sections as one JSON object"""
+    keys = ', '.join(f'"{key}" ({title})' for key, title in schema)
+    return ("**OUTPUT FORMAT:** Reply with a single JSON object and nothing else. Its keys, in this order, are "
+            f"{keys}. Each value is that section's content as a markdown string. This replaces the numbered "
+            "response format above.")
+
+
+def _title(schema: Schema, key: str) -> str:
+    return dict(schema).get(key) or key.replace('_', ' ').capitalize()
+
+
+def _normalize(title: str) -> str:
+    return re.sub(r'[^a-z0-9]', '', title.lower())
+
+
+def _format_value(value: Any) -> str:
+    """Markdown for a non-string JSON section value"""
+    if isinstance(value, list):
+        return ''.join(f"\n- {_format_value(item).strip()}" for item in value)
+    if isinstance(value, dict):
+        return ''.join(f"\n- **{key}:** {_format_value(item).strip()}" for key, item in value.items())
+    return '' if value is None else str(value)
+
+
+class JsonSectionRenderer:
+    """Incremental parser of a streamed JSON object of sections, emitting it as markdown
+
+    feed() returns the markdown for each chunk as soon as it can: a section's
+    heading when its key is complete, and its string value character by
+    character (JSON escapes decoded). Non-string values (lists, objects) are
+    rendered once complete. Output that isn't a JSON object (the model
+    ignored the format) is passed through unchanged.
+    """
+
+    def __init__(self, schema: Schema):
+        self.schema = schema
+        self.state = 'start'
+        self.buffer = ''       # key, raw value, or fence being read
+        self.escape = None     # partial escape sequence inside a string
+        self.surrogate = None  # high surrogate waiting for its pair
+        self.depth = 0
+        self.in_raw_string = False
+        self.key = ''
+        self.sections = 0
+
+    def render(self, chunks: Iterator[str]) -> Iterator[str]:
+        try:
+            for chunk in chunks:
+                text = self.feed(chunk)
+                if text:
+                    yield text
+            text = self.close()
+            if text:
+                yield text
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    def feed(self, text: str) -> str:
+        out: List[str] = []
+        i = 0
+        while i < len(text):
+            i = self._step(text, i, out)
+        return ''.join(out)
+
+    def close(self) -> str:
+        if self.state in ('start', 'fence'):
+            # Never saw a JSON object
+            text, self.buffer = self.buffer, ''
+            return text
+        return ''
+
+    def _heading(self, key: str) -> str:
+        separator = '\n\n' if self.sections else ''
+        self.sections += 1
+        return f"{separator}**{_title(self.schema, key)}:** "
+
+    def _step(self, text: str, i: int, out: List[str]) -> int:
+        state = self.state
+        char = text[i]
+        if state == 'passthrough':
+            out.append(text[i:])
+            return len(text)
+        if state == 'start':
+            if char.isspace():
+                self.buffer += char
+                return i + 1
+            if char == '{':
+                self.buffer = ''
+                self.state = 'key_wait'
+                return i + 1
+            if char == '`':
+                self.buffer += char
+                self.state = 'fence'
+                return i + 1
+            out.append(self.buffer)
+            self.buffer = ''
+            self.state = 'passthrough'
+            return i
+        if state == 'fence':
+            # ```json ... up to the end of the line, then the object
+            self.buffer += char
+            if char == '\n':
+                self.state = 'start'
+            return i + 1
+        if state == 'key_wait':
+            if char == '"':
+                self.buffer = ''
+                self.state = 'key'
+            elif char == '}':
+                self.state = 'end'
+            return i + 1
+        if state == 'key':
+            if self.escape is not None:
+                self.escape = None
+                self.buffer += JSON_ESCAPES.get(char, char)
+            elif char == '\\':
+                self.escape = ''
+            elif char == '"':
+                self.key = self.buffer
+                self.state = 'colon'
+            else:
+                self.buffer += char
+            return i + 1
+        if state == 'colon':
+            if char == ':':
+                self.state = 'value_wait'
+            return i + 1
+        if state == 'value_wait':
+            if char.isspace():
+                return i + 1
+            if char == '"':
+                out.append(self._heading(self.key))
+                self.state = 'string'
+                return i + 1
+            self.buffer = ''
+            self.depth = 0
+            self.in_raw_string = False
+            self.state = 'raw'
+            return i
+        if state == 'string':
+            return self._string(text, i, out)
+        if state == 'raw':
+            return self._raw(text, i, out)
+        if state == 'after_value':
+            if char == ',':
+                self.state = 'key_wait'
+            elif char == '}':
+                self.state = 'end'
+            return i + 1
+        # 'end': anything after the object (e.g. a closing fence) is dropped
+        return len(text)
+
+    def _string(self, text: str, i: int, out: List[str]) -> int:
+        if self.escape is not None:
+            self.escape += text[i]
+            if self.escape[0] != 'u':
+                decoded = JSON_ESCAPES.get(self.escape, self.escape)
+            elif len(self.escape) < 5:
+                return i + 1
+            else:
+                decoded = self._unicode(int(self.escape[1:], 16))
+            self.escape = None
+            out.append(decoded)
+            return i + 1
+        match = STRING_SPECIALS.search(text, i)
+        end = match.start() if match else len(text)
+        if end > i:
+            out.append(text[i:end])
+        if match is None:
+            return len(text)
+        if match.group() == '\\':
+            self.escape = ''
+        else:
+            self.state = 'after_value'
+        return end + 1
+
+    def _unicode(self, code: int) -> str:
+        if 0xD800 <= code < 0xDC00:
+            self.surrogate = code
+            return ''
+        if 0xDC00 <= code < 0xE000 and self.surrogate is not None:
+            code = 0x10000 + ((self.surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self.surrogate = None
+        return chr(code)
+
+    def _raw(self, text: str, i: int, out: List[str]) -> int:
+        char = text[i]
+        if self.in_raw_string:
+            if self.escape is not None:
+                self.escape = None
+            elif char == '\\':
+                self.escape = ''
+            elif char == '"':
+                self.in_raw_string = False
+        elif char == '"':
+            self.in_raw_string = True
+        elif char in '[{':
+            self.depth += 1
+        elif char in ']}' and self.depth > 0:
+            self.depth -= 1
+        elif (char == ',' or char == '}') and self.depth == 0:
+            # End of a scalar (or of the object after one)
+            self._finish_raw(out)
+            return i
+        self.buffer += char
+        if self.depth == 0 and not self.in_raw_string and char in ']}':
+            self._finish_raw(out)
+        return i + 1
+
+    def _finish_raw(self, out: List[str]):
+        try:
+            value = json.loads(self.buffer)
+        except ValueError:
+            value = self.buffer.strip()
+        heading = self._heading(self.key)
+        if isinstance(value, (list, dict)):
+            # Lists and objects start on the line after their heading
+            heading = heading.rstrip()
+        out.append(heading + _format_value(value))
+        self.buffer = ''
+        self.state = 'after_value'
+
+
+def _heading_of(line: str, partial: bool = False) -> Optional[Tuple[str, str]]:
+    """(title, text after it) if line is a heading: "1. **Title:** text", "## Title" or "2. Title: text"
+
+    For a partial line only a closed bold title counts; None means "not yet known".
+    """
+    # Trailing spaces of a partial line belong to the text that follows
+    text = line.lstrip().rstrip('\n')
+    hashes = len(text) - len(text.lstrip('#'))
+    text = text[hashes:].lstrip()
+    number = re.match(r'\d{1,2}[.)]\s*', text)
+    if number:
+        text = text[number.end():]
+    for marker in ('**', '__'):
+        if text.startswith(marker):
+            end = text.find(marker, len(marker))
+            if end == -1:
+                return None
+            title, rest = text[len(marker):end], text[end + len(marker):]
+            return title.strip().rstrip(':').strip(), rest.lstrip().lstrip(':').lstrip()
+    if partial:
+        return None
+    if hashes or (number and ':' in text[:80]):
+        title, _, rest = text.partition(':')
+        return title.strip(), rest.lstrip()
+    return None
+
+
+class SectionParser:
+    """Follows a streamed markdown answer and splits it into its schema's sections
+
+    on_section (if given) is called with {'section', 'title', 'delta'} as
+    text of a section passes and {'section', 'title', 'done': True, 'text'}
+    when it is complete. Text is held back only while a line could still
+    turn out to be a heading.
+    """
+
+    def __init__(self, schema: Schema, on_section: Callable[[Dict[str, Any]], None] = None):
+        self.schema = schema
+        self.on_section = on_section
+        self._titles = [(_normalize(title), key, title) for key, title in schema]
+        self._parts: Dict[str, List[str]] = {}
+        self._current: Optional[Tuple[str, str]] = None  # (key, title)
+        self._line = ''             # partial line not yet assigned
+        self._line_is_text = False  # the partial line can no longer be a heading
+
+    def track(self, chunks: Iterator[str]) -> Iterator[str]:
+        """Pass chunks through unchanged, parsing them on the way"""
+        try:
+            for chunk in chunks:
+                self.feed(chunk)
+                yield chunk
+            self.close()
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    def feed(self, text: str):
+        lines = text.split('\n')
+        for line in lines[:-1]:
+            self._complete_line(self._line + line + '\n')
+        self._line += lines[-1]
+        if not self._line:
+            return
+        if not self._line_is_text and self._may_be_heading(self._line):
+            # A bold title is known before its line ends
+            heading = _heading_of(self._line, partial=True)
+            if heading is None:
+                return
+            self._start_line(heading, self._line)
+        else:
+            self._content(self._line)
+        self._line = ''
+        self._line_is_text = True
+
+    def close(self):
+        if self._line:
+            self._complete_line(self._line)
+        self._finish_current()
+
+    @property
+    def sections(self) -> Dict[str, str]:
+        """Text per section key (blank sections left out)"""
+        sections = {key: ''.join(parts).strip() for key, parts in self._parts.items()}
+        return {key: text for key, text in sections.items() if text}
+
+    @staticmethod
+    def _may_be_heading(partial: str) -> bool:
+        start = partial.lstrip()
+        return len(partial) < MAX_HEADING_CHARS and (not start or start[0] in '#*_0123456789')
+
+    def _complete_line(self, line: str):
+        if self._line_is_text:
+            self._content(line)
+        else:
+            heading = _heading_of(line)
+            if heading is None:
+                self._content(line)
+            else:
+                self._start_line(heading, line)
+        self._line = ''
+        self._line_is_text = False
+
+    def _start_line(self, heading: Tuple[str, str], line: str):
+        """Start the heading's section (the rest of the line is its first text), or treat the line as text"""
+        matched = self._match(heading[0])
+        if matched is None:
+            self._content(line)
+            return
+        self._finish_current()
+        self._current = matched
+        key = matched[0]
+        if self._parts.get(key):
+            # The same section again: keep both parts
+            self._parts[key] = [''.join(self._parts[key]).rstrip(), '\n\n']
+        self._parts.setdefault(key, [])
+        self._content(heading[1] + ('\n' if line.endswith('\n') else ''), force=True)
+
+    def _match(self, title: str) -> Optional[Tuple[str, str]]:
+        normalized = _normalize(title)
+        if not normalized:
+            return None
+        for schema_title, key, display in self._titles:
+            if normalized.startswith(schema_title):
+                return key, display
+        return None
+
+    def _content(self, text: str, force: bool = False):
+        if not text and not force:
+            return
+        key, title = self._current or (PREAMBLE, '')
+        self._parts.setdefault(key, []).append(text)
+        if self.on_section is not None and (text or force):
+            self.on_section({'section': key, 'title': title, 'delta': text})
+
+    def _finish_current(self):
+        key, title = self._current or (PREAMBLE, '')
+        if key not in self._parts:
+            return
+        if self.on_section is not None:
+            self.on_section({'section': key, 'title': title, 'done': True,
+                             'text': ''.join(self._parts[key]).strip()})
+
+
+def parse_sections(text: str, message_type: str = None) -> Optional[Dict[str, str]]:
+    """Sections of a complete answer (None for message types without a schema)"""
+    schema = schema_for(message_type)
+    if schema is None or not text:
+        return None
+    parser = SectionParser(schema)
+    parser.feed(text)
+    parser.close()
+    return parser.sections or None
+
+
+def render_sections(text: str, message_type: str = None) -> str:
+    """Markdown for a complete answer requested as JSON (text unchanged otherwise)"""
+    if not structured_output(message_type):
+        return text
+    renderer = JsonSectionRenderer(schema_for(message_type))
+    return renderer.feed(text) + renderer.close()
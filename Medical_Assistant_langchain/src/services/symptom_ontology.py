@@ -0,0 +1,523 @@
+"""
+Local symptom ontology: free text to canonical symptom codes, and an
+instant preliminary differential.
+
+Every synonym of every symptom ("head ache", "headache", "cephalalgia")
+is loaded into one character trie, keyed without spaces or hyphens, so a
+message is matched in a single left-to-right pass: at each word, the
+longest synonym starting there wins, and words that match nothing are
+tried once more with a small edit distance ("headach", "diarhea").
+Symptoms right after a negation ("no fever", "don't have a cough") are
+reported but left out of the codes.
+
+The symptom -> condition co-occurrence table (how often each condition
+presents with each symptom, plus a prior) is precomputed at load into a
+log-probability matrix, so a preliminary differential for any set of codes
+is one column sum and a softmax. It is a rough, local ranking that is shown
+while the LLM answer streams, not a diagnosis.
+
+Extend or override the built-in tables with a JSON file in
+SYMPTOM_ONTOLOGY_PATH: {"symptoms": {code: [name, [synonyms]]},
+"conditions": {name: {"prior": p, "urgent": bool, "symptoms": {code: p}}}}.
+
+    python src/services/symptom_ontology.py "head ache and a high temperature, no cough"
+"""
+import argparse
+import json
+import re
+import threading
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+import sys
+import os
+
+import numpy as np
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from utils.metrics import metrics
+
+# code -> (display name, synonyms); synonyms are matched case-, space- and hyphen-insensitively
+SYMPTOMS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    'headache': ('Headache', ('headache', 'head pain', 'head hurts', 'pain in my head', 'cephalalgia',
+                              'cephalgia')),
+    'fever': ('Fever', ('fever', 'feverish', 'febrile', 'pyrexia', 'high temperature', 'running a temperature',
+                        'temperature of')),
+    'chills': ('Chills', ('chills', 'shivering', 'shivers', 'rigors')),
+    'cough': ('Cough', ('cough', 'coughing', 'tussis')),
+    'productive_cough': ('Productive cough', ('productive cough', 'coughing up phlegm', 'coughing up mucus',
+                                              'phlegm', 'sputum')),
+    'sore_throat': ('Sore throat', ('sore throat', 'throat pain', 'painful throat', 'scratchy throat',
+                                    'throat hurts', 'painful swallowing', 'odynophagia')),
+    'runny_nose': ('Runny or blocked nose', ('runny nose', 'rhinorrhea', 'rhinorrhoea', 'nasal discharge',
+                                             'stuffy nose', 'blocked nose', 'nasal congestion', 'congestion')),
+    'sneezing': ('Sneezing', ('sneezing', 'sneeze', 'sneezes')),
+    'loss_of_smell': ('Loss of taste or smell', ('loss of smell', 'loss of taste', 'lost my sense of smell',
+                                                 'lost my sense of taste', 'cant smell', 'cant taste', 'anosmia',
+                                                 'ageusia')),
+    'fatigue': ('Fatigue', ('fatigue', 'fatigued', 'tiredness', 'tired', 'exhaustion', 'exhausted', 'lethargy',
+                            'lethargic', 'low energy', 'no energy')),
+    'body_aches': ('Body aches', ('body aches', 'body ache', 'aching all over', 'muscle aches', 'muscle pain',
+                                  'sore muscles', 'aching muscles', 'myalgia')),
+    'joint_pain': ('Joint pain', ('joint pain', 'painful joints', 'aching joints', 'sore joints', 'arthralgia')),
+    'back_pain': ('Back pain', ('back pain', 'backache', 'back ache', 'lower back pain', 'lumbago')),
+    'nausea': ('Nausea', ('nausea', 'nauseous', 'nauseated', 'queasy', 'feeling sick', 'feel sick')),
+    'vomiting': ('Vomiting', ('vomiting', 'vomit', 'vomited', 'throwing up', 'threw up', 'emesis')),
+    'diarrhea': ('Diarrhea', ('diarrhea', 'diarrhoea', 'loose stools', 'watery stools', 'runny stools')),
+    'constipation': ('Constipation', ('constipation', 'constipated', 'cant poop', 'hard stools')),
+    'abdominal_pain': ('Abdominal pain', ('abdominal pain', 'stomach pain', 'stomach ache', 'stomachache',
+                                          'belly pain', 'tummy ache', 'tummy pain', 'abdominal cramps',
+                                          'stomach cramps', 'stomach hurts', 'belly hurts', 'tummy hurts')),
+    'right_lower_abdominal_pain': ('Right lower abdominal pain', ('right lower abdominal pain',
+                                                                  'lower right abdominal pain',
+                                                                  'pain in my lower right abdomen',
+                                                                  'right lower quadrant pain',
+                                                                  'lower right side pain')),
+    'heartburn': ('Heartburn', ('heartburn', 'heart burn', 'acid reflux', 'reflux', 'indigestion', 'dyspepsia',
+                                'pyrosis')),
+    'chest_pain': ('Chest pain', ('chest pain', 'chest tightness', 'tight chest', 'chest pressure',
+                                  'pain in my chest', 'chest hurts', 'angina')),
+    'shortness_of_breath': ('Shortness of breath', ('shortness of breath', 'short of breath', 'breathlessness',
+                                                    'breathless', 'difficulty breathing', 'trouble breathing',
+                                                    'hard to breathe', 'cant breathe', 'dyspnea', 'dyspnoea')),
+    'wheezing': ('Wheezing', ('wheezing', 'wheeze', 'wheezy')),
+    'palpitations': ('Palpitations', ('palpitations', 'heart palpitations', 'racing heart', 'heart racing',
+                                      'pounding heart', 'heart pounding', 'fluttering heart')),
+    'sweating': ('Sweating', ('sweating', 'sweaty', 'night sweats', 'cold sweat', 'diaphoresis')),
+    'dizziness': ('Dizziness', ('dizziness', 'dizzy', 'lightheaded', 'lightheadedness', 'vertigo', 'giddiness',
+                                'room spinning')),
+    'fainting': ('Fainting', ('fainting', 'fainted', 'passed out', 'blacked out', 'syncope')),
+    'confusion': ('Confusion', ('confusion', 'confused', 'disoriented', 'disorientation')),
+    'stiff_neck': ('Stiff neck', ('stiff neck', 'neck stiffness', 'nuchal rigidity')),
+    'light_sensitivity': ('Sensitivity to light', ('sensitivity to light', 'light sensitivity',
+                                                   'sensitive to light', 'photophobia')),
+    'one_sided_weakness': ('One-sided weakness or numbness', ('one sided weakness', 'weakness on one side',
+                                                              'numbness on one side', 'face drooping',
+                                                              'facial droop', 'drooping face', 'hemiparesis')),
+    'slurred_speech': ('Slurred speech', ('slurred speech', 'slurring my words', 'trouble speaking',
+                                          'difficulty speaking', 'dysarthria')),
+    'rash': ('Rash', ('rash', 'skin rash', 'hives', 'urticaria', 'welts')),
+    'itching': ('Itching', ('itching', 'itchy', 'itch', 'pruritus')),
+    'facial_swelling': ('Face, lip or throat swelling', ('swollen face', 'facial swelling', 'swollen lips',
+                                                         'lip swelling', 'swollen tongue', 'throat swelling',
+                                                         'throat closing', 'angioedema')),
+    'red_eyes': ('Red or itchy eyes', ('red eyes', 'red eye', 'pink eye', 'eye redness', 'itchy eyes',
+                                       'watery eyes', 'bloodshot eyes')),
+    'ear_pain': ('Ear pain', ('ear pain', 'earache', 'ear ache', 'otalgia')),
+    'painful_urination': ('Painful urination', ('painful urination', 'burning urination', 'burning when i pee',
+                                                'burning when urinating', 'pain when peeing', 'dysuria')),
+    'frequent_urination': ('Frequent urination', ('frequent urination', 'urinating often', 'peeing a lot',
+                                                  'peeing often', 'polyuria')),
+    'excessive_thirst': ('Excessive thirst', ('excessive thirst', 'very thirsty', 'always thirsty', 'polydipsia')),
+    'weight_loss': ('Unexplained weight loss', ('weight loss', 'losing weight', 'lost weight')),
+    'leg_swelling': ('Leg swelling or calf pain', ('swollen leg', 'swollen legs', 'leg swelling', 'calf pain',
+                                                   'calf swelling', 'swollen calf')),
+    'anxiety': ('Anxiety', ('anxiety', 'anxious', 'panic', 'panicky', 'nervousness', 'sense of doom')),
+    'insomnia': ('Trouble sleeping', ('insomnia', 'cant sleep', 'trouble sleeping', 'difficulty sleeping',
+                                      'sleeplessness')),
+}
+
+# Symptoms that need prompt in-person care whatever the differential says
+RED_FLAGS = frozenset({
+    'chest_pain', 'shortness_of_breath', 'fainting', 'confusion', 'stiff_neck', 'one_sided_weakness',
+    'slurred_speech', 'facial_swelling',
+})
+
+# condition -> prior, urgent, {symptom code: share of cases presenting with it}
+CONDITIONS: Dict[str, Dict[str, Any]] = {
+    'Common cold': {'prior': 0.20, 'symptoms': {
+        'runny_nose': 0.9, 'sneezing': 0.7, 'sore_throat': 0.6, 'cough': 0.6, 'fatigue': 0.4, 'headache': 0.3,
+        'fever': 0.2, 'productive_cough': 0.2}},
+    'Influenza': {'prior': 0.08, 'symptoms': {
+        'fever': 0.9, 'fatigue': 0.85, 'body_aches': 0.8, 'cough': 0.8, 'chills': 0.7, 'headache': 0.7,
+        'sore_throat': 0.5, 'runny_nose': 0.3, 'nausea': 0.1}},
+    'COVID-19': {'prior': 0.05, 'symptoms': {
+        'fever': 0.7, 'cough': 0.7, 'fatigue': 0.7, 'body_aches': 0.5, 'headache': 0.5, 'loss_of_smell': 0.4,
+        'sore_throat': 0.4, 'shortness_of_breath': 0.3, 'runny_nose': 0.3, 'diarrhea': 0.1}},
+    'Strep throat': {'prior': 0.03, 'symptoms': {
+        'sore_throat': 0.95, 'fever': 0.8, 'headache': 0.4, 'abdominal_pain': 0.15, 'nausea': 0.1}},
+    'Sinusitis': {'prior': 0.05, 'symptoms': {
+        'runny_nose': 0.85, 'headache': 0.6, 'cough': 0.4, 'fever': 0.3, 'fatigue': 0.3, 'ear_pain': 0.1}},
+    'Allergic rhinitis': {'prior': 0.10, 'symptoms': {
+        'runny_nose': 0.9, 'sneezing': 0.85, 'red_eyes': 0.6, 'itching': 0.5, 'cough': 0.2}},
+    'Acute bronchitis': {'prior': 0.04, 'symptoms': {
+        'cough': 0.95, 'productive_cough': 0.7, 'fatigue': 0.4, 'wheezing': 0.3, 'sore_throat': 0.3,
+        'fever': 0.2, 'chest_pain': 0.15}},
+    'Pneumonia': {'prior': 0.01, 'symptoms': {
+        'cough': 0.85, 'fever': 0.8, 'productive_cough': 0.6, 'shortness_of_breath': 0.6, 'chills': 0.5,
+        'fatigue': 0.6, 'chest_pain': 0.4, 'confusion': 0.1}},
+    'Asthma flare': {'prior': 0.03, 'symptoms': {
+        'shortness_of_breath': 0.85, 'wheezing': 0.8, 'cough': 0.7, 'chest_pain': 0.3}},
+    'Tension headache': {'prior': 0.12, 'symptoms': {
+        'headache': 0.95, 'fatigue': 0.3, 'anxiety': 0.2, 'insomnia': 0.2}},
+    'Migraine': {'prior': 0.05, 'symptoms': {
+        'headache': 0.95, 'light_sensitivity': 0.7, 'nausea': 0.6, 'vomiting': 0.3, 'dizziness': 0.3}},
+    'Meningitis': {'prior': 0.001, 'urgent': True, 'symptoms': {
+        'fever': 0.85, 'headache': 0.85, 'stiff_neck': 0.7, 'light_sensitivity': 0.5, 'confusion': 0.5,
+        'vomiting': 0.4, 'rash': 0.2}},
+    'Gastroenteritis': {'prior': 0.06, 'symptoms': {
+        'diarrhea': 0.85, 'nausea': 0.8, 'vomiting': 0.7, 'abdominal_pain': 0.7, 'fever': 0.4, 'fatigue': 0.3,
+        'body_aches': 0.2}},
+    'Appendicitis': {'prior': 0.003, 'urgent': True, 'symptoms': {
+        'right_lower_abdominal_pain': 0.9, 'abdominal_pain': 0.9, 'nausea': 0.6, 'vomiting': 0.5, 'fever': 0.4}},
+    'Gastro-oesophageal reflux': {'prior': 0.06, 'symptoms': {
+        'heartburn': 0.9, 'chest_pain': 0.3, 'cough': 0.2, 'nausea': 0.2, 'sore_throat': 0.15}},
+    'Constipation': {'prior': 0.05, 'symptoms': {
+        'constipation': 0.95, 'abdominal_pain': 0.5, 'nausea': 0.1}},
+    'Urinary tract infection': {'prior': 0.04, 'symptoms': {
+        'painful_urination': 0.9, 'frequent_urination': 0.85, 'abdominal_pain': 0.4, 'back_pain': 0.2,
+        'fever': 0.2}},
+    'Type 2 diabetes': {'prior': 0.02, 'symptoms': {
+        'excessive_thirst': 0.8, 'frequent_urination': 0.8, 'fatigue': 0.6, 'weight_loss': 0.4}},
+    'Heart attack': {'prior': 0.01, 'urgent': True, 'symptoms': {
+        'chest_pain': 0.9, 'shortness_of_breath': 0.5, 'sweating': 0.5, 'nausea': 0.35, 'dizziness': 0.3,
+        'fatigue': 0.3, 'palpitations': 0.2, 'back_pain': 0.1}},
+    'Pulmonary embolism': {'prior': 0.001, 'urgent': True, 'symptoms': {
+        'shortness_of_breath': 0.85, 'chest_pain': 0.6, 'palpitations': 0.4, 'leg_swelling': 0.3, 'cough': 0.2,
+        'fainting': 0.1}},
+    'Stroke': {'prior': 0.001, 'urgent': True, 'symptoms': {
+        'one_sided_weakness': 0.85, 'slurred_speech': 0.75, 'confusion': 0.4, 'dizziness': 0.35,
+        'headache': 0.3}},
+    'Anaphylaxis': {'prior': 0.0005, 'urgent': True, 'symptoms': {
+        'facial_swelling': 0.8, 'rash': 0.8, 'shortness_of_breath': 0.7, 'itching': 0.5, 'wheezing': 0.5,
+        'dizziness': 0.4, 'vomiting': 0.2}},
+    'Panic attack': {'prior': 0.015, 'symptoms': {
+        'anxiety': 0.9, 'palpitations': 0.8, 'shortness_of_breath': 0.6, 'dizziness': 0.5, 'sweating': 0.5,
+        'chest_pain': 0.4, 'nausea': 0.2}},
+    'Vertigo (BPPV)': {'prior': 0.02, 'symptoms': {
+        'dizziness': 0.95, 'nausea': 0.5, 'vomiting': 0.2}},
+    'Ear infection': {'prior': 0.03, 'symptoms': {
+        'ear_pain': 0.9, 'fever': 0.5, 'headache': 0.2}},
+    'Conjunctivitis': {'prior': 0.03, 'symptoms': {
+        'red_eyes': 0.95, 'itching': 0.4}},
+    'Muscle strain': {'prior': 0.08, 'symptoms': {
+        'back_pain': 0.8, 'body_aches': 0.3}},
+    'Osteoarthritis': {'prior': 0.05, 'symptoms': {
+        'joint_pain': 0.95, 'back_pain': 0.2}},
+    'Contact dermatitis': {'prior': 0.04, 'symptoms': {
+        'rash': 0.9, 'itching': 0.85}},
+    'Dehydration': {'prior': 0.02, 'symptoms': {
+        'excessive_thirst': 0.7, 'dizziness': 0.5, 'fatigue': 0.5, 'headache': 0.4, 'confusion': 0.05}},
+}
+
+# Likelihood of a symptom for a condition that isn't listed as presenting with it
+UNLISTED_SYMPTOM = 0.01
+# How much a typical symptom that isn't mentioned counts against a condition
+# (0 ignores it, 1 treats it as known to be absent; people rarely list everything)
+UNMENTIONED_WEIGHT = 0.5
+# An urgent condition at least this likely makes the triage urgent
+URGENT_PROBABILITY = 0.2
+
+# A symptom right after one of these (within NEGATION_WINDOW words, same clause) is negated
+NEGATIONS = frozenset({'no', 'not', 'without', 'denies', 'deny', 'never', 'nor', 'dont', 'doesnt', 'didnt',
+                       'havent', 'hasnt', 'isnt', 'arent', 'wasnt', 'free'})
+NEGATION_WINDOW = 3
+CLAUSE_BREAKS = frozenset({'but', 'although', 'though', 'except', 'however'})
+# Words never tried as typos of a symptom
+STOPWORDS = frozenset({'about', 'after', 'again', 'always', 'being', 'could', 'every', 'feeling', 'having',
+                       'really', 'since', 'should', 'started', 'there', 'these', 'thing', 'think', 'today',
+                       'where', 'which', 'while', 'would', 'yesterday'})
+
+# Words (apostrophes inside them are dropped: "can't" -> "cant") and clause punctuation
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:['’][a-z0-9]+)*|[.,;:!?()\n]")
+_END = ''  # trie key marking the end of a synonym
+
+
+class SymptomMatch(NamedTuple):
+    code: str
+    name: str
+    text: str       # the matched words as written
+    start: int      # character offsets in the message
+    end: int
+    edits: int      # 0 for an exact synonym
+    negated: bool
+
+
+def _normalize(text: str) -> str:
+    """Lowercase, apostrophes dropped ("can't" -> "cant")"""
+    return text.lower().replace("'", '').replace('’', '')
+
+
+def _key(phrase: str) -> str:
+    """Trie key of a synonym: its letters and digits only, so spacing and hyphens don't matter"""
+    return re.sub(r'[^a-z0-9]', '', _normalize(phrase))
+
+
+def _max_edits(length: int) -> int:
+    return 2 if length >= 9 else 1 if length >= 5 else 0
+
+
+class SymptomOntology:
+    """Symptom synonyms in a character trie, plus the condition co-occurrence table"""
+
+    def __init__(self, symptoms: Dict[str, Tuple[str, Iterable[str]]] = None,
+                 conditions: Dict[str, Dict[str, Any]] = None):
+        self.symptoms = dict(SYMPTOMS if symptoms is None else symptoms)
+        self.conditions = dict(CONDITIONS if conditions is None else conditions)
+        self.trie: Dict[str, Any] = {}
+        for code, (name, synonyms) in self.symptoms.items():
+            for phrase in (name, *synonyms):
+                self._insert(_key(phrase), code)
+        self._build_table()
+
+    def _insert(self, key: str, code: str):
+        if not key:
+            return
+        node = self.trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault(_END, code)
+
+    def _build_table(self):
+        """Log-likelihood matrix (conditions x symptoms) and log priors"""
+        self.codes = list(self.symptoms)
+        self.code_index = {code: i for i, code in enumerate(self.codes)}
+        self.condition_names = list(self.conditions)
+        table = np.full((len(self.condition_names), len(self.codes)), UNLISTED_SYMPTOM, dtype=np.float64)
+        for row, name in enumerate(self.condition_names):
+            for code, share in self.conditions[name]['symptoms'].items():
+                if code in self.code_index:
+                    table[row, self.code_index[code]] = share
+        # score = log prior + sum of log(share) over mentioned symptoms + sum of
+        # log(1 - weight * share) over the others, i.e. a per-condition base
+        # (every symptom unmentioned) plus a gain per mentioned symptom
+        unmentioned = np.log1p(-UNMENTIONED_WEIGHT * np.where(table > UNLISTED_SYMPTOM, table, 0.0))
+        self.log_gain = np.log(table) - unmentioned
+        self.log_base = np.log([self.conditions[name]['prior'] for name in self.condition_names]) \
+            + unmentioned.sum(axis=1)
+        self.urgent = np.array([bool(self.conditions[name].get('urgent')) for name in self.condition_names])
+        # Conditions listing each symptom, for reporting which symptoms support a condition
+        self.listed = table > UNLISTED_SYMPTOM
+
+    # Matching
+
+    def match(self, text: str) -> List[SymptomMatch]:
+        """Symptoms mentioned in text, in order (negated ones included, flagged)"""
+        text = text or ''
+        tokens = [(_normalize(found.group(0)), found.start(), found.end())
+                  for found in TOKEN_PATTERN.finditer(text.lower())]
+        matches = []
+        i = 0
+        while i < len(tokens):
+            word = tokens[i][0]
+            if not word[0].isalnum():
+                i += 1
+                continue
+            found = self._exact(tokens, i) or self._fuzzy(tokens, i)
+            if found is None:
+                i += 1
+                continue
+            code, last, edits = found
+            start, end = tokens[i][1], tokens[last][2]
+            matches.append(SymptomMatch(code, self.symptoms[code][0], text[start:end], start, end, edits,
+                                        self._negated(tokens, i)))
+            i = last + 1
+        metrics.increment('symptom_ontology.matches', len(matches))
+        return matches
+
+    def _exact(self, tokens: List[tuple], first: int) -> Optional[Tuple[str, int, int]]:
+        """Longest synonym spelled by the words from `first` on, ending at a word end"""
+        node = self.trie
+        best = None
+        for i in range(first, len(tokens)):
+            word = tokens[i][0]
+            if not word[0].isalnum():
+                break
+            for char in word:
+                node = node.get(char)
+                if node is None:
+                    return best
+            if _END in node:
+                best = (node[_END], i, 0)
+        return best
+
+    def _fuzzy(self, tokens: List[tuple], first: int) -> Optional[Tuple[str, int, int]]:
+        """Closest synonym within a few edits of one word, or of two words run together"""
+        word = tokens[first][0]
+        if len(word) < 5 or word in STOPWORDS or word in NEGATIONS:
+            return None
+        candidates = [(word, first)]
+        if first + 1 < len(tokens) and tokens[first + 1][0][0].isalnum():
+            candidates.append((word + tokens[first + 1][0], first + 1))
+        best = None
+        for key, last in candidates:
+            found = self._nearest(key, _max_edits(len(key)))
+            if found is not None and (best is None or found[1] < best[2]):
+                best = (found[0], last, found[1])
+        return best
+
+    def _nearest(self, key: str, max_edits: int) -> Optional[Tuple[str, int]]:
+        """(code, distance) of the trie entry closest to key, by Levenshtein distance
+
+        Walks the trie with one row of the edit-distance table per node,
+        pruning branches already over max_edits; the first letter must match.
+        """
+        node = self.trie.get(key[0])
+        if node is None or max_edits == 0:
+            return None
+        best: List[Any] = [None, max_edits + 1]
+        # Distances from key's prefixes to the one-letter path key[0]
+        first_row = [1] + [i - 1 for i in range(1, len(key) + 1)]
+
+        def visit(node: Dict[str, Any], previous: List[int]):
+            if _END in node and previous[-1] < best[1]:
+                best[0], best[1] = node[_END], previous[-1]
+            if min(previous) > max_edits:
+                return
+            for char, child in node.items():
+                if char == _END:
+                    continue
+                row = [previous[0] + 1]
+                for i in range(1, len(key) + 1):
+                    row.append(min(row[i - 1] + 1, previous[i] + 1,
+                                   previous[i - 1] + (key[i - 1] != char)))
+                visit(child, row)
+
+        visit(node, first_row)
+        return (best[0], best[1]) if best[0] is not None else None
+
+    @staticmethod
+    def _negated(tokens: List[tuple], first: int) -> bool:
+        for word, _, _ in reversed(tokens[max(0, first - NEGATION_WINDOW):first]):
+            if not word[0].isalnum() or word in CLAUSE_BREAKS:
+                return False
+            if word in NEGATIONS:
+                return True
+        return False
+
+    def codes_for(self, text: str) -> List[str]:
+        """Canonical codes of the symptoms text mentions (not negated), first mention order"""
+        return list(dict.fromkeys(match.code for match in self.match(text) if not match.negated))
+
+    def lookup(self, phrase: str) -> Optional[str]:
+        """Code of a phrase that is exactly one synonym (case, spaces and hyphens aside), or None"""
+        node = self.trie
+        for char in _key(phrase):
+            node = node.get(char)
+            if node is None:
+                return None
+        return node.get(_END)
+
+    def canonicalize(self, symptoms: Iterable[str]) -> List[str]:
+        """Free-text symptoms, normalised, in order, without duplicates
+
+        A symptom that is exactly a synonym ("Head ache", "pyrexia") becomes
+        its code; any other is kept as its lowercased text, so severity,
+        duration and negation ("sudden worst headache of my life", "no
+        fever") are never folded into a bare code.
+        """
+        canonical = []
+        for symptom in symptoms:
+            text = ' '.join(_normalize(symptom).split())
+            if text:
+                canonical.append(self.lookup(text) or text)
+        return list(dict.fromkeys(canonical))
+
+    def name(self, code: str) -> str:
+        """Display name of a code (unrecognised symptoms are shown as given)"""
+        entry = self.symptoms.get(code)
+        return entry[0] if entry else code
+
+    # Preliminary triage
+
+    def differential(self, codes: Iterable[str], limit: int = None) -> List[Dict[str, Any]]:
+        """Conditions ranked by posterior over the known codes, most likely first
+
+        Each entry has the condition, its probability (0-1, over the listed
+        conditions only), whether it is urgent and the supporting codes.
+        """
+        limit = limit or Config.SYMPTOM_TRIAGE_MAX_CONDITIONS
+        columns = [self.code_index[code] for code in dict.fromkeys(codes) if code in self.code_index]
+        if not columns:
+            return []
+        scores = self.log_base + self.log_gain[:, columns].sum(axis=1)
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        # Only conditions presenting with at least one of the symptoms
+        supported = self.listed[:, columns].any(axis=1)
+        ranked = [row for row in np.argsort(-probabilities) if supported[row]]
+        return [{
+            'condition': self.condition_names[row],
+            'probability': round(float(probabilities[row]), 3),
+            'urgent': bool(self.urgent[row]),
+            'supporting': [self.codes[column] for column in columns if self.listed[row, column]],
+        } for row in ranked[:limit] if probabilities[row] >= Config.SYMPTOM_TRIAGE_MIN_PROBABILITY]
+
+    def triage(self, text: str) -> Optional[Dict[str, Any]]:
+        """Symptoms, red flags and preliminary differential for a message (None without symptoms)"""
+        matches = self.match(text)
+        codes = list(dict.fromkeys(match.code for match in matches if not match.negated))
+        if not codes:
+            return None
+        absent = [match.code for match in matches if match.negated and match.code not in codes]
+        red_flags = [code for code in codes if code in RED_FLAGS]
+        differential = self.differential(codes)
+        metrics.increment('symptom_ontology.triages')
+        return {
+            'symptoms': [{'code': code, 'name': self.name(code)} for code in codes],
+            'absent': list(dict.fromkeys(absent)),
+            'red_flags': red_flags,
+            # A likely urgent condition counts even without a red-flag symptom
+            'urgent': bool(red_flags) or any(entry['urgent'] and entry['probability'] >= URGENT_PROBABILITY
+                                             for entry in differential),
+            'differential': differential,
+        }
+
+
+def format_triage(triage: Dict[str, Any]) -> str:
+    """Markdown for a preliminary triage, shown above the streaming answer"""
+    names = ', '.join(symptom['name'] for symptom in triage['symptoms'])
+    paragraphs = [f"**Preliminary triage** (local symptom index, not a diagnosis): {names}"]
+    if triage['urgent']:
+        paragraphs.append("⚠️ These symptoms can be serious: seek urgent medical care, or call emergency services "
+                          "if they are severe or sudden.")
+    paragraphs.append('\n'.join(f"- {entry['condition']}{' ⚠️' if entry['urgent'] else ''}: "
+                                f"{entry['probability']:.0%}" for entry in triage['differential']))
+    return '\n\n'.join(paragraph for paragraph in paragraphs if paragraph)
+
+
+def load_ontology(path: str = None) -> SymptomOntology:
+    """Built-in ontology, extended by the JSON file at path (SYMPTOM_ONTOLOGY_PATH by default)"""
+    path = Config.SYMPTOM_ONTOLOGY_PATH if path is None else path
+    symptoms, conditions = dict(SYMPTOMS), dict(CONDITIONS)
+    if path:
+        try:
+            with open(path) as f:
+                extra = json.load(f)
+            symptoms.update({code: (entry[0], tuple(entry[1])) for code, entry in extra.get('symptoms', {}).items()})
+            conditions.update(extra.get('conditions', {}))
+        except Exception as e:
+            print(f"Error loading symptom ontology {path}, using the built-in one: {e}")
+    return SymptomOntology(symptoms, conditions)
+
+
+_ontology: Optional[SymptomOntology] = None
+_ontology_lock = threading.Lock()
+
+
+def get_symptom_ontology() -> SymptomOntology:
+    """Process-wide ontology, built on first use"""
+    global _ontology
+    with _ontology_lock:
+        if _ontology is None:
+            _ontology = load_ontology()
+        return _ontology
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Match symptoms in text and show the preliminary differential")
+    parser.add_argument('text', help='Free-text symptoms')
+    args = parser.parse_args()
+    ontology = get_symptom_ontology()
+    print(json.dumps({
+        'matches': [match._asdict() for match in ontology.match(args.text)],
+        'triage': ontology.triage(args.text),
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
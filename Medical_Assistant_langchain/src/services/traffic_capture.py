@@ -0,0 +1,260 @@
+"""
+Opt-in capture of production traffic for offline replay.
+
+With TRAFFIC_CAPTURE_DIR set, each process appends to its own
+gzip-compressed JSONL log in that directory:
+
+- one `req` event per service call (chat, stream_chat and the
+  MedicalAssistantService methods): operation, arguments, start offset
+  and latency
+- one `llm` event per upstream LLM call: its cassette key, output chunks
+  and when each chunk arrived
+- one `db` event per store call: method, key argument, result and latency
+
+benchmarks/replay_traffic.py re-drives the services from these logs
+against cassette-backed fakes, so real traffic shapes can be replayed
+offline. Logs contain user messages and health profiles: only enable
+capture where that data may be stored, and delete logs when done.
+"""
+import atexit
+import functools
+import gzip
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import sys
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from utils.metrics import metrics
+
+# Bump when the event layout below changes
+LOG_VERSION = 1
+
+
+def llm_key(messages: List[Any]) -> str:
+    """Cassette key of an LLM call: a hash of its last message
+
+    For chat that is the user's message, so a replay still finds the
+    recording when prompt templates or history selection change.
+    """
+    last = messages[-1] if messages else ''
+    text = str(getattr(last, 'content', last))
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def store_key(args: tuple, kwargs: Dict[str, Any]) -> str:
+    """Cassette key of a store call: its first string argument (session, user or memo key)"""
+    for value in list(args) + list(kwargs.values()):
+        if isinstance(value, str):
+            return value
+    return ''
+
+
+def _text(value: Any) -> str:
+    # LangChain messages and chunks have text(), Gemini responses .text
+    text = getattr(value, 'text', value)
+    return str(text() if callable(text) else text)
+
+
+def _plain(value: Any) -> bool:
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(_plain(item) for item in value)
+    if isinstance(value, dict):
+        return all(isinstance(key, str) and _plain(item) for key, item in value.items())
+    return False
+
+
+class TrafficRecorder:
+    """Appends capture events to a gzip JSONL log; safe to share between threads"""
+
+    def __init__(self, path: str, max_seconds: float = None, flush_events: int = None):
+        self.path = path
+        self.max_seconds = Config.TRAFFIC_CAPTURE_SECONDS if max_seconds is None else max_seconds
+        self.flush_events = flush_events or Config.TRAFFIC_CAPTURE_FLUSH_EVENTS
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._unflushed = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = gzip.open(path, 'at', encoding='utf-8')
+        self._write({'e': 'meta', 'v': LOG_VERSION, 'started': datetime.now().isoformat(), 'pid': os.getpid()})
+
+    @property
+    def active(self) -> bool:
+        if self._file is None:
+            return False
+        if self.max_seconds and self.offset() > self.max_seconds:
+            self.close()
+            return False
+        return True
+
+    def offset(self) -> float:
+        """Seconds since recording started"""
+        return time.perf_counter() - self.started
+
+    def request(self, operation: str, arguments: Dict[str, Any], started: float, seconds: float):
+        """Record a service call (arguments that aren't plain JSON, e.g. deadlines, are left out)"""
+        self._write({'e': 'req', 'op': operation, 't': round(started, 4), 'd': round(seconds, 4),
+                     'args': {name: value for name, value in arguments.items() if _plain(value)}})
+
+    def llm_stream(self, key: str, chunks: Iterator[Any]) -> Iterator[Any]:
+        """Pass an upstream chunk stream through, recording each chunk's text and arrival time"""
+        started = self.offset()
+        texts, times = [], []
+        try:
+            for chunk in chunks:
+                texts.append(_text(chunk))
+                times.append(round(self.offset() - started, 4))
+                yield chunk
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+            self._write({'e': 'llm', 'k': key, 't': round(started, 4), 'chunks': texts, 'at': times})
+
+    def llm_call(self, key: str, call: Callable[[], Any]) -> Any:
+        """Run a blocking LLM call, recording its text and duration"""
+        started = self.offset()
+        result = call()
+        duration = round(self.offset() - started, 4)
+        self._write({'e': 'llm', 'k': key, 't': round(started, 4), 'chunks': [_text(result)], 'at': [duration]})
+        return result
+
+    def store_call(self, method: str, key: str, result: Any, started: float, seconds: float):
+        self._write({'e': 'db', 'm': method, 'k': key, 't': round(started, 4), 'd': round(seconds, 4),
+                     'r': result})
+
+    def _write(self, event: Dict[str, Any]):
+        line = json.dumps(event, separators=(',', ':'), ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is None:
+                return
+            try:
+                self._file.write(line + '\n')
+                self._unflushed += 1
+                if self._unflushed >= self.flush_events:
+                    # A sync flush keeps everything so far readable if the process dies
+                    self._file.flush()
+                    self._unflushed = 0
+            except Exception as e:
+                print(f"Error writing traffic capture: {e}")
+                return
+        metrics.increment('traffic_capture.events')
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class RecordingStore:
+    """Store wrapper recording every public method call's result and latency"""
+
+    def __init__(self, store, recorder: TrafficRecorder):
+        self.store = store
+        self.recorder = recorder
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.store, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            if not self.recorder.active:
+                return attribute(*args, **kwargs)
+            started = self.recorder.offset()
+            result = attribute(*args, **kwargs)
+            self.recorder.store_call(name, store_key(args, kwargs), result, started,
+                                     self.recorder.offset() - started)
+            return result
+
+        return call
+
+
+def captured(operation: str):
+    """Decorator recording a service method's calls while capture is on
+
+    The instance's `recorder` attribute (None when capture is off) decides;
+    generator methods are timed until the caller stops iterating.
+    """
+    def decorate(method):
+        signature = inspect.signature(method)
+
+        def arguments(self, args, kwargs) -> Dict[str, Any]:
+            bound = signature.bind(self, *args, **kwargs).arguments
+            bound.pop('self', None)
+            return dict(bound)
+
+        if inspect.isgeneratorfunction(method):
+            @functools.wraps(method)
+            def stream(self, *args, **kwargs):
+                recorder = getattr(self, 'recorder', None)
+                if recorder is None or not recorder.active:
+                    yield from method(self, *args, **kwargs)
+                    return
+                started = recorder.offset()
+                try:
+                    yield from method(self, *args, **kwargs)
+                finally:
+                    recorder.request(operation, arguments(self, args, kwargs), started,
+                                     recorder.offset() - started)
+            return stream
+
+        @functools.wraps(method)
+        def call(self, *args, **kwargs):
+            recorder = getattr(self, 'recorder', None)
+            if recorder is None or not recorder.active:
+                return method(self, *args, **kwargs)
+            started = recorder.offset()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                recorder.request(operation, arguments(self, args, kwargs), started, recorder.offset() - started)
+        return call
+    return decorate
+
+
+def read_traffic_log(path: str) -> Iterator[Dict[str, Any]]:
+    """Events of a capture log; a log cut short by a crash yields what was flushed"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile, ValueError) as e:
+            print(f"Traffic log {path} ends early: {e}")
+
+
+_recorder: Optional[TrafficRecorder] = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder() -> Optional[TrafficRecorder]:
+    """This process's recorder (None unless TRAFFIC_CAPTURE_DIR is set)"""
+    global _recorder
+    if not Config.TRAFFIC_CAPTURE_DIR:
+        return None
+    with _recorder_lock:
+        if _recorder is None:
+            name = f"traffic-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.jsonl.gz"
+            try:
+                _recorder = TrafficRecorder(os.path.join(Config.TRAFFIC_CAPTURE_DIR, name))
+            except Exception as e:
+                print(f"Traffic capture disabled: {e}")
+                return None
+            atexit.register(_recorder.close)
+        return _recorder
@@ -0,0 +1,107 @@
+"""
+Compact in-memory chat turns.
+
+A stored exchange is kept as one __slots__ Turn (no per-instance dict, an
+interned message_type) instead of a row dict plus a HumanMessage/AIMessage
+pair, and the LangChain messages are only built when a prompt is rendered.
+TurnStore keeps the recent turns of the most recently used sessions.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+import sys
+import threading
+
+from langchain.schema import AIMessage, HumanMessage
+
+
+class Turn:
+    """One user message and the assistant's response"""
+
+    __slots__ = ('message', 'response', 'message_type', 'timestamp', 'pending', 'sections')
+
+    def __init__(self, message: str, response: str, message_type: str = None, timestamp: str = None,
+                 pending: bool = False, sections: Dict[str, str] = None):
+        self.message = message
+        self.response = response
+        # A handful of distinct values shared by every turn
+        self.message_type = sys.intern(message_type) if message_type else message_type
+        self.timestamp = timestamp
+        self.pending = pending  # journaled, not yet in the store
+        self.sections = sections  # parsed response sections, if the message type has them
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> 'Turn':
+        return cls(row['message'], row['response'], row.get('message_type'), row.get('timestamp'),
+                   sections=row.get('sections'))
+
+    def to_row(self) -> Dict[str, Any]:
+        """The turn as a chat store history row"""
+        return {
+            'message': self.message,
+            'response': self.response,
+            'message_type': self.message_type,
+            'timestamp': self.timestamp,
+            'sections': self.sections,
+        }
+
+    def __iter__(self) -> Iterator[str]:
+        # Unpacks like the old (message, response) tuples
+        yield self.message
+        yield self.response
+
+    def __repr__(self) -> str:
+        return f"Turn(message={self.message[:30]!r}, message_type={self.message_type!r}, timestamp={self.timestamp!r})"
+
+
+def to_messages(turns: Iterable[Turn]) -> List[Any]:
+    """LangChain messages for turns, in order (only needed at prompt-render time)"""
+    messages = []
+    for turn in turns:
+        messages.append(HumanMessage(content=turn.message))
+        messages.append(AIMessage(content=turn.response))
+    return messages
+
+
+class TurnStore:
+    """Recent turns per session for the `max_sessions` most recently used sessions"""
+
+    def __init__(self, max_sessions: int, history_size: int):
+        self.max_sessions = max_sessions
+        self.history_size = history_size
+        self._sessions: 'OrderedDict[str, List[Turn]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str, limit: Optional[int] = None) -> List[Turn]:
+        """The session's turns, oldest first (the last `limit` if given)"""
+        with self._lock:
+            turns = self._sessions.get(session_id)
+            if turns is None:
+                return []
+            self._sessions.move_to_end(session_id)
+            return turns[-limit:] if limit else list(turns)
+
+    def extend(self, session_id: str, turns: List[Turn], replace: bool = False):
+        """Append turns to a session (or replace its turns), keeping the last history_size"""
+        with self._lock:
+            history = self._sessions.pop(session_id, [])
+            if replace:
+                history = []
+            history.extend(turns)
+            if len(history) > self.history_size:
+                del history[:-self.history_size]
+            # Session IDs repeat on every call; store one copy of each
+            self._sessions[sys.intern(session_id)] = history
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def pop(self, session_id: str) -> List[Turn]:
+        with self._lock:
+            return self._sessions.pop(session_id, [])
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
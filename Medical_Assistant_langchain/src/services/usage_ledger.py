@@ -0,0 +1,73 @@
+"""
+Per-turn token and latency usage ledger.
+
+Each chat turn records its prompt/output/cached token counts, model,
+time to first token, total latency and cache status. Records are queued
+and written in batches by a background BatchWriter, so the chat path never
+waits on them, and can be rolled up per session, message_type, model or
+day for capacity planning.
+"""
+from datetime import datetime
+from typing import Any, Dict, List
+import sys
+import os
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.dirname(current_dir)
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from utils.batch_writer import BatchWriter
+
+USAGE_GROUPS = ('session', 'message_type', 'model', 'day')
+
+# cache_status values
+CACHE_MISS = 'miss'                  # made its own LLM call
+CACHE_COALESCED = 'coalesced'        # shared another request's in-flight call
+CACHE_QUICK_ANSWER = 'quick_answer'  # served a precomputed answer
+
+
+class UsageLedger:
+    """Queue usage records and write them to the store in batches"""
+
+    def __init__(self, store, writer: BatchWriter = None):
+        self.store = store
+        self.writer = writer if writer is not None else BatchWriter(
+            self.store.save_usage_records, name='usage',
+            batch_size=Config.USAGE_BATCH_SIZE, interval=Config.USAGE_FLUSH_INTERVAL,
+            max_pending=Config.USAGE_MAX_PENDING
+        )
+
+    def record(self, session_id: str, message_type: str, usage: Dict[str, Any], latency: float):
+        """Queue one turn; usage holds what generation reported (see MedicalChatService.generate)"""
+        ttft = usage.get('ttft')
+        self.writer.add({
+            'session_id': session_id,
+            'message_type': message_type,
+            'model': usage.get('model'),
+            'prompt_tokens': usage.get('prompt_tokens', 0),
+            'output_tokens': usage.get('output_tokens', 0),
+            'cached_tokens': usage.get('cached_tokens', 0),
+            'ttft_ms': round(ttft * 1000) if ttft is not None else None,
+            'latency_ms': round(latency * 1000),
+            'cache_status': usage.get('cache_status', CACHE_MISS),
+            'timestamp': datetime.now().isoformat(),
+        })
+
+    def rollup(self, group_by: str = 'session', since: datetime = None, until: datetime = None,
+               limit: int = 100) -> List[Dict[str, Any]]:
+        """Totals per group, costliest first (queued records are written first)"""
+        if group_by not in USAGE_GROUPS:
+            raise ValueError(f"group_by must be one of {', '.join(USAGE_GROUPS)}")
+        self.flush()
+        return self.store.get_usage_rollup(group_by, since, until, limit)
+
+    def flush(self) -> int:
+        return self.writer.run_once()
+
+    def close(self):
+        """Stop the writer and flush what is still queued"""
+        self.writer.stop()
+        self.flush()
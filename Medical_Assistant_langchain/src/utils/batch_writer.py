@@ -0,0 +1,97 @@
+import threading
+from typing import Any, Callable, List
+
+from utils.metrics import metrics
+from utils.periodic import PeriodicJob
+
+
+class BatchWriter(PeriodicJob):
+    """Buffer rows in memory and write them in batches from a background thread.
+
+    `flush(rows)` is called with up to `batch_size` rows every `interval`
+    seconds, or as soon as a full batch is waiting. It returns False (or
+    raises) when the write failed; the rows are then kept and retried on
+    the next pass, up to `max_pending` rows, after which the oldest are
+    dropped. Pending rows are flushed on stop().
+    """
+
+    name = 'batch-writer'
+
+    def __init__(self, flush: Callable[[List[Any]], bool], name: str = None, batch_size: int = 200,
+                 interval: float = 5.0, max_pending: int = 10000):
+        super().__init__(interval)
+        self.flush = flush
+        if name:
+            self.name = name
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._rows: List[Any] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._started = False
+
+    def add(self, row: Any):
+        """Queue a row; the writer thread is started on first use"""
+        with self._lock:
+            self._rows.append(row)
+            dropped = len(self._rows) - self.max_pending
+            if dropped > 0:
+                del self._rows[:dropped]
+            full = len(self._rows) >= self.batch_size
+            start, self._started = not self._started, True
+        if dropped > 0:
+            metrics.increment(f'batch.{self.name}.dropped', dropped)
+        if start:
+            self.start()
+        if full:
+            self._wake.set()
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+    def run_once(self) -> int:
+        """Write pending rows batch by batch, returning how many were written"""
+        written = 0
+        while True:
+            with self._lock:
+                batch = self._rows[:self.batch_size]
+                del self._rows[:len(batch)]
+            if not batch:
+                break
+            try:
+                ok = self.flush(batch) is not False
+            except Exception as e:
+                print(f"Error writing {self.name} batch: {e}")
+                ok = False
+            if not ok:
+                # Put the batch back in front of anything queued meanwhile
+                with self._lock:
+                    self._rows[:0] = batch
+                    overflow = len(self._rows) - self.max_pending
+                    if overflow > 0:
+                        del self._rows[:overflow]
+                if overflow > 0:
+                    metrics.increment(f'batch.{self.name}.dropped', overflow)
+                metrics.increment(f'batch.{self.name}.errors')
+                break
+            written += len(batch)
+            metrics.increment(f'batch.{self.name}.rows', len(batch))
+        metrics.set_gauge(f'batch.{self.name}.pending', self.pending)
+        return written
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.run_once()
+        # Final flush on stop
+        self.run_once()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        super().stop(timeout)
+        with self._lock:
+            self._started = False
@@ -0,0 +1,138 @@
+import threading
+import time
+from typing import Any, Callable, List
+
+from utils.metrics import metrics
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+
+# Exported as the `breaker.<name>.state` gauge
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency while its breaker is open"""
+
+
+class CircuitBreaker:
+    """Stop calling a dependency that keeps failing or timing out.
+
+    After `failure_threshold` consecutive failures (calls raising, or taking
+    longer than `slow_call_seconds`) the breaker opens and calls are
+    rejected immediately with CircuitOpenError. After `reset_timeout`
+    seconds a single trial call is let through (half-open): success closes
+    the breaker, failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0,
+                 slow_call_seconds: float = None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_seconds = slow_call_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[str], None]] = []
+        metrics.set_gauge(f'breaker.{name}.state', STATE_VALUES[CLOSED])
+
+    def on_state_change(self, listener: Callable[[str], None]):
+        """Call listener(new_state) after every transition"""
+        self._listeners.append(listener)
+
+    def _transition(self, state: str):
+        # Caller holds the lock; listeners run after it is released
+        self.state = state
+        metrics.set_gauge(f'breaker.{self.name}.state', STATE_VALUES[state])
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+            metrics.increment(f'breaker.{self.name}.opened')
+
+    def _notify(self, state: str):
+        for listener in self._listeners:
+            try:
+                listener(state)
+            except Exception as e:
+                print(f"Error in {self.name} breaker listener: {e}")
+
+    def allow(self) -> bool:
+        """Whether a call may go through now (claims the half-open trial slot)"""
+        changed = None
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._transition(HALF_OPEN)
+                changed = HALF_OPEN
+            if self.state == CLOSED:
+                allowed = True
+            elif self.state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                allowed = True
+            else:
+                allowed = False
+        if changed:
+            self._notify(changed)
+        if not allowed:
+            metrics.increment(f'breaker.{self.name}.rejected')
+        return allowed
+
+    def record_success(self):
+        changed = None
+        with self._lock:
+            self.failures = 0
+            self._trial_in_flight = False
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+                changed = CLOSED
+        if changed:
+            self._notify(changed)
+
+    def record_failure(self):
+        changed = None
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self._transition(OPEN)
+                changed = OPEN
+        metrics.increment(f'breaker.{self.name}.failures')
+        if changed:
+            self._notify(changed)
+
+    def trip(self):
+        """Open now, whatever the failure count (e.g. the dependency can't even be built)"""
+        changed = None
+        with self._lock:
+            self.failures = max(self.failures, self.failure_threshold)
+            self._trial_in_flight = False
+            if self.state != OPEN:
+                self._transition(OPEN)
+                changed = OPEN
+            else:
+                self.opened_at = time.monotonic()
+        if changed:
+            self._notify(changed)
+
+    @property
+    def is_open(self) -> bool:
+        return self.state != CLOSED
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run func through the breaker; raises CircuitOpenError when open"""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        if self.slow_call_seconds and time.perf_counter() - started > self.slow_call_seconds:
+            # It worked, but a dependency this slow is as bad as a down one
+            self.record_failure()
+        else:
+            self.record_success()
+        return result
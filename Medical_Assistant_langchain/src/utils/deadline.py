@@ -0,0 +1,174 @@
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+from utils.profiling import active_profiler
+
+# Blocking calls run under a time limit here (history loads, persistence);
+# a call that overruns keeps running on its thread, the caller moves on
+_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix='deadline')
+
+
+class Cancelled(Exception):
+    """The request was superseded or abandoned"""
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time"""
+
+
+class CancellationToken:
+    """Set once when the work it guards is no longer wanted"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str = 'cancelled'):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+class Deadline:
+    """Time budget for one request plus its cancellation token.
+
+    Stages take a share of the whole budget with budget(), and reserve()
+    gives a stage a deadline that ends early enough to leave time for the
+    stages after it.
+    """
+
+    def __init__(self, timeout: float, token: CancellationToken = None, expires_at: float = None):
+        self.timeout = timeout
+        self.expires_at = expires_at if expires_at is not None else time.monotonic() + timeout
+        self.token = token if token is not None else CancellationToken()
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self):
+        """Raise Cancelled or DeadlineExceeded if the request should stop"""
+        if self.token.cancelled:
+            raise Cancelled(self.token.reason)
+        if self.expired:
+            raise DeadlineExceeded(f"deadline of {self.timeout:.1f}s exceeded")
+
+    def budget(self, share: float) -> float:
+        """Seconds for a stage: `share` of the whole budget, capped by what is left"""
+        return min(self.timeout * share, self.remaining())
+
+    def reserve(self, seconds: float) -> 'Deadline':
+        """Deadline for a stage that must finish `seconds` before this one"""
+        return Deadline(self.timeout, self.token, self.expires_at - seconds)
+
+
+def run_with_timeout(fn: Callable[..., Any], timeout: float, *args, **kwargs) -> Any:
+    """Call fn, raising DeadlineExceeded if it takes longer than timeout"""
+    profiler = active_profiler()
+    if profiler is not None:
+        fn = profiler.wrap(fn)
+    future = _pool.submit(fn, *args, **kwargs)
+    try:
+        return future.result(timeout=max(timeout, 0.0))
+    except FutureTimeout:
+        raise DeadlineExceeded(f"{getattr(fn, '__name__', 'call')} took longer than {timeout:.1f}s")
+
+
+def iterate_until(iterable: Iterable[Any], deadline: Deadline, poll: float = 0.1) -> Iterator[Any]:
+    """Yield from iterable, stopping (and closing it) once the deadline passes or is cancelled.
+
+    Chunks are pulled one at a time on a separate thread while the caller
+    waits in steps of at most `poll` seconds, so a stream that stalls (or
+    never sends its first chunk) still ends at the deadline or on
+    cancellation. The upstream is closed as soon as it is idle: at once if
+    the caller stops between chunks, else when the pending chunk arrives.
+    """
+    iterator = iter(iterable)
+    requests: queue.Queue = queue.Queue()
+    results: queue.Queue = queue.Queue()
+
+    def pump():
+        try:
+            while requests.get():
+                try:
+                    results.put((True, next(iterator)))
+                except StopIteration:
+                    results.put((False, None))
+                    return
+                except BaseException as e:
+                    results.put((False, e))
+                    return
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+
+    profiler = active_profiler()
+    if profiler is not None:
+        pump = profiler.wrap(pump)
+    context = contextvars.copy_context()
+    thread = threading.Thread(target=context.run, args=(pump,), name='deadline-stream', daemon=True)
+    thread.start()
+    pulling = False
+    try:
+        while True:
+            deadline.check()
+            requests.put(True)
+            pulling = True
+            while True:
+                try:
+                    more, value = results.get(timeout=max(min(poll, deadline.remaining()), 0.001))
+                    break
+                except queue.Empty:
+                    deadline.check()
+            pulling = False
+            if not more:
+                if value is not None:
+                    raise value
+                return
+            yield value
+    finally:
+        requests.put(False)
+        if not pulling:
+            thread.join()
+
+
+class RequestRegistry:
+    """The in-flight request of each session, so a newer one can supersede it"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active: Dict[str, CancellationToken] = {}
+
+    def begin(self, key: str, token: CancellationToken):
+        """Register token for key, cancelling the request it replaces"""
+        with self._lock:
+            previous = self._active.get(key)
+            self._active[key] = token
+        if previous is not None and previous is not token:
+            previous.cancel('superseded')
+
+    def finish(self, key: str, token: CancellationToken):
+        with self._lock:
+            if self._active.get(key) is token:
+                del self._active[key]
+
+    def cancel(self, key: str, reason: str = 'cancelled') -> bool:
+        """Cancel the in-flight request for key, returning whether there was one"""
+        with self._lock:
+            token = self._active.pop(key, None)
+        if token is None:
+            return False
+        token.cancel(reason)
+        return True
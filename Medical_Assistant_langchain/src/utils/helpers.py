@@ -60,8 +60,13 @@ def create_session_id() -> str:
     import uuid
     return str(uuid.uuid4())
 
-def parse_symptoms(symptoms_text: str) -> List[str]:
-    """Parse symptoms from text input"""
+def parse_symptoms(symptoms_text: str, canonical: bool = False) -> List[str]:
+    """Parse symptoms from text input
+
+    With canonical=True each symptom that is exactly a synonym is mapped
+    to its symptom ontology code ("head ache", "cephalalgia" -> "headache");
+    the others are kept as lowercased text.
+    """
     # Split by common delimiters
     symptoms = re.split(r'[,;\n]+', symptoms_text)
     
@@ -72,6 +77,9 @@ def parse_symptoms(symptoms_text: str) -> List[str]:
         if clean_symptom and len(clean_symptom) > 2:
             parsed_symptoms.append(clean_symptom)
     
+    if canonical:
+        from services.symptom_ontology import get_symptom_ontology
+        return get_symptom_ontology().canonicalize(parsed_symptoms)
     return parsed_symptoms
 
 def is_emergency_keywords(message: str) -> bool:
@@ -0,0 +1,164 @@
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Return the pct-th percentile (0-100) of values using linear interpolation"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (pct / 100.0) * (len(ordered) - 1)
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    fraction = rank - lower
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * fraction
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Summarize a list of durations (seconds) into count/mean/p50/p95/p99/max"""
+    if not values:
+        return {'count': 0, 'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': max(values),
+    }
+
+
+class RequestTrace:
+    """Stage timings collected for a single request"""
+
+    def __init__(self, request_id: Optional[str] = None):
+        self.request_id = request_id or str(uuid.uuid4())
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def record(self, stage: str, seconds: float):
+        """Add elapsed seconds to a stage (stages may run more than once)"""
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'request_id': self.request_id,
+            'elapsed': self.elapsed,
+            'stages': dict(self.stages),
+        }
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar('current_trace', default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    """Return the trace of the request running in this context, if any"""
+    return _current_trace.get()
+
+
+class MetricsRegistry:
+    """Thread-safe in-process counters, gauges and timing reservoirs"""
+
+    def __init__(self, max_samples: int = 10000):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, Deque[float]] = {}
+
+    def increment(self, name: str, value: float = 1):
+        """Increment a counter"""
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float):
+        """Set a gauge to its current value"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        """Record a duration sample (keeps the most recent max_samples)"""
+        with self._lock:
+            samples = self._timings.get(name)
+            if samples is None:
+                samples = deque(maxlen=self.max_samples)
+                self._timings[name] = samples
+            samples.append(seconds)
+
+    def counter(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0.0)
+
+    def gauge(self, name: str) -> Optional[float]:
+        with self._lock:
+            return self._gauges.get(name)
+
+    def timings(self, name: str) -> List[float]:
+        with self._lock:
+            return list(self._timings.get(name, ()))
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a pipeline stage into `stage.<name>` and the current request trace"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(f'stage.{name}', elapsed)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.record(name, elapsed)
+
+    @contextmanager
+    def trace(self, request_id: Optional[str] = None) -> Iterator[RequestTrace]:
+        """Collect stage timings for one request in the current context"""
+        request_trace = RequestTrace(request_id)
+        token = _current_trace.set(request_trace)
+        try:
+            yield request_trace
+        finally:
+            _current_trace.reset(token)
+
+    @contextmanager
+    def use_trace(self, request_trace: RequestTrace) -> Iterator[RequestTrace]:
+        """Record stages into an existing trace, e.g. when a request resumes on another thread"""
+        token = _current_trace.set(request_trace)
+        try:
+            yield request_trace
+        finally:
+            _current_trace.reset(token)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a JSON-serializable view of all metrics"""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            timings = {name: list(samples) for name, samples in self._timings.items()}
+        return {
+            'counters': counters,
+            'gauges': gauges,
+            'timings': {name: summarize(samples) for name, samples in timings.items()},
+        }
+
+    def reset(self):
+        """Drop all recorded metrics"""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._timings.clear()
+
+
+# Process-wide registry used by the service layer
+metrics = MetricsRegistry()
@@ -0,0 +1,51 @@
+import threading
+from typing import Optional
+
+
+class PeriodicJob:
+    """Base class for maintenance jobs that run `run_once()` every `interval` seconds.
+
+    Subclasses implement run_once() and should check `stopping` between
+    batches so stop() returns promptly.
+    """
+
+    name = 'periodic-job'
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop.is_set()
+
+    def run_once(self):
+        raise NotImplementedError
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Run the job on a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the background thread (a batch in progress finishes first)"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_forever(self):
+        """Run in the foreground until Ctrl+C"""
+        try:
+            self._loop()
+        except KeyboardInterrupt:
+            self._stop.set()
@@ -0,0 +1,199 @@
+"""
+On-demand sampling profiler for single chat requests.
+
+A profiled request is sampled from a background thread every
+PROFILE_INTERVAL seconds, following only the threads working on it
+(including deadline pool threads running its history load and save).
+Each run writes two files to PROFILE_DIR, named after the request ID:
+
+    <request_id>.folded  collapsed stacks ("frame;frame;frame count"), the
+                         input format of flamegraph.pl, inferno and speedscope
+    <request_id>.json    request ID, tag, duration, sample count and stage timings
+
+Requests are profiled when PROFILE_SAMPLE_RATE picks them or when they
+carry PROFILE_TOKEN (X-Profile header on the API, ?profile= in Streamlit).
+Unprofiled requests only pay for a context variable lookup.
+"""
+import functools
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+import os
+
+from config import Config
+from utils.metrics import RequestTrace, metrics
+
+PROFILE_HEADER = 'X-Profile'
+# Request IDs name the profile files, so client-supplied ones must be plain names
+REQUEST_ID_PATTERN = re.compile(r'[A-Za-z0-9-]{1,64}')
+
+_active_profiler: ContextVar[Optional['RequestProfiler']] = ContextVar('active_profiler', default=None)
+
+
+def active_profiler() -> Optional['RequestProfiler']:
+    """The profiler of the request running in this context, if any"""
+    return _active_profiler.get()
+
+
+def profiling_requested(token: Optional[str] = None) -> bool:
+    """Whether to profile a request that came with `token` (header/query value)"""
+    if token and Config.PROFILE_TOKEN and token == Config.PROFILE_TOKEN:
+        return True
+    return Config.PROFILE_SAMPLE_RATE > 0 and random.random() < Config.PROFILE_SAMPLE_RATE
+
+
+def request_id_or_new(request_id: Optional[str] = None) -> str:
+    """request_id if it is a safe file name ([A-Za-z0-9-], up to 64 characters), otherwise a new UUID"""
+    if request_id and REQUEST_ID_PATTERN.fullmatch(request_id):
+        return request_id
+    return str(uuid.uuid4())
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(';', ',')
+
+
+class RequestProfiler:
+    """Samples the stacks of the threads attached to one request"""
+
+    def __init__(self, request_id: str = None, tag: str = 'request', interval: float = None,
+                 output_dir: str = None):
+        self.request_id = request_id_or_new(request_id)
+        self.tag = tag
+        self.interval = interval or Config.PROFILE_INTERVAL
+        self.output_dir = output_dir or Config.PROFILE_DIR
+        self.samples: Counter = Counter()
+        self._threads: Dict[int, int] = {}  # thread ident -> attach depth
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self.started_at: Optional[datetime] = None
+        self.elapsed = 0.0
+
+    def start(self):
+        self.started_at = datetime.now()
+        self._started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample_loop, name=f'profiler-{self.request_id}', daemon=True)
+        self._sampler.start()
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                threads = list(self._threads)
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            for ident in threads:
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack:
+                    self.samples[';'.join(reversed(stack))] += 1
+
+    @contextmanager
+    def attached(self) -> Iterator[None]:
+        """Sample the current thread (and mark this context as profiled) while inside"""
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+        token = _active_profiler.set(self)
+        try:
+            yield
+        finally:
+            _active_profiler.reset(token)
+            with self._lock:
+                depth = self._threads.pop(ident) - 1
+                if depth:
+                    self._threads[ident] = depth
+
+    def wrap(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        """fn, sampled on whichever thread ends up running it"""
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            with self.attached():
+                return fn(*args, **kwargs)
+        return run
+
+    def stop(self, trace: RequestTrace = None) -> Optional[str]:
+        """Stop sampling and write the artifacts, returning the .folded path"""
+        self.elapsed = time.perf_counter() - self._started
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        metrics.increment('profiler.requests')
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            output_dir = os.path.realpath(self.output_dir)
+            base = os.path.realpath(os.path.join(output_dir, self.request_id))
+            if os.path.dirname(base) != output_dir:
+                raise ValueError(f"profile path escapes {output_dir}")
+            with open(f"{base}.folded", 'w', encoding='utf-8') as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            with open(f"{base}.json", 'w', encoding='utf-8') as f:
+                json.dump({
+                    'request_id': self.request_id,
+                    'tag': self.tag,
+                    'started_at': self.started_at.isoformat(),
+                    'elapsed': self.elapsed,
+                    'interval': self.interval,
+                    'samples': sum(self.samples.values()),
+                    'stages': dict(trace.stages) if trace is not None else {},
+                }, f, indent=2)
+            print(f"Profile for request {self.request_id} written to {base}.folded")
+            return f"{base}.folded"
+        except Exception as e:
+            print(f"Error writing profile for request {self.request_id}: {e}")
+            return None
+
+
+def profile_call(fn: Callable[..., Any], *args, request_id: str = None, tag: str = 'call', **kwargs) -> Any:
+    """Run fn(*args, **kwargs) as one profiled request"""
+    profiler = RequestProfiler(request_id, tag)
+    profiler.start()
+    with metrics.trace(profiler.request_id) as trace:
+        try:
+            with profiler.attached():
+                return fn(*args, **kwargs)
+        finally:
+            profiler.stop(trace)
+
+
+def profile_stream(stream: Iterable[Any], request_id: str = None, tag: str = 'stream') -> Iterator[Any]:
+    """Yield from stream as one profiled request.
+
+    Only time spent producing chunks is sampled, on whichever thread pulls
+    each one (the API advances streams from a thread pool), not the time
+    the consumer spends between chunks.
+    """
+    profiler = RequestProfiler(request_id, tag)
+    trace = RequestTrace(profiler.request_id)
+    profiler.start()
+    iterator = iter(stream)
+    try:
+        while True:
+            with profiler.attached(), metrics.use_trace(trace):
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+            yield chunk
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            with profiler.attached(), metrics.use_trace(trace):
+                close()
+        profiler.stop(trace)
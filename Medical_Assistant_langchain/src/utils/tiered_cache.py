@@ -0,0 +1,319 @@
+"""
+Two-level cache shared by every replica.
+
+L1 is a small in-process LRU with a short TTL; L2 is a Redis-protocol
+server (Redis, Valkey, KeyDB, or fakeredis in tests) that all replicas
+read and write, so a session's history or a profile loaded by one replica
+is warm on the others. Values are compact JSON, zstd- (or zlib-)
+compressed above CACHE_COMPRESS_MIN_BYTES, behind a one-byte format tag.
+
+Keys carry CACHE_KEY_VERSION, so bumping it retires every entry at once
+(old ones just expire). Invalidating a key deletes it from L2 and
+publishes a message that makes every other replica drop it from L1;
+the L1 TTL bounds staleness if a message is missed. L2 calls go through a
+circuit breaker: when Redis is slow or down the cache degrades to L1 and
+the callers read their store as before.
+"""
+import json
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import redis
+except ImportError:  # optional: only needed for the shared cache tier
+    redis = None
+
+try:
+    import zstandard
+except ImportError:  # optional: fall back to zlib
+    zstandard = None
+
+from config import Config
+from utils.circuit_breaker import CircuitBreaker
+from utils.metrics import metrics
+
+# Bump when the encoding below changes
+FORMAT_VERSION = 1
+# One-byte tags in front of every encoded value
+TAG_JSON = b'J'
+TAG_ZLIB = b'z'
+TAG_ZSTD = b'Z'
+
+
+class ValueCodec:
+    """Compact JSON, compressed when large enough to be worth it"""
+
+    def __init__(self, min_compress_bytes: int = None):
+        self.min_compress_bytes = (Config.CACHE_COMPRESS_MIN_BYTES if min_compress_bytes is None
+                                   else min_compress_bytes)
+        # zstd (de)compressors aren't safe to share between threads
+        self._local = threading.local()
+
+    def encode(self, value: Any) -> bytes:
+        data = json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        if len(data) < self.min_compress_bytes:
+            return TAG_JSON + data
+        if zstandard is not None:
+            compressor = getattr(self._local, 'compressor', None)
+            if compressor is None:
+                compressor = self._local.compressor = zstandard.ZstdCompressor(level=3)
+            return TAG_ZSTD + compressor.compress(data)
+        return TAG_ZLIB + zlib.compress(data, 6)
+
+    def decode(self, payload: bytes) -> Any:
+        tag, data = payload[:1], payload[1:]
+        if tag == TAG_ZSTD:
+            if zstandard is None:
+                raise ValueError("zstandard is required to read zstd-compressed cache entries")
+            decompressor = getattr(self._local, 'decompressor', None)
+            if decompressor is None:
+                decompressor = self._local.decompressor = zstandard.ZstdDecompressor()
+            data = decompressor.decompress(data)
+        elif tag == TAG_ZLIB:
+            data = zlib.decompress(data)
+        elif tag != TAG_JSON:
+            raise ValueError(f"Unknown cache entry format: {tag!r}")
+        return json.loads(data)
+
+
+class LocalCache:
+    """Thread-safe LRU of (namespace, key) -> value, each entry living `ttl` seconds"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Tuple[str, str], Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, entry_key: Tuple[str, str]) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[entry_key]
+                return None
+            self._entries.move_to_end(entry_key)
+            return entry[1]
+
+    def put(self, entry_key: Tuple[str, str], value: Any):
+        with self._lock:
+            self._entries[entry_key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, entry_key: Tuple[str, str]):
+        with self._lock:
+            self._entries.pop(entry_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class TieredCache:
+    """L1 in-process LRU in front of a shared L2 Redis, with pub/sub invalidation
+
+    client is a redis-py compatible client (e.g. fakeredis.FakeRedis());
+    without one, a client for CACHE_REDIS_URL is created. Misses and L2
+    failures return nothing: the caller loads from its store.
+    """
+
+    def __init__(self, client=None, l1_entries: int = None, l1_ttl: float = None, ttl: float = None,
+                 prefix: str = None, subscribe: bool = True):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("The redis package is required for the shared cache (pip install redis)")
+            client = redis.Redis.from_url(Config.CACHE_REDIS_URL, socket_timeout=Config.CACHE_TIMEOUT,
+                                          socket_connect_timeout=Config.CACHE_TIMEOUT)
+        self.client = client
+        self.local = LocalCache(l1_entries or Config.CACHE_L1_ENTRIES,
+                                Config.CACHE_L1_TTL if l1_ttl is None else l1_ttl)
+        self.ttl = ttl or Config.CACHE_TTL
+        prefix = prefix or Config.CACHE_PREFIX
+        self.key_prefix = f"{prefix}:{FORMAT_VERSION}.{Config.CACHE_KEY_VERSION}:"
+        self.channel = f"{prefix}:invalidate"
+        self.codec = ValueCodec()
+        self.breaker = CircuitBreaker('cache', Config.CACHE_BREAKER_FAILURES, Config.CACHE_BREAKER_RESET,
+                                      Config.CACHE_SLOW_CALL_SECONDS)
+        # Tells this replica's own invalidation messages apart from the others'
+        self.origin = uuid.uuid4().hex[:12]
+        self._listeners: Dict[str, List[Callable[[str], None]]] = {}
+        self._subscriber = None
+        self._wants_subscriber = subscribe
+        self._subscribe_lock = threading.Lock()
+        if subscribe:
+            self._subscribe()
+
+    def redis_key(self, namespace: str, key: str) -> str:
+        return f"{self.key_prefix}{namespace}:{key}"
+
+    # Reads
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        return self.get_many(namespace, [key]).get(key)
+
+    def get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, Any]:
+        """Cached values of keys (missing keys are left out), from L1, then one L2 round trip"""
+        found: Dict[str, Any] = {}
+        missing = []
+        for key in keys:
+            value = self.local.get((namespace, key))
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        if found:
+            metrics.increment(f'cache.{namespace}.l1_hits', len(found))
+        if not missing:
+            return found
+        payloads = self._l2(lambda: self.client.mget([self.redis_key(namespace, key) for key in missing]))
+        hits = 0
+        for key, payload in zip(missing, payloads or ()):
+            if payload is None:
+                continue
+            try:
+                value = self.codec.decode(payload)
+            except Exception as e:
+                print(f"Error decoding cache entry {namespace}:{key}: {e}")
+                continue
+            self.local.put((namespace, key), value)
+            found[key] = value
+            hits += 1
+        if hits:
+            metrics.increment(f'cache.{namespace}.l2_hits', hits)
+        if len(missing) > hits:
+            metrics.increment(f'cache.{namespace}.misses', len(missing) - hits)
+        return found
+
+    # Writes
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float = None):
+        self.set_many(namespace, {key: value}, ttl)
+
+    def set_many(self, namespace: str, items: Dict[str, Any], ttl: float = None):
+        """Store values in both levels in one pipelined L2 round trip
+
+        Other replicas are told to drop their L1 copies, so they read the new values from L2.
+        """
+        if not items:
+            return
+        seconds = max(int(ttl or self.ttl), 1)
+        encoded = {}
+        for key, value in items.items():
+            self.local.put((namespace, key), value)
+            encoded[self.redis_key(namespace, key)] = self.codec.encode(value)
+
+        def write():
+            pipe = self.client.pipeline(transaction=False)
+            for redis_key, payload in encoded.items():
+                pipe.set(redis_key, payload, ex=seconds)
+            pipe.publish(self.channel, self._message(namespace, list(items)))
+            return pipe.execute()
+
+        self._l2(write)
+
+    def invalidate(self, namespace: str, *keys: str):
+        """Drop keys everywhere: here, in L2 and (via pub/sub) in every other replica's L1"""
+        if not keys:
+            return
+        for key in keys:
+            self.local.pop((namespace, key))
+
+        def drop():
+            pipe = self.client.pipeline(transaction=False)
+            pipe.delete(*[self.redis_key(namespace, key) for key in keys])
+            pipe.publish(self.channel, self._message(namespace, list(keys)))
+            return pipe.execute()
+
+        self._l2(drop)
+        metrics.increment(f'cache.{namespace}.invalidations', len(keys))
+
+    def _l2(self, call: Callable[[], Any]) -> Any:
+        """Run an L2 call through the breaker; None if Redis is unavailable"""
+        try:
+            result = self.breaker.call(call)
+        except Exception as e:
+            metrics.increment('cache.l2_errors')
+            if not self.breaker.is_open:
+                print(f"Shared cache unavailable: {e}")
+            return None
+        if self._wants_subscriber and self._subscriber is None:
+            # Redis was down when this replica started
+            self._subscribe()
+        return result
+
+    # Invalidation messages
+
+    def on_invalidate(self, namespace: str, listener: Callable[[str], None]):
+        """Call listener(key) when another replica invalidates or rewrites a key of namespace"""
+        self._listeners.setdefault(namespace, []).append(listener)
+
+    def _message(self, namespace: str, keys: List[str]) -> str:
+        return json.dumps([self.origin, namespace, keys], separators=(',', ':'))
+
+    def _subscribe(self):
+        with self._subscribe_lock:
+            if self._subscriber is not None:
+                return
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{self.channel: self._handle_message})
+                self._subscriber = pubsub.run_in_thread(sleep_time=1.0, daemon=True,
+                                                        exception_handler=self._subscriber_failed)
+            except Exception as e:
+                # Without messages, L1 entries can be stale for up to CACHE_L1_TTL
+                print(f"Error subscribing to cache invalidations: {e}")
+
+    def _handle_message(self, message: Dict[str, Any]):
+        try:
+            origin, namespace, keys = json.loads(message['data'])
+        except (ValueError, TypeError) as e:
+            print(f"Ignoring malformed cache invalidation: {e}")
+            return
+        if origin == self.origin:
+            return
+        for key in keys:
+            self.local.pop((namespace, key))
+            for listener in self._listeners.get(namespace, ()):
+                try:
+                    listener(key)
+                except Exception as e:
+                    print(f"Error in cache invalidation listener: {e}")
+        metrics.increment('cache.remote_invalidations', len(keys))
+
+    def _subscriber_failed(self, error: Exception, pubsub, thread):
+        # Messages may have been missed while disconnected: L1 can't be trusted
+        print(f"Cache invalidation subscriber failed, clearing L1: {error}")
+        metrics.increment('cache.subscriber_errors')
+        self.local.clear()
+        time.sleep(1.0)
+
+    def close(self):
+        if self._subscriber is not None:
+            self._subscriber.stop()
+            self._subscriber = None
+
+
+_shared_cache: Optional[TieredCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache() -> Optional[TieredCache]:
+    """Process-wide cache for CACHE_REDIS_URL (None if it isn't set)"""
+    global _shared_cache
+    if not Config.CACHE_REDIS_URL:
+        return None
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = TieredCache()
+        return _shared_cache
@@ -11,8 +11,27 @@ if src_path not in sys.path:
     sys.path.insert(0, src_path)
 
 from services.langchain_service import MedicalChatService
+from services.api_client import MedicalChatClient
+from services.quick_actions import QUICK_ACTIONS
+from services.symptom_ontology import format_triage
+from services.turn_store import Turn
+from utils.profiling import profile_stream, profiling_requested
 from config import Config
 
+def create_chat_service():
+    """Use the API server when configured, otherwise run the service in-process"""
+    if Config.API_BASE_URL:
+        return MedicalChatClient(Config.API_BASE_URL)
+    service = MedicalChatService()
+    if Config.WARMUP_ENABLED:
+        service.warm_up()
+    return service
+
+@st.cache_resource
+def get_chat_service():
+    """One (warmed-up) chat service per Streamlit process, shared by all sessions"""
+    return create_chat_service()
+
 def initialize_app():
     """Initialize the application"""
     try:
@@ -24,7 +43,7 @@ def initialize_app():
             st.session_state.session_id = str(uuid.uuid4())
         
         if 'chat_service' not in st.session_state:
-            st.session_state.chat_service = MedicalChatService()
+            st.session_state.chat_service = get_chat_service()
         
         if 'chat_history' not in st.session_state:
             st.session_state.chat_history = []
@@ -45,12 +64,9 @@ def load_chat_history():
     """Load existing chat history from database"""
     try:
         chat_service = st.session_state.chat_service
-        history = chat_service.db.get_chat_history(st.session_state.session_id, 20)
+        history = chat_service.get_chat_history(st.session_state.session_id, 20)
         
-        st.session_state.chat_history = [
-            (chat['message'], chat['response']) 
-            for chat in history
-        ]
+        st.session_state.chat_history = [Turn.from_row(chat) for chat in history]
     except Exception as e:
         print(f"Error loading chat history: {e}")
 
@@ -76,51 +92,42 @@ def main():
         st.header("🩺 Medical Assistant")
         st.markdown("---")
         
-        # Quick actions
-        st.subheader("Quick Actions")
-        
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if st.button("🆘 First Aid"):
-                st.session_state.quick_message = "I need first aid advice for an emergency situation."
-        
-        with col2:
-            if st.button("💊 Get Medication"):
-                st.session_state.quick_message = "I need specific medication recommendations for my condition. Please provide exact drug names and dosages."
-        
-        col3, col4 = st.columns(2)
-        
-        with col3:
-            if st.button("🤒 Symptoms"):
-                st.session_state.quick_message = "I'm experiencing symptoms and need a complete medical consultation with medication recommendations."
-        
-        with col4:
-            if st.button("🏥 Prescription"):
-                st.session_state.quick_message = "I need a detailed prescription for my medical condition with specific medications and dosages."
+        # Quick actions, two per row under their section headers
+        section = None
+        for index, (action_section, label, message) in enumerate(QUICK_ACTIONS):
+            if action_section != section:
+                section = action_section
+                st.subheader(section)
+            if index % 2 == 0:
+                columns = st.columns(2)
+            with columns[index % 2]:
+                if st.button(label):
+                    st.session_state.quick_message = message
         
-        # Additional medication-focused buttons
-        st.subheader("Medication Services")
-        
-        col5, col6 = st.columns(2)
-        
-        with col5:
-            if st.button("📋 Drug Info"):
-                st.session_state.quick_message = "I need detailed information about a specific medication including dosage, side effects, and interactions."
-        
-        with col6:
-            if st.button("⚠️ Drug Interactions"):
-                st.session_state.quick_message = "I need to check for drug interactions between my medications."
-        
-        col7, col8 = st.columns(2)
-        
-        with col7:
-            if st.button("🔄 Alternative Meds"):
-                st.session_state.quick_message = "I need alternative medication options for my condition due to side effects or allergies."
+        st.markdown("---")
         
-        with col8:
-            if st.button("📊 Dosage Adjustment"):
-                st.session_state.quick_message = "I need help adjusting my medication dosage based on my response to treatment."
+        # Search past answers in this session
+        st.subheader("🔎 Search Consultation")
+        query = st.text_input("Search past answers", placeholder="e.g. metformin dose", label_visibility="collapsed")
+        if query:
+            if st.session_state.get('search_query') != query:
+                st.session_state.search_query = query
+                st.session_state.search_pages = [None]
+            page = st.session_state.chat_service.search_history(
+                query, st.session_state.session_id, cursor=st.session_state.search_pages[-1]
+            )
+            if not page['results']:
+                st.caption("No matching answers.")
+            for result in page['results']:
+                with st.expander(f"{result['timestamp'][:16].replace('T', ' ')} · {(result['message'] or '')[:40]}"):
+                    st.markdown(result['snippet'])
+            columns = st.columns(2)
+            if len(st.session_state.search_pages) > 1 and columns[0].button("◀ Previous"):
+                st.session_state.search_pages.pop()
+                st.rerun()
+            if page['next_cursor'] and columns[1].button("Next ▶"):
+                st.session_state.search_pages.append(page['next_cursor'])
+                st.rerun()
         
         st.markdown("---")
         
@@ -134,6 +141,8 @@ def main():
             st.rerun()
         
         if st.button("🔄 New Session"):
+            # Stop any answer still being generated for the old session
+            st.session_state.chat_service.cancel_session(st.session_state.session_id)
             st.session_state.session_id = str(uuid.uuid4())
             st.session_state.chat_history = []
             st.success("New session started!")
@@ -237,21 +246,28 @@ def process_user_message(prompt):
     
     # Generate response
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            try:
-                response = st.session_state.chat_service.chat(
-                    prompt,
-                    st.session_state.session_id
-                )
-                st.write(response)
-                
-                # Add to session chat history
-                st.session_state.chat_history.append((prompt, response))
-                
-            except Exception as e:
-                error_message = f"I apologize, but I'm experiencing technical difficulties. Please try again later. Error: {str(e)}"
-                st.error(error_message)
-                st.session_state.chat_history.append((prompt, error_message))
+        try:
+            # Filled with the local preliminary triage while the answer streams
+            triage_placeholder = st.empty()
+            # A newer message cancels an answer still streaming for this session
+            stream = st.session_state.chat_service.stream_chat(
+                prompt,
+                st.session_state.session_id,
+                supersede=True,
+                on_triage=lambda triage: triage_placeholder.info(format_triage(triage))
+            )
+            # Hidden switch: ?profile=<PROFILE_TOKEN> profiles this answer
+            if profiling_requested(st.query_params.get('profile')):
+                stream = profile_stream(stream, request_id=str(uuid.uuid4()), tag='streamlit.chat')
+            response = st.write_stream(stream)
+            
+            # Add to session chat history
+            st.session_state.chat_history.append(Turn(prompt, response))
+            
+        except Exception as e:
+            error_message = f"I apologize, but I'm experiencing technical difficulties. Please try again later. Error: {str(e)}"
+            st.error(error_message)
+            st.session_state.chat_history.append(Turn(prompt, error_message))
 
 if __name__ == "__main__":
     main()
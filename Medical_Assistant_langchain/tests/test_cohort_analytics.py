@@ -0,0 +1,45 @@
+import os
+import sys
+
+import numpy as np
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.join(os.path.dirname(current_dir), 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.cohort_analytics import CohortAccumulator, ProfileColumns, suppression_mask
+
+
+def profile(gender, condition, age=40):
+    return {'health_info': {'age': age, 'weight': 70, 'height': 175, 'gender': gender,
+                            'medical_conditions': [condition]}}
+
+
+def test_lone_small_cell_takes_a_second_one_with_it():
+    mask = suppression_mask(np.array([30, 12, 1, 0]), 10)
+    assert mask.tolist() == [[False, True, True, False]]
+
+
+def test_every_line_of_a_table_hides_zero_or_two_plus_cells():
+    table = np.array([[20, 3, 15], [12, 11, 0], [40, 25, 2]])
+    mask = suppression_mask(table, 10)
+    assert mask[table >= 1].any() and not mask[table == 0].any()
+    for line in list(mask) + list(mask.T):
+        assert line.sum() != 1
+
+
+def test_report_suppresses_small_counts():
+    profiles = [profile('female', 'asthma') for _ in range(30)] + [profile('male', 'asthma') for _ in range(12)]
+    profiles.append(profile('other', 'rare syndrome', age=80))
+    totals = CohortAccumulator()
+    totals.add(ProfileColumns(profiles))
+    report = totals.report(min_count=10)
+
+    genders = {row['name']: row['count'] for row in report['gender']}
+    assert genders == {'female': 30, 'male': None, 'other': None}
+    assert [row['name'] for row in report['medical_conditions']] == ['asthma']
+    assert report['bmi']['min'] is None and report['bmi']['max'] is None
+    assert report['bmi_by_age_band']['75+']['Normal weight'] is None
+    assert totals.report(min_count=1)['bmi']['min'] == 22.9
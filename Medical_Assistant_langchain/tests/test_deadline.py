@@ -0,0 +1,121 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.join(os.path.dirname(current_dir), 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from utils.deadline import (CancellationToken, Cancelled, Deadline, DeadlineExceeded, RequestRegistry,
+                            iterate_until, run_with_timeout)
+
+
+class StalledStream:
+    """An upstream stream whose first chunk only arrives once `release` is set"""
+
+    def __init__(self, chunks=('a', 'b', 'c')):
+        self.release = threading.Event()
+        self.closed = threading.Event()
+        self.sent = 0
+        self.chunks = chunks
+
+    def __iter__(self):
+        try:
+            self.release.wait()
+            for chunk in self.chunks:
+                self.sent += 1
+                yield chunk
+        finally:
+            self.closed.set()
+
+
+def test_stream_with_no_first_chunk_stops_at_the_deadline():
+    upstream = StalledStream()
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        list(iterate_until(iter(upstream), Deadline(0.2)))
+    assert time.monotonic() - started < 1.0
+
+    # The pending pull finishes in the background and the upstream is closed after it
+    upstream.release.set()
+    assert upstream.closed.wait(2.0)
+    assert upstream.sent == 1
+
+
+def test_cancellation_interrupts_a_stalled_stream():
+    upstream = StalledStream()
+    deadline = Deadline(30.0)
+    threading.Timer(0.1, deadline.token.cancel, args=('superseded',)).start()
+    started = time.monotonic()
+    with pytest.raises(Cancelled, match='superseded'):
+        list(iterate_until(iter(upstream), deadline))
+    assert time.monotonic() - started < 1.0
+    upstream.release.set()
+    assert upstream.closed.wait(2.0)
+
+
+def test_chunks_pass_through_in_order():
+    upstream = StalledStream()
+    upstream.release.set()
+    assert list(iterate_until(iter(upstream), Deadline(5.0))) == ['a', 'b', 'c']
+    assert upstream.closed.is_set()
+
+
+def test_stopping_between_chunks_closes_the_upstream_at_once():
+    upstream = StalledStream()
+    upstream.release.set()
+    stream = iterate_until(iter(upstream), Deadline(5.0))
+    assert next(stream) == 'a'
+    stream.close()
+    assert upstream.closed.is_set()
+    assert upstream.sent == 1
+
+
+def test_upstream_errors_reach_the_caller():
+    def failing():
+        yield 'a'
+        raise ConnectionError('stream reset')
+
+    stream = iterate_until(failing(), Deadline(5.0))
+    assert next(stream) == 'a'
+    with pytest.raises(ConnectionError, match='stream reset'):
+        next(stream)
+
+
+def test_budget_and_reserve_split_the_request_time():
+    deadline = Deadline(10.0)
+    assert deadline.budget(0.25) == pytest.approx(2.5, abs=0.05)
+    stage = deadline.reserve(4.0)
+    assert stage.remaining() == pytest.approx(6.0, abs=0.05)
+    # A reserved stage shares the request's cancellation token
+    deadline.token.cancel('superseded')
+    with pytest.raises(Cancelled):
+        stage.check()
+
+
+def test_run_with_timeout_gives_up_on_slow_calls():
+    assert run_with_timeout(lambda value: value * 2, 1.0, 21) == 42
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        run_with_timeout(time.sleep, 0.1, 2.0)
+    assert time.monotonic() - started < 1.0
+
+
+def test_newer_request_supersedes_the_session_in_flight():
+    registry = RequestRegistry()
+    first, second = CancellationToken(), CancellationToken()
+    registry.begin('s1', first)
+    registry.begin('s1', second)
+    assert first.cancelled and first.reason == 'superseded'
+    assert not second.cancelled
+
+    # Finishing a superseded request leaves the newer one registered
+    registry.finish('s1', first)
+    assert registry.cancel('s1', 'stopped')
+    assert second.reason == 'stopped'
+    assert not registry.cancel('s1')
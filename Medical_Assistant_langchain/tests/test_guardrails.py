@@ -0,0 +1,88 @@
+import os
+import sys
+
+import pytest
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.join(os.path.dirname(current_dir), 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.guardrails import Guardrails
+
+
+@pytest.fixture
+def guardrails():
+    return Guardrails()
+
+
+def stream(guardrails, message, chunks):
+    return ''.join(guardrails.start(message).guard_stream(iter(chunks)))
+
+
+def split(text, size=7):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize('text, drug', [
+    ("Take ibuprofen 4000 mg daily.", 'ibuprofen'),
+    ("You can take 6 g of paracetamol a day.", 'paracetamol'),
+    ("Acetaminophen: up to 6000 mg a day.", 'acetaminophen'),
+    ("Warfarin 50mg once daily", 'warfarin'),
+    ("Ibuprofen 400 mg three times a day.", None),
+    ("Metformin 500 mg twice daily, and keep carbohydrates below 150 g per day.", None),
+    ("Aspirin 81 mg daily, plus 5000 mg of vitamin C", None),
+    ("Amoxicillin 500 mg and 2000 mg of calcium", None),
+    ("Drink 2 liters of water and eat 30 g of fibre.", None),
+])
+def test_check_dose(guardrails, text, drug):
+    assert guardrails.check_dose(text) == drug
+
+
+def test_guard_stream_blocks_dose_split_across_chunks(guardrails):
+    output = stream(guardrails, "how much ibuprofen", split("For pain, ibuprofen 40" "00 mg daily is fine. More text here."))
+    assert 'Response stopped' in output and 'ibuprofen' in output
+    assert '4000' not in output
+
+
+def test_guard_stream_passes_ordinary_answers(guardrails):
+    text = "Metformin 500 mg twice daily, and keep carbohydrates below 150 g per day. See your doctor."
+    assert stream(guardrails, "metformin diet", split(text)) == text
+
+
+def test_guard_stream_keeps_helpline_numbers(guardrails):
+    text = "Call Poison Control at 1-800-222-1222 right away, or in the UK 0800 689 5652."
+    assert stream(guardrails, "my son drank something", split(text, 5)) == text
+    assert guardrails.check_output(text, "my son drank something")[0] == text
+
+
+def test_guard_stream_removes_echoed_user_pii(guardrails):
+    message = "I'm at 555-123-4567, email jo@example.com"
+    output = stream(guardrails, message, split("I'll note (555) 123-4567 and jo@example.com, or call 911."))
+    assert '123-4567' not in output and 'jo@example.com' not in output
+    assert '[phone removed]' in output and '[email removed]' in output and '911' in output
+    assert guardrails.check_output("Reach me on +1 555 123 4567", message)[0] == "Reach me on [phone removed]"
+
+
+def test_card_numbers_are_always_removed(guardrails):
+    assert '4111' not in stream(guardrails, "hi", ["Card 4111 1111 1111 1111 on file."])
+
+
+@pytest.mark.parametrize('message', [
+    "I feel like ending it all", "i just want to end it all", "I don't want to be here anymore",
+    "I do not want to live", "I can't go on like this", "I cannot go on", "there's no point in living",
+    "I want to kill myself", "I have been cutting myself",
+])
+def test_self_harm_escalates(guardrails, message):
+    assert guardrails.check_input(message).escalate
+
+
+@pytest.mark.parametrize('message', ["I can go on walks again", "headache and fever", "how do I end a course of antibiotics"])
+def test_ordinary_messages_do_not_escalate(guardrails, message):
+    assert not guardrails.check_input(message).escalate
+
+
+def test_input_pii_is_scrubbed(guardrails):
+    verdict = guardrails.start("my email is jo@example.com").input_verdict()
+    assert verdict.message == "my email is [email removed]" and 'pii' in verdict.reasons
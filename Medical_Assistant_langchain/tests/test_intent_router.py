@@ -0,0 +1,98 @@
+import json
+import os
+import sys
+
+import pytest
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.join(os.path.dirname(current_dir), 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.intent_router import DRUG_INFO, EMERGENCY, SMALL_TALK, IntentRouter
+
+
+@pytest.fixture
+def router():
+    return IntentRouter(log_path='')
+
+
+# Every red-flag term in EMERGENCY_PATTERN, with its inflections
+@pytest.mark.parametrize('message', [
+    "I have chest pain", "sharp chest pains since this morning",
+    "I can't breathe", "i cant breathe", "I can’t breathe", "I cannot breathe", "he couldn't breathe",
+    "she is unable to breathe", "my baby is not breathing", "he stopped breathing",
+    "my dad is unconscious", "found her in an unconsciousness state",
+    "he is having a seizure", "she has had two seizures today", "my son is seizing",
+    "I think she had a stroke", "history of strokes and now slurred speech",
+    "I overdosed on tylenol", "he took an overdose", "she is overdosing", "worried about an overdose",
+    "I feel suicidal", "thinking about suicide",
+    "I want to kill myself", "I keep thinking about killing myself",
+    "severe bleeding from my leg", "severely bleeding after a fall", "heavy bleeding that won't stop",
+    "my arm is bleeding heavily", "the wound is bleeding severely",
+    "my throat is closing", "throat closed up after peanuts", "feels like my throat closes",
+    "I think it's anaphylaxis", "history of anaphylactic shock",
+    "my child swallowed bleach", "he drank some antifreeze", "my son ate a button battery",
+    "toddler swallowed a laundry pod", "she swallowed drain cleaner", "he ingested rat poison",
+    "she took too many pills", "I think I was poisoned", "my daughter swallowed all my pills",
+])
+def test_red_flags_route_to_emergency(router, message):
+    assert router.route(message).intent == EMERGENCY
+
+
+@pytest.mark.parametrize('message', ["hi", "thanks", "thank you so much", "what can you do", "goodbye"])
+def test_small_talk(router, message):
+    assert router.route(message).intent == SMALL_TALK
+
+
+@pytest.mark.parametrize('message', [
+    "what can you do about my back pain",
+    "how are you able to help with my diabetes",
+    "thanks, what about ibuprofen",
+    "hi, I have a headache",
+    "thank you, can you tell me more about what you said earlier about it",
+])
+def test_clinical_messages_never_take_small_talk(router, message):
+    assert router.route(message).intent != SMALL_TALK
+
+
+def test_routing_log_is_scrubbed_and_has_no_session(tmp_path):
+    path = tmp_path / 'routing_log.jsonl'
+    router = IntentRouter(log_path=str(path))
+    router.route("my email is a@b.com, what is ibuprofen", session_id='alice-secret-session')
+    router.route("sometimes I feel like I want to die", session_id='alice-secret-session')
+    entries = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(entries) == 1
+    assert 'session_id' not in entries[0]
+    assert 'a@b.com' not in entries[0]['message']
+    assert 'alice-secret-session' not in path.read_text()
+
+
+def test_routing_log_rotates(tmp_path):
+    path = tmp_path / 'routing_log.jsonl'
+    router = IntentRouter(log_path=str(path))
+    router.log_max_bytes, router.log_backups = 200, 2
+    for _ in range(20):
+        router.route("what is ibuprofen")
+    assert sorted(os.listdir(tmp_path)) == ['routing_log.jsonl', 'routing_log.jsonl.1', 'routing_log.jsonl.2']
+    assert os.path.getsize(path) <= 400
+
+
+@pytest.mark.parametrize('message', [
+    "how much ibuprofen can I give my 2 year old", "what is the dose of paracetamol for a toddler",
+    "can i take ibuprofen while pregnant", "tylenol dose for my 6-month-old baby",
+    "how much benadryl for a 20 kg child", "is aspirin safe when breastfeeding",
+])
+def test_special_population_dosing_takes_the_full_path(router, message):
+    decision = router.route(message)
+    assert decision.intent not in (DRUG_INFO, SMALL_TALK)
+    assert decision.message_type != 'drug_info'
+
+
+def test_plain_drug_questions_stay_on_drug_info(router):
+    assert router.route("what is the maximum dose of ibuprofen").intent == DRUG_INFO
+
+
+def test_food_poisoning_is_not_a_red_flag(router):
+    assert router.route("I have food poisoning").intent != EMERGENCY
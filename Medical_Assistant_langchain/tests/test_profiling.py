@@ -0,0 +1,130 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(current_dir)
+for path in (os.path.join(root, 'src'), os.path.join(root, 'benchmarks')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from config import Config
+from utils.metrics import metrics
+from utils.profiling import RequestProfiler, profile_call, profile_stream, request_id_or_new
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setattr(Config, 'PROFILE_INTERVAL', 0.001)
+    return tmp_path
+
+
+def busy(seconds: float) -> str:
+    with metrics.stage('busy'):
+        until = time.perf_counter() + seconds
+        while time.perf_counter() < until:
+            pass
+    return 'done'
+
+
+@pytest.mark.parametrize('request_id', ['abc-123', 'A' * 64, '0f8fad5b-d9cb-469f-a165-70867728950e'])
+def test_safe_request_ids_are_kept(request_id):
+    assert request_id_or_new(request_id) == request_id
+
+
+@pytest.mark.parametrize('request_id', [None, '', '../../etc/passwd', 'a/b', 'id with spaces', 'A' * 65, 'abc.json'])
+def test_unsafe_request_ids_are_replaced(request_id):
+    replaced = request_id_or_new(request_id)
+    assert replaced != request_id
+    assert request_id_or_new(replaced) == replaced
+
+
+def test_profile_call_writes_files_named_after_the_request(profile_dir):
+    assert profile_call(busy, 0.05, request_id='req-1', tag='test') == 'done'
+
+    assert sorted(os.listdir(profile_dir)) == ['req-1.folded', 'req-1.json']
+    summary = json.loads((profile_dir / 'req-1.json').read_text())
+    assert summary['request_id'] == 'req-1'
+    assert summary['tag'] == 'test'
+    assert summary['samples'] > 0
+    assert 'busy' in summary['stages']
+    assert 'busy (test_profiling.py' in (profile_dir / 'req-1.folded').read_text()
+
+
+def test_unsafe_request_id_never_escapes_the_profile_dir(profile_dir):
+    profile_call(busy, 0.01, request_id='../escape', tag='test')
+
+    assert not (profile_dir.parent / 'escape.folded').exists()
+    assert len([name for name in os.listdir(profile_dir) if name.endswith('.folded')]) == 1
+
+
+def test_profile_stream_samples_the_threads_producing_chunks(profile_dir):
+    def chunks():
+        for _ in range(3):
+            busy(0.02)
+            yield 'chunk'
+
+    assert list(profile_stream(chunks(), request_id='stream-1')) == ['chunk'] * 3
+    summary = json.loads((profile_dir / 'stream-1.json').read_text())
+    assert summary['samples'] > 0
+    assert summary['tag'] == 'stream'
+
+
+def test_wrapped_calls_are_sampled_on_their_own_thread(profile_dir):
+    profiler = RequestProfiler('wrapped', interval=0.001)
+    profiler.start()
+    with ThreadPoolExecutor(1) as pool:
+        assert pool.submit(profiler.wrap(busy), 0.05).result() == 'done'
+    profiler.stop()
+    assert any('busy (test_profiling.py' in stack for stack in profiler.samples)
+
+
+class TestApi:
+    @pytest.fixture
+    def client(self, profile_dir, monkeypatch):
+        pytest.importorskip('httpx')
+        from fastapi.testclient import TestClient
+        from fakes import FakeChatModel
+        from api.app import create_app
+        from database.sqlite_manager import SQLiteManager
+        from services.intent_router import IntentRouter
+        from services.langchain_service import MedicalChatService
+
+        monkeypatch.setattr(Config, 'WARMUP_ENABLED', False)
+        monkeypatch.setattr(Config, 'PROFILE_TOKEN', 'profile-me')
+        monkeypatch.setattr(Config, 'PROFILE_SAMPLE_RATE', 0.0)
+
+        def factory():
+            return MedicalChatService(llm=FakeChatModel(tokens_per_second=0, response_tokens=20, first_token_latency=0),
+                                      db=SQLiteManager(':memory:'), router=IntentRouter(log_path=''))
+
+        with TestClient(create_app(factory)) as client:
+            yield client
+
+    def test_chat_profile_uses_the_client_request_id(self, client, profile_dir):
+        response = client.post('/chat', json={'session_id': 'p1', 'message': 'I have a headache'},
+                               headers={'X-Profile': 'profile-me', 'X-Request-ID': 'client-42'})
+        assert response.status_code == 200
+        assert response.headers['X-Request-ID'] == 'client-42'
+        assert json.loads((profile_dir / 'client-42.json').read_text())['tag'] == 'api.chat'
+
+    def test_stream_profile_replaces_an_unsafe_request_id(self, client, profile_dir):
+        response = client.post('/chat/stream', json={'session_id': 'p2', 'message': 'I have a headache'},
+                               headers={'X-Profile': 'profile-me', 'X-Request-ID': '../../tmp/x'})
+        assert response.status_code == 200
+        request_id = response.headers['X-Request-ID']
+        assert request_id != '../../tmp/x'
+        assert json.loads((profile_dir / f'{request_id}.json').read_text())['tag'] == 'api.chat_stream'
+
+    def test_requests_without_the_token_are_not_profiled(self, client, profile_dir):
+        response = client.post('/chat', json={'session_id': 'p3', 'message': 'I have a headache'},
+                               headers={'X-Profile': 'wrong', 'X-Request-ID': 'client-43'})
+        assert response.status_code == 200
+        assert 'X-Request-ID' not in response.headers
+        assert os.listdir(profile_dir) == []
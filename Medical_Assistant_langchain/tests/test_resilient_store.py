@@ -0,0 +1,195 @@
+import json
+import os
+import sys
+import time
+
+import pytest
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.join(os.path.dirname(current_dir), 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from config import Config
+from database.resilient_store import ResilientStore
+from database.sqlite_manager import SQLiteManager
+from utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class FlakyFactory:
+    """Builds an in-memory SQLite store once `up` is set, counting attempts"""
+
+    def __init__(self, up: bool = False):
+        self.up = up
+        self.builds = 0
+        self.store = SQLiteManager(':memory:')
+
+    def __call__(self):
+        self.builds += 1
+        if not self.up:
+            raise ConnectionError('storage is down')
+        return self.store
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker('test-storage', failure_threshold=3, reset_timeout=0.2)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_failing_factory_starts_degraded_and_is_not_rebuilt_while_open(breaker, tmp_path):
+    factory = FlakyFactory()
+    store = ResilientStore(store_factory=factory, breaker=breaker, journal_dir=str(tmp_path))
+
+    assert store.degraded
+    assert breaker.state == OPEN
+    assert factory.builds == 1
+
+    # Delegated calls go through the breaker, which short-circuits them
+    assert store.get_user_profile('user-1') is None
+    assert store.update_user_health_info('user-1', {'age': 40}) is False
+    assert store.get_usage_rollup('day') == []
+    assert factory.builds == 1
+
+
+def test_methods_without_a_fallback_raise_while_degraded(breaker, tmp_path):
+    store = ResilientStore(store_factory=FlakyFactory(), breaker=breaker, journal_dir=str(tmp_path))
+
+    with pytest.raises(CircuitOpenError):
+        store.get_export_page(None, 10)
+    with pytest.raises(CircuitOpenError):
+        store.search_chat_messages('aspirin')
+
+
+def test_fallback_results_are_not_shared(breaker, tmp_path):
+    store = ResilientStore(store_factory=FlakyFactory(), breaker=breaker, journal_dir=str(tmp_path))
+
+    rows = store.get_usage_rollup('day')
+    rows.append({'tokens': 1})
+    assert store.get_usage_rollup('day') == []
+
+
+def test_saves_are_journaled_then_replayed_on_recovery(breaker, tmp_path):
+    factory = FlakyFactory()
+    store = ResilientStore(store_factory=factory, breaker=breaker, journal_dir=str(tmp_path))
+
+    store.save_chat_message('s1', 'hello', 'hi there', timestamp='2026-01-01T10:00:00')
+    assert [row['message'] for row in store.get_chat_history('s1')] == ['hello']
+    assert os.path.exists(store.journal_path)
+    assert factory.store.get_chat_history('s1') == []
+
+    factory.up = True
+    time.sleep(0.25)
+    # The half-open trial builds the store; closing the breaker replays the journal
+    assert store.get_user_profile('user-1') is None
+    assert breaker.state == CLOSED
+    assert factory.builds == 2
+    assert wait_for(lambda: len(factory.store.get_chat_history('s1')) == 1)
+    assert not store._backlog
+
+
+def test_delegated_calls_reach_the_store_when_healthy(breaker, tmp_path):
+    factory = FlakyFactory(up=True)
+    store = ResilientStore(store_factory=factory, breaker=breaker, journal_dir=str(tmp_path))
+
+    store.save_chat_message('s1', 'hello', 'hi there')
+    assert not store.degraded
+    assert store.delete_sessions(['s1']) is True
+    assert factory.builds == 1
+
+
+def test_journal_left_by_a_dead_worker_is_replayed(breaker, tmp_path):
+    entry = {'op': 'save', 'session_id': 's1', 'message': 'hello', 'response': 'hi there',
+             'message_type': 'medical_query', 'timestamp': '2026-01-01T10:00:00', 'sections': None}
+    (tmp_path / 'journal-3999999.jsonl').write_text(json.dumps(entry) + '\n', encoding='utf-8')
+    factory = FlakyFactory(up=True)
+    ResilientStore(store_factory=factory, breaker=breaker, journal_dir=str(tmp_path))
+
+    assert wait_for(lambda: len(factory.store.get_chat_history('s1')) == 1)
+    assert wait_for(lambda: os.listdir(tmp_path) == [])
+
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker('test-breaker', failure_threshold=2, reset_timeout=60)
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                breaker.call(self.fail)
+        assert breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.call(lambda: 'not called')
+
+    def test_success_resets_the_failure_count(self):
+        breaker = CircuitBreaker('test-breaker', failure_threshold=2, reset_timeout=60)
+        with pytest.raises(ConnectionError):
+            breaker.call(self.fail)
+        assert breaker.call(lambda: 'ok') == 'ok'
+        with pytest.raises(ConnectionError):
+            breaker.call(self.fail)
+        assert breaker.state == CLOSED
+
+    def test_half_open_lets_one_trial_through(self):
+        breaker = CircuitBreaker('test-breaker', failure_threshold=1, reset_timeout=0.05)
+        breaker.trip()
+        time.sleep(0.06)
+        assert breaker.allow()
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == OPEN
+
+        time.sleep(0.06)
+        assert breaker.call(lambda: 'ok') == 'ok'
+        assert breaker.state == CLOSED
+
+    def test_slow_calls_count_as_failures(self):
+        breaker = CircuitBreaker('test-breaker', failure_threshold=1, reset_timeout=60, slow_call_seconds=0.01)
+        assert breaker.call(time.sleep, 0.03) is None
+        assert breaker.state == OPEN
+
+    def test_listeners_see_every_transition(self):
+        breaker = CircuitBreaker('test-breaker', failure_threshold=1, reset_timeout=0.01)
+        states = []
+        breaker.on_state_change(states.append)
+        breaker.trip()
+        time.sleep(0.02)
+        breaker.call(lambda: None)
+        assert states == [OPEN, HALF_OPEN, CLOSED]
+
+    @staticmethod
+    def fail():
+        raise ConnectionError('down')
+
+
+class TestValidateConfig:
+    def test_supabase_is_optional_with_a_journal(self, monkeypatch, tmp_path):
+        monkeypatch.setenv('GEMINI_API_KEY', 'test-key')
+        monkeypatch.delenv('SUPABASE_URL', raising=False)
+        monkeypatch.setenv('SUPABASE_KEY', 'your_supabase_anon_key_here')
+        monkeypatch.setattr(Config, 'STORAGE_JOURNAL_DIR', str(tmp_path))
+
+        assert Config.validate_config() is True
+
+    def test_supabase_is_required_without_a_journal(self, monkeypatch):
+        monkeypatch.setenv('GEMINI_API_KEY', 'test-key')
+        monkeypatch.delenv('SUPABASE_URL', raising=False)
+        monkeypatch.setattr(Config, 'STORAGE_JOURNAL_DIR', '')
+
+        with pytest.raises(ValueError, match='SUPABASE_URL'):
+            Config.validate_config()
+
+    def test_gemini_key_is_always_required(self, monkeypatch, tmp_path):
+        monkeypatch.delenv('GEMINI_API_KEY', raising=False)
+        monkeypatch.setattr(Config, 'STORAGE_JOURNAL_DIR', str(tmp_path))
+
+        with pytest.raises(ValueError, match='GEMINI_API_KEY'):
+            Config.validate_config()
@@ -0,0 +1,102 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.join(os.path.dirname(current_dir), 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+pytest.importorskip('pyarrow')
+
+from database.compaction import TranscriptCompactor
+from database.retention import ChatPurger
+from database.sqlite_manager import SQLiteManager
+from database.transcript_archive import ParquetArchive
+
+
+def days_ago(days: int) -> str:
+    return (datetime.now() - timedelta(days=days)).isoformat()
+
+
+@pytest.fixture
+def archived_store(tmp_path):
+    """SQLite store whose cold sessions were just compacted to Parquet (archived today)"""
+    archive = ParquetArchive(str(tmp_path / 'archive'))
+    store = SQLiteManager(':memory:', archive=archive)
+    store.save_chat_message('s1', 'old question', 'old answer', timestamp=days_ago(100))
+    store.save_chat_message('s1', 'recent question', 'recent answer', timestamp=days_ago(10))
+    store.save_chat_message('s2', 'very old question', 'very old answer', timestamp=days_ago(200))
+    TranscriptCompactor(store, older_than_days=5).run_once()
+    assert store.get_cold_sessions(datetime.now()) == []
+    return store, archive
+
+
+def test_parquet_retention_follows_turn_timestamps(archived_store):
+    store, archive = archived_store
+    removed = ChatPurger(store, retention_days=30).apply_retention()
+
+    assert removed == 2
+    assert [row['message'] for row in store.get_chat_history('s1')] == ['recent question']
+    assert store.get_chat_history('s2') == []
+
+
+def test_fully_expired_partitions_are_removed(archived_store, tmp_path):
+    store, archive = archived_store
+    ChatPurger(store, retention_days=1).apply_retention()
+
+    assert store.get_chat_history('s1') == []
+    assert os.listdir(tmp_path / 'archive') == []
+
+
+def test_recent_archives_are_kept(archived_store):
+    store, archive = archived_store
+    assert ChatPurger(store, retention_days=365).apply_retention() == 0
+    assert len(store.get_chat_history('s1')) == 2
+
+
+def test_clearing_hides_history_until_the_purger_deletes_it():
+    store = SQLiteManager(':memory:')
+    store.save_chat_message('s1', 'first', 'answer', timestamp=days_ago(1))
+    assert store.delete_chat_history('s1') is True
+
+    assert store.get_chat_history('s1') == []
+    assert store.conn.execute("SELECT COUNT(*) FROM chat_conversations").fetchone()[0] == 1
+
+    assert ChatPurger(store, batch_size=10).purge_deleted() == 1
+    assert store.conn.execute("SELECT COUNT(*) FROM chat_conversations").fetchone()[0] == 0
+    assert store.get_tombstones() == []
+
+
+def test_turns_after_a_clear_stay_visible():
+    store = SQLiteManager(':memory:')
+    store.save_chat_message('s1', 'before', 'answer', timestamp=days_ago(2))
+    store.delete_chat_history('s1', deleted_at=days_ago(1))
+    store.save_chat_message('s1', 'after', 'answer')
+
+    assert [row['message'] for row in store.get_chat_history('s1')] == ['after']
+    ChatPurger(store, batch_size=10).purge_deleted()
+    assert [row['message'] for row in store.get_chat_history('s1')] == ['after']
+
+
+def test_purge_works_in_batches():
+    store = SQLiteManager(':memory:')
+    for turn in range(25):
+        store.save_chat_message('s1', f'question {turn}', 'answer', timestamp=days_ago(1))
+    store.delete_chat_history('s1')
+
+    assert ChatPurger(store, batch_size=10).purge_deleted() == 25
+    assert store.get_tombstones() == []
+
+
+def test_clearing_an_archived_session_purges_its_parquet_rows(archived_store):
+    store, archive = archived_store
+    store.delete_chat_history('s1')
+    assert store.get_chat_history('s1') == []
+
+    ChatPurger(store, archive=archive, batch_size=10).purge_deleted()
+    assert archive.get_session('s1') == []
+    assert [row['message'] for row in archive.get_session('s2')] == ['very old question']
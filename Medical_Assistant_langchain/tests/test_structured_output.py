@@ -0,0 +1,105 @@
+import json
+import os
+import random
+import sys
+
+import pytest
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(current_dir)
+for path in (os.path.join(root, 'src'), os.path.join(root, 'benchmarks')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from fakes import CANNED_RESPONSE
+from database.sqlite_manager import SQLiteManager
+from database.transcript_search import search_transcripts
+from services.structured_output import (PREAMBLE, JsonSectionRenderer, SectionParser, parse_sections,
+                                        schema_for)
+
+SECTION_KEYS = ['likely_conditions', 'recommended_medications', 'treatment_plan', 'monitoring', 'follow_up']
+
+
+def random_chunks(text: str, max_size: int, seed: int = 1):
+    """text cut into chunks of 1..max_size characters, like a token stream"""
+    rng = random.Random(seed)
+    chunks, i = [], 0
+    while i < len(text):
+        size = rng.randint(1, max_size)
+        chunks.append(text[i:i + size])
+        i += size
+    return chunks
+
+
+@pytest.mark.parametrize('max_size', [1, 3, 7, 40])
+def test_parser_passes_text_through_and_finds_every_section(max_size):
+    answer = 'Here is what I think.\n' + CANNED_RESPONSE
+    events = []
+    parser = SectionParser(schema_for('medical_query'), events.append)
+
+    assert ''.join(parser.track(iter(random_chunks(answer, max_size)))) == answer
+    sections = parser.sections
+    assert list(sections) == [PREAMBLE] + SECTION_KEYS
+    assert sections['recommended_medications'].startswith('Ibuprofen 400mg')
+    assert sections['follow_up'] == 'Seek care if symptoms persist beyond 5 days or worsen'
+
+    done = [event for event in events if event.get('done')]
+    assert [event['section'] for event in done] == [PREAMBLE] + SECTION_KEYS
+    assert done[2]['title'] == 'Recommended Medications'
+    # The deltas of a section add up to its text
+    deltas = ''.join(event['delta'] for event in events
+                     if event['section'] == 'treatment_plan' and 'delta' in event)
+    assert deltas.strip() == sections['treatment_plan']
+
+
+def test_bold_text_that_is_not_a_heading_stays_in_its_section():
+    answer = ("**Likely Condition(s):** Migraine\n**Note:** this is not a heading in the schema\n"
+              "**Follow-up:** See your GP")
+    sections = parse_sections(answer, 'medical_query')
+    assert sections['likely_conditions'] == 'Migraine\n**Note:** this is not a heading in the schema'
+    assert sections['follow_up'] == 'See your GP'
+
+
+def test_message_types_without_a_schema_have_no_sections():
+    assert parse_sections('Hello there!', 'small_talk') is None
+
+
+@pytest.mark.parametrize('max_size', [1, 3, 16])
+def test_json_sections_render_as_the_same_markdown(max_size):
+    answer = {
+        'likely_conditions': 'Viral "flu"\nmoderate ✓ 😀',
+        'recommended_medications': ['Ibuprofen 400mg', 'Rest'],
+        'treatment_plan': 'Rest',
+        'monitoring': {'temp': 'q4h'},
+        'follow_up': '5 days',
+    }
+    raw = '```json\n' + json.dumps(answer, ensure_ascii=True) + '\n```'
+    renderer = JsonSectionRenderer(schema_for('medical_query'))
+    markdown = ''.join(renderer.render(iter(random_chunks(raw, max_size))))
+
+    assert markdown.startswith('**Likely Condition(s):** Viral "flu"\nmoderate ✓ 😀\n\n')
+    assert '**Recommended Medications:**\n- Ibuprofen 400mg\n- Rest' in markdown
+    sections = parse_sections(markdown, 'medical_query')
+    assert sections['likely_conditions'] == 'Viral "flu"\nmoderate ✓ 😀'
+    assert sections['monitoring'] == '- **temp:** q4h'
+    assert sections['follow_up'] == '5 days'
+
+
+def test_text_that_is_not_json_passes_through():
+    renderer = JsonSectionRenderer(schema_for('medical_query'))
+    text = 'Not json **Likely Condition(s):** x'
+    assert renderer.feed(text) + renderer.close() == text
+
+
+def test_sections_are_saved_with_the_turn_and_searchable():
+    store = SQLiteManager(':memory:')
+    store.save_chat_message('s1', 'I have a headache', CANNED_RESPONSE,
+                            sections=parse_sections(CANNED_RESPONSE, 'medical_query'))
+
+    row = store.get_chat_history('s1')[0]
+    assert list(row['sections']) == SECTION_KEYS
+    results = search_transcripts(store, 'ibuprofen', section='recommended_medications')['results']
+    assert results[0]['section'] == 'recommended_medications'
+    assert results[0]['snippet'].startswith('**Ibuprofen**')
+    assert search_transcripts(store, 'ibuprofen', section='follow_up')['results'] == []
@@ -0,0 +1,88 @@
+import os
+import sys
+
+import pytest
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.join(os.path.dirname(current_dir), 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from services.symptom_ontology import SymptomOntology, format_triage
+
+
+@pytest.fixture(scope='module')
+def ontology():
+    return SymptomOntology()
+
+
+@pytest.mark.parametrize('text, codes', [
+    ('head ache and a high temperature', ['headache', 'fever']),
+    ('I have cephalalgia and feel nauseous, sensitive to light', ['headache', 'nausea', 'light_sensitivity']),
+    ('crushing chest pain, sweaty and short of breath', ['chest_pain', 'sweating', 'shortness_of_breath']),
+    ('Runny nose, sneezing; itchy eyes', ['runny_nose', 'sneezing', 'red_eyes']),
+    ('Feeling really tired and always thirsty, peeing a lot', ['fatigue', 'excessive_thirst', 'frequent_urination']),
+    ('what is ibuprofen', []),
+])
+def test_synonyms_map_to_canonical_codes(ontology, text, codes):
+    assert ontology.codes_for(text) == codes
+
+
+def test_misspellings_match_within_a_small_edit_distance(ontology):
+    matches = ontology.match('headach and diarhea since yesterday')
+    assert [(match.code, match.text, match.edits) for match in matches] == [
+        ('headache', 'headach', 1), ('diarrhea', 'diarhea', 1)
+    ]
+
+
+def test_short_words_must_match_exactly(ontology):
+    # "cold" is one edit from "cough", but four-letter words get no edits
+    assert 'cough' not in ontology.codes_for('I caught a cold')
+
+
+def test_negated_symptoms_are_flagged_not_counted(ontology):
+    matches = {match.code: match.negated for match in ontology.match("I don't have a fever but my throat hurts")}
+    assert matches == {'fever': True, 'sore_throat': False}
+    assert ontology.codes_for('headache, no cough') == ['headache']
+
+
+def test_negation_stops_at_a_clause_break(ontology):
+    assert ontology.codes_for('no fever, but a bad headache') == ['headache']
+
+
+def test_match_offsets_point_into_the_message(ontology):
+    text = 'Since Monday: High Temperature.'
+    match = ontology.match(text)[0]
+    assert text[match.start:match.end] == 'High Temperature'
+
+
+def test_canonicalize_folds_exact_synonyms_only(ontology):
+    assert ontology.canonicalize(['Head ache', 'cephalalgia', 'high  temperature', 'itchy elbow']) == \
+        ['headache', 'fever', 'itchy elbow']
+    # Qualified symptoms are kept as written
+    assert ontology.canonicalize(['sudden worst headache of my life', 'no fever']) == \
+        ['sudden worst headache of my life', 'no fever']
+
+
+def test_differential_ranks_the_best_explained_condition_first(ontology):
+    assert ontology.differential(['headache', 'nausea', 'light_sensitivity'])[0]['condition'] == 'Migraine'
+    assert ontology.differential(['excessive_thirst', 'frequent_urination', 'fatigue'])[0]['condition'] == \
+        'Type 2 diabetes'
+    assert ontology.differential(['not_a_code']) == []
+
+
+def test_triage_flags_urgent_presentations(ontology):
+    triage = ontology.triage('fever, headache and a stiff neck')
+    assert triage['red_flags'] == ['stiff_neck']
+    assert triage['urgent']
+    assert triage['differential'][0]['condition'] == 'Meningitis'
+    assert 'seek urgent medical care' in format_triage(triage)
+
+    mild = ontology.triage('runny nose and sneezing, no fever')
+    assert not mild['urgent']
+    assert mild['absent'] == ['fever']
+
+
+def test_messages_without_symptoms_get_no_triage(ontology):
+    assert ontology.triage('What is the maximum dose of ibuprofen?') is None
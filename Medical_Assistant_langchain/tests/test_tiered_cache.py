@@ -0,0 +1,130 @@
+import os
+import sys
+import time
+
+import pytest
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.join(os.path.dirname(current_dir), 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+fakeredis = pytest.importorskip('fakeredis')
+
+from database.cached_store import HISTORY, PROFILE, CachedStore
+from database.sqlite_manager import SQLiteManager
+from utils.tiered_cache import TieredCache
+
+
+class CountingStore:
+    """The shared database, counting the reads that get past the cache"""
+
+    def __init__(self, store):
+        self.store = store
+        self.reads = 0
+
+    def __getattr__(self, name):
+        if name.startswith('get_'):
+            self.reads += 1
+        return getattr(self.store, name)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+@pytest.fixture
+def replicas():
+    """Two replicas, each with its own L1 and Redis client, sharing one Redis server and one database"""
+    server = fakeredis.FakeServer()
+    store = CountingStore(SQLiteManager(':memory:'))
+    caches = [TieredCache(fakeredis.FakeRedis(server=server), l1_ttl=60, prefix='test') for _ in range(2)]
+    # Invalidation messages only reach replicas that are already subscribed
+    assert wait_for(lambda: all(cache._subscriber is not None for cache in caches))
+    time.sleep(0.2)
+    yield store, caches, [CachedStore(store, cache) for cache in caches]
+    for cache in caches:
+        cache.close()
+
+
+def test_history_is_warm_on_the_other_replica(replicas):
+    store, (cache_a, cache_b), (replica_a, replica_b) = replicas
+    replica_a.save_chat_message('s1', 'hello', 'hi there')
+    assert [row['message'] for row in replica_a.get_chat_history('s1')] == ['hello']
+    assert store.reads == 1
+
+    # L2 hit on the other replica, which then keeps it in its own L1
+    assert [row['message'] for row in replica_b.get_chat_history('s1')] == ['hello']
+    assert store.reads == 1
+    assert cache_b.local.get((HISTORY, 's1')) is not None
+    cache_b.client.flushall()
+    assert [row['message'] for row in replica_b.get_chat_history('s1')] == ['hello']
+    assert store.reads == 1
+
+
+def test_saved_turn_reaches_the_other_replica(replicas):
+    store, _, (replica_a, replica_b) = replicas
+    replica_a.save_chat_message('s1', 'one', 'first')
+    replica_a.get_chat_history('s1')
+    replica_b.get_chat_history('s1')
+    replica_a.save_chat_message('s1', 'two', 'second')
+    assert wait_for(lambda: [row['message'] for row in replica_b.get_chat_history('s1')] == ['one', 'two'])
+    # The save dropped the entry; one replica reloads it and the other reads that from L2
+    assert [row['message'] for row in replica_a.get_chat_history('s1')] == ['one', 'two']
+    assert store.reads == 2
+
+
+def test_interleaved_saves_on_two_replicas_keep_every_turn(replicas):
+    store, _, (replica_a, replica_b) = replicas
+    replica_a.save_chat_message('s1', 'one', 'first')
+    # Both replicas hold the same window when the next two turns land
+    assert len(replica_a.get_chat_history('s1')) == 1
+    assert len(replica_b.get_chat_history('s1')) == 1
+
+    replica_a.save_chat_message('s1', 'two', 'second')
+    replica_b.save_chat_message('s1', 'three', 'third')
+    expected = ['one', 'two', 'three']
+    assert [row['message'] for row in replica_a.get_chat_history('s1')] == expected
+    assert [row['message'] for row in replica_b.get_chat_history('s1')] == expected
+
+
+def test_clearing_history_invalidates_every_replica(replicas):
+    store, (cache_a, cache_b), (replica_a, replica_b) = replicas
+    replica_a.save_chat_message('s1', 'hello', 'hi there')
+    replica_a.get_chat_history('s1')
+    replica_b.get_chat_history('s1')
+    assert cache_b.local.get((HISTORY, 's1')) is not None
+
+    replica_a.delete_chat_history('s1')
+    assert cache_a.client.get(cache_a.redis_key(HISTORY, 's1')) is None
+    assert wait_for(lambda: cache_b.local.get((HISTORY, 's1')) is None)
+    assert replica_b.get_chat_history('s1') == []
+
+
+def test_profile_update_invalidates_every_replica(replicas):
+    store, (cache_a, cache_b), (replica_a, replica_b) = replicas
+    store.create_user_profile('u1', 'Ana', 'ana@example.com', {'age': 40})
+    assert replica_a.get_user_profile('u1')['health_info'] == {'age': 40}
+    assert replica_b.get_user_profile('u1')['health_info'] == {'age': 40}
+    reads = store.reads
+
+    replica_a.update_user_health_info('u1', {'age': 41})
+    assert wait_for(lambda: cache_b.local.get((PROFILE, 'u1')) is None)
+    assert replica_b.get_user_profile('u1')['health_info'] == {'age': 41}
+    assert store.reads == reads + 1
+
+
+def test_own_invalidations_are_ignored(replicas):
+    _, (cache_a, cache_b), _ = replicas
+    cache_a.set('ns', 'k', {'v': 1})
+    cache_b.get('ns', 'k')
+    cache_a.set('ns', 'k', {'v': 2})
+    assert wait_for(lambda: cache_b.get('ns', 'k') == {'v': 2})
+    # The writer keeps the value it just wrote in L1
+    assert cache_a.local.get(('ns', 'k')) == {'v': 2}
@@ -0,0 +1,85 @@
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.join(os.path.dirname(current_dir), 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+pa = pytest.importorskip('pyarrow')
+import pyarrow.parquet as pq
+
+from database.transcript_archive import ARCHIVE_COLUMNS, ParquetArchive
+
+
+def archive_row(row_id: str, timestamp: str, session_id: str = 's1') -> dict:
+    return {
+        'id': row_id,
+        'session_id': session_id,
+        'message': f'question {row_id}',
+        'response_body': b'answer',
+        'codec': 'raw',
+        'message_type': 'medical_query',
+        'timestamp': timestamp,
+    }
+
+
+@pytest.fixture
+def archive(tmp_path):
+    """Turns with mixed offsets and ISO formats, one file written before timestamp_utc existed
+
+    In UTC: a 08:00, c 08:30, b 09:00, d 10:00:00.5
+    """
+    archive = ParquetArchive(str(tmp_path))
+    archive.write([archive_row('a', '2026-01-01T10:00:00+02:00'), archive_row('b', '2026-01-01T09:00:00')])
+    legacy = tmp_path / 'archived_date=2025-06-01'
+    legacy.mkdir()
+    pq.write_table(
+        pa.Table.from_pylist([archive_row('c', '2026-01-01T08:30:00Z'),
+                              archive_row('d', '2026-01-01T07:00:00.500-03:00')]),
+        str(legacy / 'part-legacy.parquet')
+    )
+    return archive
+
+
+def ids(rows):
+    return [row['id'] for row in rows]
+
+
+def test_rows_are_ordered_by_instant_not_by_string(archive):
+    assert ids(archive.get_session('s1')) == ['a', 'c', 'b', 'd']
+    assert ids(archive.get_export_page(limit=10)) == ['a', 'c', 'b', 'd']
+
+
+def test_rows_keep_their_original_timestamp(archive):
+    rows = archive.get_session('s1')
+    assert rows[0]['timestamp'] == '2026-01-01T10:00:00+02:00'
+    assert sorted(rows[0]) == sorted(ARCHIVE_COLUMNS)
+
+
+def test_export_cursor_pages_through_mixed_offsets(archive):
+    first = archive.get_export_page(limit=2)
+    second = archive.get_export_page(after=(first[-1]['timestamp'], first[-1]['id']), limit=2)
+    assert ids(first) == ['a', 'c']
+    assert ids(second) == ['b', 'd']
+
+
+def test_export_time_window_compares_utc_instants(archive):
+    rows = archive.get_export_page(limit=10, since=datetime(2026, 1, 1, 8, 15, tzinfo=timezone.utc),
+                                   until=datetime(2026, 1, 1, 9, 0))
+    assert ids(rows) == ['c']
+
+
+def test_session_after_and_delete_before_use_utc(archive):
+    assert ids(archive.get_session('s1', after='2026-01-01T10:15:00+01:00')) == ['d']
+    assert archive.delete_session('s1', before='2026-01-01T08:30:00+00:00') == 2
+    assert ids(archive.get_session('s1')) == ['b', 'd']
+
+
+def test_expiry_uses_utc_instants(archive):
+    assert archive.expire_before(datetime(2026, 1, 1, 9, 30)) == 3
+    assert ids(archive.get_session('s1')) == ['d']
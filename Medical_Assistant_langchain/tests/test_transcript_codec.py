@@ -0,0 +1,90 @@
+import os
+import sys
+
+import pytest
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.join(os.path.dirname(current_dir), 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+zstandard = pytest.importorskip('zstandard')
+
+import database.transcript_codec as transcript_codec
+from database.sqlite_manager import SQLiteManager
+from database.transcript_codec import CODEC_RAW, CODEC_ZLIB, CODEC_ZSTD, DICT_PREFIX, TranscriptCodec
+
+ANSWER = ("**Likely Condition(s):** Viral upper respiratory infection\n\n"
+          "**Recommended Medications:** Ibuprofen 400 mg every 6-8 hours with food\n\n"
+          "**Follow-up:** Seek care if symptoms persist beyond 5 days or worsen")
+
+
+def samples(count: int = 300):
+    symptoms = ['headache', 'fever', 'cough', 'nausea', 'sore throat']
+    return [f"**Likely Condition(s):** {symptoms[i % 5]} for {i % 9} days\n\n"
+            f"**Recommended Medications:** paracetamol 500 mg every {4 + i % 3} hours\n\n"
+            f"**Follow-up:** seek care if the {symptoms[(i + 2) % 5]} worsens" for i in range(count)]
+
+
+@pytest.fixture
+def codec(tmp_path):
+    return TranscriptCodec(dict_dir=str(tmp_path / 'dicts'), level=3)
+
+
+def test_short_bodies_are_stored_raw(codec):
+    payload, name = codec.encode('Hi!')
+    assert name == CODEC_RAW
+    assert codec.decode(payload, name) == 'Hi!'
+
+
+def test_zstd_round_trip_without_a_dictionary(codec):
+    payload, name = codec.encode(ANSWER)
+    assert name == CODEC_ZSTD
+    assert len(payload) < len(ANSWER.encode('utf-8'))
+    assert codec.decode(payload, name) == ANSWER
+
+
+def test_rows_written_with_an_older_dictionary_still_decode(codec, tmp_path):
+    first = codec.train_dictionary(samples(), dict_size=4096)
+    old_payload, old_name = codec.encode(ANSWER)
+    assert old_name == f"{DICT_PREFIX}{first}"
+
+    second = codec.train_dictionary([text.upper() for text in samples()], dict_size=4096)
+    assert second != first
+    assert codec.encode(ANSWER)[1] == f"{DICT_PREFIX}{second}"
+
+    # A fresh process loads every dictionary in the directory
+    reloaded = TranscriptCodec(dict_dir=str(tmp_path / 'dicts'), level=3)
+    assert reloaded.decode(old_payload, old_name) == ANSWER
+
+
+def test_missing_dictionary_is_an_error(codec):
+    payload, _ = codec.encode(ANSWER)
+    with pytest.raises(ValueError, match='not available'):
+        codec.decode(payload, f"{DICT_PREFIX}12345")
+
+
+def test_unknown_codec_is_an_error(codec):
+    with pytest.raises(ValueError, match='Unknown transcript codec'):
+        codec.decode(b'payload', 'brotli')
+
+
+def test_zlib_fallback_without_zstandard(monkeypatch, tmp_path):
+    monkeypatch.setattr(transcript_codec, 'zstandard', None)
+    codec = TranscriptCodec(dict_dir=str(tmp_path), level=6)
+    payload, name = codec.encode(ANSWER)
+    assert name == CODEC_ZLIB
+    assert codec.decode(payload, name) == ANSWER
+    with pytest.raises(ValueError, match='zstandard is required'):
+        codec.decode(payload, CODEC_ZSTD)
+
+
+def test_store_keeps_bodies_compressed_and_returns_plaintext(codec):
+    store = SQLiteManager(':memory:', codec=codec)
+    store.save_chat_message('s1', 'What helps a cold?', ANSWER)
+
+    body, name = store.conn.execute("SELECT response_body, codec FROM chat_conversations").fetchone()
+    assert name == CODEC_ZSTD
+    assert ANSWER.encode('utf-8') not in bytes(body)
+    assert store.get_chat_history('s1')[0]['response'] == ANSWER
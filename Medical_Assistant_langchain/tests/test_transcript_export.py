@@ -0,0 +1,127 @@
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+src_path = os.path.join(os.path.dirname(current_dir), 'src')
+if src_path not in sys.path:
+    sys.path.insert(0, src_path)
+
+from database.compaction import TranscriptCompactor
+from database.retention import ChatPurger
+from database.sqlite_manager import SQLiteManager
+from database.transcript_export import TranscriptExporter, iter_transcripts
+from database.transcript_search import search_transcripts
+
+
+def parquet_archive(tmp_path):
+    pytest.importorskip('pyarrow')
+    from database.transcript_archive import ParquetArchive
+    return ParquetArchive(str(tmp_path / 'archive'))
+
+
+@pytest.fixture(params=['archive_table', 'parquet'])
+def store(request, tmp_path):
+    """Four old sessions moved to the archive (one of them then cleared) and one live session"""
+    archive = parquet_archive(tmp_path) if request.param == 'parquet' else None
+    store = SQLiteManager(':memory:', archive=archive)
+    old = datetime.now() - timedelta(days=60)
+    for session in range(4):
+        for turn in range(5):
+            store.save_chat_message(f'old{session}', f'question {turn}', f'answer {session} {turn}',
+                                    timestamp=(old + timedelta(minutes=session * 10 + turn)).isoformat())
+    for turn in range(3):
+        store.save_chat_message('new', f'question {turn}', f'answer new {turn}')
+    TranscriptCompactor(store, older_than_days=30).run_once()
+    store.delete_chat_history('old1')
+    return store
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_iteration_covers_live_and_archived_tiers(store):
+    assert len(list(iter_transcripts(store, page_size=2))) == 3
+    archived = list(iter_transcripts(store, page_size=2, archived=True))
+    assert len(archived) == 15
+    assert 'old1' not in {row['session_id'] for row in archived}
+    assert archived[0]['response'] == 'answer 0 0'
+
+
+def test_export_includes_the_archive(store, tmp_path):
+    output = str(tmp_path / 'export.jsonl')
+    assert TranscriptExporter(store, output, page_size=4).run() == 18
+
+    rows = read_jsonl(output)
+    assert len({row['id'] for row in rows}) == 18
+    assert [row['session_id'] for row in rows[:3]] == ['new'] * 3
+    assert rows[-1]['response'] == 'answer 3 4'
+
+
+def test_interrupted_export_resumes_in_the_archive_tier(store, tmp_path):
+    output = str(tmp_path / 'export.jsonl')
+    exporter = TranscriptExporter(store, output, page_size=2)
+    real_page = store.get_export_page
+    calls = {'archived': 0}
+
+    def failing_page(*args, **kwargs):
+        if kwargs.get('archived'):
+            calls['archived'] += 1
+            if calls['archived'] == 3:
+                raise ConnectionError('connection reset')
+        return real_page(*args, **kwargs)
+
+    store.get_export_page = failing_page
+    with pytest.raises(ConnectionError):
+        exporter.run()
+    with open(exporter.checkpoint_path, encoding='utf-8') as f:
+        assert json.load(f)['tier'] == 'archive'
+
+    store.get_export_page = real_page
+    exporter.run()
+    rows = read_jsonl(output)
+    assert len(rows) == 18
+    assert len({row['id'] for row in rows}) == 18
+
+
+def test_live_only_export(store, tmp_path):
+    output = str(tmp_path / 'export.jsonl')
+    assert TranscriptExporter(store, output, include_archive=False).run() == 3
+
+
+class TestSearch:
+    @pytest.fixture
+    def store(self):
+        store = SQLiteManager(':memory:')
+        old = datetime.now() - timedelta(days=60)
+        store.save_chat_message('old', 'metformin dose?', 'take metformin with food', timestamp=old.isoformat())
+        store.save_chat_message('old', 'ibuprofen?', 'ibuprofen is fine',
+                                timestamp=(old + timedelta(minutes=1)).isoformat())
+        store.save_chat_message('new', 'metformin again', 'metformin yes')
+        store.save_chat_message('gone', 'metformin gone', 'cleared answer', timestamp=old.isoformat())
+        store.delete_chat_history('gone')
+        TranscriptCompactor(store, older_than_days=30).run_once()
+        ChatPurger(store, batch_size=10).purge_deleted()
+        return store
+
+    def test_archived_turns_stay_searchable(self, store):
+        results = search_transcripts(store, 'metformin')['results']
+        assert sorted(result['session_id'] for result in results) == ['new', 'old']
+        assert '**metformin**' in results[0]['snippet'].lower()
+
+    def test_search_pages_with_a_cursor(self, store):
+        first = search_transcripts(store, 'metformin', limit=1)
+        second = search_transcripts(store, 'metformin', limit=1, cursor=first['next_cursor'])
+        sessions = [first['results'][0]['session_id'], second['results'][0]['session_id']]
+        assert sorted(sessions) == ['new', 'old']
+
+    def test_expired_archived_turns_leave_the_index(self, store):
+        store.expire_archived_rows(10)
+        store.purge_deleted_sessions()
+        assert [result['session_id'] for result in search_transcripts(store, 'metformin')['results']] == ['new']
@@ -0,0 +1,98 @@
+import os
+import sys
+
+import pytest
+
+# Add the src directory to the path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(current_dir)
+for path in (os.path.join(root, 'src'), os.path.join(root, 'benchmarks')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from database.sqlite_manager import SQLiteManager
+from services.usage_ledger import CACHE_COALESCED, CACHE_MISS, CACHE_QUICK_ANSWER, UsageLedger
+from utils.batch_writer import BatchWriter
+
+
+def usage(prompt_tokens: int, output_tokens: int, cache_status: str = CACHE_MISS, model: str = 'gemini-flash'):
+    return {'model': model, 'prompt_tokens': prompt_tokens, 'output_tokens': output_tokens,
+            'cached_tokens': 0, 'ttft': 0.25, 'cache_status': cache_status}
+
+
+@pytest.fixture
+def ledger():
+    store = SQLiteManager(':memory:')
+    ledger = UsageLedger(store, BatchWriter(store.save_usage_records, name='test-usage', interval=60))
+    yield ledger
+    ledger.close()
+
+
+def test_rollup_totals_per_session_costliest_first(ledger):
+    ledger.record('s1', 'medical_query', usage(100, 50), latency=1.2)
+    ledger.record('s1', 'medical_query', usage(120, 40), latency=0.8)
+    ledger.record('s2', 'small_talk', usage(10, 5, CACHE_QUICK_ANSWER), latency=0.01)
+
+    rows = ledger.rollup('session')
+    assert [row['key'] for row in rows] == ['s1', 's2']
+    assert rows[0]['turns'] == 2
+    assert rows[0]['prompt_tokens'] == 220 and rows[0]['output_tokens'] == 90
+    assert rows[0]['avg_latency_ms'] == 1000
+    assert rows[0]['avg_ttft_ms'] == 250
+    assert rows[1]['cache_hits'] == 1
+
+
+def test_rollup_by_message_type_and_model(ledger):
+    ledger.record('s1', 'medical_query', usage(100, 50, model='gemini-pro'), latency=1.0)
+    ledger.record('s2', 'medical_query', usage(0, 0, CACHE_COALESCED, model='gemini-pro'), latency=1.0)
+    ledger.record('s3', 'drug_info', usage(30, 20), latency=0.5)
+
+    by_type = {row['key']: row for row in ledger.rollup('message_type')}
+    assert by_type['medical_query']['turns'] == 2
+    assert by_type['medical_query']['cache_hits'] == 1
+    assert [row['key'] for row in ledger.rollup('model')] == ['gemini-pro', 'gemini-flash']
+
+
+def test_unknown_grouping_is_rejected(ledger):
+    with pytest.raises(ValueError, match='group_by'):
+        ledger.rollup('user')
+
+
+def test_failed_batches_are_kept_for_the_next_flush():
+    store = SQLiteManager(':memory:')
+    outage = {'down': True}
+
+    def save(records):
+        return False if outage['down'] else store.save_usage_records(records)
+
+    ledger = UsageLedger(store, BatchWriter(save, name='test-usage', interval=60))
+    ledger.record('s1', 'medical_query', usage(100, 50), latency=1.0)
+    assert ledger.flush() == 0
+    assert ledger.writer.pending == 1
+
+    outage['down'] = False
+    assert ledger.flush() == 1
+    assert store.get_usage_rollup('session')[0]['prompt_tokens'] == 100
+
+
+def test_chat_turns_record_their_token_usage():
+    from fakes import FakeChatModel
+    from services.intent_router import IntentRouter
+    from services.langchain_service import MedicalChatService
+
+    store = SQLiteManager(':memory:')
+    ledger = UsageLedger(store, BatchWriter(store.save_usage_records, name='test-usage', interval=60))
+    service = MedicalChatService(
+        llm=FakeChatModel(tokens_per_second=0, response_tokens=20, first_token_latency=0),
+        db=store, router=IntentRouter(log_path=''), usage_ledger=ledger
+    )
+    service.chat('I have had a headache and a mild fever since Tuesday', 'usage-s1', 'medical_query')
+    ''.join(service.stream_chat('Should I also worry about the cough?', 'usage-s1', 'medical_query'))
+
+    rows = service.get_usage_rollup('session')
+    ledger.close()
+    assert rows[0]['key'] == 'usage-s1'
+    assert rows[0]['turns'] == 2
+    assert rows[0]['output_tokens'] == 40
+    assert rows[0]['prompt_tokens'] > 0
+    assert rows[0]['avg_ttft_ms'] is not None